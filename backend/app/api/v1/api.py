@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from app.api.v1.endpoints import auth, customers, vehicles, services, appointments, checkins, ai
+from app.api.v1.endpoints import auth, customers, vehicles, services, appointments, checkins, ai, jobs
 
 api_router = APIRouter()
 
@@ -10,3 +10,4 @@ api_router.include_router(services.router, prefix="/services", tags=["services"]
 api_router.include_router(appointments.router, prefix="/appointments", tags=["appointments"])
 api_router.include_router(checkins.router, prefix="/checkins", tags=["check-ins"])
 api_router.include_router(ai.router, prefix="/ai", tags=["ai-detection"])
+api_router.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
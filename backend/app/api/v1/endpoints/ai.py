@@ -1,5 +1,5 @@
 from typing import List, Optional, Dict, Any
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, BackgroundTasks, Request, Header, Query, Response
 from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
 from datetime import datetime, date, timedelta
@@ -7,8 +7,13 @@ import os
 import tempfile
 from app.core.database import get_db
 from app.schemas.ai_detection import AIDetection, AIDetectionCreate, AIDetectionUpdate
+from app.schemas.ingest import IngestResult
 from app.services.ai_service import AIService
-from app.services.license_plate_service import LicensePlateService
+from app.services.list_query import InvalidCursor, page_items
+from app.services.plate_cache import plate_cache
+from app.services.vision_client import get_vision_client, VisionWorkerUnavailable, VisionWorkerError
+from app.core.config import settings
+from app.core.admission import admission, admission_stats, Overloaded
 import asyncio
 import logging
 from pathlib import Path
@@ -22,21 +27,22 @@ monitoring_task = None
 
 @router.get("/", response_model=List[AIDetection])
 def get_detections(
-    skip: int = 0,
-    limit: int = 100,
+    response: Response,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
     processed: Optional[bool] = None,
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
     db: Session = Depends(get_db)
 ):
-    """Get all AI detections with optional filters"""
+    """Get AI detections, newest first, with optional filters, paginated by cursor (X-Next-Cursor header)"""
     service = AIService(db)
-    detections = service.get_detections(skip=skip, limit=limit)
-    
-    if processed is not None:
-        detections = [d for d in detections if d.processed == processed]
-    
-    return detections
+    try:
+        page = service.list_detections(limit=limit, cursor=cursor, skip=skip, processed=processed)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return page_items(page, response)
 
-@router.post("/detect", response_model=dict)
+@router.post("/detect", response_model=dict, dependencies=[Depends(admission("detect"))])
 async def detect_license_plate(
     file: UploadFile = File(...),
     db: Session = Depends(get_db)
@@ -51,8 +57,14 @@ async def detect_license_plate(
         temp_path = temp_file.name
     
     try:
-        # Process the image
-        result = service.process_license_plate(temp_path)
+        # Process the image (off the event loop: inference may run in the vision worker)
+        try:
+            result = await asyncio.to_thread(service.process_license_plate, temp_path)
+        except VisionWorkerUnavailable as e:
+            logger.error(f"Worker di visione non disponibile: {e}")
+            raise HTTPException(status_code=503, detail="Servizio di riconoscimento non disponibile")
+        except Overloaded as e:
+            raise e.to_http()
         
         if result:
             # Create detection record
@@ -89,14 +101,20 @@ async def detect_license_plate(
         if os.path.exists(temp_path):
             os.unlink(temp_path)
 
-@router.post("/stream", response_model=dict)
+@router.post("/stream", response_model=dict, dependencies=[Depends(admission("stream"))])
 def process_camera_stream(
     camera_url: str,
     db: Session = Depends(get_db)
 ):
     """Process live camera stream for license plate detection"""
     service = AIService(db)
-    result = service.process_camera_stream(camera_url)
+    try:
+        result = service.process_camera_stream(camera_url)
+    except VisionWorkerUnavailable as e:
+        logger.error(f"Worker di visione non disponibile: {e}")
+        raise HTTPException(status_code=503, detail="Servizio di riconoscimento non disponibile")
+    except Overloaded as e:
+        raise e.to_http()
     
     if result:
         # Create detection record
@@ -127,6 +145,93 @@ def process_camera_stream(
             "message": "No license plate detected from stream"
         }
 
+@router.post("/ingest", response_model=IngestResult, dependencies=[Depends(admission("ingest"))])
+async def ingest_plate_events(
+    request: Request,
+    content_type: Optional[str] = Header(None),
+    content_encoding: Optional[str] = Header(None),
+    authorization: Optional[str] = Header(None),
+    x_api_key: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Acquisizione a lotti di eventi targa (edge agent, telecamere ANPR esterne).
+    Corpo NDJSON o msgpack, eventualmente compresso con gzip; ogni evento ha un
+    event_id e i reinvii dello stesso evento vengono ignorati.
+    """
+    from app.services.ingest_service import IngestService, IngestPayloadError, decode_events
+    
+    if settings.INGEST_API_KEYS:
+        token = x_api_key or (authorization[7:] if authorization and authorization.lower().startswith("bearer ") else None)
+        if token not in settings.INGEST_API_KEYS:
+            raise HTTPException(status_code=401, detail="Chiave API non valida")
+    
+    content_length = request.headers.get("content-length")
+    if content_length and int(content_length) > settings.INGEST_MAX_BODY_BYTES:
+        raise HTTPException(status_code=413, detail="Lotto troppo grande")
+    body = await request.body()
+    if len(body) > settings.INGEST_MAX_BODY_BYTES:
+        raise HTTPException(status_code=413, detail="Lotto troppo grande")
+    
+    def _ingest():
+        objects = decode_events(body, content_type, content_encoding, settings.INGEST_MAX_DECOMPRESSED_BYTES)
+        if len(objects) > settings.INGEST_MAX_EVENTS:
+            raise IngestPayloadError(f"Troppi eventi nel lotto (massimo {settings.INGEST_MAX_EVENTS})", status_code=413)
+        return IngestService(db, save_crops=settings.INGEST_SAVE_CROPS).ingest(objects)
+    
+    try:
+        # Decodifica, validazione e scrittura fuori dall'event loop
+        return await asyncio.to_thread(_ingest)
+    except IngestPayloadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        logger.error(f"Errore nell'acquisizione lotto: {e}")
+        raise HTTPException(status_code=500, detail=f"Errore nell'acquisizione: {str(e)}")
+
+@router.get("/admission/stats")
+async def get_admission_stats():
+    """Richieste in esecuzione e in attesa per route e slot di inferenza occupati"""
+    return admission_stats()
+
+@router.get("/stats")
+def get_ai_stats(db: Session = Depends(get_db)):
+    """Ottiene statistiche del sistema AI"""
+    try:
+        from sqlalchemy import select, func
+        from app.core.database import Vehicle, Appointment
+        from app.services.detection_rollups import summarize, cached
+
+        today = datetime.now().date()
+        today_start = datetime.combine(today, datetime.min.time())
+
+        # Un'unica query: totali e rilevazioni di oggi dai rollup orari (+ righe grezze
+        # non ancora aggregate), veicoli e appuntamenti di oggi come sottoquery scalari
+        totals = cached(("ai_stats", today), lambda: summarize(db, since=today_start, extra={
+            "total_vehicles": select(func.count(Vehicle.id)).scalar_subquery(),
+            "today_appointments": select(func.count(Appointment.id)).where(
+                Appointment.appointment_date >= today_start,
+                Appointment.appointment_date < today_start + timedelta(days=1)
+            ).scalar_subquery()
+        }))
+        total_detections = totals["detections"]
+        detections_with_appointments = totals["with_appointments"]
+
+        return {
+            "status": "success",
+            "data": {
+                "total_detections": total_detections,
+                "total_vehicles": totals["total_vehicles"],
+                "today_detections": totals["detections_since"],
+                "today_appointments": totals["today_appointments"],
+                "detections_with_appointments": detections_with_appointments,
+                "accuracy_rate": (detections_with_appointments / total_detections * 100) if total_detections > 0 else 0
+            }
+        }
+
+    except Exception as e:
+        logger.error(f"Errore nel recupero statistiche: {e}")
+        raise HTTPException(status_code=500, detail=f"Errore nel recupero statistiche: {str(e)}")
+
 @router.get("/{detection_id}", response_model=AIDetection)
 def get_detection(
     detection_id: int,
@@ -167,7 +272,7 @@ def get_detection_statistics(
     """Get AI detection statistics for a date range"""
     service = AIService(db)
     start_datetime = datetime.combine(start_date, datetime.min.time())
-    end_datetime = datetime.combine(end_date, datetime.max.time())
+    end_datetime = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
     return service.get_detection_statistics(start_datetime, end_datetime)
 
 @router.post("/livestream/start")
@@ -181,13 +286,29 @@ async def start_livestream_monitoring(
     global license_plate_service, monitoring_task
     
     try:
-        # Crea il servizio se non esiste
-        if license_plate_service is None:
-            license_plate_service = LicensePlateService(db)
-        
         # Usa sempre lo stream fisso (host.docker.internal per accesso dall'interno del container)
         fixed_stream_url = "rtsp://host.docker.internal:8554/webcam"
         
+        # Con il worker di visione il livestream gira lì, una sola volta per tutti i worker API
+        vision_client = get_vision_client()
+        if vision_client:
+            camera_id = settings.CAMERAS[0]["id"]
+            await vision_client.call_async(
+                "livestream_start", camera_id=camera_id, stream_url=fixed_stream_url, output_url=output_url
+            )
+            return {
+                "status": "success",
+                "message": f"Monitoraggio livestream avviato per: {fixed_stream_url}",
+                "stream_url": fixed_stream_url,
+                "output_url": output_url,
+                "camera_id": camera_id
+            }
+        
+        # Crea il servizio se non esiste (lo stack di visione viene importato solo qui)
+        if license_plate_service is None:
+            from app.services.license_plate_service import LicensePlateService
+            license_plate_service = LicensePlateService(db)
+        
         # Avvia il monitoraggio in background
         if monitoring_task is None or monitoring_task.done():
             monitoring_task = asyncio.create_task(
@@ -211,6 +332,10 @@ async def stop_livestream_monitoring():
     global license_plate_service, monitoring_task
     
     try:
+        vision_client = get_vision_client()
+        if vision_client:
+            await vision_client.call_async("livestream_stop")
+        
         if license_plate_service:
             license_plate_service.stop_livestream_monitoring()
         
@@ -232,6 +357,23 @@ async def get_livestream_status():
     """Ottiene lo stato del monitoraggio livestream"""
     global license_plate_service, monitoring_task
     
+    vision_client = get_vision_client()
+    if vision_client:
+        try:
+            cameras = await vision_client.call_async("livestream_status")
+        except (VisionWorkerUnavailable, VisionWorkerError) as e:
+            logger.error(f"Errore nello stato livestream dal worker di visione: {e}")
+            return {"is_streaming": False, "is_task_running": False, "status": "unavailable"}
+        
+        is_active = any(camera["is_streaming"] for camera in cameras.values())
+        is_task_running = any(camera["is_task_running"] for camera in cameras.values())
+        return {
+            "is_streaming": is_active,
+            "is_task_running": is_task_running,
+            "status": "active" if (is_active or is_task_running) else "inactive",
+            "cameras": cameras
+        }
+    
     is_active = False
     if license_plate_service:
         is_active = license_plate_service.is_streaming
@@ -243,7 +385,31 @@ async def get_livestream_status():
     return {
         "is_streaming": is_active,
         "is_task_running": is_task_running,
-        "status": "active" if (is_active or is_task_running) else "inactive"
+        "status": "active" if (is_active or is_task_running) else "inactive",
+        "decode": license_plate_service.decode_status() if license_plate_service else None
+    }
+
+@router.get("/cameras/leases")
+async def get_camera_leases(db: Session = Depends(get_db)):
+    """Assegnazione delle telecamere ai worker di visione (lease e heartbeat)"""
+    from app.core.database import CameraLease, VisionWorkerNode
+    from app.services.camera_lease_service import lease_to_dict
+    
+    leases = db.query(CameraLease).order_by(CameraLease.camera_id).all()
+    workers = db.query(VisionWorkerNode).order_by(VisionWorkerNode.worker_id).all()
+    return {
+        "status": "success",
+        "data": {
+            "leases": [lease_to_dict(lease) for lease in leases],
+            "workers": [
+                {
+                    "worker_id": worker.worker_id,
+                    "hostname": worker.hostname,
+                    "heartbeat_at": worker.heartbeat_at.isoformat() if worker.heartbeat_at else None
+                }
+                for worker in workers
+            ]
+        }
     }
 
 @router.post("/plate/detect")
@@ -253,6 +419,7 @@ async def detect_license_plate(
 ):
     """Processa manualmente una targa rilevata"""
     try:
+        from app.services.license_plate_service import LicensePlateService
         service = LicensePlateService(db)
         result = await service.process_detected_plate(license_plate)
         
@@ -272,10 +439,9 @@ async def search_license_plate(
 ):
     """Cerca informazioni su una targa specifica"""
     try:
-        service = LicensePlateService(db)
-        
-        # Cerca il veicolo
-        vehicle = service.find_vehicle_by_plate(license_plate)
+        # Risolve la targa tramite la cache (nessun caricamento dei modelli AI)
+        entry = plate_cache.get(db, license_plate)
+        vehicle = entry["vehicle"]
         
         if not vehicle:
             return {
@@ -284,34 +450,18 @@ async def search_license_plate(
                 "data": None
             }
         
-        # Ottieni informazioni cliente
-        customer = service.get_customer_info(vehicle)
-        
-        # Verifica appuntamenti per oggi
-        appointments = service.check_appointments_for_vehicle(vehicle.id)
+        appointments = entry["appointments"]
         
         result = {
             "license_plate": license_plate,
-            "vehicle": {
-                "id": vehicle.id,
-                "brand": vehicle.brand,
-                "model": vehicle.model,
-                "year": vehicle.year,
-                "color": vehicle.color,
-                "fuel_type": vehicle.fuel_type
-            },
-            "customer": {
-                "id": customer.id,
-                "full_name": customer.full_name,
-                "phone": customer.phone,
-                "email": customer.email
-            } if customer else None,
+            "vehicle": vehicle,
+            "customer": entry["customer"],
             "appointments_today": [
                 {
-                    "id": apt.id,
-                    "appointment_date": apt.appointment_date,
-                    "service_name": apt.service.name if apt.service else "Servizio non specificato",
-                    "status": apt.status
+                    "id": apt["id"],
+                    "appointment_date": apt["appointment_date"],
+                    "service_name": apt["service"]["name"] if apt["service"] else "Servizio non specificato",
+                    "status": apt["status"]
                 }
                 for apt in appointments
             ],
@@ -320,7 +470,7 @@ async def search_license_plate(
         
         return {
             "status": "found",
-            "message": f"Veicolo trovato: {vehicle.brand} {vehicle.model}",
+            "message": f"Veicolo trovato: {vehicle['brand']} {vehicle['model']}",
             "data": result
         }
         
@@ -328,6 +478,46 @@ async def search_license_plate(
         logger.error(f"Errore nella ricerca targa: {e}")
         raise HTTPException(status_code=500, detail=f"Errore nella ricerca: {str(e)}")
 
+@router.get("/plate/cache/stats")
+async def get_plate_cache_stats():
+    """Statistiche delle cache: targhe, letture OCR e risultati di /ai/detect (dimensione, hit/miss)"""
+    from app.services.ocr_cache import get_detection_cache, ocr_cache_stats
+    
+    client = get_vision_client()
+    if client:
+        try:
+            ocr_cache = (await client.call_async("ping")).get("ocr_cache")
+        except (VisionWorkerUnavailable, VisionWorkerError):
+            ocr_cache = None
+    else:
+        ocr_cache = ocr_cache_stats()
+    
+    return {
+        "status": "success",
+        "data": plate_cache.stats(),
+        "ocr_cache": ocr_cache,
+        "detection_cache": get_detection_cache().stats()
+    }
+
+@router.get("/shadow/stats")
+async def get_shadow_stats():
+    """Confronto tra il motore targhe di produzione e il candidato in ombra (accordo, disaccordi, tempi)"""
+    from app.services.shadow_eval import get_shadow_evaluator
+    
+    if not settings.SHADOW_EVAL_ENABLED:
+        return {"status": "success", "enabled": False, "data": None}
+    
+    client = get_vision_client()
+    if client:
+        try:
+            shadow = (await client.call_async("ping")).get("shadow")
+        except (VisionWorkerUnavailable, VisionWorkerError) as e:
+            raise HTTPException(status_code=503, detail=f"Worker di visione non disponibile: {e}")
+    else:
+        shadow = get_shadow_evaluator().stats()
+    
+    return {"status": "success", "enabled": True, "data": shadow}
+
 @router.get("/detections/recent")
 async def get_recent_detections(
     limit: int = 10,
@@ -337,8 +527,9 @@ async def get_recent_detections(
     try:
         from app.core.database import AIDetection
         
+        # Ordinamento sulla chiave di partizione: si leggono solo le partizioni più recenti
         detections = db.query(AIDetection)\
-            .order_by(AIDetection.created_at.desc())\
+            .order_by(AIDetection.detected_at.desc())\
             .limit(limit)\
             .all()
         
@@ -348,9 +539,9 @@ async def get_recent_detections(
                 {
                     "id": detection.id,
                     "license_plate": detection.license_plate,
-                    "confidence_score": getattr(detection, 'confidence_score', detection.confidence if hasattr(detection, 'confidence') else 0.0),
-                    "detection_data": getattr(detection, 'detection_data', {}),
-                    "is_automatic": getattr(detection, 'is_automatic', True),
+                    "confidence_score": detection.confidence,
+                    "detection_data": detection.detection_data or {},
+                    "is_automatic": detection.is_automatic,
                     "created_at": detection.created_at
                 }
                 for detection in detections
@@ -361,50 +552,6 @@ async def get_recent_detections(
         logger.error(f"Errore nel recupero rilevazioni: {e}")
         raise HTTPException(status_code=500, detail=f"Errore nel recupero: {str(e)}")
 
-@router.get("/stats")
-async def get_ai_stats(db: Session = Depends(get_db)):
-    """Ottiene statistiche del sistema AI"""
-    try:
-        from app.core.database import AIDetection, Vehicle, Appointment
-        from datetime import datetime, timedelta
-        
-        # Statistiche generali
-        total_detections = db.query(AIDetection).count()
-        total_vehicles = db.query(Vehicle).count()
-        
-        # Rilevazioni oggi
-        today = datetime.now().date()
-        today_detections = db.query(AIDetection)\
-            .filter(AIDetection.created_at >= today)\
-            .count()
-        
-        # Appuntamenti oggi
-        today_appointments = db.query(Appointment)\
-            .filter(Appointment.appointment_date >= today)\
-            .filter(Appointment.appointment_date < today + timedelta(days=1))\
-            .count()
-        
-        # Rilevazioni con appuntamenti
-        detections_with_appointments = db.query(AIDetection)\
-            .filter(AIDetection.detection_data['appointments'].astext != '[]')\
-            .count()
-        
-        return {
-            "status": "success",
-            "data": {
-                "total_detections": total_detections,
-                "total_vehicles": total_vehicles,
-                "today_detections": today_detections,
-                "today_appointments": today_appointments,
-                "detections_with_appointments": detections_with_appointments,
-                "accuracy_rate": (detections_with_appointments / total_detections * 100) if total_detections > 0 else 0
-            }
-        }
-        
-    except Exception as e:
-        logger.error(f"Errore nel recupero statistiche: {e}")
-        raise HTTPException(status_code=500, detail=f"Errore nel recupero statistiche: {str(e)}")
-
 @router.get("/plates/images")
 async def get_plate_images():
     """Ottiene la lista delle immagini delle targhe salvate"""
@@ -475,6 +622,19 @@ async def get_plate_image(filename: str):
         logger.error(f"Errore nel recupero immagine: {e}")
         raise HTTPException(status_code=500, detail=f"Errore nel recupero immagine: {str(e)}")
 
+@router.get("/clips/{filename}")
+async def get_event_clip(filename: str):
+    """Ottiene la clip di un evento (pre-roll + post-roll)"""
+    clip_path = Path(settings.CLIP_DIR) / Path(filename).name
+    if not clip_path.is_file():
+        raise HTTPException(status_code=404, detail="Clip non trovata")
+    
+    return FileResponse(
+        path=str(clip_path),
+        media_type="video/x-msvideo",
+        filename=clip_path.name
+    )
+
 @router.delete("/plates/images/{filename}")
 async def delete_plate_image(filename: str):
     """Elimina una specifica immagine di targa"""
@@ -1,38 +1,36 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from datetime import datetime, date
 from app.core.database import get_db, AppointmentStatus
 from app.schemas.appointment import Appointment, AppointmentCreate, AppointmentUpdate
 from app.services.appointment_service import AppointmentService
+from app.services.list_query import InvalidCursor, page_items
 
 router = APIRouter()
 
 @router.get("/", response_model=List[Appointment])
 def get_appointments(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     customer_id: Optional[int] = Query(None),
     status: Optional[AppointmentStatus] = Query(None),
     date_from: Optional[date] = Query(None),
     date_to: Optional[date] = Query(None),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
     db: Session = Depends(get_db)
 ):
-    """Get all appointments with optional filters"""
+    """Get appointments by date with optional filters, paginated by cursor (X-Next-Cursor header)"""
     service = AppointmentService(db)
-    appointments = service.get_appointments(skip=skip, limit=limit)
-    
-    # Apply filters
-    if customer_id:
-        appointments = [a for a in appointments if a.customer_id == customer_id]
-    if status:
-        appointments = [a for a in appointments if a.status == status]
-    if date_from:
-        appointments = [a for a in appointments if a.appointment_date.date() >= date_from]
-    if date_to:
-        appointments = [a for a in appointments if a.appointment_date.date() <= date_to]
-    
-    return appointments
+    try:
+        page = service.list_appointments(
+            limit=limit, cursor=cursor, skip=skip,
+            customer_id=customer_id, status=status, date_from=date_from, date_to=date_to
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return page_items(page, response)
 
 @router.post("/", response_model=Appointment)
 def create_appointment(
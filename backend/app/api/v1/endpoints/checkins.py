@@ -1,28 +1,33 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from datetime import datetime, date
 from app.core.database import get_db
 from app.schemas.checkin import CheckIn, CheckInCreate, CheckInUpdate
-from app.services.checkin_service import CheckInService
+from app.services.checkin_service import CheckInService, OpenCheckInExists
+from app.services.list_query import InvalidCursor, page_items
 
 router = APIRouter()
 
 @router.get("/", response_model=List[CheckIn])
 def get_checkins(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     vehicle_id: Optional[int] = Query(None),
     active_only: bool = Query(False),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
     db: Session = Depends(get_db)
 ):
-    """Get all check-ins with optional filters"""
+    """Get check-ins, newest first, with optional filters, paginated by cursor (X-Next-Cursor header)"""
     service = CheckInService(db)
-    if active_only:
-        return service.get_vehicles_in_workshop()
-    if vehicle_id:
-        return service.get_checkins_by_vehicle(vehicle_id)
-    return service.get_checkins(skip=skip, limit=limit)
+    try:
+        page = service.list_checkins(
+            limit=limit, cursor=cursor, skip=skip, vehicle_id=vehicle_id, active_only=active_only
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return page_items(page, response)
 
 @router.post("/", response_model=CheckIn)
 def create_checkin(
@@ -31,7 +36,10 @@ def create_checkin(
 ):
     """Create a new check-in"""
     service = CheckInService(db)
-    return service.create_checkin(checkin)
+    try:
+        return service.create_checkin(checkin)
+    except OpenCheckInExists as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
 
 @router.get("/{checkin_id}", response_model=CheckIn)
 def get_checkin(
@@ -53,7 +61,10 @@ def update_checkin(
 ):
     """Update a check-in"""
     service = CheckInService(db)
-    updated_checkin = service.update_checkin(checkin_id, checkin)
+    try:
+        updated_checkin = service.update_checkin(checkin_id, checkin)
+    except OpenCheckInExists as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     if not updated_checkin:
         raise HTTPException(status_code=404, detail="Check-in not found")
     return updated_checkin
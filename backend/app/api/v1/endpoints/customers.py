@@ -1,24 +1,29 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from app.core.database import get_db
 from app.schemas.customer import Customer, CustomerCreate, CustomerUpdate
 from app.services.customer_service import CustomerService
+from app.services.list_query import InvalidCursor, page_items
 
 router = APIRouter()
 
 @router.get("/", response_model=List[Customer])
 def get_customers(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     search: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
     db: Session = Depends(get_db)
 ):
-    """Get all customers with optional search"""
+    """Get customers with optional search, paginated by cursor (X-Next-Cursor header); searches return the best matches"""
     service = CustomerService(db)
-    if search:
-        return service.search_customers(search)
-    return service.get_customers(skip=skip, limit=limit)
+    try:
+        page = service.list_customers(limit=limit, cursor=cursor, skip=skip, search=search)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return page_items(page, response)
 
 @router.post("/", response_model=Customer)
 def create_customer(
@@ -0,0 +1,74 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.core.database import get_db, Job as JobModel, JobStatus
+from app.schemas.job import Job, JobCreate
+from app.services import job_handlers  # registra gli handler in JOB_HANDLERS
+from app.services.job_queue import JOB_HANDLERS, enqueue, cancel_job, retry_job
+
+router = APIRouter()
+
+@router.post("/", response_model=Job, status_code=202)
+def create_job(
+    job: JobCreate,
+    db: Session = Depends(get_db)
+):
+    """Enqueue a long-running job; poll GET /jobs/{id} for progress and result"""
+    if job.job_type not in JOB_HANDLERS:
+        raise HTTPException(status_code=400, detail=f"Unknown job type. Available: {sorted(JOB_HANDLERS)}")
+    return enqueue(
+        db, job.job_type, job.payload,
+        priority=job.priority, queue=job.queue, max_attempts=job.max_attempts, run_at=job.run_at
+    )
+
+@router.get("/", response_model=List[Job])
+def get_jobs(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    status: Optional[JobStatus] = Query(None),
+    job_type: Optional[str] = Query(None),
+    db: Session = Depends(get_db)
+):
+    """Get jobs, newest first, with optional filters"""
+    query = select(JobModel).order_by(JobModel.id.desc()).offset(skip).limit(limit)
+    if status:
+        query = query.where(JobModel.status == status)
+    if job_type:
+        query = query.where(JobModel.job_type == job_type)
+    return db.execute(query).scalars().all()
+
+@router.get("/{job_id}", response_model=Job)
+def get_job(
+    job_id: int,
+    db: Session = Depends(get_db)
+):
+    """Get a job with its status, progress and result"""
+    job = db.get(JobModel, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/{job_id}/cancel", response_model=Job)
+def cancel(
+    job_id: int,
+    db: Session = Depends(get_db)
+):
+    """Cancel a queued job, or ask a running job to stop at its next progress update"""
+    job = db.get(JobModel, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return cancel_job(db, job)
+
+@router.post("/{job_id}/retry", response_model=Job)
+def retry(
+    job_id: int,
+    db: Session = Depends(get_db)
+):
+    """Requeue a failed or cancelled job"""
+    job = db.get(JobModel, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status not in (JobStatus.FAILED, JobStatus.CANCELLED):
+        raise HTTPException(status_code=409, detail="Only failed or cancelled jobs can be retried")
+    return retry_job(db, job)
@@ -1,27 +1,30 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from app.core.database import get_db
 from app.schemas.service import Service, ServiceCreate, ServiceUpdate
+from app.services.list_query import InvalidCursor, page_items
 from app.services.service_service import ServiceService
 
 router = APIRouter()
 
 @router.get("/", response_model=List[Service])
 def get_services(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     search: Optional[str] = Query(None),
     category: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
     db: Session = Depends(get_db)
 ):
-    """Get all services with optional filters"""
+    """Get services with optional filters, paginated by cursor (X-Next-Cursor header); searches return the best matches"""
     service = ServiceService(db)
-    if category:
-        return service.get_services_by_category(category)
-    if search:
-        return service.search_services(search)
-    return service.get_services(skip=skip, limit=limit)
+    try:
+        page = service.list_services(limit=limit, cursor=cursor, skip=skip, search=search, category=category)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return page_items(page, response)
 
 @router.post("/", response_model=Service)
 def create_service(
@@ -1,27 +1,30 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from app.core.database import get_db
 from app.schemas.vehicle import Vehicle, VehicleCreate, VehicleUpdate
+from app.services.list_query import InvalidCursor, page_items
 from app.services.vehicle_service import VehicleService
 
 router = APIRouter()
 
 @router.get("/", response_model=List[Vehicle])
 def get_vehicles(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     search: Optional[str] = Query(None),
     customer_id: Optional[int] = Query(None),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
     db: Session = Depends(get_db)
 ):
-    """Get all vehicles with optional filters"""
+    """Get vehicles with optional filters, paginated by cursor (X-Next-Cursor header); searches return the best matches"""
     service = VehicleService(db)
-    if customer_id:
-        return service.get_vehicles_by_customer(customer_id)
-    if search:
-        return service.search_vehicles(search)
-    return service.get_vehicles(skip=skip, limit=limit)
+    try:
+        page = service.list_vehicles(limit=limit, cursor=cursor, skip=skip, search=search, customer_id=customer_id)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return page_items(page, response)
 
 @router.post("/", response_model=Vehicle)
 def create_vehicle(
@@ -0,0 +1,292 @@
+"""
+Controllo di ammissione per le route /ai costose in CPU.
+
+Tre livelli:
+- TokenBucket: limite di frequenza per route (429 + Retry-After);
+- RouteLimiter: richieste contemporanee per route con una coda limitata;
+  con la coda piena la richiesta fallisce subito (503 + Retry-After) invece
+  di accumularsi e rallentare tutto il resto dell'API;
+- InferenceGate: slot di inferenza condivisi nel processo, assegnati per
+  priorità; il livestream passa sempre davanti ai caricamenti manuali, che
+  inoltre non possono occupare gli slot riservati alle telecamere.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.core.metrics import record_admission_rejected, set_inference_queue_depth
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_LIVE = 0
+PRIORITY_UPLOAD = 1
+
+_PRIORITY_NAMES = {PRIORITY_LIVE: "live", PRIORITY_UPLOAD: "upload"}
+
+
+class Overloaded(Exception):
+    """Richiesta rifiutata per sovraccarico; retry_after in secondi"""
+
+    def __init__(self, message: str, retry_after: float, status_code: int = 503, reason: str = "queue_full"):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.status_code = status_code
+        self.reason = reason
+
+    def to_http(self) -> HTTPException:
+        return HTTPException(
+            status_code=self.status_code,
+            detail=str(self),
+            headers={"Retry-After": str(self.retry_after)}
+        )
+
+
+class TokenBucket:
+    """Token bucket thread-safe: `rate` token al secondo, al massimo `burst` accumulati"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        """0 se il token è stato preso, altrimenti i secondi di attesa per il prossimo"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate if self.rate > 0 else 60.0
+
+
+class _ServiceTime:
+    """Media mobile esponenziale della durata di una richiesta, per stimare Retry-After"""
+
+    def __init__(self, initial: float = 1.0, alpha: float = 0.2):
+        self.value = initial
+        self.alpha = alpha
+
+    def observe(self, duration: float):
+        self.value += self.alpha * (duration - self.value)
+
+
+class RouteLimiter:
+    """
+    Al massimo `max_concurrent` richieste in esecuzione e `max_queue` in attesa
+    per una route; oltre, Overloaded. Va usato dall'event loop dell'API.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, rate: float = 0, burst: int = 1):
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._service_time = _ServiceTime()
+
+    def _estimate_wait(self) -> float:
+        return (self.waiting + 1) * self._service_time.value / self.max_concurrent
+
+    def check(self):
+        """Rifiuta subito le richieste oltre il limite di frequenza o con la coda piena"""
+        if self.bucket:
+            wait = self.bucket.try_acquire()
+            if wait > 0:
+                record_admission_rejected(self.name, "rate_limited")
+                raise Overloaded("Troppe richieste, riprovare più tardi", wait, status_code=429, reason="rate_limited")
+        if self.in_flight >= self.max_concurrent and self.waiting >= self.max_queue:
+            record_admission_rejected(self.name, "queue_full")
+            raise Overloaded("Servizio di riconoscimento sovraccarico, riprovare più tardi", self._estimate_wait())
+
+    async def enter(self):
+        self.check()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        return time.monotonic()
+
+    def exit(self, started: float):
+        self.in_flight -= 1
+        self._service_time.observe(time.monotonic() - started)
+        self._semaphore.release()
+
+    def stats(self) -> Dict:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "avg_seconds": round(self._service_time.value, 3)
+        }
+
+
+class InferenceGate:
+    """
+    Slot di inferenza del processo assegnati per priorità (valore più basso
+    prima, poi in ordine di arrivo). I caricamenti possono usare al massimo
+    `slots - reserved_live` slot e restare in coda in `max_upload_waiting`;
+    il livestream non viene mai rifiutato.
+    """
+
+    def __init__(self, slots: int, reserved_live: int = 1, max_upload_waiting: int = 8):
+        self.slots = max(1, slots)
+        self.upload_slots = max(1, self.slots - reserved_live)
+        self.max_upload_waiting = max_upload_waiting
+        self._busy = 0
+        self._busy_uploads = 0
+        self._waiters = []  # heap di (priorità, seq, evento)
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._service_time = _ServiceTime()
+
+    def _can_run(self, priority: int) -> bool:
+        if self._busy >= self.slots:
+            return False
+        return priority == PRIORITY_LIVE or self._busy_uploads < self.upload_slots
+
+    def _waiting(self, priority: int) -> int:
+        return sum(1 for p, _, _ in self._waiters if p == priority)
+
+    @contextmanager
+    def slot(self, priority: int = PRIORITY_UPLOAD, timeout: float = None):
+        self.acquire(priority, timeout)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._service_time.observe(time.monotonic() - started)
+            self.release(priority)
+
+    def acquire(self, priority: int, timeout: float = None):
+        with self._lock:
+            if self._can_run(priority) and not any(p <= priority for p, _, _ in self._waiters):
+                self._take(priority)
+                return
+            if priority != PRIORITY_LIVE and self._waiting(priority) >= self.max_upload_waiting:
+                record_admission_rejected("inference", "queue_full")
+                raise Overloaded(
+                    "Coda di inferenza piena, riprovare più tardi",
+                    (len(self._waiters) + 1) * self._service_time.value / self.slots
+                )
+            entry = (priority, next(self._counter), threading.Event())
+            heapq.heappush(self._waiters, entry)
+            self._publish_depth()
+
+        if not entry[2].wait(timeout):
+            with self._lock:
+                if not entry[2].is_set():
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    self._publish_depth()
+                    raise Overloaded("Tempo di attesa per l'inferenza scaduto", self._service_time.value)
+        # Lo slot è stato assegnato da release()
+
+    def release(self, priority: int):
+        with self._lock:
+            self._busy -= 1
+            if priority != PRIORITY_LIVE:
+                self._busy_uploads -= 1
+            self._wake()
+
+    def _take(self, priority: int):
+        self._busy += 1
+        if priority != PRIORITY_LIVE:
+            self._busy_uploads += 1
+
+    def _wake(self):
+        # Il primo in coda per priorità; un caricamento senza slot disponibili
+        # non blocca un livestream arrivato dopo
+        woken = True
+        while woken:
+            woken = False
+            for entry in sorted(self._waiters):
+                if self._can_run(entry[0]):
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    self._take(entry[0])
+                    entry[2].set()
+                    woken = True
+                    break
+        self._publish_depth()
+
+    def _publish_depth(self):
+        for priority, name in _PRIORITY_NAMES.items():
+            set_inference_queue_depth(name, self._waiting(priority))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "slots": self.slots,
+                "busy": self._busy,
+                "busy_uploads": self._busy_uploads,
+                "waiting_live": self._waiting(PRIORITY_LIVE),
+                "waiting_uploads": self._waiting(PRIORITY_UPLOAD),
+                "avg_seconds": round(self._service_time.value, 3)
+            }
+
+
+inference_gate = InferenceGate(
+    settings.INFERENCE_SLOTS,
+    reserved_live=settings.INFERENCE_RESERVED_LIVE_SLOTS,
+    max_upload_waiting=settings.INFERENCE_MAX_UPLOAD_WAITING
+)
+
+_route_limiters: Dict[str, RouteLimiter] = {}
+
+
+def route_limiter(name: str) -> RouteLimiter:
+    """Limiter della route `name` configurato da ADMISSION_LIMITS (creato al primo uso)"""
+    if name not in _route_limiters:
+        limits = settings.ADMISSION_LIMITS.get(name, {})
+        _route_limiters[name] = RouteLimiter(
+            name,
+            max_concurrent=int(limits.get("concurrency", 2)),
+            max_queue=int(limits.get("queue", 8)),
+            rate=limits.get("rate", 0),
+            burst=int(limits.get("burst", 1))
+        )
+    return _route_limiters[name]
+
+
+def admission(name: str):
+    """Dipendenza FastAPI: ammette la richiesta nella route `name` o risponde 429/503 con Retry-After"""
+    limiter = route_limiter(name)
+
+    async def dependency():
+        try:
+            started = await limiter.enter()
+        except Overloaded as e:
+            raise e.to_http()
+        try:
+            yield
+        finally:
+            limiter.exit(started)
+
+    return dependency
+
+
+def admission_stats() -> Dict:
+    return {
+        "routes": {name: limiter.stats() for name, limiter in _route_limiters.items()},
+        "inference": inference_gate.stats()
+    }
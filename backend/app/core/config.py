@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List, Optional
+from typing import List, Optional, Dict, Any
 import os
 
 class Settings(BaseSettings):
@@ -49,7 +49,207 @@ class Settings(BaseSettings):
     # Monitoring
     ENABLE_METRICS: bool = True
     METRICS_PORT: int = 9090
-    
+
+    # Startup: "cached" esegue create_all solo se i modelli cambiano, "always" a ogni
+    # avvio, "skip" mai (schema gestito dalle migrazioni)
+    SCHEMA_CHECK_MODE: str = "cached"
+    SCHEMA_CACHE_PATH: str = ".schema_cache"
+    # Carica YOLO/EasyOCR all'avvio invece che al primo utilizzo
+    VISION_PRELOAD: bool = False
+
+    # Worker di visione dedicato (python -m app.vision_worker): se il socket è
+    # configurato, inferenza e livestream passano dal worker invece che dal processo API
+    VISION_WORKER_SOCKET: Optional[str] = None
+    VISION_WORKER_AUTHKEY: Optional[str] = None  # default: SECRET_KEY
+    VISION_WORKER_TIMEOUT_SECONDS: float = 30.0
+    VISION_WORKER_POOL_SIZE: int = 4
+    VISION_WORKER_ID: Optional[str] = None  # default: hostname-pid
+
+    # Assegnazione delle telecamere ai worker di visione tramite lease su database:
+    # ogni worker monitora la sua quota di CAMERAS e rinnova i lease con un heartbeat
+    CAMERA_LEASES_ENABLED: bool = False
+    CAMERA_LEASE_TTL_SECONDS: int = 30
+    CAMERA_LEASE_HEARTBEAT_SECONDS: int = 10
+
+    # Telecamere: id, url dello stream e ruolo (entrance, exit, both); opzionali
+    # "weight" (quota di inferenza, default 1) e "min_fps" (fps minimo garantito
+    # anche sotto carico, es. per le telecamere di uscita che chiudono i check-in),
+    # "substream_url" (stream a bassa risoluzione per il doppio stream)
+    CAMERAS: List[Dict[str, Any]] = [
+        {"id": "webcam", "url": "rtsp://host.docker.internal:8554/webcam", "role": "both"}
+    ]
+
+    # Doppio stream: con "substream_url" in CAMERAS movimento e rilevamento girano sul
+    # substream a bassa risoluzione; il main stream viene convertito solo per l'OCR
+    DUAL_STREAM_ENABLED: bool = True
+    DUAL_STREAM_MAX_SKEW_SECONDS: float = 0.5  # oltre, OCR sul ritaglio del substream
+    DUAL_STREAM_FETCH_TIMEOUT_SECONDS: float = 0.3
+    DUAL_STREAM_CROP_PADDING: float = 0.15
+    # Cattura dei livestream: "opencv" oppure "ffmpeg" (processo ffmpeg con decodifica
+    # ridotta a scena ferma: solo keyframe o bassa risoluzione, piena al primo movimento)
+    CAPTURE_BACKEND: str = "opencv"
+    CAPTURE_IDLE_MODE: str = "keyframes"  # keyframes, lowres, full (nessun cambio di modo)
+    # Il ritorno a "full" richiede handshake RTSP + keyframe (1-2 s, misurato in decode_status
+    # e con benchmarks/bench_decode_wakeup.py): nel frattempo arrivano i frame del modo ridotto
+    CAPTURE_IDLE_AFTER_SECONDS: float = 10.0
+    CAPTURE_LOWRES_WIDTH: int = 640
+    FFMPEG_PATH: str = "ffmpeg"
+    MOTION_GATE_WIDTH: int = 160
+    MOTION_GATE_THRESHOLD: int = 25
+    MOTION_GATE_MIN_AREA: float = 0.002  # frazione di pixel cambiati
+    MOTION_GATE_HOLD_SECONDS: float = 2.0
+    MOTION_GATE_BACKGROUND_SECONDS: float = 2.0  # costante di tempo dell'aggiornamento dello sfondo
+
+    # Snapshot di POST /ai/stream: ultimo frame del monitoraggio se la telecamera è già
+    # monitorata (entro SNAPSHOT_MAX_FRAME_AGE_SECONDS), altrimenti cattura persistente
+    # in pool, chiusa dopo SNAPSHOT_IDLE_SECONDS senza richieste
+    SNAPSHOT_MAX_FRAME_AGE_SECONDS: float = 5.0
+    SNAPSHOT_IDLE_SECONDS: float = 60.0
+    SNAPSHOT_MAX_CAPTURES: int = 4
+    SNAPSHOT_TIMEOUT_SECONDS: float = 2.0
+
+    # Clip degli eventi: pre-roll in memoria (JPEG) + post-roll, al posto della registrazione continua
+    CLIP_RECORDING_ENABLED: bool = True
+    CLIP_DIR: str = "uploads/clips"
+    CLIP_PRE_ROLL_SECONDS: float = 5.0
+    CLIP_POST_ROLL_SECONDS: float = 5.0
+    CLIP_MAX_SECONDS: float = 60.0
+    CLIP_FPS: float = 5.0
+    CLIP_JPEG_QUALITY: int = 70
+    CLIP_BUFFER_MAX_MB: int = 20  # per telecamera
+    # Una targa che resta in vista (auto parcheggiata) non avvia nuove clip finché
+    # non sparisce per almeno questi secondi; i cambi di check-in avviano sempre la clip
+    CLIP_PLATE_DEBOUNCE_SECONDS: float = 300.0
+
+    # Scheduler dell'inferenza tra le telecamere del worker di visione
+    CAMERA_SCHEDULER_ENABLED: bool = True
+    CAMERA_SCHEDULER_MAX_FRAME_AGE_SECONDS: float = 1.0  # frame più vecchi vengono scartati
+    CAMERA_SCHEDULER_FPS_WINDOW_SECONDS: float = 10.0
+
+    # Tracking delle targhe tra frame (IoU): OCR solo sulle prime letture di ogni traccia
+    TRACKER_IOU_THRESHOLD: float = 0.3
+    TRACKER_MAX_AGE_SECONDS: float = 2.0
+    TRACKER_MIN_HITS: int = 3
+    TRACKER_MAX_OCR_READS: int = 5
+
+    # Edge agent (python -m app.edge_agent): cattura, rilevamento, tracking e OCR
+    # vicino alla telecamera, senza database; i passaggi vengono inviati all'API centrale
+    EDGE_CAMERA_ID: str = "edge"
+    EDGE_STREAM_URL: Optional[str] = None  # default: url della prima telecamera in CAMERAS
+    EDGE_INGEST_URL: str = "http://localhost:8000/api/v1/ai/ingest"
+    EDGE_API_TOKEN: Optional[str] = None
+    EDGE_TARGET_FPS: float = 10.0
+    EDGE_SEND_CROPS: bool = True
+    EDGE_BATCH_SIZE: int = 50
+    EDGE_FLUSH_INTERVAL_SECONDS: float = 5.0
+    EDGE_SPOOL_DIR: str = "edge_spool"
+    EDGE_SPOOL_MAX_MB: int = 500
+
+    # Acquisizione a lotti degli eventi targa (POST /ai/ingest)
+    INGEST_API_KEYS: List[str] = []  # vuoto: nessuna autenticazione, come gli altri endpoint AI
+    INGEST_MAX_BODY_BYTES: int = 20 * 1024 * 1024
+    INGEST_MAX_DECOMPRESSED_BYTES: int = 200 * 1024 * 1024
+    INGEST_MAX_EVENTS: int = 20000
+    INGEST_SAVE_CROPS: bool = True
+
+    # Controllo di ammissione per le route /ai costose in CPU
+    # concurrency: richieste in esecuzione, queue: in attesa (oltre: 503),
+    # rate/burst: token bucket in richieste al secondo (oltre: 429)
+    ADMISSION_LIMITS: Dict[str, Dict[str, float]] = {
+        "detect": {"concurrency": 2, "queue": 8, "rate": 5, "burst": 10},
+        "stream": {"concurrency": 1, "queue": 2, "rate": 1, "burst": 3},
+        "ingest": {"concurrency": 4, "queue": 16, "rate": 20, "burst": 40},
+    }
+    INFERENCE_SLOTS: int = 2  # inferenze contemporanee nel processo
+    INFERENCE_RESERVED_LIVE_SLOTS: int = 1  # slot che i caricamenti manuali non possono usare
+    INFERENCE_MAX_UPLOAD_WAITING: int = 8
+
+    # Coda di job persistente (python -m app.job_worker)
+    JOB_WORKER_ID: Optional[str] = None  # default: hostname-pid
+    JOB_WORKER_QUEUES: List[str] = ["default"]
+    JOB_WORKER_CONCURRENCY: int = 2
+    JOB_POLL_INTERVAL_SECONDS: float = 1.0
+    JOB_HEARTBEAT_SECONDS: int = 15
+    JOB_STALE_SECONDS: int = 120  # job "running" senza heartbeat: il worker è morto, si rimette in coda
+    JOB_RETRY_BASE_SECONDS: int = 30
+    JOB_RETRY_MAX_SECONDS: int = 3600
+    JOB_EXPORT_DIR: str = "uploads/exports"
+    RECOGNITION_BACKFILL_WORKERS: int = 2  # processi OCR per la rielaborazione dell'archivio targhe
+    RECOGNITION_BACKFILL_BATCH_SIZE: int = 200  # rilevazioni per lotto (e per checkpoint)
+
+    # Archiviazione delle rilevazioni: ai_detections partizionata per mese (Postgres),
+    # rollup orari per telecamera e veicolo trovato/sconosciuto letti dalle statistiche,
+    # retention delle partizioni grezze (0 = nessuna; i rollup restano). La manutenzione
+    # è un job ricorrente accodato all'avvio del job worker
+    DETECTION_MAINTENANCE_ENABLED: bool = True
+    DETECTION_MAINTENANCE_INTERVAL_MINUTES: int = 15
+    DETECTION_PARTITIONS_AHEAD_MONTHS: int = 2
+    DETECTION_RETENTION_MONTHS: int = 12
+    DETECTION_ROLLUP_LOOKBACK_HOURS: int = 24  # ore ricalcolate a ogni esecuzione (eventi in ritardo)
+
+    # Cache in memoria di /ai/stats e /ai/statistics/ (0 = sempre dal database)
+    STATS_CACHE_TTL_SECONDS: int = 10
+
+    # Automatic check-in/check-out from plate passes
+    AUTO_CHECKIN_ENABLED: bool = True
+    AUTO_CHECKIN_DEDUP_SECONDS: int = 30
+    AUTO_CHECKIN_DEBOUNCE_SECONDS: int = 300
+    # Stato dei veicoli in memoria: i cambi fatti da altri processi si vedono entro questo tempo
+    AUTO_CHECKIN_STATE_TTL_SECONDS: float = 60.0
+
+    # Plate lookup cache (targa -> veicolo/cliente/appuntamenti del giorno)
+    PLATE_CACHE_MAX_SIZE: int = 5000
+    PLATE_CACHE_TTL_SECONDS: int = 900
+    PLATE_CACHE_NEGATIVE_TTL_SECONDS: int = 60
+    PLATE_CACHE_WARMUP_HOUR: int = 6
+    PLATE_CACHE_SYNC_SECONDS: float = 5.0  # invalidazioni tra processi e nodi (0 = processo unico)
+
+    # Privacy redaction (volti e targhe nello stream di output)
+    REDACTION_ENABLED: bool = True
+    REDACTION_BUDGET_MS: float = 12.0
+    REDACTION_FACE_DETECT_WIDTH: int = 320
+    REDACTION_FACE_DETECT_INTERVAL: int = 5
+    REDACTION_PIXEL_BLOCK: int = 12
+
+    # Plate engine (rilevatore + riconoscitore)
+    PLATE_DETECTOR_BACKEND: str = "yolo"
+    PLATE_DETECTOR_MODEL_PATH: str = "models/license_plate_detector.pt"
+    PLATE_DETECTOR_CONFIDENCE: float = 0.5
+    PLATE_RECOGNIZER_BACKEND: str = "easyocr"
+    PLATE_OCR_LANGUAGES: List[str] = ["it", "en"]
+    PLATE_MAX_CANDIDATES: int = 5
+
+    # Valutazione in ombra di un modello candidato sul traffico reale delle telecamere
+    SHADOW_EVAL_ENABLED: bool = False
+    SHADOW_DETECTOR_BACKEND: str = "yolo"
+    SHADOW_DETECTOR_MODEL_PATH: str = "models/license_plate_detector_candidate.pt"
+    SHADOW_RECOGNIZER_BACKEND: str = "easyocr"
+    SHADOW_SAMPLE_RATE: float = 0.05  # frazione dei frame inviati anche al candidato
+    SHADOW_CPU_SHARE: float = 0.25  # CPU media concessa al candidato (frazione di un core)
+    SHADOW_DIR: str = "uploads/shadow"  # disaccordi in JSONL (+ frame se SHADOW_SAVE_FRAMES)
+    SHADOW_SAVE_FRAMES: bool = True
+
+    # Cache delle letture OCR per hash percettivo del ritaglio targa normalizzato
+    OCR_CACHE_ENABLED: bool = True
+    OCR_CACHE_MAX_SIZE: int = 1024
+    OCR_CACHE_TTL_SECONDS: int = 300
+    OCR_CACHE_MAX_DISTANCE: int = 4  # bit diversi ammessi su 256 (0 = solo hash identico)
+    OCR_CACHE_MAX_PIXEL_DIFF: int = 48  # verifica sulla miniatura 64x16: scarto massimo per punto
+
+    # Cache dei risultati di /ai/detect per contenuto dell'immagine (SHA-256)
+    DETECTION_CACHE_MAX_SIZE: int = 256
+    DETECTION_CACHE_TTL_SECONDS: int = 600
+
+    # Batched detection persistence
+    DETECTION_SINK_BATCH_SIZE: int = 200
+    DETECTION_SINK_FLUSH_INTERVAL_MS: int = 500
+    DETECTION_SINK_MAX_QUEUE: int = 10000
+    DETECTION_SINK_MAX_ATTEMPTS: int = 3
+    DETECTION_SINK_DEAD_LETTER_PATH: str = "detection_dead_letter.jsonl"  # righe rifiutate dal database
+
+    # Shared-memory frame transport
+    FRAME_RING_SLOTS: int = 8
+
     class Config:
         env_file = ".env"
         case_sensitive = True
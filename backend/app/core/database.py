@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Float, Boolean, ForeignKey, JSON, Enum as SQLEnum, Time
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Float, Boolean, ForeignKey, JSON, Enum as SQLEnum, Time, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from sqlalchemy.sql import func
@@ -33,6 +33,13 @@ class AppointmentStatus(enum.Enum):
     COMPLETED = "completed"
     CANCELLED = "cancelled"
 
+class JobStatus(enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
 class InvoiceStatus(enum.Enum):
     DRAFT = "draft"
     SENT = "sent"
@@ -144,6 +151,14 @@ class CheckIn(Base):
     # Relationships
     vehicle = relationship("Vehicle", back_populates="checkins")
 
+    # Al più un check-in aperto per veicolo
+    __table_args__ = (
+        Index(
+            "idx_checkins_open_vehicle", "vehicle_id", unique=True,
+            postgresql_where=checkout_time.is_(None), sqlite_where=checkout_time.is_(None)
+        ),
+    )
+
 class Invoice(Base):
     __tablename__ = "invoices"
     
@@ -172,13 +187,100 @@ class AIDetection(Base):
     image_path = Column(String)
     processed = Column(Boolean, default=False)
     vehicle_id = Column(Integer, ForeignKey("vehicles.id"))
-    detected_at = Column(DateTime(timezone=True), server_default=func.now())
+    detection_data = Column(JSON)  # risultato strutturato (veicolo, cliente, appuntamenti, bbox)
+    is_automatic = Column(Boolean, default=False)
+    source = Column(String)  # camera, upload, stream
+    # Chiave di idempotenza degli eventi acquisiti; l'unicità è garantita da ai_detection_event_keys
+    # (su Postgres la tabella è partizionata per detected_at e non ammette un indice unico sul solo event_id)
+    event_id = Column(String, index=True)
+    clip_path = Column(String)  # clip dell'evento (pre-roll + post-roll), scritta dopo il post-roll
+    detected_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())  # chiave di partizione
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
     # Relationships
     vehicle = relationship("Vehicle", back_populates="ai_detections")
 
+class AIDetectionEventKey(Base):
+    __tablename__ = "ai_detection_event_keys"
+    
+    event_id = Column(String, primary_key=True)
+    detected_at = Column(DateTime(timezone=True), nullable=False)  # per la retention insieme alle partizioni
+
+class AIDetectionRollup(Base):
+    __tablename__ = "ai_detection_rollups_hourly"
+    
+    bucket = Column(DateTime(timezone=True), primary_key=True)  # inizio dell'ora
+    camera_id = Column(String, primary_key=True)  # source della rilevazione, '' per upload e stream manuali
+    vehicle_found = Column(Boolean, primary_key=True)
+    detections = Column(Integer, nullable=False, default=0)
+    processed = Column(Integer, nullable=False, default=0)
+    with_appointments = Column(Integer, nullable=False, default=0)
+    confidence_sum = Column(Float, nullable=False, default=0.0)
+
+class AIDetectionRollupDirtyHour(Base):
+    __tablename__ = "ai_detection_rollup_dirty_hours"
+    
+    # Ore già aggregate le cui rilevazioni sono cambiate dopo il rollup (backfill,
+    # modifiche, eventi in ritardo): il prossimo rollup le ricalcola
+    bucket = Column(DateTime(timezone=True), primary_key=True)
+    marked_at = Column(DateTime(timezone=True), nullable=False)
+
+class VisionWorkerNode(Base):
+    __tablename__ = "vision_workers"
+    
+    worker_id = Column(String, primary_key=True)
+    hostname = Column(String)
+    started_at = Column(DateTime(timezone=True), server_default=func.now())
+    heartbeat_at = Column(DateTime(timezone=True), nullable=False)
+
+class CameraLease(Base):
+    __tablename__ = "camera_leases"
+    
+    camera_id = Column(String, primary_key=True)
+    worker_id = Column(String)  # NULL = telecamera libera
+    lease_expires_at = Column(DateTime(timezone=True))
+    acquired_at = Column(DateTime(timezone=True))
+    stopped = Column(Boolean, nullable=False, default=False)  # fermata da /ai/livestream/stop: nessun lease
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class PlateCacheInvalidation(Base):
+    __tablename__ = "plate_cache_invalidations"
+    
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)  # plate, vehicle, customer
+    key = Column(String, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class Job(Base):
+    __tablename__ = "jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    queue = Column(String, nullable=False, default="default")
+    job_type = Column(String, nullable=False)
+    payload = Column(JSON)
+    status = Column(
+        SQLEnum(JobStatus, name="job_status", values_callable=lambda statuses: [s.value for s in statuses]),
+        nullable=False,
+        default=JobStatus.QUEUED
+    )
+    priority = Column(Integer, nullable=False, default=0)  # più alto = prima
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())  # prossimo tentativo
+    locked_by = Column(String)
+    heartbeat_at = Column(DateTime(timezone=True))
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    progress = Column(Float, nullable=False, default=0.0)
+    progress_message = Column(String)
+    result = Column(JSON)
+    checkpoint = Column(JSON)  # stato salvato dall'handler per riprendere dopo un'interruzione
+    error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
 class AuditLog(Base):
     __tablename__ = "audit_logs"
     
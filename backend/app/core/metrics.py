@@ -40,6 +40,127 @@ EXPORT_REQUESTS = Counter(
     ['format', 'status']
 )
 
+PLATE_CACHE_LOOKUPS = Counter(
+    'plate_cache_lookups_total',
+    'Plate cache lookups',
+    ['result']
+)
+
+PLATE_CACHE_EVICTIONS = Counter(
+    'plate_cache_evictions_total',
+    'Plate cache entries evicted because the cache was full'
+)
+
+PLATE_CACHE_SIZE = Gauge(
+    'plate_cache_entries',
+    'Number of entries currently held by the plate cache'
+)
+
+REDACTION_DURATION = Histogram(
+    'redaction_duration_seconds',
+    'Time spent redacting faces and plates in a frame',
+    buckets=(0.001, 0.002, 0.004, 0.008, 0.016, 0.032, 0.064)
+)
+
+REDACTION_BUDGET_OVERRUNS = Counter(
+    'redaction_budget_overruns_total',
+    'Frames whose redaction exceeded the configured time budget'
+)
+
+DETECTION_SINK_ROWS = Counter(
+    'detection_sink_rows_total',
+    'Detections written by the batched detection sink',
+    ['status']
+)
+
+DETECTION_SINK_FLUSHES = Counter(
+    'detection_sink_flushes_total',
+    'Batched detection inserts',
+    ['status']
+)
+
+DETECTION_SINK_DROPPED = Counter(
+    'detection_sink_dropped_total',
+    'Detections dropped because the sink queue was full'
+)
+
+DETECTION_SINK_QUEUE = Gauge(
+    'detection_sink_queue_size',
+    'Detections waiting to be written'
+)
+
+CAMERA_LEASES_OWNED = Gauge(
+    'camera_leases_owned',
+    'Cameras currently leased by this vision worker'
+)
+
+CAMERA_LEASE_EVENTS = Counter(
+    'camera_lease_events_total',
+    'Camera lease changes on this vision worker',
+    ['event']
+)
+
+JOBS_FINISHED = Counter(
+    'jobs_finished_total',
+    'Jobs finished by the job workers',
+    ['job_type', 'status']
+)
+
+JOB_DURATION = Histogram(
+    'job_duration_seconds',
+    'Time spent running a job attempt',
+    ['job_type'],
+    buckets=(0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600)
+)
+
+ADMISSION_REJECTED = Counter(
+    'admission_rejected_total',
+    'Requests rejected by admission control',
+    ['route', 'reason']
+)
+
+INFERENCE_QUEUE_DEPTH = Gauge(
+    'inference_queue_depth',
+    'Inference requests waiting for a slot',
+    ['priority']
+)
+
+CAMERA_INFERENCE_FPS = Gauge(
+    'camera_inference_fps',
+    'Frames per second actually run through inference for each camera',
+    ['camera_id']
+)
+
+CAMERA_FRAMES_DROPPED = Counter(
+    'camera_frames_dropped_total',
+    'Frames dropped by the camera scheduler because a newer frame arrived or they got too old',
+    ['camera_id']
+)
+
+OCR_CACHE_LOOKUPS = Counter(
+    'ocr_cache_lookups_total',
+    'OCR and detection result cache lookups',
+    ['cache', 'result']
+)
+
+OCR_CACHE_SIZE = Gauge(
+    'ocr_cache_entries',
+    'Number of entries currently held by the OCR and detection result caches',
+    ['cache']
+)
+
+SHADOW_COMPARISONS = Counter(
+    'shadow_comparisons_total',
+    'Frames run through both the production and the candidate plate engine, by outcome',
+    ['camera_id', 'outcome']
+)
+
+SHADOW_INFERENCE_DURATION = Histogram(
+    'shadow_inference_duration_seconds',
+    'Inference time on the frames sampled for shadow evaluation',
+    ['model']
+)
+
 def setup_metrics():
     """Initialize metrics"""
     logger.info("Setting up Prometheus metrics")
@@ -71,3 +192,79 @@ def record_email_ingestion(status: str, provider: str):
 def record_export_request(format: str, status: str):
     """Record export request"""
     EXPORT_REQUESTS.labels(format=format, status=status).inc()
+
+def record_plate_cache_lookup(result: str):
+    """Record a plate cache lookup (hit, miss, negative_hit)"""
+    PLATE_CACHE_LOOKUPS.labels(result=result).inc()
+
+def record_plate_cache_eviction():
+    """Record a plate cache eviction"""
+    PLATE_CACHE_EVICTIONS.inc()
+
+def set_plate_cache_size(count: int):
+    """Set the number of entries in the plate cache"""
+    PLATE_CACHE_SIZE.set(count)
+
+def record_redaction_duration(duration: float):
+    """Record time spent redacting a frame"""
+    REDACTION_DURATION.observe(duration)
+
+def record_redaction_budget_overrun():
+    """Record a frame whose redaction exceeded the budget"""
+    REDACTION_BUDGET_OVERRUNS.inc()
+
+def record_detection_sink_flush(status: str, rows: int):
+    """Record a batched detection insert"""
+    DETECTION_SINK_FLUSHES.labels(status=status).inc()
+    DETECTION_SINK_ROWS.labels(status=status).inc(rows)
+
+def record_detection_sink_dropped():
+    """Record a detection dropped by the sink"""
+    DETECTION_SINK_DROPPED.inc()
+
+def set_detection_sink_queue_size(count: int):
+    """Set the number of detections waiting in the sink queue"""
+    DETECTION_SINK_QUEUE.set(count)
+
+def set_camera_leases_owned(count: int):
+    """Set the number of cameras leased by this worker"""
+    CAMERA_LEASES_OWNED.set(count)
+
+def record_camera_lease_event(event: str):
+    """Record a camera lease change (acquired, released, lost, fenced, stopped)"""
+    CAMERA_LEASE_EVENTS.labels(event=event).inc()
+
+def record_job_finished(job_type: str, status: str, duration: float):
+    """Record a finished job attempt (succeeded, retry, failed, cancelled, lost)"""
+    JOBS_FINISHED.labels(job_type=job_type, status=status).inc()
+    JOB_DURATION.labels(job_type=job_type).observe(duration)
+
+def record_admission_rejected(route: str, reason: str):
+    """Record a request rejected by admission control (rate_limited, queue_full)"""
+    ADMISSION_REJECTED.labels(route=route, reason=reason).inc()
+
+def set_inference_queue_depth(priority: str, count: int):
+    """Set the number of inference requests waiting for a slot"""
+    INFERENCE_QUEUE_DEPTH.labels(priority=priority).set(count)
+
+def set_camera_inference_fps(camera_id: str, fps: float):
+    """Set the effective inference fps of a camera"""
+    CAMERA_INFERENCE_FPS.labels(camera_id=camera_id).set(fps)
+
+def record_camera_frame_dropped(camera_id: str):
+    """Record a frame dropped by the camera scheduler"""
+    CAMERA_FRAMES_DROPPED.labels(camera_id=camera_id).inc()
+
+def record_ocr_cache_lookup(cache: str, result: str):
+    """Record an OCR/detection result cache lookup (hit or miss)"""
+    OCR_CACHE_LOOKUPS.labels(cache=cache, result=result).inc()
+
+def set_ocr_cache_size(cache: str, count: int):
+    """Set the number of entries held by an OCR/detection result cache"""
+    OCR_CACHE_SIZE.labels(cache=cache).set(count)
+
+def record_shadow_comparison(camera_id: str, outcome: str, primary_seconds: float, shadow_seconds: float):
+    """Record a production vs candidate comparison on a sampled frame"""
+    SHADOW_COMPARISONS.labels(camera_id=camera_id, outcome=outcome).inc()
+    SHADOW_INFERENCE_DURATION.labels(model="primary").observe(primary_seconds)
+    SHADOW_INFERENCE_DURATION.labels(model="shadow").observe(shadow_seconds)
@@ -0,0 +1,180 @@
+"""
+Strumenti per un avvio rapido dell'API: misura dei tempi di import per modulo
+e verifica dello schema del database con cache.
+
+Questo modulo usa solo la libreria standard, così può essere importato prima di
+tutto il resto in `app.main` e misurare anche gli import di FastAPI e SQLAlchemy.
+"""
+import hashlib
+import importlib.abc
+import json
+import logging
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _TimedLoader(importlib.abc.Loader):
+    """Loader che delega a quello originale misurando il tempo di esecuzione del modulo"""
+
+    def __init__(self, loader, recorder: "ImportTimer"):
+        self._loader = loader
+        self._recorder = recorder
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._recorder._enter()
+        started = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._recorder._exit(module.__name__, time.perf_counter() - started)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class ImportTimer(importlib.abc.MetaPathFinder):
+    """
+    Finder che registra, per ogni modulo importato durante l'avvio, il tempo
+    inclusivo (con i sotto-import) e il tempo proprio del modulo.
+    """
+
+    def __init__(self):
+        self.inclusive: Dict[str, float] = {}
+        self.self_time: Dict[str, float] = {}
+        self._children = threading.local()
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+        self._resolving = threading.local()
+
+    def _stack(self) -> List[float]:
+        if not hasattr(self._children, "stack"):
+            self._children.stack = []
+        return self._children.stack
+
+    def _enter(self):
+        self._stack().append(0.0)
+
+    def _exit(self, name: str, elapsed: float):
+        stack = self._stack()
+        children = stack.pop()
+        self.inclusive[name] = elapsed
+        self.self_time[name] = max(0.0, elapsed - children)
+        if stack:
+            stack[-1] += elapsed
+
+    def find_spec(self, fullname, path, target=None):
+        if getattr(self._resolving, "active", False):
+            return None
+        self._resolving.active = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                        spec.loader = _TimedLoader(spec.loader, self)
+                    return spec
+            return None
+        finally:
+            self._resolving.active = False
+
+    def start(self):
+        self._started_at = time.perf_counter()
+        sys.meta_path.insert(0, self)
+
+    def stop(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+            self._finished_at = time.perf_counter()
+
+    def report(self, top: int = 15) -> Dict:
+        """Tempi di import per pacchetto (tempo proprio) e moduli più lenti (tempo inclusivo)"""
+        packages: Dict[str, float] = {}
+        for name, elapsed in self.self_time.items():
+            package = name.split(".")[0]
+            packages[package] = packages.get(package, 0.0) + elapsed
+
+        def _ms(value: float) -> float:
+            return round(value * 1000, 1)
+
+        total = (self._finished_at or time.perf_counter()) - (self._started_at or time.perf_counter())
+        return {
+            "total_ms": _ms(total),
+            "modules_imported": len(self.inclusive),
+            "packages": [
+                {"package": name, "self_ms": _ms(elapsed)}
+                for name, elapsed in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+            ],
+            "slowest_modules": [
+                {"module": name, "inclusive_ms": _ms(elapsed), "self_ms": _ms(self.self_time[name])}
+                for name, elapsed in sorted(self.inclusive.items(), key=lambda item: item[1], reverse=True)[:top]
+            ],
+            "vision_stack_loaded": any(name in sys.modules for name in ("cv2", "easyocr", "ultralytics", "torch"))
+        }
+
+
+import_timer = ImportTimer()
+
+startup_report: Dict = {}
+
+
+def start_import_timing():
+    import_timer.start()
+
+
+def finish_startup(extra: Dict = None) -> Dict:
+    """Chiude la misura degli import e compone il report di avvio"""
+    import_timer.stop()
+    startup_report.clear()
+    startup_report.update(import_timer.report())
+    if extra:
+        startup_report.update(extra)
+    return startup_report
+
+
+def _schema_fingerprint(metadata, database_url: str) -> str:
+    description = {
+        "database": database_url.split("@")[-1],
+        "tables": {
+            table.name: sorted(f"{column.name}:{column.type}:{column.nullable}" for column in table.columns)
+            for table in metadata.sorted_tables
+        }
+    }
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+
+def ensure_schema(engine, metadata, database_url: str, mode: str = "cached", cache_path: str = ".schema_cache") -> str:
+    """
+    Crea le tabelle mancanti. In modalità "cached" `create_all` viene eseguito
+    solo se i modelli sono cambiati dall'ultimo avvio riuscito; "always" lo esegue
+    a ogni avvio, "skip" mai (schema gestito dalle migrazioni).
+    Restituisce l'azione eseguita: "created", "cached" o "skipped".
+    """
+    if mode == "skip":
+        return "skipped"
+
+    fingerprint = _schema_fingerprint(metadata, database_url)
+    if mode == "cached":
+        try:
+            with open(cache_path) as cache_file:
+                if cache_file.read().strip() == fingerprint:
+                    return "cached"
+        except OSError:
+            pass
+
+    metadata.create_all(bind=engine)
+
+    try:
+        with open(cache_path, "w") as cache_file:
+            cache_file.write(fingerprint)
+    except OSError as e:
+        logger.warning(f"Impossibile scrivere la cache dello schema {cache_path}: {e}")
+    return "created"
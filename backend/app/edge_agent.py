@@ -0,0 +1,168 @@
+"""
+Edge agent per le sedi satellite.
+
+Esegue su un piccolo dispositivo vicino alla telecamera solo la parte
+cattura -> rilevamento -> tracking -> OCR della pipeline targhe, senza
+database. Ogni veicolo diventa un evento compatto di passaggio targa (più,
+opzionalmente, il ritaglio migliore in JPEG) inviato a lotti all'API centrale
+(/api/v1/ai/ingest); se l'uplink non è raggiungibile i lotti restano su disco
+e vengono reinviati al ritorno della connessione.
+
+Uso: EDGE_CAMERA_ID=ingresso EDGE_STREAM_URL=rtsp://... python -m app.edge_agent
+"""
+from typing import Optional, Dict
+import base64
+import logging
+import signal
+import threading
+import time
+import cv2
+from app.core.config import settings
+from app.services.plate_engine import PlateEngine, get_plate_engine
+from app.services.plate_tracker import PlateTracker, PlateTrack, plate_pass_event
+from app.services.edge_uplink import EdgeUplink
+
+logger = logging.getLogger(__name__)
+
+
+class EdgeAgent:
+    def __init__(
+        self,
+        camera_id: str,
+        stream_url: str,
+        engine: PlateEngine,
+        tracker: PlateTracker,
+        uplink: EdgeUplink,
+        target_fps: float = 10.0,
+        send_crops: bool = True
+    ):
+        self.camera_id = camera_id
+        self.stream_url = stream_url
+        self.engine = engine
+        self.tracker = tracker
+        self.uplink = uplink
+        self.frame_interval = 1.0 / target_fps if target_fps > 0 else 0.0
+        self.send_crops = send_crops
+        self._stop = threading.Event()
+        self.frames_processed = 0
+        self.ocr_reads = 0
+        self.events_sent = 0
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        self.uplink.start()
+        logger.info(f"Edge agent avviato: camera {self.camera_id}, stream {self.stream_url}")
+        try:
+            while not self._stop.is_set():
+                capture = cv2.VideoCapture(self.stream_url)
+                if not capture.isOpened():
+                    logger.error(f"Impossibile aprire lo stream: {self.stream_url}")
+                    self._stop.wait(5)
+                    continue
+                try:
+                    self._process_stream(capture)
+                finally:
+                    capture.release()
+                    self._emit(self.tracker.flush())
+                if not self._stop.is_set():
+                    logger.warning("Stream interrotto, nuova connessione tra 2 secondi")
+                    self._stop.wait(2)
+        finally:
+            self.uplink.stop()
+            logger.info(
+                f"Edge agent fermato: {self.frames_processed} frame, "
+                f"{self.ocr_reads} letture OCR, {self.events_sent} passaggi"
+            )
+
+    def _process_stream(self, capture):
+        next_frame_at = time.monotonic()
+        while not self._stop.is_set():
+            # Frame in eccesso rispetto al target: solo grab, senza decodifica
+            if time.monotonic() < next_frame_at:
+                if not capture.grab():
+                    return
+                continue
+            next_frame_at = time.monotonic() + self.frame_interval
+
+            ret, frame = capture.read()
+            if not ret:
+                return
+            self.process_frame(frame, time.time())
+
+    def process_frame(self, frame, timestamp: float):
+        """Rileva, aggiorna le tracce, legge con l'OCR solo le tracce che ne hanno bisogno"""
+        self.frames_processed += 1
+        boxes, scores = self.engine.locate(frame)
+
+        for track in self.tracker.update(boxes, scores, timestamp):
+            if not self.tracker.needs_read(track):
+                continue
+            x1, y1, x2, y2 = track.bbox
+            crop = frame[y1:y2, x1:x2]
+            reading = self.engine.read(crop)
+            self.ocr_reads += 1
+            if reading:
+                plate, ocr_confidence = reading
+                track.add_reading(
+                    plate,
+                    track.detection_confidence * ocr_confidence,
+                    crop if self.send_crops else None
+                )
+
+        self._emit(self.tracker.expire(timestamp))
+
+    def _emit(self, tracks):
+        for track in tracks:
+            event = self.build_event(track)
+            self.uplink.submit(event)
+            self.events_sent += 1
+            logger.info(f"Passaggio targa {event['license_plate']} ({event['frames']} frame, {event['reads']} letture)")
+
+    def build_event(self, track: PlateTrack) -> Dict:
+        event = plate_pass_event(track, self.camera_id)
+        if track.best_crop is not None:
+            ok, jpeg = cv2.imencode(".jpg", track.best_crop, [cv2.IMWRITE_JPEG_QUALITY, 85])
+            if ok:
+                event["crop_jpeg"] = base64.b64encode(jpeg.tobytes()).decode()
+        return event
+
+
+def create_edge_agent(stream_url: Optional[str] = None) -> EdgeAgent:
+    """Edge agent configurato da settings (EDGE_*, TRACKER_*)"""
+    tracker = PlateTracker(
+        iou_threshold=settings.TRACKER_IOU_THRESHOLD,
+        max_age=settings.TRACKER_MAX_AGE_SECONDS,
+        min_hits=settings.TRACKER_MIN_HITS,
+        max_reads=settings.TRACKER_MAX_OCR_READS
+    )
+    uplink = EdgeUplink(
+        settings.EDGE_INGEST_URL,
+        token=settings.EDGE_API_TOKEN,
+        spool_dir=settings.EDGE_SPOOL_DIR,
+        batch_size=settings.EDGE_BATCH_SIZE,
+        flush_interval=settings.EDGE_FLUSH_INTERVAL_SECONDS,
+        max_spool_bytes=settings.EDGE_SPOOL_MAX_MB * 1024 * 1024
+    )
+    return EdgeAgent(
+        settings.EDGE_CAMERA_ID,
+        stream_url or settings.EDGE_STREAM_URL or settings.CAMERAS[0]["url"],
+        get_plate_engine(),
+        tracker,
+        uplink,
+        target_fps=settings.EDGE_TARGET_FPS,
+        send_crops=settings.EDGE_SEND_CROPS
+    )
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    agent = create_edge_agent()
+    signal.signal(signal.SIGTERM, lambda *_: agent.stop())
+    signal.signal(signal.SIGINT, lambda *_: agent.stop())
+    agent.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Worker della coda di job persistente (tabella jobs su Postgres).
+
+Preleva i job con SELECT ... FOR UPDATE SKIP LOCKED, quindi se ne possono
+avviare quanti se ne vuole su più macchine; i job falliti vengono ritentati
+con backoff esponenziale, quelli di un worker morto rimessi in coda.
+
+Uso: JOB_WORKER_QUEUES='["default"]' python -m app.job_worker
+"""
+import logging
+import os
+import signal
+import socket
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.services import job_handlers  # registra gli handler in JOB_HANDLERS
+from app.services.job_queue import JobWorker
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    worker = JobWorker(
+        settings.JOB_WORKER_ID or f"{socket.gethostname()}-{os.getpid()}",
+        queues=settings.JOB_WORKER_QUEUES,
+        concurrency=settings.JOB_WORKER_CONCURRENCY,
+        poll_interval=settings.JOB_POLL_INTERVAL_SECONDS,
+        heartbeat_seconds=settings.JOB_HEARTBEAT_SECONDS,
+        stale_seconds=settings.JOB_STALE_SECONDS
+    )
+    if settings.DETECTION_MAINTENANCE_ENABLED:
+        # Job ricorrente: si riaccoda da solo, qui si riavvia la catena se è stata interrotta
+        db = SessionLocal()
+        try:
+            job_handlers.schedule_detection_maintenance(db)
+        finally:
+            db.close()
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    signal.signal(signal.SIGINT, lambda *_: worker.stop())
+    worker.run()
+
+
+if __name__ == "__main__":
+    main()
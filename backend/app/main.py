@@ -1,3 +1,7 @@
+# Misura i tempi di import dell'avvio: deve precedere ogni altro import
+from app.core import startup
+startup.start_import_timing()
+
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
@@ -8,9 +12,13 @@ import time
 
 from app.core.config import settings
 from app.core.database import engine, Base
+from app.core.startup import ensure_schema, finish_startup, startup_report
 from app.api.v1.api import api_router
 from app.core.security import verify_token
 from app.core.metrics import setup_metrics
+from app.services.plate_cache import run_daily_warmup, run_invalidation_sync
+from app.services.detection_sink import detection_sink
+import asyncio
 
 # Setup structured logging
 structlog.configure(
@@ -37,22 +45,62 @@ logger = structlog.get_logger()
 REQUEST_COUNT = Counter('http_requests_total', 'Total HTTP requests', ['method', 'endpoint', 'status'])
 REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'HTTP request latency')
 
+def _preload_vision():
+    try:
+        from app.services.plate_engine import get_plate_engine
+        get_plate_engine()
+        logger.info("Vision stack preloaded")
+    except Exception as e:
+        logger.error("Vision stack preload failed", error=str(e))
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting Smart Garage Dashboard API")
     
-    # Create database tables
-    Base.metadata.create_all(bind=engine)
+    # Create database tables (create_all solo se i modelli sono cambiati)
+    schema_started = time.perf_counter()
+    schema_action = ensure_schema(
+        engine,
+        Base.metadata,
+        settings.DATABASE_URL,
+        mode=settings.SCHEMA_CHECK_MODE,
+        cache_path=settings.SCHEMA_CACHE_PATH
+    )
+    schema_ms = round((time.perf_counter() - schema_started) * 1000, 1)
     
     # Setup metrics
     setup_metrics()
     
-    logger.info("Smart Garage Dashboard API started successfully")
+    # Persistenza a lotti delle rilevazioni
+    detection_sink.start()
+    
+    # Precarica la cache targhe ogni mattina
+    plate_cache_warmup = asyncio.create_task(run_daily_warmup())
+    plate_cache_sync = asyncio.create_task(run_invalidation_sync())
+    
+    # Lo stack di visione (cv2, EasyOCR, YOLO) viene caricato al primo utilizzo;
+    # con VISION_PRELOAD il caricamento parte subito ma senza bloccare l'avvio.
+    # Con il worker di visione dedicato i modelli non vengono mai caricati qui
+    if settings.VISION_PRELOAD and not settings.VISION_WORKER_SOCKET:
+        asyncio.create_task(asyncio.to_thread(_preload_vision))
+    
+    report = finish_startup({"schema_action": schema_action, "schema_ms": schema_ms})
+    logger.info(
+        "Smart Garage Dashboard API started successfully",
+        import_ms=report["total_ms"],
+        modules_imported=report["modules_imported"],
+        schema_action=schema_action,
+        schema_ms=schema_ms,
+        slowest_packages=report["packages"][:5]
+    )
     yield
     
     # Shutdown
     logger.info("Shutting down Smart Garage Dashboard API")
+    plate_cache_warmup.cancel()
+    plate_cache_sync.cancel()
+    detection_sink.stop()
 
 app = FastAPI(
     title="Smart Garage Dashboard API",
@@ -70,6 +118,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Security
@@ -118,6 +167,11 @@ async def log_requests(request, call_next):
 async def health_check():
     return {"status": "healthy", "service": "smart-garage-api"}
 
+@app.get("/health/startup")
+async def startup_health():
+    """Tempi di avvio: import per pacchetto, moduli più lenti e verifica schema"""
+    return startup_report
+
 # Dashboard statistics endpoint
 @app.get("/api/v1/dashboard/stats")
 async def get_dashboard_stats():
@@ -7,6 +7,8 @@ from .service import Service, ServiceCreate, ServiceUpdate, ServiceInDB
 from .invoice import Invoice, InvoiceCreate, InvoiceUpdate, InvoiceInDB
 from .checkin import CheckIn, CheckInCreate, CheckInUpdate, CheckInInDB
 from .ai_detection import AIDetection, AIDetectionCreate, AIDetectionUpdate, AIDetectionInDB
+from .ingest import PlateEventIn, IngestResult
+from .job import Job, JobCreate
 
 __all__ = [
     "User", "UserCreate", "UserUpdate", "UserInDB",
@@ -16,5 +18,7 @@ __all__ = [
     "Service", "ServiceCreate", "ServiceUpdate", "ServiceInDB",
     "Invoice", "InvoiceCreate", "InvoiceUpdate", "InvoiceInDB",
     "CheckIn", "CheckInCreate", "CheckInUpdate", "CheckInInDB",
-    "AIDetection", "AIDetectionCreate", "AIDetectionUpdate", "AIDetectionInDB"
+    "AIDetection", "AIDetectionCreate", "AIDetectionUpdate", "AIDetectionInDB",
+    "PlateEventIn", "IngestResult",
+    "Job", "JobCreate"
 ]
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Optional, Dict, Any
 from pydantic import BaseModel
 from datetime import datetime
 
@@ -8,6 +8,10 @@ class AIDetectionBase(BaseModel):
     image_path: Optional[str] = None
     processed: bool = False
     vehicle_id: Optional[int] = None
+    detection_data: Optional[Dict[str, Any]] = None
+    is_automatic: bool = False
+    source: Optional[str] = None
+    clip_path: Optional[str] = None
 
 class AIDetectionCreate(AIDetectionBase):
     pass
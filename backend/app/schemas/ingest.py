@@ -0,0 +1,23 @@
+from typing import Optional, List, Dict, Any, Union
+from pydantic import BaseModel, Field
+from datetime import datetime
+
+class PlateEventIn(BaseModel):
+    event_id: str = Field(..., min_length=1, max_length=64)  # chiave di idempotenza
+    camera_id: str = Field(..., min_length=1, max_length=100)
+    license_plate: str = Field(..., min_length=1, max_length=20)
+    confidence: float = Field(..., ge=0, le=1)
+    first_seen: Optional[datetime] = None
+    last_seen: Optional[datetime] = None
+    frames: Optional[int] = None
+    reads: Optional[int] = None
+    bbox: Optional[List[int]] = None
+    crop_jpeg: Optional[Union[bytes, str]] = None  # bytes (msgpack) o base64 (NDJSON)
+
+class IngestResult(BaseModel):
+    received: int
+    accepted: int
+    duplicates: int
+    rejected: int
+    matched_vehicles: int
+    errors: List[Dict[str, Any]] = []
@@ -0,0 +1,36 @@
+from typing import Optional, Dict, Any
+from pydantic import BaseModel, Field
+from datetime import datetime
+from app.core.database import JobStatus
+
+class JobCreate(BaseModel):
+    job_type: str
+    payload: Dict[str, Any] = {}
+    priority: int = 0  # più alto = prima
+    queue: str = "default"
+    max_attempts: int = Field(3, ge=1, le=20)
+    run_at: Optional[datetime] = None
+
+class Job(BaseModel):
+    id: int
+    queue: str
+    job_type: str
+    payload: Optional[Dict[str, Any]] = None
+    status: JobStatus
+    priority: int
+    attempts: int
+    max_attempts: int
+    run_at: Optional[datetime] = None
+    locked_by: Optional[str] = None
+    cancel_requested: bool
+    progress: float
+    progress_message: Optional[str] = None
+    result: Optional[Any] = None
+    checkpoint: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
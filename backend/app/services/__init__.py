@@ -1,16 +1,23 @@
-from .user_service import UserService
-from .customer_service import CustomerService
-from .vehicle_service import VehicleService
-from .service_service import ServiceService
-from .appointment_service import AppointmentService
-from .checkin_service import CheckInService
-from .invoice_service import InvoiceService
-from .ai_service import AIService
-from .notification_service import NotificationService
+import importlib
+
+# Import lazy dei servizi: `from app.services import VehicleService` funziona come
+# prima, ma importare un singolo modulo (es. app.services.plate_engine sull'edge
+# agent) non carica più tutti i servizi né il database
+_SERVICES = {
+    "UserService": ".user_service",
+    "CustomerService": ".customer_service",
+    "VehicleService": ".vehicle_service",
+    "ServiceService": ".service_service",
+    "AppointmentService": ".appointment_service",
+    "CheckInService": ".checkin_service",
+    "InvoiceService": ".invoice_service",
+    "AIService": ".ai_service",
+    "NotificationService": ".notification_service",
+}
 
 __all__ = [
     "UserService",
-    "CustomerService", 
+    "CustomerService",
     "VehicleService",
     "ServiceService",
     "AppointmentService",
@@ -19,3 +26,9 @@ __all__ = [
     "AIService",
     "NotificationService"
 ]
+
+
+def __getattr__(name):
+    if name not in _SERVICES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(_SERVICES[name], __name__), name)
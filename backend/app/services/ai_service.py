@@ -1,18 +1,34 @@
 from typing import List, Optional
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.admission import inference_gate, Overloaded, PRIORITY_UPLOAD
 from app.core.database import AIDetection, Vehicle
 from app.schemas.ai_detection import AIDetectionCreate, AIDetectionUpdate
+from app.services.detection_rollups import mark_hours_dirty
+from app.services.list_query import Page, paginate, where
+from app.services.vision_client import VisionWorkerUnavailable
 from datetime import datetime
-import cv2
-import numpy as np
-import easyocr
-import os
 
 class AIService:
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, engine=None):
         self.db = db
-        # Initialize EasyOCR reader for license plate recognition
-        self.reader = easyocr.Reader(['en'], gpu=False)
+        self._engine = engine
+
+    @property
+    def engine(self):
+        """
+        Plate engine, resolved on first use: the dedicated vision worker when
+        configured, otherwise the in-process engine. The vision stack (cv2,
+        EasyOCR, YOLO) is not imported by CRUD-only requests
+        """
+        if self._engine is None:
+            from app.services.vision_client import get_vision_client
+            self._engine = get_vision_client()
+        if self._engine is None:
+            from app.services.plate_engine import get_plate_engine
+            self._engine = get_plate_engine()
+        return self._engine
 
     def get_detection(self, detection_id: int) -> Optional[AIDetection]:
         return self.db.query(AIDetection).filter(AIDetection.id == detection_id).first()
@@ -20,6 +36,15 @@ class AIService:
     def get_detections(self, skip: int = 0, limit: int = 100) -> List[AIDetection]:
         return self.db.query(AIDetection).offset(skip).limit(limit).all()
 
+    def list_detections(self, limit: int = 100, cursor: str = None, skip: int = 0,
+                        processed: bool = None) -> Page:
+        """Detections, newest first, filtered in SQL"""
+        query = where(
+            select(AIDetection),
+            AIDetection.processed == processed if processed is not None else None
+        )
+        return paginate(self.db, query, (AIDetection.detected_at, AIDetection.id), limit, cursor, skip, descending=True)
+
     def get_unprocessed_detections(self) -> List[AIDetection]:
         return self.db.query(AIDetection).filter(AIDetection.processed == False).all()
 
@@ -29,7 +54,10 @@ class AIService:
             confidence=detection.confidence,
             image_path=detection.image_path,
             processed=detection.processed,
-            vehicle_id=detection.vehicle_id
+            vehicle_id=detection.vehicle_id,
+            detection_data=detection.detection_data,
+            is_automatic=detection.is_automatic,
+            source=detection.source
         )
         self.db.add(db_detection)
         self.db.commit()
@@ -45,6 +73,9 @@ class AIService:
         for field, value in update_data.items():
             setattr(db_detection, field, value)
         
+        if update_data:
+            # The hourly rollup of this detection is recomputed on the next run
+            mark_hours_dirty(self.db, [db_detection.detected_at])
         db_detection.updated_at = datetime.utcnow()
         self.db.commit()
         self.db.refresh(db_detection)
@@ -55,77 +86,51 @@ class AIService:
         Process an image to detect and recognize license plates
         """
         try:
-            # Read image
-            image = cv2.imread(image_path)
-            if image is None:
-                return None
-
-            # Convert to grayscale
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-
-            # Apply Gaussian blur
-            blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-
-            # Edge detection
-            edges = cv2.Canny(blurred, 50, 150)
-
-            # Find contours
-            contours, _ = cv2.findContours(edges.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-            # Filter contours by area (license plates are typically rectangular)
-            plate_contours = []
-            for contour in contours:
-                area = cv2.contourArea(contour)
-                if area > 1000:  # Minimum area threshold
-                    x, y, w, h = cv2.boundingRect(contour)
-                    aspect_ratio = w / float(h)
-                    if 2.0 <= aspect_ratio <= 5.0:  # License plate aspect ratio
-                        plate_contours.append(contour)
-
-            # Process each potential license plate region
-            results = []
-            for contour in plate_contours:
-                x, y, w, h = cv2.boundingRect(contour)
-                plate_region = gray[y:y+h, x:x+w]
-                
-                # Use EasyOCR to recognize text
-                ocr_result = self.reader.readtext(plate_region)
-                
-                for (bbox, text, confidence) in ocr_result:
-                    # Clean and validate license plate text
-                    cleaned_text = self.clean_license_plate(text)
-                    if self.is_valid_license_plate(cleaned_text):
-                        results.append({
-                            'license_plate': cleaned_text,
-                            'confidence': confidence,
-                            'bbox': bbox
-                        })
-
-            return results[0] if results else None
+            # The encoded image is decoded by the engine (in-process or vision worker)
+            with open(image_path, "rb") as image_file:
+                return self.process_image(image_file.read())
 
+        except (VisionWorkerUnavailable, Overloaded):
+            raise
         except Exception as e:
             print(f"Error processing license plate: {e}")
             return None
 
+    def process_image(self, image) -> Optional[dict]:
+        """
+        Detect and recognize the most likely license plate in an image
+        (decoded BGR array or encoded bytes). Ad-hoc requests wait behind the
+        live camera pipeline for an inference slot. Foreign and older-format
+        plates (5-10 alphanumeric characters) are accepted as well
+        """
+        if not isinstance(image, (bytes, bytearray)) or not settings.DETECTION_CACHE_MAX_SIZE:
+            with inference_gate.slot(PRIORITY_UPLOAD):
+                return self.engine.detect_best(image, strict=False)
+
+        # The same image uploaded again skips inference entirely
+        from app.services.ocr_cache import get_detection_cache, content_hash, is_missing
+        cache = get_detection_cache()
+        key = content_hash(image)
+        result = cache.get(key)
+        if is_missing(result):
+            with inference_gate.slot(PRIORITY_UPLOAD):
+                result = self.engine.detect_best(image, strict=False)
+            cache.put(key, result)
+        return result
+
     def clean_license_plate(self, text: str) -> str:
         """
         Clean and format license plate text
         """
-        # Remove special characters and spaces
-        cleaned = ''.join(c for c in text.upper() if c.isalnum())
-        return cleaned
+        from app.services.plate_text import clean_plate_text
+        return clean_plate_text(text)
 
     def is_valid_license_plate(self, text: str) -> bool:
         """
         Validate if the recognized text looks like a license plate
         """
-        # Italian license plate format: AA123BB or 123456
-        if len(text) >= 5 and len(text) <= 10:
-            # Check if it contains both letters and numbers
-            has_letters = any(c.isalpha() for c in text)
-            has_numbers = any(c.isdigit() for c in text)
-            return has_letters and has_numbers
-        return False
+        from app.services.plate_text import normalize_plate
+        return normalize_plate(text, strict=False) is not None
 
     def match_vehicle(self, license_plate: str) -> Optional[Vehicle]:
         """
@@ -138,44 +143,56 @@ class AIService:
         Process live camera stream for license plate detection
         """
         try:
-            # Open camera stream
-            cap = cv2.VideoCapture(camera_url)
-            if not cap.isOpened():
-                return None
-
-            # Read frame
-            ret, frame = cap.read()
-            if not ret:
-                cap.release()
+            from app.services.vision_client import get_vision_client
+            client = get_vision_client()
+            if client is not None:
+                # Snapshot and detection both run in the vision worker: only
+                # the plate result crosses the RPC, not the frame
+                return client.snapshot_detect_best(camera_url, strict=False)
+
+            frame = self.snapshot(camera_url)
+            if frame is None:
                 return None
 
-            # Save frame temporarily
-            temp_path = f"/tmp/camera_frame_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-            cv2.imwrite(temp_path, frame)
-            cap.release()
-
-            # Process the frame
-            result = self.process_license_plate(temp_path)
-            
-            # Clean up temporary file
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-
-            return result
+            # Process the frame in memory
+            return self.process_image(frame)
 
+        except (VisionWorkerUnavailable, Overloaded):
+            raise
         except Exception as e:
             print(f"Error processing camera stream: {e}")
             return None
 
+    def snapshot(self, camera_url: str):
+        """
+        Current frame of the camera, without a new RTSP handshake per request:
+        the latest frame of the monitoring pipeline when the camera is already
+        monitored, otherwise a pooled capture kept open until idle. With the
+        vision worker configured the livestreams (and the pool) live there
+        """
+        from app.services.vision_client import get_vision_client
+        client = get_vision_client()
+        if client is not None:
+            return client.snapshot(camera_url)
+
+        from app.services.snapshot_service import get_snapshot_pool
+        return get_snapshot_pool().snapshot(camera_url)
+
     def get_detection_statistics(self, start_date: datetime, end_date: datetime) -> dict:
-        detections = self.db.query(AIDetection).filter(
-            AIDetection.detected_at >= start_date,
-            AIDetection.detected_at <= end_date
-        ).all()
-        
-        total_detections = len(detections)
-        processed_detections = len([d for d in detections if d.processed])
-        average_confidence = sum(d.confidence for d in detections) / total_detections if total_detections > 0 else 0
+        """
+        Detection totals for [start_date, end_date) in a single query, read
+        from the hourly rollups for the hours already aggregated and from raw
+        rows otherwise. Cached for STATS_CACHE_TTL_SECONDS
+        """
+        from app.services.detection_rollups import summarize, cached
+        totals = cached(
+            ("detection_statistics", start_date, end_date),
+            lambda: summarize(self.db, start_date, end_date)
+        )
+
+        total_detections = totals["detections"]
+        processed_detections = totals["processed"]
+        average_confidence = totals["confidence_sum"] / total_detections if total_detections > 0 else 0
         
         return {
             "total_detections": total_detections,
@@ -1,8 +1,11 @@
 from typing import List, Optional
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from app.core.database import Appointment, AppointmentStatus
 from app.schemas.appointment import AppointmentCreate, AppointmentUpdate
-from datetime import datetime, timedelta
+from app.services.list_query import Page, paginate, where
+from app.services.plate_cache import plate_cache
+from datetime import datetime, date, time, timedelta
 
 class AppointmentService:
     def __init__(self, db: Session):
@@ -14,6 +17,19 @@ class AppointmentService:
     def get_appointments(self, skip: int = 0, limit: int = 100) -> List[Appointment]:
         return self.db.query(Appointment).offset(skip).limit(limit).all()
 
+    def list_appointments(self, limit: int = 100, cursor: str = None, skip: int = 0,
+                          customer_id: int = None, status: AppointmentStatus = None,
+                          date_from: date = None, date_to: date = None) -> Page:
+        """Appointments by date, filtered in SQL; date_to is inclusive"""
+        query = where(
+            select(Appointment),
+            Appointment.customer_id == customer_id if customer_id is not None else None,
+            Appointment.status == status if status else None,
+            Appointment.appointment_date >= datetime.combine(date_from, time.min) if date_from else None,
+            Appointment.appointment_date < datetime.combine(date_to + timedelta(days=1), time.min) if date_to else None
+        )
+        return paginate(self.db, query, (Appointment.appointment_date, Appointment.id), limit, cursor, skip)
+
     def get_appointments_by_customer(self, customer_id: int) -> List[Appointment]:
         return self.db.query(Appointment).filter(Appointment.customer_id == customer_id).all()
 
@@ -50,6 +66,7 @@ class AppointmentService:
         self.db.add(db_appointment)
         self.db.commit()
         self.db.refresh(db_appointment)
+        plate_cache.invalidate_vehicle(db_appointment.vehicle_id)
         return db_appointment
 
     def update_appointment(self, appointment_id: int, appointment: AppointmentUpdate) -> Optional[Appointment]:
@@ -57,6 +74,7 @@ class AppointmentService:
         if not db_appointment:
             return None
         
+        previous_vehicle_id = db_appointment.vehicle_id
         update_data = appointment.dict(exclude_unset=True)
         for field, value in update_data.items():
             setattr(db_appointment, field, value)
@@ -64,6 +82,8 @@ class AppointmentService:
         db_appointment.updated_at = datetime.utcnow()
         self.db.commit()
         self.db.refresh(db_appointment)
+        plate_cache.invalidate_vehicle(previous_vehicle_id)
+        plate_cache.invalidate_vehicle(db_appointment.vehicle_id)
         return db_appointment
 
     def delete_appointment(self, appointment_id: int) -> bool:
@@ -71,8 +91,10 @@ class AppointmentService:
         if not db_appointment:
             return False
         
+        vehicle_id = db_appointment.vehicle_id
         self.db.delete(db_appointment)
         self.db.commit()
+        plate_cache.invalidate_vehicle(vehicle_id)
         return True
 
     def update_appointment_status(self, appointment_id: int, status: AppointmentStatus) -> Optional[Appointment]:
@@ -84,6 +106,7 @@ class AppointmentService:
         db_appointment.updated_at = datetime.utcnow()
         self.db.commit()
         self.db.refresh(db_appointment)
+        plate_cache.invalidate_vehicle(db_appointment.vehicle_id)
         return db_appointment
 
     def check_availability(self, appointment_date: datetime, duration: int) -> bool:
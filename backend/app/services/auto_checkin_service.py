@@ -0,0 +1,195 @@
+from datetime import datetime, timezone, timedelta
+from typing import Optional, Dict, NamedTuple, Tuple, Callable
+import asyncio
+import logging
+import threading
+import time
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.database import SessionLocal, CheckIn
+
+logger = logging.getLogger(__name__)
+
+ROLE_ENTRANCE = "entrance"
+ROLE_EXIT = "exit"
+ROLE_BOTH = "both"
+
+
+class _VehicleState(NamedTuple):
+    """Ultimo check-in del veicolo (l'aperto se c'è), come letto da _apply"""
+    id: int
+    checkin_time: datetime
+    checkout_time: Optional[datetime]
+
+
+def camera_roles_from_settings() -> Dict[str, str]:
+    return {camera["id"]: camera.get("role", ROLE_BOTH) for camera in settings.CAMERAS}
+
+
+class AutoCheckInEngine:
+    """
+    Check-in/check-out automatico guidato dai passaggi targa.
+
+    Lo stato dei veicoli in officina è la tabella `checkins`: la scrivono l'API (check-in manuali, ingest degli edge agent) e i
+    worker di visione di più nodi. Ogni passaggio che supera il filtro parte
+    dall'ultimo check-in del veicolo; l'indice unico parziale
+    idx_checkins_open_vehicle impedisce due check-in aperti per lo stesso
+    veicolo e chi perde la corsa non fa nulla. L'ultimo check-in letto resta in
+    memoria per `state_ttl_seconds` (aggiornato dai cambi fatti qui, invalidato
+    da quelli manuali del processo): i passaggi di un veicolo già in officina
+    non interrogano il database a ogni lettura. Uno stato superato da un altro
+    processo viene scoperto alla scrittura (indice unico, chiusura condizionale)
+    e riletto.
+    - i passaggi ripetuti della stessa targa sulla stessa telecamera entro
+      `dedup_seconds` vengono ignorati senza toccare il database;
+    - un veicolo non può cambiare stato prima di `debounce_seconds` dall'ultimo
+      cambio registrato (evita check-in/check-out a raffica davanti alla telecamera).
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        camera_roles: Dict[str, str] = None,
+        dedup_seconds: int = 30,
+        debounce_seconds: int = 300,
+        state_ttl_seconds: float = 60.0
+    ):
+        self.session_factory = session_factory
+        self.camera_roles = camera_roles if camera_roles is not None else camera_roles_from_settings()
+        self.dedup_window = timedelta(seconds=dedup_seconds)
+        self.debounce_window = timedelta(seconds=debounce_seconds)
+        self.state_ttl = state_ttl_seconds
+        self._last_pass: Dict[Tuple[str, str], datetime] = {}
+        # vehicle_id -> (ultimo check-in o None, istante monotonic della lettura)
+        self._states: Dict[int, Tuple[Optional[_VehicleState], float]] = {}
+        self._lock = threading.Lock()
+
+    def handle_plate_pass(self, camera_id: str, vehicle_id: int, license_plate: str,
+                          seen_at: datetime = None) -> Optional[str]:
+        """
+        Elabora un passaggio targa; restituisce "checkin", "checkout" o None
+        se lo stato del veicolo non cambia
+        """
+        seen_at = _as_aware(seen_at) if seen_at else _now()
+        role = self.camera_roles.get(camera_id, ROLE_BOTH)
+
+        with self._lock:
+            key = (camera_id, license_plate)
+            last_pass = self._last_pass.get(key)
+            self._last_pass[key] = seen_at
+            if len(self._last_pass) > 10000:
+                self._prune_passes(seen_at)
+            if last_pass and seen_at - last_pass < self.dedup_window:
+                return None
+
+        db = self.session_factory()
+        try:
+            action = self._apply(db, camera_id, vehicle_id, role, seen_at)
+        except Exception as e:
+            db.rollback()
+            self.invalidate(vehicle_id)
+            logger.error(f"Errore nel check-in/check-out automatico per {license_plate}: {e}")
+            return None
+        finally:
+            db.close()
+
+        if action:
+            logger.info(f"{'Check-in' if action == 'checkin' else 'Check-out'} automatico: {license_plate} (camera {camera_id})")
+        return action
+
+    def invalidate(self, vehicle_id: int = None):
+        """Da chiamare dopo check-in/check-out manuali: lo stato del veicolo viene riletto al prossimo passaggio"""
+        with self._lock:
+            if vehicle_id is None:
+                self._states.clear()
+            else:
+                self._states.pop(vehicle_id, None)
+
+    def _last_checkin(self, db: Session, vehicle_id: int) -> Optional[_VehicleState]:
+        with self._lock:
+            cached = self._states.get(vehicle_id)
+        if cached is not None and time.monotonic() - cached[1] < self.state_ttl:
+            return cached[0]
+        # Il check-in aperto se c'è, altrimenti l'ultimo chiuso
+        row = db.query(CheckIn.id, CheckIn.checkin_time, CheckIn.checkout_time)\
+            .filter(CheckIn.vehicle_id == vehicle_id)\
+            .order_by(CheckIn.checkout_time.isnot(None), CheckIn.checkin_time.desc(), CheckIn.id.desc())\
+            .first()
+        state = _VehicleState(*row) if row is not None else None
+        self._remember(vehicle_id, state)
+        return state
+
+    def _remember(self, vehicle_id: int, state: Optional[_VehicleState]):
+        with self._lock:
+            self._states[vehicle_id] = (state, time.monotonic())
+            if len(self._states) > 10000:
+                now = time.monotonic()
+                self._states = {key: value for key, value in self._states.items() if now - value[1] < self.state_ttl}
+
+    def _apply(self, db: Session, camera_id: str, vehicle_id: int, role: str, seen_at: datetime) -> Optional[str]:
+        last = self._last_checkin(db, vehicle_id)
+        inside = last is not None and last.checkout_time is None
+
+        if last is not None:
+            last_change = _as_aware(last.checkout_time or last.checkin_time)
+            if seen_at - last_change < self.debounce_window:
+                return None
+
+        if not inside and role in (ROLE_ENTRANCE, ROLE_BOTH):
+            checkin = CheckIn(
+                vehicle_id=vehicle_id,
+                checkin_time=seen_at,
+                is_automatic=True,
+                notes=f"Check-in automatico (camera {camera_id})"
+            )
+            db.add(checkin)
+            try:
+                db.flush()
+                checkin_id = checkin.id
+                db.commit()
+            except IntegrityError:
+                # Un altro processo (o un check-in manuale) l'ha aperto nel frattempo
+                db.rollback()
+                self.invalidate(vehicle_id)
+                return None
+            self._remember(vehicle_id, _VehicleState(checkin_id, seen_at, None))
+            return "checkin"
+
+        if inside and role in (ROLE_EXIT, ROLE_BOTH):
+            closed = db.query(CheckIn)\
+                .filter(CheckIn.id == last.id, CheckIn.checkout_time.is_(None))\
+                .update({CheckIn.checkout_time: seen_at, CheckIn.updated_at: seen_at}, synchronize_session=False)
+            db.commit()
+            if not closed:
+                # Già chiuso altrove: lo stato in memoria era superato
+                self.invalidate(vehicle_id)
+                return None
+            self._remember(vehicle_id, last._replace(checkout_time=seen_at))
+            return "checkout"
+
+        return None
+
+    def _prune_passes(self, now: datetime):
+        # Chiamato con il lock acquisito
+        self._last_pass = {key: at for key, at in self._last_pass.items() if now - at < self.dedup_window}
+
+    async def handle_plate_pass_async(self, camera_id: str, vehicle_id: int, license_plate: str,
+                                      seen_at: datetime = None) -> Optional[str]:
+        # Il database non va mai interrogato sul thread dell'event loop
+        return await asyncio.to_thread(self.handle_plate_pass, camera_id, vehicle_id, license_plate, seen_at)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _as_aware(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+auto_checkin_engine = AutoCheckInEngine(
+    dedup_seconds=settings.AUTO_CHECKIN_DEDUP_SECONDS,
+    debounce_seconds=settings.AUTO_CHECKIN_DEBOUNCE_SECONDS,
+    state_ttl_seconds=settings.AUTO_CHECKIN_STATE_TTL_SECONDS
+)
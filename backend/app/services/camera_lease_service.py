@@ -0,0 +1,353 @@
+from datetime import datetime, timezone, timedelta
+from typing import Optional, List, Dict, Set, Callable
+import logging
+import math
+import os
+import socket
+import threading
+import time
+from sqlalchemy import update, delete, or_, select, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.database import SessionLocal, CameraLease, VisionWorkerNode
+from app.core.metrics import set_camera_leases_owned, record_camera_lease_event
+
+logger = logging.getLogger(__name__)
+
+
+def default_worker_id() -> str:
+    return settings.VISION_WORKER_ID or f"{socket.gethostname()}-{os.getpid()}"
+
+
+class CameraLeaseManager:
+    """
+    Assegnazione delle telecamere ai worker di visione tramite lease su database.
+
+    Ogni worker, a ogni heartbeat:
+    - aggiorna la propria riga in `vision_workers` e rinnova i lease che possiede;
+    - calcola la quota equa (telecamere / worker vivi, arrotondata per eccesso);
+    - rilascia i lease oltre la quota (un worker appena entrato li prende al giro dopo);
+    - acquisisce lease liberi o scaduti fino alla quota.
+
+    L'acquisizione è un UPDATE condizionato sulla riga della telecamera, quindi due
+    worker non possono prendere la stessa telecamera. Se un worker muore i suoi lease
+    scadono dopo `lease_seconds` e vengono ripresi dagli altri.
+
+    Scadenze e confronti usano l'orologio del database (letto a inizio giro), non
+    quello del nodo: uno sfasamento tra i nodi non fa rubare telecamere. Se il
+    rinnovo non riesce (database irraggiungibile) il worker ferma i propri
+    monitoraggi entro `lease_seconds` dall'ultimo rinnovo riuscito, prima che un
+    altro worker possa subentrare. Le telecamere fermate (/ai/livestream/stop)
+    restano senza lease finché non vengono riavviate.
+    """
+
+    def __init__(
+        self,
+        cameras: List[str],
+        on_acquire: Callable[[str], None],
+        on_release: Callable[[str], None],
+        worker_id: str = None,
+        session_factory: Callable[[], Session] = SessionLocal,
+        lease_seconds: int = 30,
+        heartbeat_seconds: int = 10
+    ):
+        self.cameras = list(cameras)
+        self.on_acquire = on_acquire
+        self.on_release = on_release
+        self.worker_id = worker_id or default_worker_id()
+        self.session_factory = session_factory
+        self.lease_ttl = timedelta(seconds=lease_seconds)
+        self.heartbeat_interval = heartbeat_seconds
+        self.owned: Set[str] = set()
+        self._renewed_at: Optional[float] = None  # time.monotonic() dell'ultimo rinnovo riuscito
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        # Serializza i giri di heartbeat con set_stopped (chiamato dai thread RPC)
+        self._lock = threading.RLock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="camera-leases", daemon=True)
+        self._thread.start()
+        logger.info(f"Lease telecamere avviati per il worker {self.worker_id}")
+
+    def stop(self):
+        """Ferma l'heartbeat e rilascia subito i lease, così gli altri worker subentrano senza attendere la scadenza"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(self.heartbeat_interval + 5)
+            self._thread = None
+        self.release_all()
+
+    def wake(self):
+        """Anticipa il prossimo giro (es. dopo il riavvio di una telecamera)"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.fence()
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"Errore nel rinnovo dei lease telecamere: {e}")
+            self.fence()
+
+            # Con lease posseduti e rinnovo in ritardo ci si sveglia in tempo per fermarli
+            wait = self.heartbeat_interval
+            if self.owned and self._renewed_at is not None:
+                wait = min(wait, max(0.0, self._fence_deadline() - time.monotonic()))
+            self._wake.wait(wait)
+            self._wake.clear()
+
+    def _fence_deadline(self) -> float:
+        return self._renewed_at + self.lease_ttl.total_seconds()
+
+    def fence(self) -> bool:
+        """
+        Ferma i monitoraggi se i lease non sono stati rinnovati entro la loro
+        durata: da quel momento un altro worker può averli presi
+        """
+        with self._lock:
+            return self._fence()
+
+    def _fence(self) -> bool:
+        if not self.owned or self._renewed_at is None or time.monotonic() < self._fence_deadline():
+            return False
+        fenced, self.owned = sorted(self.owned), set()
+        set_camera_leases_owned(0)
+        for camera_id in fenced:
+            record_camera_lease_event("fenced")
+            logger.warning(f"Lease della telecamera {camera_id} non rinnovato in tempo: monitoraggio fermato")
+            self._notify(self.on_release, camera_id)
+        return True
+
+    def tick(self, now: datetime = None) -> Dict:
+        """Un giro di heartbeat, rinnovo, ribilanciamento e acquisizione"""
+        with self._lock:
+            return self._tick(now)
+
+    def _tick(self, now: datetime = None) -> Dict:
+        started = time.monotonic()
+        db = self.session_factory()
+        try:
+            # Orologio del database: lo stesso per tutti i nodi
+            now = now or _db_now(db)
+            expires_at = now + self.lease_ttl
+
+            self._heartbeat(db, now)
+            self._ensure_camera_rows(db)
+
+            live_workers = db.query(VisionWorkerNode)\
+                .filter(VisionWorkerNode.heartbeat_at >= now - self.lease_ttl)\
+                .count()
+            active_cameras = db.query(CameraLease)\
+                .filter(CameraLease.camera_id.in_(self.cameras), CameraLease.stopped == False)\
+                .count()
+            quota = math.ceil(active_cameras / max(1, live_workers))
+
+            renewed: Set[str] = set()
+            if self.owned:
+                renewed = set(db.execute(
+                    update(CameraLease)
+                    .where(
+                        CameraLease.camera_id.in_(self.owned),
+                        CameraLease.worker_id == self.worker_id,
+                        CameraLease.stopped == False
+                    )
+                    .values(lease_expires_at=expires_at)
+                    .returning(CameraLease.camera_id)
+                ).scalars())
+            lost = self.owned - renewed
+
+            # Ribilanciamento: le telecamere oltre la quota tornano libere
+            released = set(sorted(renewed)[quota:])
+            if released:
+                db.execute(
+                    update(CameraLease)
+                    .where(CameraLease.camera_id.in_(released), CameraLease.worker_id == self.worker_id)
+                    .values(worker_id=None, lease_expires_at=None)
+                )
+
+            owned = renewed - released
+            acquired: Set[str] = set()
+            if len(owned) < quota:
+                free = db.query(CameraLease.camera_id)\
+                    .filter(CameraLease.camera_id.in_(self.cameras), CameraLease.stopped == False)\
+                    .filter(self._is_free(now))\
+                    .order_by(CameraLease.camera_id)\
+                    .limit(quota - len(owned))\
+                    .all()
+                for (camera_id,) in free:
+                    result = db.execute(
+                        update(CameraLease)
+                        .where(CameraLease.camera_id == camera_id, CameraLease.stopped == False, self._is_free(now))
+                        .values(worker_id=self.worker_id, lease_expires_at=expires_at, acquired_at=now)
+                    )
+                    if result.rowcount == 1:
+                        acquired.add(camera_id)
+
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        self.owned = owned | acquired
+        self._renewed_at = started
+        set_camera_leases_owned(len(self.owned))
+
+        for camera_id in sorted(lost):
+            record_camera_lease_event("lost")
+            logger.warning(f"Lease della telecamera {camera_id} perso dal worker {self.worker_id}")
+            self._notify(self.on_release, camera_id)
+        for camera_id in sorted(released):
+            record_camera_lease_event("released")
+            logger.info(f"Telecamera {camera_id} rilasciata per ribilanciamento ({live_workers} worker attivi)")
+            self._notify(self.on_release, camera_id)
+        for camera_id in sorted(acquired):
+            record_camera_lease_event("acquired")
+            logger.info(f"Telecamera {camera_id} assegnata al worker {self.worker_id}")
+
+        # Chiamato per tutte le telecamere possedute: riavvia anche un monitoraggio
+        # terminato per errore (le telecamere fermate non sono più possedute)
+        for camera_id in sorted(self.owned):
+            self._notify(self.on_acquire, camera_id)
+
+        return {
+            "worker_id": self.worker_id,
+            "live_workers": live_workers,
+            "quota": quota,
+            "owned": sorted(self.owned),
+            "acquired": sorted(acquired),
+            "released": sorted(released),
+            "lost": sorted(lost)
+        }
+
+    def set_stopped(self, camera_ids: List[str], stopped: bool) -> List[str]:
+        """
+        Ferma (o riavvia) il monitoraggio delle telecamere su tutti i worker: una
+        telecamera fermata perde il lease e non viene riassegnata. Restituisce le
+        telecamere aggiornate
+        """
+        camera_ids = [camera_id for camera_id in camera_ids if camera_id in self.cameras]
+        if not camera_ids:
+            return []
+        with self._lock:
+            return self._set_stopped(camera_ids, stopped)
+
+    def _set_stopped(self, camera_ids: List[str], stopped: bool) -> List[str]:
+        db = self.session_factory()
+        try:
+            self._ensure_camera_rows(db)
+            values = {"stopped": stopped}
+            if stopped:
+                values.update(worker_id=None, lease_expires_at=None)
+            db.execute(update(CameraLease).where(CameraLease.camera_id.in_(camera_ids)).values(**values))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        if stopped:
+            for camera_id in sorted(self.owned & set(camera_ids)):
+                record_camera_lease_event("stopped")
+                self._notify(self.on_release, camera_id)
+            self.owned -= set(camera_ids)
+            set_camera_leases_owned(len(self.owned))
+        else:
+            self.wake()
+        return camera_ids
+
+    def release_all(self):
+        db = self.session_factory()
+        try:
+            db.execute(
+                update(CameraLease)
+                .where(CameraLease.worker_id == self.worker_id)
+                .values(worker_id=None, lease_expires_at=None)
+            )
+            db.execute(delete(VisionWorkerNode).where(VisionWorkerNode.worker_id == self.worker_id))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Errore nel rilascio dei lease telecamere: {e}")
+        finally:
+            db.close()
+
+        for camera_id in sorted(self.owned):
+            record_camera_lease_event("released")
+            self._notify(self.on_release, camera_id)
+        self.owned = set()
+        set_camera_leases_owned(0)
+
+    def _is_free(self, now: datetime):
+        return or_(
+            CameraLease.worker_id.is_(None),
+            CameraLease.lease_expires_at.is_(None),
+            CameraLease.lease_expires_at < now
+        )
+
+    def _heartbeat(self, db: Session, now: datetime):
+        updated = db.execute(
+            update(VisionWorkerNode)
+            .where(VisionWorkerNode.worker_id == self.worker_id)
+            .values(heartbeat_at=now)
+        ).rowcount
+        if not updated:
+            db.add(VisionWorkerNode(worker_id=self.worker_id, hostname=socket.gethostname(), heartbeat_at=now))
+            db.flush()
+
+        # I worker spariti senza rilasciare i lease vengono rimossi dopo un po'
+        db.execute(
+            delete(VisionWorkerNode)
+            .where(VisionWorkerNode.heartbeat_at < now - self.lease_ttl * 10)
+        )
+
+    def _ensure_camera_rows(self, db: Session):
+        existing = {camera_id for (camera_id,) in db.query(CameraLease.camera_id).filter(CameraLease.camera_id.in_(self.cameras))}
+        for camera_id in self.cameras:
+            if camera_id in existing:
+                continue
+            try:
+                with db.begin_nested():
+                    db.add(CameraLease(camera_id=camera_id))
+            except IntegrityError:
+                # Creata nel frattempo da un altro worker
+                pass
+
+    def _notify(self, callback: Callable[[str], None], camera_id: str):
+        try:
+            callback(camera_id)
+        except Exception as e:
+            logger.error(f"Errore nella gestione della telecamera {camera_id}: {e}")
+
+    def leases(self) -> List[Dict]:
+        db = self.session_factory()
+        try:
+            return [lease_to_dict(lease) for lease in db.query(CameraLease).order_by(CameraLease.camera_id).all()]
+        finally:
+            db.close()
+
+
+def lease_to_dict(lease: CameraLease) -> Dict:
+    return {
+        "camera_id": lease.camera_id,
+        "worker_id": lease.worker_id,
+        "lease_expires_at": lease.lease_expires_at.isoformat() if lease.lease_expires_at else None,
+        "acquired_at": lease.acquired_at.isoformat() if lease.acquired_at else None,
+        "stopped": bool(lease.stopped)
+    }
+
+
+def _db_now(db: Session) -> datetime:
+    now = db.execute(select(func.now())).scalar()
+    # SQLite restituisce CURRENT_TIMESTAMP in UTC senza fuso
+    return now if now.tzinfo else now.replace(tzinfo=timezone.utc)
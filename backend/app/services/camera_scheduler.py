@@ -0,0 +1,211 @@
+from concurrent.futures import Future
+from typing import Optional, List, Dict, Any, Callable
+import collections
+import logging
+import threading
+import time
+from app.core.metrics import set_camera_inference_fps, record_camera_frame_dropped
+
+logger = logging.getLogger(__name__)
+
+
+class _CameraState:
+    def __init__(self, camera_id: str, weight: float, min_fps: float):
+        self.camera_id = camera_id
+        self.weight = max(weight, 0.01)
+        self.min_fps = min_fps
+        self.pending: Optional[tuple] = None  # (frame, captured_at, future, detect)
+        self.start_tag = 0.0  # tempo virtuale di inizio del frame in attesa
+        self.finish_tag = 0.0  # tempo virtuale di fine dell'ultimo frame servito
+        self.last_served = 0.0
+        self.served: "collections.deque[float]" = collections.deque()
+        self.frames_served = 0
+        self.frames_dropped = 0
+
+    def overdue(self, now: float) -> float:
+        """Secondi di ritardo rispetto all'fps minimo garantito (<= 0 se in regola)"""
+        if self.min_fps <= 0:
+            return 0.0
+        return now - self.last_served - 1.0 / self.min_fps
+
+    def fps(self, now: float, window: float) -> float:
+        while self.served and self.served[0] < now - window:
+            self.served.popleft()
+        return len(self.served) / window
+
+
+class CameraScheduler:
+    """
+    Scheduler dell'inferenza tra le telecamere che condividono lo stesso motore.
+
+    Ogni telecamera ha al massimo un frame in attesa: un frame nuovo sostituisce
+    quello non ancora elaborato, e i frame più vecchi di `max_frame_age` vengono
+    scartati per primi quando il motore non tiene il passo. Il prossimo frame
+    da elaborare è quello della telecamera più in ritardo sul proprio fps
+    minimo garantito; se tutte sono in regola, si procede per peso
+    (start-time fair queuing: ogni inferenza costa 1/peso in tempo virtuale e
+    si serve il frame con il tempo di inizio più basso; una telecamera rimasta
+    inattiva riparte dal tempo virtuale corrente, senza credito accumulato).
+    """
+
+    def __init__(
+        self,
+        detect: Callable[[Any], List[Dict]],
+        workers: int = 1,
+        max_frame_age: float = 1.0,
+        fps_window: float = 10.0,
+        on_result: Optional[Callable[[str, Any, List[Dict], float], None]] = None
+    ):
+        self.detect = detect
+        # Chiamato dal thread di inferenza con (telecamera, frame, targhe, secondi); non deve bloccare
+        self.on_result = on_result
+        self.workers = workers
+        self.max_frame_age = max_frame_age
+        self.fps_window = fps_window
+        self._cameras: Dict[str, _CameraState] = {}
+        self._virtual_time = 0.0
+        self._service_seconds = 0.0  # durata media di un'inferenza
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._running = False
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"camera-scheduler-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            for state in self._cameras.values():
+                self._drop(state, count=False)
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    def register(self, camera_id: str, weight: float = 1.0, min_fps: float = 0.0):
+        with self._cond:
+            state = self._cameras.get(camera_id)
+            if state is None:
+                state = self._cameras[camera_id] = _CameraState(camera_id, weight, min_fps)
+                state.last_served = time.monotonic()
+            else:
+                state.weight = max(weight, 0.01)
+                state.min_fps = min_fps
+
+    def unregister(self, camera_id: str):
+        with self._cond:
+            state = self._cameras.pop(camera_id, None)
+            if state:
+                self._drop(state, count=False)
+        set_camera_inference_fps(camera_id, 0)
+
+    def submit(self, camera_id: str, frame, captured_at: float = None,
+               detect: Optional[Callable[[Any], List[Dict]]] = None) -> Future:
+        """
+        Mette in coda il frame della telecamera. Il Future restituisce le targhe
+        rilevate, oppure None se il frame è stato scartato. `detect` sostituisce
+        il rilevamento comune per questo frame (es. telecamere a doppio stream).
+        """
+        future: Future = Future()
+        with self._cond:
+            state = self._cameras.get(camera_id)
+            if state is None or not self._running:
+                future.set_result(None)
+                return future
+            if state.pending is not None:
+                self._drop(state)
+            state.start_tag = max(state.finish_tag, self._virtual_time)
+            state.pending = (frame, captured_at or time.monotonic(), future, detect or self.detect)
+            self._cond.notify()
+        return future
+
+    def _drop(self, state: _CameraState, count: bool = True):
+        future = state.pending[2] if state.pending else None
+        state.pending = None
+        if future is None:
+            return
+        if count:
+            state.frames_dropped += 1
+            record_camera_frame_dropped(state.camera_id)
+        future.set_result(None)
+
+    def _next(self, now: float) -> Optional[_CameraState]:
+        """Scarta i frame troppo vecchi e sceglie la telecamera da servire"""
+        ready = []
+        for state in self._cameras.values():
+            if state.pending is None:
+                continue
+            if now - state.pending[1] > self.max_frame_age:
+                self._drop(state)
+                continue
+            ready.append(state)
+        if not ready:
+            return None
+
+        # In ritardo anche chi lo sarebbe alla fine dell'inferenza successiva
+        deadline = now + self._service_seconds
+        overdue = [state for state in ready if state.overdue(deadline) > 0]
+        if overdue:
+            return max(overdue, key=lambda state: state.overdue(deadline) * state.min_fps)
+        return min(ready, key=lambda state: (state.start_tag, state.pending[1]))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                state = None
+                while self._running:
+                    state = self._next(time.monotonic())
+                    if state is not None:
+                        break
+                    self._cond.wait(self.max_frame_age)
+                if not self._running:
+                    return
+                frame, captured_at, future, detect = state.pending
+                state.pending = None
+                self._virtual_time = max(self._virtual_time, state.start_tag)
+                state.finish_tag = state.start_tag + 1.0 / state.weight
+
+            started = time.monotonic()
+            try:
+                result = detect(frame)
+            except Exception as e:
+                logger.error(f"Errore di inferenza per la telecamera {state.camera_id}: {e}")
+                result = []
+
+            now = time.monotonic()
+            with self._cond:
+                self._service_seconds += 0.2 * (now - started - self._service_seconds)
+                state.last_served = now
+                state.frames_served += 1
+                state.served.append(now)
+                fps = state.fps(now, self.fps_window)
+            set_camera_inference_fps(state.camera_id, fps)
+            if self.on_result:
+                # Prima di risolvere il future: dopo, lo slot del frame può essere riutilizzato
+                try:
+                    self.on_result(state.camera_id, frame, result, now - started)
+                except Exception as e:
+                    logger.error(f"Errore nel callback dello scheduler: {e}")
+            future.set_result(result)
+
+    def stats(self) -> Dict[str, Dict]:
+        now = time.monotonic()
+        with self._cond:
+            return {
+                camera_id: {
+                    "weight": state.weight,
+                    "min_fps": state.min_fps,
+                    "effective_fps": round(state.fps(now, self.fps_window), 2),
+                    "frames_served": state.frames_served,
+                    "frames_dropped": state.frames_dropped,
+                    "pending": state.pending is not None
+                }
+                for camera_id, state in self._cameras.items()
+            }
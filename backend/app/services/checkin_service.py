@@ -1,9 +1,16 @@
 from typing import List, Optional
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from app.core.database import CheckIn
 from app.schemas.checkin import CheckInCreate, CheckInUpdate
+from app.services.auto_checkin_service import auto_checkin_engine
+from app.services.list_query import Page, paginate, where
 from datetime import datetime
 
+class OpenCheckInExists(ValueError):
+    status_code = 409
+
 class CheckInService:
     def __init__(self, db: Session):
         self.db = db
@@ -14,6 +21,16 @@ class CheckInService:
     def get_checkins(self, skip: int = 0, limit: int = 100) -> List[CheckIn]:
         return self.db.query(CheckIn).offset(skip).limit(limit).all()
 
+    def list_checkins(self, limit: int = 100, cursor: str = None, skip: int = 0,
+                      vehicle_id: int = None, active_only: bool = False) -> Page:
+        """Check-ins, newest first, filtered in SQL"""
+        query = where(
+            select(CheckIn),
+            CheckIn.vehicle_id == vehicle_id if vehicle_id is not None else None,
+            CheckIn.checkout_time.is_(None) if active_only else None
+        )
+        return paginate(self.db, query, (CheckIn.checkin_time, CheckIn.id), limit, cursor, skip, descending=True)
+
     def get_checkins_by_vehicle(self, vehicle_id: int) -> List[CheckIn]:
         return self.db.query(CheckIn).filter(CheckIn.vehicle_id == vehicle_id).all()
 
@@ -32,7 +49,8 @@ class CheckInService:
             is_automatic=checkin.is_automatic
         )
         self.db.add(db_checkin)
-        self.db.commit()
+        self._commit(db_checkin.vehicle_id)
+        auto_checkin_engine.invalidate(db_checkin.vehicle_id)
         self.db.refresh(db_checkin)
         return db_checkin
 
@@ -46,10 +64,25 @@ class CheckInService:
             setattr(db_checkin, field, value)
         
         db_checkin.updated_at = datetime.utcnow()
-        self.db.commit()
+        self._commit(db_checkin.vehicle_id)
+        auto_checkin_engine.invalidate(db_checkin.vehicle_id)
         self.db.refresh(db_checkin)
         return db_checkin
 
+    def _commit(self, vehicle_id: int):
+        """
+        Commit guarded by the unique index on open check-ins: a vehicle checked
+        in concurrently (camera pass, edge ingest, another user) raises
+        OpenCheckInExists
+        """
+        try:
+            self.db.commit()
+        except IntegrityError:
+            self.db.rollback()
+            if self.get_active_checkin(vehicle_id):
+                raise OpenCheckInExists("Vehicle already has an active check-in")
+            raise
+
     def checkout_vehicle(self, vehicle_id: int, checkout_time: datetime = None) -> Optional[CheckIn]:
         active_checkin = self.get_active_checkin(vehicle_id)
         if not active_checkin:
@@ -58,6 +91,7 @@ class CheckInService:
         active_checkin.checkout_time = checkout_time or datetime.utcnow()
         active_checkin.updated_at = datetime.utcnow()
         self.db.commit()
+        auto_checkin_engine.invalidate(vehicle_id)
         self.db.refresh(active_checkin)
         return active_checkin
 
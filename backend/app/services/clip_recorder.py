@@ -0,0 +1,194 @@
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, List, Tuple, Deque, Dict
+import logging
+import queue
+import threading
+import time
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingClip:
+    def __init__(self, path: Path, frames: List[Tuple[float, bytes]], until: float, max_until: float):
+        self.path = path
+        self.frames = frames
+        self.until = until
+        self.max_until = max_until
+
+
+class ClipRecorder:
+    """
+    Clip degli eventi da un buffer di pre-roll in memoria.
+
+    Invece di registrare di continuo, ogni telecamera tiene in memoria gli
+    ultimi `pre_seconds` secondi come JPEG (a `fps` frame al secondo e al
+    massimo `max_buffer_bytes`). Quando scatta un evento (passaggio targa,
+    veicolo sconosciuto) il pre-roll viene congelato, si aggiungono i frame dei
+    `post_seconds` successivi e la clip viene scritta su disco da un thread
+    separato. Eventi ravvicinati estendono la clip in corso invece di crearne
+    una nuova, fino a `max_clip_seconds`.
+
+    Gli eventi con una chiave (la targa) vengono ignorati se la stessa chiave è
+    stata vista negli ultimi `debounce_seconds`: un'auto ferma davanti alla
+    telecamera non estende la clip a ogni frame. L'encoding JPEG di add_frame
+    è pesante, quindi il chiamante controlla prima wants_frame e lo esegue
+    fuori dall'event loop.
+    """
+
+    def __init__(
+        self,
+        camera_id: str,
+        clips_dir: str = "uploads/clips",
+        pre_seconds: float = 5.0,
+        post_seconds: float = 5.0,
+        fps: float = 5.0,
+        jpeg_quality: int = 70,
+        max_buffer_bytes: int = 20 * 1024 * 1024,
+        max_clip_seconds: float = 60.0,
+        debounce_seconds: float = 300.0
+    ):
+        self.camera_id = camera_id
+        self.clips_dir = Path(clips_dir)
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.frame_interval = 1.0 / fps if fps > 0 else 0.0
+        self.fps = fps
+        self.jpeg_quality = jpeg_quality
+        self.max_buffer_bytes = max_buffer_bytes
+        self.max_clip_seconds = max_clip_seconds
+        self.debounce_seconds = debounce_seconds
+        self._last_seen: Dict[str, float] = {}
+        self._ring: Deque[Tuple[float, bytes]] = deque()
+        self._ring_bytes = 0
+        self._last_kept = 0.0
+        self._pending: Optional[_PendingClip] = None
+        self._lock = threading.Lock()
+        self._writer_queue: "queue.Queue[Optional[_PendingClip]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self.clips_written = 0
+
+    def wants_frame(self, timestamp: float) -> bool:
+        """True se un frame a `timestamp` verrebbe tenuto dal campionamento a `fps`"""
+        return timestamp - self._last_kept >= self.frame_interval
+
+    def add_frame(self, frame: np.ndarray, timestamp: float = None):
+        """Aggiunge il frame al pre-roll (e alla clip in corso), campionato a `fps`"""
+        timestamp = timestamp or time.time()
+        if not self.wants_frame(timestamp):
+            return
+        self._last_kept = timestamp
+
+        ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            return
+        data = jpeg.tobytes()
+
+        with self._lock:
+            self._ring.append((timestamp, data))
+            self._ring_bytes += len(data)
+            while self._ring and (
+                self._ring[0][0] < timestamp - self.pre_seconds or self._ring_bytes > self.max_buffer_bytes
+            ):
+                self._ring_bytes -= len(self._ring.popleft()[1])
+
+            pending = self._pending
+            if pending is None:
+                return
+            pending.frames.append((timestamp, data))
+            if timestamp >= pending.until:
+                self._pending = None
+                self._submit(pending)
+
+    def trigger(self, timestamp: float = None, key: str = None, force: bool = False) -> Optional[str]:
+        """
+        Segnala un evento e restituisce il percorso della clip che lo conterrà
+        (scritta dopo il post-roll), o None se `key` era già in vista
+        negli ultimi `debounce_seconds` e l'evento non è forzato
+        """
+        timestamp = timestamp or time.time()
+        with self._lock:
+            if key is not None:
+                last_seen = self._last_seen.get(key)
+                self._last_seen[key] = timestamp
+                if len(self._last_seen) > 256:
+                    self._last_seen = {
+                        k: seen for k, seen in self._last_seen.items()
+                        if timestamp - seen < self.debounce_seconds
+                    }
+                if not force and last_seen is not None and timestamp - last_seen < self.debounce_seconds:
+                    return None
+
+            pending = self._pending
+            if pending is not None:
+                pending.until = min(max(pending.until, timestamp + self.post_seconds), pending.max_until)
+                return str(pending.path)
+
+            name = f"clip_{self.camera_id}_{datetime.fromtimestamp(timestamp).strftime('%Y%m%d_%H%M%S')}_{int(timestamp * 1000) % 1000:03d}.avi"
+            start = self._ring[0][0] if self._ring else timestamp
+            self._pending = _PendingClip(
+                self.clips_dir / name,
+                list(self._ring),
+                until=timestamp + self.post_seconds,
+                max_until=start + self.max_clip_seconds
+            )
+            return str(self._pending.path)
+
+    def flush(self):
+        """Scrive subito la clip in corso (fine dello stream) e attende il writer"""
+        with self._lock:
+            pending, self._pending = self._pending, None
+        if pending is not None:
+            self._submit(pending)
+        if self._writer and self._writer.is_alive():
+            self._writer_queue.put(None)
+            self._writer.join(timeout=30)
+        self._writer = None
+
+    def _submit(self, pending: _PendingClip):
+        if self._writer is None or not self._writer.is_alive():
+            self._writer = threading.Thread(target=self._run_writer, name=f"clips-{self.camera_id}", daemon=True)
+            self._writer.start()
+        self._writer_queue.put(pending)
+
+    def _run_writer(self):
+        while True:
+            pending = self._writer_queue.get()
+            if pending is None:
+                return
+            try:
+                self._write(pending)
+            except Exception as e:
+                logger.error(f"Errore nella scrittura della clip {pending.path}: {e}")
+
+    def _write(self, pending: _PendingClip):
+        if not pending.frames:
+            return
+        self.clips_dir.mkdir(parents=True, exist_ok=True)
+        first = cv2.imdecode(np.frombuffer(pending.frames[0][1], dtype=np.uint8), cv2.IMREAD_COLOR)
+        height, width = first.shape[:2]
+        # MJPEG: solo decodifica e ricompressione JPEG dei pochi frame della clip
+        writer = cv2.VideoWriter(str(pending.path), cv2.VideoWriter_fourcc(*"MJPG"), self.fps, (width, height))
+        try:
+            writer.write(first)
+            for _, data in pending.frames[1:]:
+                frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if frame is not None and frame.shape[:2] == (height, width):
+                    writer.write(frame)
+        finally:
+            writer.release()
+        self.clips_written += 1
+        duration = pending.frames[-1][0] - pending.frames[0][0]
+        logger.info(f"Clip salvata: {pending.path} ({len(pending.frames)} frame, {duration:.1f}s)")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "buffered_frames": len(self._ring),
+                "buffered_bytes": self._ring_bytes,
+                "recording": self._pending is not None,
+                "clips_written": self.clips_written
+            }
@@ -1,7 +1,11 @@
 from typing import List, Optional
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from app.core.database import Customer
 from app.schemas.customer import CustomerCreate, CustomerUpdate
+from app.services.list_query import Page, paginate
+from app.services.plate_cache import plate_cache
+from app.services import text_search
 from datetime import datetime
 
 class CustomerService:
@@ -14,6 +18,13 @@ class CustomerService:
     def get_customers(self, skip: int = 0, limit: int = 100) -> List[Customer]:
         return self.db.query(Customer).offset(skip).limit(limit).all()
 
+    def list_customers(self, limit: int = 100, cursor: str = None, skip: int = 0,
+                       search: str = None) -> Page:
+        if search:
+            # Risultati per rilevanza: una sola pagina, senza cursore
+            return Page(self.search_customers(search, limit=limit), None)
+        return paginate(self.db, select(Customer), (Customer.id,), limit, cursor, skip)
+
     def get_customer_by_email(self, email: str) -> Optional[Customer]:
         return self.db.query(Customer).filter(Customer.email == email).first()
 
@@ -28,6 +39,7 @@ class CustomerService:
         self.db.add(db_customer)
         self.db.commit()
         self.db.refresh(db_customer)
+        text_search.invalidate("customers")
         return db_customer
 
     def update_customer(self, customer_id: int, customer: CustomerUpdate) -> Optional[Customer]:
@@ -42,6 +54,8 @@ class CustomerService:
         db_customer.updated_at = datetime.utcnow()
         self.db.commit()
         self.db.refresh(db_customer)
+        plate_cache.invalidate_customer(customer_id)
+        text_search.invalidate("customers")
         return db_customer
 
     def delete_customer(self, customer_id: int) -> bool:
@@ -51,11 +65,10 @@ class CustomerService:
         
         self.db.delete(db_customer)
         self.db.commit()
+        plate_cache.invalidate_customer(customer_id)
+        text_search.invalidate("customers")
         return True
 
-    def search_customers(self, query: str) -> List[Customer]:
-        return self.db.query(Customer).filter(
-            Customer.full_name.ilike(f"%{query}%") |
-            Customer.email.ilike(f"%{query}%") |
-            Customer.phone.ilike(f"%{query}%")
-        ).all()
+    def search_customers(self, query: str, limit: int = 50) -> List[Customer]:
+        """Customers by name, email or phone (phone prefix first), most relevant first"""
+        return text_search.search(self.db, text_search.CUSTOMER_SEARCH, query, limit)
@@ -0,0 +1,136 @@
+"""
+Partizionamento mensile di ai_detections e retention delle rilevazioni grezze.
+
+Su Postgres ai_detections è partizionata per intervallo su detected_at, una
+partizione per mese UTC (ai_detections_pAAAAMM) più una partizione di default
+per le righe fuori dai mesi creati. La manutenzione crea in anticipo le
+partizioni dei prossimi mesi e applica la retention staccando ed eliminando
+le partizioni scadute: un DROP TABLE invece di un DELETE su milioni di righe.
+I rollup orari (vedi detection_rollups) non vengono toccati dalla retention.
+
+Su SQLite o su una ai_detections non partizionata la retention ripiega su un
+DELETE per detected_at.
+"""
+from datetime import datetime, timezone
+from typing import List, Optional
+import logging
+import re
+from sqlalchemy import delete, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from app.core.database import AIDetection, AIDetectionEventKey, AIDetectionRollupDirtyHour
+
+logger = logging.getLogger(__name__)
+
+PARTITION_PREFIX = "ai_detections_p"
+DEFAULT_PARTITION = "ai_detections_default"
+_PARTITION_NAME = re.compile(rf"^{PARTITION_PREFIX}(\d{{4}})(\d{{2}})$")
+
+
+def month_start(value: datetime) -> datetime:
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{PARTITION_PREFIX}{month:%Y%m}"
+
+
+def is_partitioned(db: Session) -> bool:
+    """True se ai_detections è una tabella partizionata (solo Postgres)"""
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    return bool(db.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('ai_detections'))"
+    )).scalar())
+
+
+def monthly_partitions(db: Session) -> List[datetime]:
+    """Mesi (inizio, UTC) delle partizioni mensili esistenti, in ordine"""
+    names = db.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass('ai_detections')"
+    )).scalars()
+    months = []
+    for name in names:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            months.append(datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc))
+    return sorted(months)
+
+
+def ensure_partitions(db: Session, months_ahead: int = 2, now: datetime = None) -> List[str]:
+    """Crea le partizioni dal mese corrente a `months_ahead` mesi in avanti; restituisce le nuove"""
+    if not is_partitioned(db):
+        return []
+    current = month_start(now or datetime.now(timezone.utc))
+    existing = set(monthly_partitions(db))
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if month in existing:
+            continue
+        name = partition_name(month)
+        try:
+            db.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF ai_detections "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+            ))
+            db.commit()
+        except SQLAlchemyError as e:
+            # Tipicamente righe del mese già finite nella partizione di default
+            db.rollback()
+            logger.error(f"Impossibile creare la partizione {name}: {e}")
+            continue
+        created.append(name)
+        logger.info(f"Partizione {name} creata")
+    return created
+
+
+def apply_retention(db: Session, retention_months: int, now: datetime = None) -> List[str]:
+    """
+    Elimina le rilevazioni grezze più vecchie di `retention_months` mesi interi
+    (0 = nessuna retention); restituisce le partizioni eliminate
+    """
+    if retention_months <= 0:
+        return []
+    cutoff = add_months(month_start(now or datetime.now(timezone.utc)), -retention_months)
+
+    dropped = []
+    if is_partitioned(db):
+        for month in monthly_partitions(db):
+            if add_months(month, 1) > cutoff:
+                break
+            name = partition_name(month)
+            # DETACH prima del DROP: il lock esclusivo sulla tabella padre dura un istante
+            db.execute(text(f"ALTER TABLE ai_detections DETACH PARTITION {name}"))
+            db.execute(text(f"DROP TABLE {name}"))
+            db.commit()
+            dropped.append(name)
+            logger.info(f"Partizione {name} eliminata (retention {retention_months} mesi)")
+        deleted = db.execute(text(
+            f"DELETE FROM {DEFAULT_PARTITION} WHERE detected_at < :cutoff"
+        ), {"cutoff": cutoff}).rowcount
+    else:
+        deleted = db.execute(delete(AIDetection).where(AIDetection.detected_at < cutoff)).rowcount
+    keys = db.execute(delete(AIDetectionEventKey).where(AIDetectionEventKey.detected_at < cutoff)).rowcount
+    # Le ore eliminate non vanno più ricalcolate: il rollup senza righe grezze le azzererebbe
+    db.execute(delete(AIDetectionRollupDirtyHour).where(AIDetectionRollupDirtyHour.bucket < cutoff))
+    db.commit()
+    if deleted or keys:
+        logger.info(f"Retention: {deleted} rilevazioni e {keys} chiavi evento eliminate prima del {cutoff:%Y-%m-%d}")
+    return dropped
+
+
+def partition_status(db: Session) -> Optional[dict]:
+    """Partizioni esistenti e righe nella partizione di default, None se la tabella non è partizionata"""
+    if not is_partitioned(db):
+        return None
+    return {
+        "partitions": [partition_name(month) for month in monthly_partitions(db)],
+        "default_rows": db.execute(text(f"SELECT count(*) FROM {DEFAULT_PARTITION}")).scalar()
+    }
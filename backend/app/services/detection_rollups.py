@@ -0,0 +1,304 @@
+"""
+Rollup orari delle rilevazioni (ai_detection_rollups_hourly), per telecamera
+e per veicolo trovato/sconosciuto.
+
+Le statistiche leggono i rollup per le ore complete già aggregate e le righe
+grezze solo per il resto dell'intervallo (le ore ai bordi e la coda non
+ancora aggregata), in un'unica query con aggregati FILTER, quindi il costo
+non cresce con lo storico. Il rollup ricalcola per intero le ultime ore a
+ogni esecuzione: rilevazioni arrivate in ritardo (eventi degli edge agent) o aggiornate dopo l'abbinamento con il
+veicolo entrano nei conteggi entro la finestra di ricalcolo. La finestra parte
+al più tardi dall'ultima ora aggregata (un'interruzione del worker più lunga
+della finestra non lascia buchi), e le ore più vecchie modificate dopo il
+rollup (backfill, PUT /ai/{id}, eventi in ritardo) vengono segnate con
+mark_hours_dirty e ricalcolate alla prossima esecuzione.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, Callable, Hashable, Iterable, List, Tuple
+import logging
+import threading
+import time
+from sqlalchemy import select, delete, insert, func, case, literal, union_all, and_, bindparam
+from sqlalchemy.orm import Session
+from app.core.database import AIDetection, AIDetectionRollup, AIDetectionRollupDirtyHour
+from app.services.ocr_cache import TTLCache, is_missing
+
+logger = logging.getLogger(__name__)
+
+HOUR = timedelta(hours=1)
+TOTALS = ("detections", "processed", "vehicle_found", "with_appointments", "confidence_sum", "detections_since")
+
+# Fine dell'ultima ora aggregata, riletta al più ogni HORIZON_TTL secondi. Un valore
+# vecchio è comunque corretto: le ore successive si leggono dalle righe grezze
+HORIZON_TTL = 60.0
+_horizon: Dict[Any, tuple] = {}
+_horizon_lock = threading.Lock()
+
+
+def floor_hour(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def ceil_hour(value: datetime) -> datetime:
+    floored = floor_hour(value)
+    return floored if floored == value else floored + HOUR
+
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    # Datetime senza fuso: ora locale, come li interpreta Postgres su timestamptz.
+    # In UTC anche per SQLite, che salva detected_at in UTC senza fuso
+    return value.astimezone(timezone.utc) if value is not None else None
+
+
+def has_appointments():
+    """Rilevazione con appuntamenti del giorno nel risultato strutturato"""
+    return AIDetection.detection_data["appointments"].as_string() != "[]"
+
+
+# Formato con cui SQLAlchemy salva e confronta i DateTime su SQLite: i bucket
+# calcolati con strftime devono coincidere con i parametri delle query
+_SQLITE_HOUR = "%Y-%m-%d %H:00:00.000000"
+
+
+def _hour_bucket(db: Session):
+    if db.get_bind().dialect.name == "sqlite":
+        return func.strftime(_SQLITE_HOUR, AIDetection.detected_at)
+    return func.date_trunc("hour", AIDetection.detected_at)
+
+
+def _in_hours(db: Session, bucket, start: datetime, end: datetime):
+    """
+    Rilevazioni delle ore [start, end). Su SQLite si confronta il bucket, così
+    una rilevazione salvata senza microsecondi (CURRENT_TIMESTAMP) allo scoccare
+    dell'ora non finisce in un bucket fuori dall'intervallo cancellato
+    """
+    if db.get_bind().dialect.name == "sqlite":
+        return and_(bucket >= start, bucket < end)
+    return and_(AIDetection.detected_at >= start, AIDetection.detected_at < end)
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite non conserva il fuso: bucket e detected_at sono in UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _dirty_insert(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        raise RuntimeError(f"Database non supportato per i rollup: {dialect}")
+    statement = dialect_insert(AIDetectionRollupDirtyHour)
+    return statement.on_conflict_do_update(
+        index_elements=["bucket"], set_={"marked_at": statement.excluded.marked_at}
+    )
+
+
+def mark_hours_dirty(db: Session, detected_at: Iterable[datetime], before: datetime = None) -> int:
+    """
+    Segna da ricalcolare le ore delle rilevazioni indicate (solo quelle prima di
+    `before`, se indicato), nella transazione del chiamante: il commit insieme
+    alle modifiche, o entrambe o nessuna. Una nuova segnalazione aggiorna
+    marked_at, così il rollup in corso non la cancella
+    """
+    buckets = {floor_hour(_utc(_as_utc(value))) for value in detected_at if value is not None}
+    if before is not None:
+        buckets = {bucket for bucket in buckets if bucket < _utc(before)}
+    if not buckets:
+        return 0
+    marked_at = datetime.now(timezone.utc)
+    db.execute(_dirty_insert(db), [{"bucket": bucket, "marked_at": marked_at} for bucket in sorted(buckets)])
+    return len(buckets)
+
+
+def _hour_ranges(hours: Iterable[datetime]) -> List[Tuple[datetime, datetime]]:
+    """Ore raggruppate in intervalli [inizio, fine) di ore consecutive"""
+    ranges: List[Tuple[datetime, datetime]] = []
+    for hour in sorted(hours):
+        if ranges and ranges[-1][1] == hour:
+            ranges[-1] = (ranges[-1][0], hour + HOUR)
+        else:
+            ranges.append((hour, hour + HOUR))
+    return ranges
+
+
+def rolled_until(db: Session, max_age: float = 0.0) -> Optional[datetime]:
+    """
+    Fine dell'ultima ora aggregata (le ore successive si leggono dalle righe
+    grezze); con `max_age` riusa il valore letto da meno di max_age secondi
+    """
+    key = db.get_bind().url
+    now = time.monotonic()
+    cached = _horizon.get(key)
+    if max_age and cached is not None and now - cached[0] < max_age:
+        return cached[1]
+
+    last = db.execute(select(func.max(AIDetectionRollup.bucket))).scalar()
+    horizon = _as_utc(last) + HOUR if last is not None else None
+    with _horizon_lock:
+        _horizon[key] = (now, horizon)
+    return horizon
+
+
+def rollup_hours(db: Session, lookback_hours: int = 24, now: datetime = None) -> int:
+    """
+    Ricalcola i rollup delle ore complete delle ultime `lookback_hours` ore, o
+    dall'ultima ora aggregata se è più vecchia (alla prima esecuzione: dall'inizio
+    dello storico), più le ore segnate da mark_hours_dirty; restituisce le righe scritte
+    """
+    until = floor_hour(_utc(now) or datetime.now(timezone.utc))
+    horizon = rolled_until(db)
+    if horizon is None:
+        first = db.execute(select(func.min(AIDetection.detected_at))).scalar()
+        if first is None:
+            return 0
+        since = floor_hour(_as_utc(first))
+    else:
+        since = min(until - timedelta(hours=lookback_hours), horizon)
+
+    # Segnalazioni lette prima dell'aggregazione: quelle arrivate o rinnovate dopo
+    # restano (marked_at diverso) e vengono ricalcolate alla prossima esecuzione
+    dirty = [
+        (_as_utc(bucket), marked_at) for bucket, marked_at in db.execute(
+            select(AIDetectionRollupDirtyHour.bucket, AIDetectionRollupDirtyHour.marked_at)
+            .where(AIDetectionRollupDirtyHour.bucket < until)
+        ).all()
+    ]
+    ranges = [(since, until)] if since < until else []
+    ranges += _hour_ranges(bucket for bucket, _ in dirty if bucket < since)
+
+    written = sum(_rollup_range(db, start, end) for start, end in ranges)
+    if dirty:
+        # executemany di una DELETE: a livello Core (la sessione non supporta DELETE ORM multi-parametro)
+        db.connection().execute(
+            delete(AIDetectionRollupDirtyHour).where(
+                AIDetectionRollupDirtyHour.bucket == bindparam("dirty_bucket"),
+                AIDetectionRollupDirtyHour.marked_at == bindparam("dirty_marked_at")
+            ),
+            [{"dirty_bucket": bucket, "dirty_marked_at": marked_at} for bucket, marked_at in dirty]
+        )
+    db.commit()
+    # Orizzonte aggiornato anche per summarize() in questo processo
+    rolled_until(db)
+    extra = f" + {len(ranges) - 1} intervalli segnati" if len(ranges) > 1 else ""
+    logger.info(f"Rollup rilevazioni {since:%Y-%m-%d %H:00} - {until:%Y-%m-%d %H:00}{extra}: {written} righe")
+    return written
+
+
+def _rollup_range(db: Session, since: datetime, until: datetime) -> int:
+    """Riscrive i rollup delle ore [since, until), senza commit"""
+    bucket = _hour_bucket(db).label("bucket")
+    camera_id = func.coalesce(AIDetection.source, literal("")).label("camera_id")
+    vehicle_found = AIDetection.vehicle_id.isnot(None).label("vehicle_found")
+    aggregate = (
+        select(
+            bucket,
+            camera_id,
+            vehicle_found,
+            func.count(AIDetection.id),
+            func.sum(case((AIDetection.processed == True, 1), else_=0)),
+            func.sum(case((has_appointments(), 1), else_=0)),
+            func.coalesce(func.sum(AIDetection.confidence), 0.0)
+        )
+        .where(_in_hours(db, _hour_bucket(db), since, until))
+        .group_by(bucket, camera_id, vehicle_found)
+    )
+
+    # Ore ricalcolate per intero: una rilevazione passata da sconosciuta a
+    # trovata cambia gruppo, quindi si cancella e si riscrive invece di un upsert
+    db.execute(delete(AIDetectionRollup).where(AIDetectionRollup.bucket >= since, AIDetectionRollup.bucket < until))
+    return db.execute(insert(AIDetectionRollup).from_select(
+        ["bucket", "camera_id", "vehicle_found", "detections", "processed", "with_appointments", "confidence_sum"],
+        aggregate
+    )).rowcount
+
+
+def _raw_branch(start: Optional[datetime], end: Optional[datetime], since: Optional[datetime]):
+    query = select(
+        func.count(AIDetection.id).label("detections"),
+        func.count(AIDetection.id).filter(AIDetection.processed == True).label("processed"),
+        func.count(AIDetection.id).filter(AIDetection.vehicle_id.isnot(None)).label("vehicle_found"),
+        func.count(AIDetection.id).filter(has_appointments()).label("with_appointments"),
+        func.sum(AIDetection.confidence).label("confidence_sum"),
+        (func.count(AIDetection.id).filter(AIDetection.detected_at >= since) if since is not None
+         else literal(0)).label("detections_since")
+    )
+    if start is not None:
+        query = query.where(AIDetection.detected_at >= start)
+    if end is not None:
+        query = query.where(AIDetection.detected_at < end)
+    return query
+
+
+def _rollup_branch(start: Optional[datetime], end: datetime, since: Optional[datetime]):
+    detections = func.sum(AIDetectionRollup.detections)
+    query = select(
+        detections.label("detections"),
+        func.sum(AIDetectionRollup.processed).label("processed"),
+        detections.filter(AIDetectionRollup.vehicle_found == True).label("vehicle_found"),
+        func.sum(AIDetectionRollup.with_appointments).label("with_appointments"),
+        func.sum(AIDetectionRollup.confidence_sum).label("confidence_sum"),
+        (detections.filter(AIDetectionRollup.bucket >= since) if since is not None
+         else literal(0)).label("detections_since")
+    ).where(AIDetectionRollup.bucket < end)
+    if start is not None:
+        query = query.where(AIDetectionRollup.bucket >= start)
+    return query
+
+
+def summarize(db: Session, start: datetime = None, end: datetime = None, since: datetime = None,
+              extra: Dict[str, Any] = None) -> Dict:
+    """
+    Totali delle rilevazioni con detected_at in [start, end) (None = senza limite)
+    in un'unica query: rollup per le ore complete già aggregate, righe grezze per
+    il resto. `since` aggiunge il conteggio da quell'istante (detections_since,
+    all'ora per la parte aggregata); `extra` sono sottoquery scalari calcolate
+    nella stessa SELECT (es. conteggi di altre tabelle per la stessa scheda)
+    """
+    start, end, since = _utc(start), _utc(end), _utc(since)
+    rolled = rolled_until(db, max_age=HORIZON_TTL)
+    low = ceil_hour(start) if start is not None else None
+    high = floor_hour(end) if end is not None else rolled
+    if rolled is not None and high is not None:
+        high = min(high, rolled)
+
+    if rolled is None or high is None or (low is not None and low >= high):
+        branches = [_raw_branch(start, end, since)]
+    else:
+        branches = [_rollup_branch(low, high, since), _raw_branch(high, end, since)]
+        if start is not None and start < low:
+            branches.append(_raw_branch(start, low, since))
+    parts = union_all(*branches).subquery() if len(branches) > 1 else branches[0].subquery()
+
+    columns = [func.sum(parts.c[name]).label(name) for name in TOTALS]
+    columns += [subquery.label(name) for name, subquery in (extra or {}).items()]
+    row = db.execute(select(*columns)).mappings().one()
+
+    totals = {name: int(row[name] or 0) for name in TOTALS if name != "confidence_sum"}
+    totals["confidence_sum"] = float(row["confidence_sum"] or 0.0)
+    totals.update({name: row[name] for name in (extra or {})})
+    return totals
+
+
+_stats_cache: Optional[TTLCache] = None
+
+
+def cached(key: Hashable, compute: Callable[[], Any]) -> Any:
+    """
+    Risultato di compute() riusato per STATS_CACHE_TTL_SECONDS (0 = nessuna
+    cache): le dashboard interrogano le statistiche a ogni refresh
+    """
+    global _stats_cache
+    from app.core.config import settings
+
+    if settings.STATS_CACHE_TTL_SECONDS <= 0:
+        return compute()
+    if _stats_cache is None:
+        _stats_cache = TTLCache("stats", max_size=64, ttl_seconds=settings.STATS_CACHE_TTL_SECONDS)
+    value = _stats_cache.get(key)
+    if is_missing(value):
+        value = compute()
+        _stats_cache.put(key, value)
+    return value
@@ -0,0 +1,217 @@
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional, List, Dict, Callable
+import json
+import logging
+import queue
+import threading
+import time
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.database import SessionLocal, AIDetection
+from app.core.metrics import (
+    record_detection_sink_flush,
+    record_detection_sink_dropped,
+    set_detection_sink_queue_size
+)
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+def detection_row_from_result(result: Dict, confidence: float, source: str = None, is_automatic: bool = True) -> Dict:
+    """Converte il risultato di process_detected_plate in una riga di ai_detections"""
+    vehicle_info = result.get("vehicle_info")
+    detected_at = result.get("detected_at")
+    return {
+        "license_plate": result["license_plate"],
+        "confidence": float(confidence),
+        "image_path": result.get("plate_image_path"),
+        "clip_path": result.get("clip_path"),
+        "processed": vehicle_info is not None,
+        "vehicle_id": vehicle_info["id"] if vehicle_info else None,
+        "detection_data": result,
+        "is_automatic": is_automatic,
+        "source": source,
+        "detected_at": _utc(datetime.fromisoformat(detected_at)) if detected_at else datetime.now(timezone.utc)
+    }
+
+
+def _utc(value: datetime) -> datetime:
+    # I risultati senza fuso (versioni precedenti) sono in ora locale
+    return value.astimezone(timezone.utc)
+
+
+class DetectionSink:
+    """
+    Persistenza asincrona e a lotti delle rilevazioni.
+
+    Le rilevazioni vengono accodate senza bloccare il ciclo dei frame; un thread
+    dedicato, con sessioni proprie, le scrive con un INSERT multi-riga ogni
+    `batch_size` eventi o ogni `flush_interval_ms` millisecondi.
+
+    Un lotto fallito per un errore transitorio (connessione persa, database
+    riavviato) viene ritentato fino a `max_attempts` volte; se fallisce ancora,
+    o per una riga non valida (es. vehicle_id di un veicolo eliminato), le righe
+    vengono scritte una per volta e quelle rifiutate finiscono in
+    `dead_letter_path` (JSON, una per riga) invece di perdere l'intero lotto.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 200,
+        flush_interval_ms: int = 500,
+        max_queue: int = 10000,
+        session_factory: Callable[[], Session] = SessionLocal,
+        max_attempts: int = 3,
+        retry_delay: float = 0.5,
+        dead_letter_path: str = "detection_dead_letter.jsonl"
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.session_factory = session_factory
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        self.dead_letter_path = Path(dead_letter_path)
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.flushed_rows = 0
+        self.dropped_rows = 0
+        self.dead_letter_rows = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="detection-sink", daemon=True)
+            self._thread.start()
+            logger.info("Detection sink avviato")
+
+    def submit(self, row: Dict) -> bool:
+        """Accoda una rilevazione; se la coda è piena la rilevazione viene scartata"""
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped_rows += 1
+            record_detection_sink_dropped()
+            logger.warning("Coda rilevazioni piena: rilevazione scartata")
+            return False
+        set_detection_sink_queue_size(self._queue.qsize())
+        return True
+
+    def stop(self, timeout: float = 5.0):
+        """Svuota la coda scrivendo le rilevazioni rimaste e ferma il thread"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+            logger.info("Detection sink fermato")
+
+    def _run(self):
+        batch: List[Dict] = []
+        deadline = time.monotonic() + self.flush_interval
+
+        while True:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._flush(batch)
+                return
+            if item is not None:
+                batch.append(item)
+
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _flush(self, batch: List[Dict]):
+        set_detection_sink_queue_size(self._queue.qsize())
+        if not batch:
+            return
+
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self._insert(batch)
+                self.flushed_rows += len(batch)
+                record_detection_sink_flush("success", len(batch))
+                return
+            except (IntegrityError, DataError) as e:
+                # Ritentare il lotto non serve: c'è almeno una riga non valida
+                logger.warning(f"Lotto di {len(batch)} rilevazioni rifiutato, salvataggio riga per riga: {e}")
+                break
+            except Exception as e:
+                record_detection_sink_flush("error", len(batch))
+                logger.warning(f"Errore nel salvataggio di {len(batch)} rilevazioni "
+                               f"(tentativo {attempt}/{self.max_attempts}): {e}")
+                if attempt < self.max_attempts:
+                    time.sleep(self.retry_delay * attempt)
+
+        self._flush_rows(batch)
+
+    def _insert(self, rows: List[Dict]):
+        db = self.session_factory()
+        try:
+            db.execute(insert(AIDetection), rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _flush_rows(self, batch: List[Dict]):
+        """Scrive le righe una per volta; quelle rifiutate vanno nel file dead letter"""
+        rejected = []
+        for row in batch:
+            try:
+                self._insert([row])
+                self.flushed_rows += 1
+            except Exception as e:
+                rejected.append({"row": row, "error": str(e)})
+        if len(batch) > len(rejected):
+            record_detection_sink_flush("success", len(batch) - len(rejected))
+        if rejected:
+            self._dead_letter(rejected)
+
+    def _dead_letter(self, rejected: List[Dict]):
+        try:
+            with open(self.dead_letter_path, "a", encoding="utf-8") as file:
+                for entry in rejected:
+                    file.write(json.dumps(entry, default=str) + "\n")
+            self.dead_letter_rows += len(rejected)
+            record_detection_sink_flush("dead_letter", len(rejected))
+            logger.error(f"{len(rejected)} rilevazioni non salvate, scritte in {self.dead_letter_path}")
+        except OSError as e:
+            record_detection_sink_flush("error", len(rejected))
+            logger.error(f"{len(rejected)} rilevazioni perse: file dead letter non scrivibile ({e})")
+
+    def stats(self) -> Dict:
+        return {
+            "queued": self._queue.qsize(),
+            "flushed_rows": self.flushed_rows,
+            "dropped_rows": self.dropped_rows,
+            "dead_letter_rows": self.dead_letter_rows,
+            "running": self._thread is not None and self._thread.is_alive()
+        }
+
+
+detection_sink = DetectionSink(
+    batch_size=settings.DETECTION_SINK_BATCH_SIZE,
+    flush_interval_ms=settings.DETECTION_SINK_FLUSH_INTERVAL_MS,
+    max_queue=settings.DETECTION_SINK_MAX_QUEUE,
+    max_attempts=settings.DETECTION_SINK_MAX_ATTEMPTS,
+    dead_letter_path=settings.DETECTION_SINK_DEAD_LETTER_PATH
+)
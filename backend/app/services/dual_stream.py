@@ -0,0 +1,148 @@
+from typing import Optional, Dict, List
+import logging
+import threading
+import time
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class _FrameRequest:
+    def __init__(self, since: float):
+        self.since = since
+        self.event = threading.Event()
+        self.frame: Optional[np.ndarray] = None
+        self.grabbed_at = 0.0
+
+
+class MainStreamReader:
+    """
+    Lettore del main stream (1080p/4K) di una telecamera in modalità doppio
+    stream. Il thread di lettura fa solo grab() per restare allineato al
+    tempo reale; la conversione in BGR e la copia del frame (retrieve) avvengono
+    solo per le richieste in attesa.
+
+    Il monitoraggio chiede il frame ad alta risoluzione con request() nel
+    momento in cui cattura il frame del substream, non dopo l'inferenza: il
+    frame ritagliato è quello dell'istante dei riquadri, non uno più recente di
+    una latenza di inferenza (in cui un'auto in movimento esce dal margine).
+    Un retrieve serve tutte le richieste in attesa.
+    """
+
+    # Richieste in attesa al massimo (frame scartati dallo scheduler non vengono mai ritirati)
+    MAX_PENDING = 4
+
+    def __init__(self, url: str, max_skew: float = 0.5, reconnect_seconds: float = 2.0):
+        self.url = url
+        self.max_skew = max_skew
+        self.reconnect_seconds = reconnect_seconds
+        self._capture = None
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._lock = threading.Lock()
+        self._requests: List[_FrameRequest] = []
+        self.frames_grabbed = 0
+        self.frames_retrieved = 0
+        self.frames_fetched = 0
+        self.fetch_misses = 0
+        self._skew_total = 0.0
+
+    def start(self) -> bool:
+        self._capture = cv2.VideoCapture(self.url)
+        if not self._capture.isOpened():
+            logger.error(f"Impossibile aprire il main stream: {self.url}")
+            self._capture.release()
+            self._capture = None
+            return False
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="main-stream", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._capture is not None:
+            self._capture.release()
+            self._capture = None
+
+    def _run(self):
+        while self._running:
+            if not self._capture.grab():
+                logger.warning(f"Main stream interrotto, riconnessione: {self.url}")
+                self._capture.release()
+                time.sleep(self.reconnect_seconds)
+                self._capture = cv2.VideoCapture(self.url)
+                continue
+            grabbed_at = time.monotonic()
+            self.frames_grabbed += 1
+
+            with self._lock:
+                ready = [request for request in self._requests if request.since <= grabbed_at]
+                if not ready:
+                    continue
+                self._requests = [request for request in self._requests if request.since > grabbed_at]
+            ret, frame = self._capture.retrieve()
+            if ret:
+                self.frames_retrieved += 1
+            for request in ready:
+                if ret:
+                    request.frame = frame
+                    request.grabbed_at = grabbed_at
+                request.event.set()
+
+    def request(self, since: float) -> _FrameRequest:
+        """
+        Prenota il primo frame del main stream letto dopo `since` (istante
+        monotonic di cattura del frame del substream); si ritira con wait()
+        """
+        request = _FrameRequest(since)
+        with self._lock:
+            if not self._running:
+                # Lettore fermo: wait() restituisce subito None
+                request.event.set()
+                return request
+            self._requests.append(request)
+            dropped = self._requests[:-self.MAX_PENDING]
+            del self._requests[:-self.MAX_PENDING]
+        for stale in dropped:
+            stale.event.set()
+        return request
+
+    def wait(self, request: _FrameRequest, timeout: float = 0.3) -> Optional[np.ndarray]:
+        """
+        Il frame della richiesta, o None se non arriva entro `timeout` o se è
+        troppo distante nel tempo per riportarci i riquadri
+        """
+        if not request.event.wait(timeout) or request.frame is None:
+            with self._lock:
+                if request in self._requests:
+                    self._requests.remove(request)
+            self.fetch_misses += 1
+            return None
+        skew = request.grabbed_at - request.since
+        if skew > self.max_skew:
+            self.fetch_misses += 1
+            return None
+        self.frames_fetched += 1
+        self._skew_total += skew
+        return request.frame
+
+    def fetch(self, since: float, timeout: float = 0.3) -> Optional[np.ndarray]:
+        """Il primo frame del main stream letto dopo `since`, atteso al massimo `timeout` secondi"""
+        if not self._running:
+            return None
+        return self.wait(self.request(since), timeout)
+
+    def stats(self) -> Dict:
+        return {
+            "main_stream_url": self.url,
+            "frames_grabbed": self.frames_grabbed,
+            "frames_retrieved": self.frames_retrieved,
+            "frames_fetched": self.frames_fetched,
+            "fetch_misses": self.fetch_misses,
+            "avg_skew_ms": round(self._skew_total / self.frames_fetched * 1000, 1) if self.frames_fetched else None
+        }
@@ -0,0 +1,165 @@
+from pathlib import Path
+from typing import Optional, List, Dict
+import gzip
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+import httpx
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+def encode_batch(events: List[Dict]) -> bytes:
+    """Lotto di eventi come NDJSON compresso con gzip"""
+    lines = "\n".join(json.dumps(event, separators=(",", ":")) for event in events)
+    return gzip.compress(lines.encode(), compresslevel=6)
+
+
+class EdgeUplink:
+    """
+    Invio a lotti degli eventi di passaggio targa all'API centrale.
+
+    Gli eventi vengono raccolti in memoria e inviati ogni `batch_size` eventi o
+    ogni `flush_interval` secondi. Se l'uplink non è raggiungibile il lotto
+    compresso viene salvato così com'è in `spool_dir` e reinviato, in ordine,
+    appena un invio torna a riuscire. Lo spool è limitato a `max_spool_bytes`:
+    oltre il limite si scartano i lotti più vecchi.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        token: str = None,
+        spool_dir: str = "edge_spool",
+        batch_size: int = 50,
+        flush_interval: float = 5.0,
+        max_spool_bytes: int = 500 * 1024 * 1024,
+        timeout: float = 10.0
+    ):
+        self.url = url
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_spool_bytes = max_spool_bytes
+        self.spool_dir = Path(spool_dir)
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        headers = {"Content-Type": "application/x-ndjson", "Content-Encoding": "gzip"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        self._client = httpx.Client(headers=headers, timeout=timeout)
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self.sent_events = 0
+        self.spooled_batches = 0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="edge-uplink", daemon=True)
+        self._thread.start()
+
+    def submit(self, event: Dict):
+        self._queue.put(event)
+
+    def stop(self, timeout: float = 15.0):
+        """Invia (o salva su disco) gli eventi rimasti e ferma il thread"""
+        if self._thread and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+        self._thread = None
+        self._client.close()
+
+    def _run(self):
+        # Lotti rimasti da un'interruzione precedente
+        self._drain_spool()
+
+        batch: List[Dict] = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._flush(batch)
+                return
+            if item is not None:
+                batch.append(item)
+
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _flush(self, batch: List[Dict]):
+        if not batch:
+            # Nessun evento nuovo: si riprova comunque lo spool
+            self._drain_spool()
+            return
+
+        body = encode_batch(batch)
+        if self._spool_files():
+            # Rispetta l'ordine: prima i lotti salvati, poi quello nuovo
+            self._spool(body)
+            self._drain_spool()
+        elif self._send(body):
+            self.sent_events += len(batch)
+        else:
+            self._spool(body)
+
+    def _send(self, body: bytes) -> bool:
+        """True se il lotto è stato accettato (o rifiutato in modo definitivo)"""
+        try:
+            response = self._client.post(self.url, content=body)
+        except httpx.HTTPError as e:
+            logger.warning(f"Uplink non raggiungibile: {e}")
+            return False
+
+        if response.status_code < 300:
+            return True
+        if 400 <= response.status_code < 500 and response.status_code not in (401, 403, 408, 429):
+            # Lotto non valido: reinviarlo non servirebbe e bloccherebbe lo spool
+            logger.error(f"Lotto rifiutato dall'API centrale ({response.status_code}): {response.text[:200]}")
+            return True
+        logger.warning(f"Invio lotto fallito ({response.status_code})")
+        return False
+
+    def _spool_files(self) -> List[Path]:
+        return sorted(self.spool_dir.glob("*.ndjson.gz"))
+
+    def _spool(self, body: bytes):
+        name = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.ndjson.gz"
+        temp_path = self.spool_dir / f".{name}.tmp"
+        temp_path.write_bytes(body)
+        os.replace(temp_path, self.spool_dir / name)
+        self.spooled_batches += 1
+
+        files = self._spool_files()
+        total = sum(path.stat().st_size for path in files)
+        while files and total > self.max_spool_bytes:
+            oldest = files.pop(0)
+            total -= oldest.stat().st_size
+            oldest.unlink()
+            logger.warning(f"Spool pieno: lotto {oldest.name} scartato")
+
+    def _drain_spool(self):
+        for path in self._spool_files():
+            if not self._send(path.read_bytes()):
+                return
+            path.unlink()
+            logger.info(f"Lotto {path.name} inviato dallo spool")
+
+    def stats(self) -> Dict:
+        files = self._spool_files()
+        return {
+            "sent_events": self.sent_events,
+            "spooled_batches": self.spooled_batches,
+            "spool_pending": len(files),
+            "spool_bytes": sum(path.stat().st_size for path in files)
+        }
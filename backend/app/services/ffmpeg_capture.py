@@ -0,0 +1,275 @@
+from typing import Optional, Dict, Tuple
+import logging
+import re
+import subprocess
+import threading
+import time
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MODE_FULL = "full"
+MODE_LOWRES = "lowres"
+MODE_KEYFRAMES = "keyframes"
+MODES = (MODE_FULL, MODE_LOWRES, MODE_KEYFRAMES)
+
+
+_versions: Dict[str, Tuple[int, int]] = {}
+
+
+def ffmpeg_version(ffmpeg_path: str = "ffmpeg") -> Tuple[int, int]:
+    """
+    (major, minor) di ffmpeg, letto una volta per eseguibile. Le build da git
+    ("N-12345-g...") non hanno un numero di versione: si assumono recenti.
+    """
+    if ffmpeg_path not in _versions:
+        version = (99, 0)
+        try:
+            output = subprocess.run(
+                [ffmpeg_path, "-hide_banner", "-version"], capture_output=True, text=True, timeout=10
+            ).stdout
+            match = re.match(r"ffmpeg version n?(\d+)\.(\d+)", output)
+            if match:
+                version = (int(match.group(1)), int(match.group(2)))
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.warning(f"Versione di ffmpeg non rilevata ({ffmpeg_path}): {e}")
+        _versions[ffmpeg_path] = version
+    return _versions[ffmpeg_path]
+
+
+class _Decoder:
+    """Un processo ffmpeg in un modo di decodifica, con il primo frame letto in anticipo"""
+
+    def __init__(self, process: subprocess.Popen, mode: str, shape: Tuple[int, int, int]):
+        self.process = process
+        self.mode = mode
+        self.shape = shape
+        self.started_at = time.monotonic()
+        self.first_frame: Optional[np.ndarray] = None
+        self.ready = threading.Event()
+
+    def read_into(self, image: np.ndarray) -> bool:
+        buffer = memoryview(image).cast("B")
+        received = 0
+        while received < len(buffer):
+            count = self.process.stdout.readinto(buffer[received:])
+            if not count:
+                return False
+            received += count
+        return True
+
+    def prefetch(self):
+        """Legge il primo frame (thread separato): il decoder è pronto quando arriva o quando fallisce"""
+        frame = np.empty(self.shape, dtype=np.uint8)
+        try:
+            if self.read_into(frame):
+                self.first_frame = frame
+        except (OSError, ValueError):
+            pass
+        self.ready.set()
+
+    def stop(self):
+        self.process.kill()
+        self.process.stdout.close()
+        self.process.wait(timeout=5)
+
+
+class FFmpegCapture:
+    """
+    Cattura tramite un processo ffmpeg che scrive frame BGR grezzi su pipe,
+    con l'interfaccia di cv2.VideoCapture usata dal monitoraggio (read, grab,
+    get, isOpened, release) e tre modi di decodifica:
+
+    - full: tutti i frame alla risoluzione originale;
+    - lowres: decodifica semplificata (niente deblocking, flag "fast") e
+      frame ridotti a `lowres_width` pixel, per conversione, copia e analisi
+      del movimento più leggere;
+    - keyframes: il decoder scarta i frame non chiave (-skip_frame nokey),
+      quindi si decodifica un frame per GOP.
+
+    Le opzioni del decoder di ffmpeg non si cambiano a processo avviato, quindi
+    un cambio di modo apre una seconda sessione: il tempo di risveglio è
+    l'handshake RTSP più l'attesa del keyframe successivo (fino a un GOP, tipicamente
+    1-2 s). Il cambio è "make-before-break": set_mode avvia il nuovo processo e
+    read continua a servire i frame del precedente finché poll_switch non trova
+    pronto il primo frame del nuovo; solo allora il vecchio viene chiuso. Il
+    monitoraggio non resta mai senza frame, e il tempo di risveglio misurato è
+    in stats() (last_wakeup_ms, avg_wakeup_ms).
+    """
+
+    def __init__(self, url: str, mode: str = MODE_FULL, lowres_width: int = 640, ffmpeg_path: str = "ffmpeg"):
+        if mode not in MODES:
+            raise ValueError(f"Modo di decodifica non supportato: {mode}")
+        self.url = url
+        self.mode = mode
+        self.lowres_width = lowres_width
+        self.ffmpeg_path = ffmpeg_path
+        self.width = 0
+        self.height = 0
+        self.fps = 0.0
+        self.mode_switches = 0
+        self.frames_read = 0
+        self.last_wakeup = None
+        self._wakeup_total = 0.0
+        self._decoder: Optional[_Decoder] = None
+        self._pending: Optional[_Decoder] = None
+
+    def open(self) -> bool:
+        # Dimensioni e fps dallo stream (ffmpeg su pipe grezza non li comunica)
+        probe = cv2.VideoCapture(self.url)
+        try:
+            if not probe.isOpened():
+                logger.error(f"Impossibile aprire lo stream: {self.url}")
+                return False
+            self.width = int(probe.get(cv2.CAP_PROP_FRAME_WIDTH))
+            self.height = int(probe.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            self.fps = probe.get(cv2.CAP_PROP_FPS) or 25.0
+        finally:
+            probe.release()
+        if not self.width or not self.height:
+            logger.error(f"Risoluzione dello stream sconosciuta: {self.url}")
+            return False
+        self._decoder = self._start(self.mode)
+        return self._decoder is not None
+
+    def frame_size(self, mode: str = None) -> Tuple[int, int]:
+        """(larghezza, altezza) dei frame prodotti nel modo indicato"""
+        if (mode or self.mode) == MODE_LOWRES and self.lowres_width < self.width:
+            height = int(round(self.height * self.lowres_width / self.width / 2)) * 2
+            return self.lowres_width, max(2, height)
+        return self.width, self.height
+
+    def _command(self, mode: str) -> list:
+        command = [self.ffmpeg_path, "-hide_banner", "-loglevel", "error", "-nostdin"]
+        if self.url.startswith("rtsp://"):
+            command += ["-rtsp_transport", "tcp"]
+        if mode == MODE_KEYFRAMES:
+            command += ["-skip_frame", "nokey"]
+        elif mode == MODE_LOWRES:
+            command += ["-skip_loop_filter", "all", "-flags2", "fast"]
+        command += ["-i", self.url, "-an", "-sn"]
+        if mode == MODE_LOWRES:
+            width, height = self.frame_size(mode)
+            command += ["-vf", f"scale={width}:{height}"]
+        # -fps_mode esiste da ffmpeg 5.1; prima l'equivalente è -vsync
+        if ffmpeg_version(self.ffmpeg_path) >= (5, 1):
+            command += ["-fps_mode", "passthrough"]
+        else:
+            command += ["-vsync", "passthrough"]
+        return command + ["-f", "rawvideo", "-pix_fmt", "bgr24", "pipe:1"]
+
+    def _start(self, mode: str) -> Optional[_Decoder]:
+        try:
+            process = subprocess.Popen(
+                self._command(mode), stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0
+            )
+        except OSError as e:
+            logger.error(f"Impossibile avviare ffmpeg ({self.ffmpeg_path}): {e}")
+            return None
+        threading.Thread(target=self._log_errors, args=(process,), name="ffmpeg-stderr", daemon=True).start()
+        width, height = self.frame_size(mode)
+        logger.info(f"Decodifica {mode} ({width}x{height}): {self.url}")
+        return _Decoder(process, mode, (height, width, 3))
+
+    def _log_errors(self, process: subprocess.Popen):
+        for line in process.stderr:
+            logger.warning(f"ffmpeg: {line.decode(errors='replace').strip()}")
+
+    def _stop(self):
+        for decoder in (self._decoder, self._pending):
+            if decoder is not None:
+                decoder.stop()
+        self._decoder = self._pending = None
+
+    def set_mode(self, mode: str):
+        """
+        Richiede il modo di decodifica: il nuovo processo parte subito, ma i frame
+        arrivano dal precedente finché poll_switch non lo trova pronto
+        """
+        if mode not in MODES:
+            raise ValueError(f"Modo di decodifica non supportato: {mode}")
+        pending = self._pending
+        if pending is not None:
+            if pending.mode == mode:
+                return
+            # Cambio annullato o ribaltato prima che il nuovo processo fosse pronto
+            self._pending = None
+            pending.stop()
+        if mode == self.mode:
+            return
+        logger.info(f"Decodifica {self.mode} -> {mode}: {self.url}")
+        pending = self._start(mode)
+        if pending is None:
+            return
+        threading.Thread(target=pending.prefetch, name="ffmpeg-wakeup", daemon=True).start()
+        self._pending = pending
+
+    def poll_switch(self) -> bool:
+        """Completa il cambio di modo se il nuovo processo ha prodotto il primo frame; True se il modo è cambiato"""
+        pending = self._pending
+        if pending is None or not pending.ready.is_set():
+            return False
+        self._pending = None
+        if pending.first_frame is None:
+            logger.error(f"Decodifica {pending.mode} non avviata, si resta in {self.mode}: {self.url}")
+            pending.stop()
+            return False
+        previous, self._decoder = self._decoder, pending
+        if previous is not None:
+            previous.stop()
+        self.mode = pending.mode
+        self.mode_switches += 1
+        self.last_wakeup = time.monotonic() - pending.started_at
+        self._wakeup_total += self.last_wakeup
+        logger.info(f"Decodifica {self.mode} attiva dopo {self.last_wakeup * 1000:.0f} ms: {self.url}")
+        return True
+
+    def isOpened(self) -> bool:
+        return self._decoder is not None and self._decoder.process.poll() is None
+
+    def read(self, image: np.ndarray = None) -> Tuple[bool, Optional[np.ndarray]]:
+        """Il prossimo frame; scritto direttamente in `image` se ha la forma giusta"""
+        decoder = self._decoder
+        if decoder is None:
+            return False, None
+        shape = decoder.shape
+        if image is None or image.shape != shape or image.dtype != np.uint8 or not image.flags.c_contiguous:
+            image = np.empty(shape, dtype=np.uint8)
+        if decoder.first_frame is not None:
+            # Primo frame del processo appena attivato, già letto da prefetch
+            image[:] = decoder.first_frame
+            decoder.first_frame = None
+        elif not decoder.read_into(image):
+            return False, None
+        self.frames_read += 1
+        return True, image
+
+    def grab(self) -> bool:
+        return self.read()[0]
+
+    def get(self, prop: int) -> float:
+        width, height = self.frame_size()
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(height)
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        return 0.0
+
+    def release(self):
+        self._stop()
+
+    def stats(self) -> Dict:
+        width, height = self.frame_size()
+        return {
+            "backend": "ffmpeg",
+            "mode": self.mode,
+            "resolution": f"{width}x{height}",
+            "mode_switches": self.mode_switches,
+            "switching_to": self._pending.mode if self._pending else None,
+            "frames_read": self.frames_read,
+            "last_wakeup_ms": round(self.last_wakeup * 1000) if self.last_wakeup is not None else None,
+            "avg_wakeup_ms": round(self._wakeup_total / self.mode_switches * 1000) if self.mode_switches else None
+        }
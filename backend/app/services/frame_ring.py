@@ -0,0 +1,133 @@
+from multiprocessing import shared_memory
+import multiprocessing
+import numpy as np
+from typing import Optional, Tuple, Dict
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class FrameRing:
+    """
+    Anello di slot per frame preallocati in memoria condivisa.
+
+    Gli stadi della pipeline (cattura, inferenza, encoder) si scambiano solo
+    l'indice dello slot: ogni processo vede lo stesso buffer come array numpy,
+    quindi nessun frame viene serializzato o copiato tra un processo e l'altro.
+    Ogni slot ha un contatore di riferimenti; lo slot torna libero quando
+    l'ultimo stadio chiama `release`.
+    """
+
+    def __init__(self, slots: int, shape: Tuple[int, ...], dtype=np.uint8, lock=None,
+                 _frames: shared_memory.SharedMemory = None, _meta: shared_memory.SharedMemory = None):
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self._owner = _frames is None
+        self._lock = lock if lock is not None else multiprocessing.Lock()
+
+        if self._owner:
+            _frames = shared_memory.SharedMemory(create=True, size=self.frame_bytes * slots)
+            # Per slot: refcount (int64), sequenza (int64), timestamp (float64),
+            # più il contatore globale dei frame (int64)
+            _meta = shared_memory.SharedMemory(create=True, size=slots * 3 * 8 + 8)
+
+        self._frames_shm = _frames
+        self._meta_shm = _meta
+        self._frames = np.ndarray((slots,) + self.shape, dtype=self.dtype, buffer=_frames.buf)
+        self._refcounts = np.ndarray((slots,), dtype=np.int64, buffer=_meta.buf, offset=0)
+        self._sequence = np.ndarray((slots,), dtype=np.int64, buffer=_meta.buf, offset=slots * 8)
+        self._timestamps = np.ndarray((slots,), dtype=np.float64, buffer=_meta.buf, offset=slots * 16)
+        self._counter = np.ndarray((1,), dtype=np.int64, buffer=_meta.buf, offset=slots * 24)
+
+        if self._owner:
+            self._refcounts[:] = 0
+            self._sequence[:] = -1
+            self._timestamps[:] = 0.0
+            self._counter[0] = 0
+        self._next = 0
+
+    def handle(self) -> Dict:
+        """Descrizione serializzabile dell'anello per l'aggancio da un altro processo"""
+        return {
+            "slots": self.slots,
+            "shape": self.shape,
+            "dtype": self.dtype.str,
+            "frames": self._frames_shm.name,
+            "meta": self._meta_shm.name
+        }
+
+    @classmethod
+    def attach(cls, handle: Dict, lock) -> "FrameRing":
+        """Si aggancia a un anello creato da un altro processo"""
+        return cls(
+            handle["slots"], handle["shape"], handle["dtype"], lock=lock,
+            _frames=shared_memory.SharedMemory(name=handle["frames"]),
+            _meta=shared_memory.SharedMemory(name=handle["meta"])
+        )
+
+    def __reduce__(self):
+        # Passando l'anello come argomento di un Process si trasferiscono solo nomi e lock
+        return (FrameRing.attach, (self.handle(), self._lock))
+
+    def acquire(self, timestamp: float = None) -> Optional[int]:
+        """
+        Riserva uno slot libero per un nuovo frame (refcount = 1).
+        Restituisce None se tutti gli slot sono in uso: il chiamante scarta il frame.
+        """
+        with self._lock:
+            for offset in range(self.slots):
+                index = (self._next + offset) % self.slots
+                if self._refcounts[index] == 0:
+                    self._refcounts[index] = 1
+                    self._sequence[index] = self._counter[0]
+                    self._timestamps[index] = timestamp if timestamp is not None else time.time()
+                    self._counter[0] += 1
+                    self._next = (index + 1) % self.slots
+                    return index
+        return None
+
+    def retain(self, index: int, count: int = 1):
+        """Aggiunge riferimenti allo slot prima di passarlo ad altri stadi"""
+        with self._lock:
+            self._refcounts[index] += count
+
+    def release(self, index: int):
+        """Rilascia un riferimento; lo slot torna libero a zero"""
+        with self._lock:
+            if self._refcounts[index] > 0:
+                self._refcounts[index] -= 1
+
+    def frame(self, index: int) -> np.ndarray:
+        """Vista numpy (senza copia) sul frame dello slot"""
+        return self._frames[index]
+
+    def crop(self, index: int, bbox: Tuple[int, int, int, int]) -> np.ndarray:
+        """Vista numpy (senza copia) sulla regione (x, y, w, h) del frame"""
+        x, y, w, h = bbox
+        return self._frames[index, y:y + h, x:x + w]
+
+    def sequence(self, index: int) -> int:
+        return int(self._sequence[index])
+
+    def timestamp(self, index: int) -> float:
+        return float(self._timestamps[index])
+
+    def in_use(self) -> int:
+        with self._lock:
+            return int(np.count_nonzero(self._refcounts))
+
+    def close(self):
+        """Chiude l'anello; il processo proprietario libera anche la memoria condivisa"""
+        self._frames = None
+        self._refcounts = self._sequence = self._timestamps = self._counter = None
+        self._frames_shm.close()
+        self._meta_shm.close()
+        if self._owner:
+            try:
+                self._frames_shm.unlink()
+                self._meta_shm.unlink()
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,264 @@
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional, List, Dict, Any
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import zlib
+from pydantic import ValidationError
+from sqlalchemy import select, insert
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.database import AIDetection, AIDetectionEventKey, Vehicle
+from app.schemas.ingest import PlateEventIn
+from app.services.detection_rollups import floor_hour, mark_hours_dirty
+from app.services.plate_text import clean_plate_text
+
+logger = logging.getLogger(__name__)
+
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/json")
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+MAX_REPORTED_ERRORS = 50
+
+
+class InvalidLine:
+    """Riga NDJSON non decodificabile: tiene il posto dell'evento per riportarne l'indice"""
+
+    def __init__(self, error: str):
+        self.error = error
+
+
+class IngestPayloadError(ValueError):
+    """Corpo della richiesta non accettabile nel suo insieme"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _decompress(body: bytes, max_bytes: int) -> bytes:
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        data = decompressor.decompress(body, max_bytes + 1)
+    except zlib.error as e:
+        raise IngestPayloadError(f"Corpo gzip non valido: {e}")
+    if len(data) > max_bytes or decompressor.unconsumed_tail:
+        raise IngestPayloadError("Lotto troppo grande una volta decompresso", status_code=413)
+    return data
+
+
+def decode_events(body: bytes, content_type: str, content_encoding: str = None,
+                  max_decompressed_bytes: int = 200 * 1024 * 1024) -> List[Any]:
+    """
+    Decodifica un lotto NDJSON o msgpack, eventualmente compresso con gzip.
+    Le righe NDJSON non valide diventano InvalidLine, così gli errori restano
+    riferiti alla posizione dell'evento nel lotto.
+    """
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if (content_encoding or "").lower() == "gzip" or body[:2] == b"\x1f\x8b":
+        body = _decompress(body, max_decompressed_bytes)
+
+    if content_type in MSGPACK_TYPES:
+        import msgpack
+
+        try:
+            objects = _unpack_msgpack(msgpack, body)
+        except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as e:
+            raise IngestPayloadError(f"Corpo msgpack non valido: {e}")
+        # Un unico array di eventi oppure una sequenza di oggetti
+        if len(objects) == 1 and isinstance(objects[0], list):
+            objects = objects[0]
+        return objects
+
+    if content_type in NDJSON_TYPES:
+        objects: List[Any] = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                objects.append(json.loads(line))
+            except ValueError as e:
+                objects.append(InvalidLine(f"JSON non valido: {e}"))
+        return objects
+
+    raise IngestPayloadError(f"Content-Type non supportato: {content_type or 'assente'}", status_code=415)
+
+
+def _unpack_msgpack(msgpack, body: bytes) -> List[Any]:
+    unpacker = msgpack.Unpacker(raw=False, max_buffer_size=len(body) + 1)
+    unpacker.feed(body)
+    return list(unpacker)
+
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # Orari degli edge agent senza fuso: trattati come UTC, come detected_at
+    if value is None:
+        return None
+    return value.astimezone(timezone.utc) if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _crop_bytes(crop) -> Optional[bytes]:
+    if crop is None or isinstance(crop, bytes):
+        return crop
+    try:
+        return base64.b64decode(crop, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+
+class IngestService:
+    """
+    Acquisizione a lotti degli eventi di passaggio targa (edge agent, telecamere ANPR).
+
+    Il lotto viene validato evento per evento (gli eventi non validi vengono
+    segnalati senza scartare gli altri), i veicoli vengono abbinati con una sola
+    query per tutte le targhe e gli event_id vengono registrati in
+    ai_detection_event_keys con un unico INSERT ... ON CONFLICT DO NOTHING:
+    solo gli eventi nuovi diventano rilevazioni, così un lotto reinviato non
+    crea duplicati.
+    """
+
+    def __init__(self, db: Session, plates_dir: str = "uploads/plates", save_crops: bool = True):
+        self.db = db
+        self.plates_dir = Path(plates_dir)
+        self.save_crops = save_crops
+
+    def ingest(self, objects: List[Any]) -> Dict:
+        errors: List[Dict] = []
+        events: Dict[str, PlateEventIn] = {}
+        duplicates = 0
+
+        for index, obj in enumerate(objects):
+            if isinstance(obj, InvalidLine):
+                errors.append({"index": index, "error": obj.error})
+                continue
+            try:
+                event = PlateEventIn.model_validate(obj)
+            except ValidationError as e:
+                errors.append({"index": index, "error": e.errors(include_url=False, include_input=False)})
+                continue
+            event.license_plate = clean_plate_text(event.license_plate)
+            event.first_seen, event.last_seen = _as_utc(event.first_seen), _as_utc(event.last_seen)
+            if not event.license_plate:
+                errors.append({"index": index, "error": "Targa vuota"})
+                continue
+            if event.event_id in events:
+                duplicates += 1
+                continue
+            events[event.event_id] = event
+
+        received = len(objects)
+        if not events:
+            return self._result(received, 0, duplicates, errors, 0)
+
+        # Abbinamento veicoli: una query per tutte le targhe del lotto
+        plates = {event.license_plate for event in events.values()}
+        vehicles = dict(self.db.execute(
+            select(Vehicle.license_plate, Vehicle.id).where(Vehicle.license_plate.in_(plates))
+        ).all())
+
+        now = datetime.now(timezone.utc)
+        rows = [self._row(event, vehicles.get(event.license_plate), now) for event in events.values()]
+
+        # executemany: SQLAlchemy raggruppa le righe in INSERT multi-riga con statement in cache.
+        # Chiavi e rilevazioni nella stessa transazione: un lotto fallito non lascia chiavi orfane
+        inserted = set(self.db.execute(
+            self._insert_ignoring_duplicates().returning(AIDetectionEventKey.event_id),
+            [{"event_id": row["event_id"], "detected_at": row["detected_at"]} for row in rows]
+        ).scalars())
+        new_rows = [row for row in rows if row["event_id"] in inserted]
+        if new_rows:
+            self.db.execute(insert(AIDetection), new_rows)
+            # Eventi di ore già concluse (edge agent rimasti offline): il rollup le ricalcola
+            # anche se sono fuori dalla sua finestra. L'ora corrente non è mai aggregata
+            mark_hours_dirty(self.db, [row["detected_at"] for row in new_rows], before=floor_hour(now))
+        self.db.commit()
+        duplicates += len(rows) - len(inserted)
+
+        matched = [row for row in rows if row["event_id"] in inserted and row["vehicle_id"]]
+        if self.save_crops:
+            self._write_crops(events, rows, inserted)
+        self._feed_auto_checkin(matched)
+
+        logger.info(f"Lotto acquisito: {len(inserted)} nuovi eventi, {duplicates} duplicati, {len(errors)} scartati")
+        return self._result(received, len(inserted), duplicates, errors, len(matched))
+
+    def _insert_ignoring_duplicates(self):
+        dialect = self.db.get_bind().dialect.name
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        elif dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            raise RuntimeError(f"Database non supportato per l'acquisizione a lotti: {dialect}")
+        return dialect_insert(AIDetectionEventKey).on_conflict_do_nothing(index_elements=["event_id"])
+
+    def _row(self, event: PlateEventIn, vehicle_id: Optional[int], now: datetime) -> Dict:
+        detected_at = event.last_seen or event.first_seen or now
+        image_path = None
+        if event.crop_jpeg is not None and self.save_crops:
+            # L'event_id arriva dall'esterno: nel nome del file se ne usa solo l'hash
+            suffix = hashlib.sha1(event.event_id.encode()).hexdigest()[:12]
+            image_path = str(self.plates_dir / (
+                f"plate_{event.license_plate}_{detected_at.strftime('%Y%m%d_%H%M%S')}_{suffix}.jpg"
+            ))
+        return {
+            "event_id": event.event_id,
+            "license_plate": event.license_plate,
+            "confidence": event.confidence,
+            "image_path": image_path,
+            "processed": vehicle_id is not None,
+            "vehicle_id": vehicle_id,
+            "is_automatic": True,
+            "source": event.camera_id,
+            "detected_at": detected_at,
+            "detection_data": {
+                "camera_id": event.camera_id,
+                "first_seen": event.first_seen.isoformat() if event.first_seen else None,
+                "last_seen": event.last_seen.isoformat() if event.last_seen else None,
+                "frames": event.frames,
+                "reads": event.reads,
+                "bbox": event.bbox,
+                "vehicle_found": vehicle_id is not None
+            }
+        }
+
+    def _write_crops(self, events: Dict[str, PlateEventIn], rows: List[Dict], inserted: set):
+        # Solo per gli eventi nuovi: i reinvii non riscrivono le immagini
+        for row in rows:
+            if row["event_id"] not in inserted or not row["image_path"]:
+                continue
+            crop = _crop_bytes(events[row["event_id"]].crop_jpeg)
+            if not crop:
+                continue
+            try:
+                self.plates_dir.mkdir(parents=True, exist_ok=True)
+                Path(row["image_path"]).write_bytes(crop)
+            except OSError as e:
+                logger.error(f"Errore nel salvataggio ritaglio {row['image_path']}: {e}")
+
+    def _feed_auto_checkin(self, rows: List[Dict]):
+        if not settings.AUTO_CHECKIN_ENABLED or not rows:
+            return
+        from app.services.auto_checkin_service import auto_checkin_engine
+
+        # Le rilevazioni sono già salvate: un errore qui non deve far fallire il lotto,
+        # perché il reinvio verrebbe scartato come duplicato e il passaggio perso
+        for row in sorted(rows, key=lambda r: r["detected_at"]):
+            try:
+                auto_checkin_engine.handle_plate_pass(row["source"], row["vehicle_id"], row["license_plate"], row["detected_at"])
+            except Exception as e:
+                logger.error(f"Check-in automatico non elaborato per l'evento {row['event_id']}: {e}")
+
+    def _result(self, received: int, accepted: int, duplicates: int, errors: List[Dict], matched: int) -> Dict:
+        return {
+            "received": received,
+            "accepted": accepted,
+            "duplicates": duplicates,
+            "rejected": len(errors),
+            "matched_vehicles": matched,
+            "errors": errors[:MAX_REPORTED_ERRORS]
+        }
@@ -0,0 +1,302 @@
+"""
+Handler dei job di lunga durata eseguiti da `python -m app.job_worker`.
+
+Ogni handler riceve il JobContext e il payload del job e restituisce un
+risultato serializzabile in JSON, salvato in jobs.result.
+"""
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Any
+import csv
+import logging
+from sqlalchemy import func, select
+from sqlalchemy.orm import selectinload
+from app.core.config import settings
+from app.core.database import AIDetection, Appointment, AppointmentStatus, Job, JobStatus
+from app.services.job_queue import JobContext, job_handler, enqueue
+
+logger = logging.getLogger(__name__)
+
+
+def _plate_engine():
+    from app.services.vision_client import get_vision_client
+    from app.services.plate_engine import get_plate_engine
+
+    return get_vision_client() or get_plate_engine()
+
+
+@job_handler("ai.detect_images")
+def detect_images(ctx: JobContext, payload: Dict[str, Any]) -> Dict:
+    """Riconoscimento targhe su un elenco di immagini già caricate: {"image_paths": [...]}"""
+    engine = _plate_engine()
+    image_paths = payload.get("image_paths", [])
+    results = []
+    for index, image_path in enumerate(image_paths):
+        try:
+            plate = engine.detect_best(Path(image_path).read_bytes())
+        except (OSError, ValueError) as e:
+            results.append({"image_path": image_path, "error": str(e)})
+        else:
+            results.append({"image_path": image_path, "plate": plate})
+        ctx.progress((index + 1) / len(image_paths), f"{index + 1}/{len(image_paths)} immagini")
+    return {"images": len(image_paths), "results": results}
+
+
+@job_handler("ai.process_video")
+def process_video(ctx: JobContext, payload: Dict[str, Any]) -> Dict:
+    """
+    Riconoscimento targhe su un video registrato:
+    {"video_path": ..., "sample_fps": 2, "recorded_at": iso opzionale}.
+    Le letture vengono raggruppate per targa e salvate come passaggi tramite
+    l'acquisizione a lotti; l'event_id deriva dal job, quindi un nuovo
+    tentativo non duplica le rilevazioni. Gli orari dei passaggi partono
+    dall'inizio della registrazione (vedi _recording_start), non dall'avvio del job.
+    """
+    import cv2
+    from app.core.database import SessionLocal
+    from app.services.ingest_service import IngestService
+
+    video_path = payload["video_path"]
+    sample_fps = float(payload.get("sample_fps", 2.0))
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise ValueError(f"Impossibile aprire il video: {video_path}")
+
+    engine = _plate_engine()
+    fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+    total_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT)) or 0
+    step = max(1, int(round(fps / sample_fps)))
+    started_at = _recording_start(video_path, payload.get("recorded_at"), total_frames / fps)
+
+    plates: Dict[str, Dict] = {}
+    frame_index = 0
+    sampled = 0
+    try:
+        while True:
+            # Solo grab per i frame non campionati: niente decodifica
+            if frame_index % step:
+                if not capture.grab():
+                    break
+                frame_index += 1
+                continue
+            ret, frame = capture.read()
+            if not ret:
+                break
+            sampled += 1
+            offset = timedelta(seconds=frame_index / fps)
+            for reading in engine.detect(frame):
+                plate = plates.setdefault(reading["license_plate"], {
+                    "confidence": 0.0, "first_seen": offset, "last_seen": offset, "frames": 0, "bbox": None
+                })
+                plate["frames"] += 1
+                plate["last_seen"] = offset
+                if reading["confidence"] > plate["confidence"]:
+                    plate["confidence"] = reading["confidence"]
+                    plate["bbox"] = list(reading["bbox"])
+            frame_index += 1
+            if total_frames:
+                ctx.progress(frame_index / total_frames, f"{frame_index}/{total_frames} frame, {len(plates)} targhe")
+    finally:
+        capture.release()
+
+    source = payload.get("camera_id") or f"video:{Path(video_path).name}"
+    events = [
+        {
+            "event_id": f"job{ctx.job_id}-{license_plate}",
+            "camera_id": source,
+            "license_plate": license_plate,
+            "confidence": plate["confidence"],
+            "first_seen": (started_at + plate["first_seen"]).isoformat(),
+            "last_seen": (started_at + plate["last_seen"]).isoformat(),
+            "frames": plate["frames"],
+            "bbox": plate["bbox"]
+        }
+        for license_plate, plate in plates.items()
+    ]
+    db = SessionLocal()
+    try:
+        ingest = IngestService(db, save_crops=False).ingest(events)
+    finally:
+        db.close()
+
+    return {
+        "video_path": video_path,
+        "frames": frame_index,
+        "sampled_frames": sampled,
+        "plates": sorted(plates),
+        "accepted": ingest["accepted"],
+        "matched_vehicles": ingest["matched_vehicles"]
+    }
+
+
+def _recording_start(video_path: str, recorded_at: str = None, duration_seconds: float = 0.0) -> datetime:
+    """
+    Inizio della registrazione: `recorded_at` del payload se presente (ISO, senza
+    fuso = UTC), altrimenti la data di modifica del file meno la durata del video,
+    dato che il registratore chiude il file a fine registrazione.
+    """
+    if recorded_at:
+        start = datetime.fromisoformat(recorded_at)
+        return start if start.tzinfo else start.replace(tzinfo=timezone.utc)
+    modified = datetime.fromtimestamp(Path(video_path).stat().st_mtime, tz=timezone.utc)
+    return modified - timedelta(seconds=duration_seconds)
+
+
+@job_handler("notifications.appointment_reminders")
+def appointment_reminders(ctx: JobContext, payload: Dict[str, Any]) -> Dict:
+    """Promemoria email per gli appuntamenti delle prossime `hours_ahead` ore (default 24)"""
+    from app.services.notification_service import NotificationService
+
+    now = datetime.now(timezone.utc)
+    until = now + timedelta(hours=payload.get("hours_ahead", 24))
+    db = ctx.session()
+    try:
+        appointments = db.execute(
+            select(Appointment)
+            .options(selectinload(Appointment.customer), selectinload(Appointment.service))
+            .where(
+                Appointment.appointment_date >= now,
+                Appointment.appointment_date < until,
+                Appointment.status.in_([AppointmentStatus.SCHEDULED, AppointmentStatus.CONFIRMED])
+            )
+            .order_by(Appointment.appointment_date)
+        ).scalars().all()
+    finally:
+        db.close()
+
+    notifications = NotificationService()
+    sent, failed = 0, []
+    for index, appointment in enumerate(appointments):
+        ok = notifications.send_appointment_reminder(
+            appointment.customer.email,
+            appointment.customer.full_name,
+            appointment.appointment_date,
+            appointment.service.name
+        )
+        if ok:
+            sent += 1
+        else:
+            failed.append(appointment.id)
+        ctx.progress((index + 1) / len(appointments), f"{index + 1}/{len(appointments)} promemoria")
+    return {"appointments": len(appointments), "sent": sent, "failed": failed}
+
+
+@job_handler("exports.detections_csv")
+def export_detections_csv(ctx: JobContext, payload: Dict[str, Any]) -> Dict:
+    """Esporta in CSV le rilevazioni di un periodo: {"start_date": iso, "end_date": iso}"""
+    query = select(
+        AIDetection.id, AIDetection.detected_at, AIDetection.license_plate, AIDetection.confidence,
+        AIDetection.source, AIDetection.vehicle_id, AIDetection.processed
+    ).order_by(AIDetection.detected_at)
+    if payload.get("start_date"):
+        query = query.where(AIDetection.detected_at >= datetime.fromisoformat(payload["start_date"]))
+    if payload.get("end_date"):
+        query = query.where(AIDetection.detected_at < datetime.fromisoformat(payload["end_date"]))
+
+    export_dir = Path(settings.JOB_EXPORT_DIR)
+    export_dir.mkdir(parents=True, exist_ok=True)
+    path = export_dir / f"detections_job{ctx.job_id}.csv"
+
+    rows = 0
+    db = ctx.session()
+    try:
+        total = db.execute(select(func.count()).select_from(query.order_by(None).subquery())).scalar()
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["id", "detected_at", "license_plate", "confidence", "source", "vehicle_id", "processed"])
+            # Lettura a blocchi: l'export non carica tutta la tabella in memoria
+            for row in db.execute(query.execution_options(yield_per=1000)):
+                writer.writerow(row)
+                rows += 1
+                if rows % 1000 == 0:
+                    # Le righe inserite dopo il conteggio possono superare il totale
+                    ctx.progress(min(1.0, rows / total) if total else 0.0, f"{rows}/{total} righe esportate")
+    finally:
+        db.close()
+    return {"path": str(path), "rows": rows}
+
+
+@job_handler("ai.backfill_recognition")
+def backfill_recognition(ctx: JobContext, payload: Dict[str, Any]) -> Dict:
+    """
+    Rilegge con il motore attuale i ritagli targa archiviati e aggiorna le
+    rilevazioni cambiate: {"start_id": 0, "end_id": null, "dry_run": false}.
+    Riprende dall'ultimo lotto completato se il job viene ritentato.
+    """
+    from app.services.recognition_backfill import RecognitionBackfill
+
+    db = ctx.session()
+    try:
+        backfill = RecognitionBackfill(
+            db,
+            workers=int(payload.get("workers", settings.RECOGNITION_BACKFILL_WORKERS)),
+            batch_size=int(payload.get("batch_size", settings.RECOGNITION_BACKFILL_BATCH_SIZE)),
+            start_id=int(payload.get("start_id", 0)),
+            end_id=payload.get("end_id"),
+            dry_run=bool(payload.get("dry_run", False)),
+            job_id=ctx.job_id,
+            checkpoint=ctx.checkpoint,
+            save_checkpoint=lambda db, state: ctx.save_checkpoint(state, db)
+        )
+        if ctx.checkpoint:
+            logger.info(f"Backfill job {ctx.job_id}: ripresa dopo la rilevazione {backfill.last_id}")
+
+        def on_batch(state: Dict, done: int, total: int):
+            counters = state["counters"]
+            ctx.progress(
+                done / total if total else 1.0,
+                f"{done}/{total} rilevazioni, {counters['changed']} letture cambiate"
+            )
+
+        result = backfill.run(on_batch)
+    finally:
+        db.close()
+    logger.info(
+        f"Backfill job {ctx.job_id} completato: {result['scanned']} rilevazioni, "
+        f"{result['changed']} letture cambiate, {result['vehicle_matches_changed']} veicoli riassociati"
+    )
+    return result
+
+
+@job_handler("ai.maintain_detection_storage")
+def maintain_detection_storage(ctx: JobContext, payload: Dict[str, Any]) -> Dict:
+    """
+    Manutenzione di ai_detections: partizioni dei prossimi mesi, rollup orari
+    delle ultime ore e retention delle partizioni scadute (dopo il rollup, così
+    nessuna ora viene eliminata prima di essere aggregata). La prossima
+    esecuzione viene accodata all'inizio: un errore non interrompe la catena.
+    """
+    from app.services.detection_partitions import ensure_partitions, apply_retention, partition_status
+    from app.services.detection_rollups import rollup_hours
+
+    db = ctx.session()
+    try:
+        schedule_detection_maintenance(
+            db, delay_minutes=settings.DETECTION_MAINTENANCE_INTERVAL_MINUTES, current_job_id=ctx.job_id
+        )
+        created = ensure_partitions(db, settings.DETECTION_PARTITIONS_AHEAD_MONTHS)
+        rollups = rollup_hours(db, settings.DETECTION_ROLLUP_LOOKBACK_HOURS)
+        dropped = apply_retention(db, settings.DETECTION_RETENTION_MONTHS)
+        status = partition_status(db)
+        if status and status["default_rows"]:
+            logger.warning(f"{status['default_rows']} rilevazioni nella partizione di default di ai_detections")
+    finally:
+        db.close()
+    return {"created_partitions": created, "rollup_rows": rollups, "dropped_partitions": dropped, "partitions": status}
+
+
+def schedule_detection_maintenance(db, delay_minutes: int = 0, current_job_id: int = None):
+    """Accoda la prossima manutenzione delle rilevazioni, se non ce n'è già una in coda o in esecuzione"""
+    pending = select(Job.id).where(
+        Job.job_type == "ai.maintain_detection_storage",
+        Job.status.in_([JobStatus.QUEUED, JobStatus.RUNNING])
+    )
+    if current_job_id is not None:
+        pending = pending.where(Job.id != current_job_id)
+    if db.execute(pending.limit(1)).first() is not None:
+        return None
+    # Nessun nuovo tentativo: la prossima esecuzione è già in coda
+    return enqueue(
+        db, "ai.maintain_detection_storage", max_attempts=1,
+        run_at=datetime.now(timezone.utc) + timedelta(minutes=delay_minutes)
+    )
@@ -0,0 +1,377 @@
+from datetime import datetime, timezone, timedelta
+from typing import Optional, List, Dict, Any, Callable
+import logging
+import random
+import threading
+import time
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.database import SessionLocal, Job, JobStatus
+
+logger = logging.getLogger(__name__)
+
+# job_type -> handler(ctx, payload) -> risultato serializzabile in JSON
+JOB_HANDLERS: Dict[str, Callable[["JobContext", Dict[str, Any]], Any]] = {}
+
+
+def job_handler(job_type: str):
+    """Registra una funzione come handler di un tipo di job"""
+    def decorator(func):
+        JOB_HANDLERS[job_type] = func
+        return func
+    return decorator
+
+
+class JobCancelled(Exception):
+    """Sollevata da JobContext quando è stata richiesta la cancellazione del job"""
+
+
+class JobLockLost(RuntimeError):
+    """Il job non è più "running" per questo worker (rimesso in coda come orfano o già chiuso)"""
+
+
+class JobContext:
+    """Passato agli handler: avanzamento, controllo della cancellazione e sessioni database"""
+
+    def __init__(self, job_id: int, job_type: str, attempt: int,
+                 session_factory: Callable[[], Session] = SessionLocal, min_interval: float = 1.0,
+                 checkpoint: Optional[Dict[str, Any]] = None):
+        self.job_id = job_id
+        self.job_type = job_type
+        self.attempt = attempt
+        # Ultimo checkpoint salvato (da un tentativo precedente), None alla prima esecuzione
+        self.checkpoint = checkpoint
+        self.session_factory = session_factory
+        self.min_interval = min_interval
+        self._last_report = 0.0
+
+    def progress(self, fraction: float, message: str = None, force: bool = False):
+        """
+        Aggiorna l'avanzamento (0..1). Le scritture sono limitate a una ogni
+        `min_interval` secondi; solleva JobCancelled se il job è stato cancellato.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_report < self.min_interval:
+            return
+        self._last_report = now
+
+        db = self.session_factory()
+        try:
+            db.execute(
+                update(Job)
+                .where(Job.id == self.job_id)
+                .values(progress=max(0.0, min(1.0, fraction)), progress_message=message, heartbeat_at=_db_now(db))
+            )
+            db.commit()
+            cancelled = db.execute(select(Job.cancel_requested).where(Job.id == self.job_id)).scalar()
+        finally:
+            db.close()
+        if cancelled:
+            raise JobCancelled()
+
+    def save_checkpoint(self, state: Dict[str, Any], db: Optional[Session] = None):
+        """
+        Salva lo stato da cui riprendere se il job viene interrotto e ritentato.
+        Con `db` la scrittura entra nella transazione del chiamante, che fa il
+        commit: il checkpoint e le modifiche del lotto vengono salvati insieme.
+        """
+        statement = update(Job).where(Job.id == self.job_id)
+        if db is not None:
+            db.execute(statement.values(checkpoint=state, heartbeat_at=_db_now(db)))
+            self.checkpoint = state
+            return
+        db = self.session_factory()
+        try:
+            db.execute(statement.values(checkpoint=state, heartbeat_at=_db_now(db)))
+            db.commit()
+        finally:
+            db.close()
+        self.checkpoint = state
+
+    def session(self) -> Session:
+        return self.session_factory()
+
+
+def enqueue(db: Session, job_type: str, payload: Dict[str, Any] = None, priority: int = 0,
+            queue: str = "default", max_attempts: int = 3, run_at: datetime = None) -> Job:
+    """Inserisce un job in coda e lo restituisce con l'id assegnato"""
+    if job_type not in JOB_HANDLERS:
+        raise ValueError(f"Tipo di job sconosciuto: {job_type}")
+    job = Job(
+        queue=queue,
+        job_type=job_type,
+        payload=payload or {},
+        priority=priority,
+        max_attempts=max_attempts,
+        run_at=run_at or _db_now(db),
+        status=JobStatus.QUEUED
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def claim_next(db: Session, worker_id: str, queues: List[str]) -> Optional[Job]:
+    """
+    Preleva il prossimo job pronto (priorità più alta, poi il più vecchio).
+    Su Postgres FOR UPDATE SKIP LOCKED fa sì che worker concorrenti non si
+    blocchino a vicenda né prendano lo stesso job. Il job restituito è staccato
+    dalla sessione: leggerne i campi durante l'esecuzione non apre una
+    transazione che resterebbe inattiva per tutta la durata dell'handler.
+    """
+    now = _db_now(db)
+    job = db.execute(
+        select(Job)
+        .where(Job.status == JobStatus.QUEUED, Job.queue.in_(queues), Job.run_at <= now)
+        .order_by(Job.priority.desc(), Job.run_at, Job.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    ).scalar_one_or_none()
+    if job is None:
+        db.rollback()
+        return None
+
+    job.status = JobStatus.RUNNING
+    job.locked_by = worker_id
+    job.attempts += 1
+    job.heartbeat_at = now
+    job.started_at = now
+    job.error = None
+    db.flush()
+    db.expunge(job)
+    db.commit()
+    return job
+
+
+def retry_delay(attempt: int, base: int = 30, maximum: int = 3600) -> float:
+    """Backoff esponenziale con jitter: base, 2*base, 4*base... fino a maximum"""
+    delay = min(maximum, base * (2 ** max(0, attempt - 1)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def requeue_stale(db: Session, stale_seconds: int) -> int:
+    """
+    Job "running" il cui worker ha smesso di dare segni di vita. Come in
+    fail_job, tornano in coda solo se restano tentativi e non ne è stata
+    chiesta la cancellazione: un handler che uccide il worker non viene
+    ritentato all'infinito. L'heartbeat è confrontato con l'orologio del
+    database, comune ai worker su host diversi. Restituisce i job rimessi in coda.
+    """
+    now = _db_now(db)
+    stale = (Job.status == JobStatus.RUNNING, Job.heartbeat_at < now - timedelta(seconds=stale_seconds))
+    error = "Worker non più attivo"
+    closed = 0
+    for status, condition in ((JobStatus.CANCELLED, Job.cancel_requested == True),
+                              (JobStatus.FAILED, Job.attempts >= Job.max_attempts)):
+        closed += db.execute(
+            update(Job).where(*stale, condition).values(status=status, locked_by=None, error=error, finished_at=now)
+        ).rowcount
+    requeued = db.execute(
+        update(Job).where(*stale).values(status=JobStatus.QUEUED, locked_by=None, run_at=now, error=error)
+    ).rowcount
+    db.commit()
+    if closed:
+        logger.warning(f"{closed} job orfani chiusi senza nuovi tentativi (esauriti o cancellati)")
+    return requeued
+
+
+def complete_job(db: Session, job: Job, result: Any, worker_id: str):
+    """Segna il job come completato; JobLockLost se nel frattempo non era più di questo worker"""
+    _finish(db, job, worker_id, status=JobStatus.SUCCEEDED, result=result, progress=1.0, finished_at=_now())
+
+
+def fail_job(db: Session, job: Job, error: str, worker_id: str,
+             base_delay: int = 30, max_delay: int = 3600) -> bool:
+    """Registra un tentativo fallito; True se il job è stato rimesso in coda con backoff"""
+    if job.attempts < job.max_attempts and not job.cancel_requested:
+        run_at = _now() + timedelta(seconds=retry_delay(job.attempts, base_delay, max_delay))
+        _finish(db, job, worker_id, status=JobStatus.QUEUED, error=error, run_at=run_at)
+        return True
+    status = JobStatus.CANCELLED if job.cancel_requested else JobStatus.FAILED
+    _finish(db, job, worker_id, status=status, error=error, finished_at=_now())
+    return False
+
+
+def _finish(db: Session, job: Job, worker_id: str, **values):
+    """
+    Chiude l'esecuzione solo se il job è ancora "running" e bloccato da questo
+    worker: se requeue_stale lo ha già rimesso in coda (e magari un altro
+    worker lo sta eseguendo) l'esito di questo tentativo viene scartato.
+    """
+    job_id = job.id
+    result = db.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.locked_by == worker_id, Job.status == JobStatus.RUNNING)
+        .values(locked_by=None, **values)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    if result.rowcount != 1:
+        raise JobLockLost(f"Job {job_id} non più assegnato al worker {worker_id}")
+
+
+def cancel_job(db: Session, job: Job) -> Job:
+    """Un job in coda viene cancellato subito; uno in esecuzione al prossimo aggiornamento di avanzamento"""
+    if job.status == JobStatus.QUEUED:
+        job.status = JobStatus.CANCELLED
+        job.finished_at = _now()
+    elif job.status == JobStatus.RUNNING:
+        job.cancel_requested = True
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def retry_job(db: Session, job: Job) -> Job:
+    """Rimette in coda un job fallito o cancellato, con un nuovo ciclo di tentativi"""
+    if job.status in (JobStatus.FAILED, JobStatus.CANCELLED):
+        job.status = JobStatus.QUEUED
+        job.attempts = 0
+        job.cancel_requested = False
+        job.run_at = _db_now(db)
+        job.progress = 0.0
+        job.progress_message = None
+        job.checkpoint = None
+        job.finished_at = None
+        db.commit()
+        db.refresh(job)
+    return job
+
+
+class JobWorker:
+    """
+    Processo worker della coda: `concurrency` thread prelevano job dalle code
+    indicate, un thread separato aggiorna l'heartbeat dei job in esecuzione e
+    rimette in coda quelli rimasti orfani di un worker morto.
+    """
+
+    def __init__(
+        self,
+        worker_id: str,
+        queues: List[str] = None,
+        concurrency: int = 2,
+        poll_interval: float = 1.0,
+        heartbeat_seconds: int = 15,
+        stale_seconds: int = 120,
+        session_factory: Callable[[], Session] = SessionLocal
+    ):
+        self.worker_id = worker_id
+        self.queues = queues or ["default"]
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.heartbeat_seconds = heartbeat_seconds
+        self.stale_seconds = stale_seconds
+        self.session_factory = session_factory
+        self._stop = threading.Event()
+        self._running: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        logger.info(f"Job worker {self.worker_id} avviato: code {self.queues}, {self.concurrency} thread")
+        threads = [
+            threading.Thread(target=self._loop, name=f"job-worker-{i}", daemon=True)
+            for i in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        self._heartbeat_loop()
+        for thread in threads:
+            thread.join()
+        logger.info(f"Job worker {self.worker_id} fermato")
+
+    def _loop(self):
+        while not self._stop.is_set():
+            if not self.run_once():
+                self._stop.wait(self.poll_interval)
+
+    def run_once(self) -> bool:
+        """Esegue al massimo un job; False se la coda era vuota"""
+        db = self.session_factory()
+        try:
+            job = claim_next(db, self.worker_id, self.queues)
+            if job is None:
+                return False
+            self._execute(db, job)
+            return True
+        finally:
+            db.close()
+
+    def _execute(self, db: Session, job: Job):
+        from app.core.metrics import record_job_finished
+
+        handler = JOB_HANDLERS.get(job.job_type)
+        context = JobContext(job.id, job.job_type, job.attempts, self.session_factory, checkpoint=job.checkpoint)
+        with self._lock:
+            self._running[job.id] = job.job_type
+        started = time.monotonic()
+        logger.info(f"Job {job.id} ({job.job_type}) avviato, tentativo {job.attempts}/{job.max_attempts}")
+        try:
+            try:
+                if handler is None:
+                    raise LookupError(f"Nessun handler registrato per {job.job_type}")
+                result = handler(context, job.payload or {})
+            except JobCancelled:
+                _finish(db, job, self.worker_id, status=JobStatus.CANCELLED, finished_at=_now())
+                status = "cancelled"
+                logger.info(f"Job {job.id} cancellato")
+            except Exception as e:
+                db.rollback()
+                # Richiesta di cancellazione arrivata durante l'esecuzione
+                job.cancel_requested = db.execute(select(Job.cancel_requested).where(Job.id == job.id)).scalar()
+                retried = fail_job(db, job, f"{type(e).__name__}: {e}", self.worker_id,
+                                   settings.JOB_RETRY_BASE_SECONDS, settings.JOB_RETRY_MAX_SECONDS)
+                status = "retry" if retried else "failed"
+                logger.error(f"Job {job.id} ({job.job_type}) fallito: {e}" + (" - nuovo tentativo in coda" if retried else ""))
+            else:
+                complete_job(db, job, result, self.worker_id)
+                status = "succeeded"
+                logger.info(f"Job {job.id} ({job.job_type}) completato")
+        except JobLockLost as e:
+            db.rollback()
+            status = "lost"
+            logger.warning(f"{e}: esito del tentativo scartato")
+        finally:
+            with self._lock:
+                self._running.pop(job.id, None)
+        record_job_finished(job.job_type, status, time.monotonic() - started)
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.heartbeat_seconds):
+            db = self.session_factory()
+            try:
+                with self._lock:
+                    running = list(self._running)
+                if running:
+                    db.execute(
+                        update(Job)
+                        .where(Job.id.in_(running), Job.locked_by == self.worker_id)
+                        .values(heartbeat_at=_db_now(db))
+                    )
+                    db.commit()
+                requeued = requeue_stale(db, self.stale_seconds)
+                if requeued:
+                    logger.warning(f"{requeued} job orfani rimessi in coda")
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Errore heartbeat job worker: {e}")
+            finally:
+                db.close()
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _db_now(db: Session) -> datetime:
+    # Heartbeat, orfani e job pronti sull'orologio del database, non su quello dell'host del worker
+    if db.get_bind().dialect.name == "sqlite":
+        # CURRENT_TIMESTAMP di SQLite è al secondo: un job appena accodato non risulterebbe pronto
+        return datetime.fromisoformat(db.execute(select(func.strftime("%Y-%m-%d %H:%M:%f", "now"))).scalar()).replace(tzinfo=timezone.utc)
+    now = db.execute(select(func.now())).scalar()
+    # SQLite restituisce CURRENT_TIMESTAMP in UTC senza fuso
+    return now if now.tzinfo else now.replace(tzinfo=timezone.utc)
@@ -1,80 +1,156 @@
 import cv2
 import numpy as np
-import re
-from datetime import datetime, date
+from datetime import datetime, date, timezone
 from typing import Optional, List, Dict
 import asyncio
 import logging
+import threading
+import time
 from sqlalchemy.orm import Session
 from app.core.database import Vehicle, Appointment, Customer
 from app.services.vehicle_service import VehicleService
 from app.services.appointment_service import AppointmentService
+from app.services.plate_cache import plate_cache
+from app.services.redaction_service import create_redactor
+from app.services.frame_ring import FrameRing
+from app.services.camera_scheduler import CameraScheduler
+from app.services.clip_recorder import ClipRecorder
+from app.services.dual_stream import MainStreamReader
+from app.services.ffmpeg_capture import FFmpegCapture, MODE_FULL
+from app.services.motion_gate import MotionGate
+from app.services.plate_engine import PlateEngine, get_plate_engine
+from app.services.detection_sink import detection_sink, detection_row_from_result
+from app.services.auto_checkin_service import AutoCheckInEngine, auto_checkin_engine
+from app.services.shadow_eval import get_shadow_evaluator
+from app.services.snapshot_service import get_snapshot_pool
+from app.core.config import settings
+from app.core.admission import inference_gate, PRIORITY_LIVE
 import os
 from pathlib import Path
-from ultralytics import YOLO
-import easyocr
 
 logger = logging.getLogger(__name__)
 
+
+async def _settle(future: asyncio.Future):
+    """
+    Risultato di `future` atteso fino alla fine anche se il chiamante viene
+    cancellato: il lavoro in un thread (cattura, inferenza, encoding) scrive e
+    legge gli slot dell'anello, che si può chiudere solo dopo. La cancellazione
+    viene propagata al termine.
+    """
+    cancelled = False
+    while not future.done():
+        try:
+            await asyncio.shield(future)
+        except asyncio.CancelledError:
+            cancelled = True
+        except Exception:
+            break
+    if cancelled:
+        raise asyncio.CancelledError()
+    return future.result()
+
+
+async def _in_thread(func, *args):
+    """asyncio.to_thread che non lascia il thread in esecuzione se il chiamante viene cancellato"""
+    return await _settle(asyncio.ensure_future(asyncio.to_thread(func, *args)))
+
+
 class LicensePlateService:
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, engine: Optional[PlateEngine] = None,
+                 camera_id: str = None, checkin_engine: Optional[AutoCheckInEngine] = None,
+                 scheduler: Optional[CameraScheduler] = None):
         self.db = db
+        self.camera_id = camera_id or settings.CAMERAS[0]["id"]
+        # Con più telecamere sullo stesso motore l'inferenza passa dallo scheduler condiviso
+        self.scheduler = scheduler
+        self.checkin_engine = checkin_engine or auto_checkin_engine
         self.vehicle_service = VehicleService(db)
         self.appointment_service = AppointmentService(db)
         self.is_streaming = False
         self.current_stream = None
         self.output_stream = None
+        self.output_size = None
         
-        # Inizializza YOLO per il rilevamento targhe
-        self.yolo_model = None
-        self._load_yolo_model()
+        # Doppio stream: main stream per i ritagli ad alta risoluzione, movimento sul substream
+        self.main_stream: Optional[MainStreamReader] = None
+        self.motion_gate: Optional[MotionGate] = None
         
-        # Inizializza EasyOCR per il riconoscimento testo
-        self.ocr_reader = None
-        self._load_ocr_reader()
+        # Anello di frame in memoria condivisa tra gli stadi (creato al primo frame)
+        self.frame_ring = None
+        # Cambio di risoluzione: l'anello va ricreato quando nessuno stadio ne usa più gli slot
+        self._ring_resized = False
+        
+        # Ultimo frame catturato (slot trattenuto nell'anello) per gli snapshot di /ai/stream
+        self._latest_slot: Optional[int] = None
+        self._latest_at = 0.0
+        self._latest_lock = threading.Lock()
+        self._snapshot_url: Optional[str] = None
+        
+        # Pre-roll in memoria per le clip degli eventi (creato all'avvio del monitoraggio)
+        self.clip_recorder: Optional[ClipRecorder] = None
+        
+        # Motore targhe condiviso (YOLO/contorni + EasyOCR), caricato al primo utilizzo
+        self._engine = engine
+        
+        # Stadio di oscuramento privacy per lo stream di output (creato al primo utilizzo)
+        self._redactor = None
         
         # Crea directory per salvare le foto delle targhe
         self.plates_dir = Path("uploads/plates")
         self.plates_dir.mkdir(parents=True, exist_ok=True)
         
-    def _load_yolo_model(self):
-        """Carica il modello YOLO per il rilevamento targhe"""
-        try:
-            model_path = "models/license_plate_detector.pt"
-            if os.path.exists(model_path):
-                self.yolo_model = YOLO(model_path)
-                logger.info("Modello YOLO caricato per il rilevamento targhe")
-            else:
-                # Fallback al modello pre-addestrato YOLOv8
-                self.yolo_model = YOLO('yolov8n.pt')
-                logger.info("Modello YOLOv8 pre-addestrato caricato")
-        except Exception as e:
-            logger.error(f"Errore nel caricamento modello YOLO: {e}")
-            self.yolo_model = None
+    @property
+    def engine(self) -> PlateEngine:
+        if self._engine is None:
+            self._engine = get_plate_engine()
+        return self._engine
     
-    def _load_ocr_reader(self):
-        """Carica EasyOCR per il riconoscimento testo"""
-        try:
-            # Inizializza EasyOCR per italiano e inglese
-            self.ocr_reader = easyocr.Reader(['it', 'en'], gpu=False)
-            logger.info("EasyOCR caricato per il riconoscimento testo")
-        except Exception as e:
-            logger.error(f"Errore nel caricamento EasyOCR: {e}")
-            self.ocr_reader = None
-        
-    def start_livestream_monitoring(self, stream_url: str = "0", output_url: str = None):
+    @property
+    def redactor(self):
+        if self._redactor is None:
+            self._redactor = create_redactor()
+        return self._redactor
+    
+    def start_livestream_monitoring(self, stream_url: str = "0", output_url: str = None, substream_url: str = None):
         """Avvia il monitoraggio del livestream per il riconoscimento targhe"""
         try:
             self.is_streaming = True
-            self.current_stream = cv2.VideoCapture(stream_url)
+            
+            capture_url = stream_url
+            if substream_url and settings.DUAL_STREAM_ENABLED:
+                self.main_stream = MainStreamReader(stream_url, max_skew=settings.DUAL_STREAM_MAX_SKEW_SECONDS)
+                if self.main_stream.start():
+                    capture_url = substream_url
+                    logger.info(f"Doppio stream: rilevamento su {substream_url}, ritagli da {stream_url}")
+                else:
+                    logger.warning("Main stream non disponibile: monitoraggio sul solo substream")
+                    self.main_stream = None
+                    capture_url = substream_url
+            
+            self.current_stream = self._open_capture(capture_url)
             
             if not self.current_stream.isOpened():
-                logger.error(f"Impossibile aprire lo stream: {stream_url}")
+                logger.error(f"Impossibile aprire lo stream: {capture_url}")
                 return False
             
+            # Movimento: decide se il frame va all'inferenza (doppio stream) e il modo di decodifica (ffmpeg)
+            if self.main_stream or self._idle_decoding:
+                self.motion_gate = MotionGate(
+                    width=settings.MOTION_GATE_WIDTH,
+                    threshold=settings.MOTION_GATE_THRESHOLD,
+                    min_area=settings.MOTION_GATE_MIN_AREA,
+                    hold_seconds=settings.MOTION_GATE_HOLD_SECONDS,
+                    background_seconds=settings.MOTION_GATE_BACKGROUND_SECONDS
+                )
+            
             # Configura lo stream di output se specificato
             if output_url:
                 self._setup_output_stream(output_url)
+            
+            # Gli snapshot di questa telecamera usano i frame del monitoraggio
+            self._snapshot_url = stream_url
+            get_snapshot_pool().register_live(stream_url, self.latest_frame)
                 
             logger.info("Livestream monitoring avviato")
             return True
@@ -83,6 +159,37 @@ class LicensePlateService:
             logger.error(f"Errore nell'avvio del livestream: {e}")
             return False
     
+    def _open_capture(self, url: str):
+        if settings.CAPTURE_BACKEND == "ffmpeg":
+            capture = FFmpegCapture(url, lowres_width=settings.CAPTURE_LOWRES_WIDTH, ffmpeg_path=settings.FFMPEG_PATH)
+            capture.open()
+            return capture
+        return cv2.VideoCapture(url)
+    
+    @property
+    def _idle_decoding(self) -> bool:
+        """Decodifica ridotta a scena ferma attiva (solo con la cattura ffmpeg)"""
+        return isinstance(self.current_stream, FFmpegCapture) and settings.CAPTURE_IDLE_MODE != MODE_FULL
+    
+    def _update_decode_mode(self, motion: bool, now: float) -> bool:
+        """
+        Decodifica piena al primo movimento, ridotta dopo CAPTURE_IDLE_AFTER_SECONDS
+        di scena ferma; True se il modo è cambiato. Il nuovo modo diventa attivo
+        quando il suo processo ffmpeg produce il primo frame (vedi FFmpegCapture)
+        """
+        if motion:
+            self.current_stream.set_mode(MODE_FULL)
+        elif (self.current_stream.mode == MODE_FULL
+              and now - self.motion_gate.last_motion >= settings.CAPTURE_IDLE_AFTER_SECONDS):
+            self.current_stream.set_mode(settings.CAPTURE_IDLE_MODE)
+        return self.current_stream.poll_switch()
+    
+    def decode_status(self) -> Dict:
+        """Backend e modo di decodifica dello stream analizzato"""
+        if isinstance(self.current_stream, FFmpegCapture):
+            return self.current_stream.stats()
+        return {"backend": "opencv", "mode": MODE_FULL}
+    
     def _setup_output_stream(self, output_url: str):
         """Configura lo stream di output con blur"""
         try:
@@ -94,6 +201,7 @@ class LicensePlateService:
             # Configura il codec per l'output
             fourcc = cv2.VideoWriter_fourcc(*'XVID')
             self.output_stream = cv2.VideoWriter(output_url, fourcc, fps, (width, height))
+            self.output_size = (width, height)
             
             logger.info(f"Stream di output configurato: {output_url}")
             
@@ -103,6 +211,11 @@ class LicensePlateService:
     def stop_livestream_monitoring(self):
         """Ferma il monitoraggio del livestream"""
         self.is_streaming = False
+        if self._snapshot_url:
+            get_snapshot_pool().unregister_live(self._snapshot_url, self.latest_frame)
+            self._snapshot_url = None
+        if self.main_stream:
+            self.main_stream.stop()
         if self.current_stream:
             self.current_stream.release()
         if self.output_stream:
@@ -110,38 +223,40 @@ class LicensePlateService:
         logger.info("Livestream monitoring fermato")
     
     def apply_blur_to_faces(self, frame):
-        """Applica blur alle facce nel frame"""
+        """Applica l'oscuramento ai volti nel frame"""
         try:
-            # Per ora saltiamo il blur delle facce per concentrarci sul rilevamento targhe
-            # TODO: Implementare rilevamento facce se necessario
-            pass
+            frame = self.redactor.redact_faces(frame)
         except Exception as e:
             logger.error(f"Errore nell'applicazione blur facce: {e}")
             
         return frame
     
     def apply_blur_to_plates(self, frame, detected_plates):
-        """Applica blur alle targhe rilevate"""
+        """Applica l'oscuramento alle targhe rilevate"""
         try:
-            for plate_info in detected_plates:
-                bbox = plate_info['bbox']
-                x, y, w, h = bbox
-                
-                # Applica blur gaussiano alla regione della targa
-                plate_roi = frame[y:y+h, x:x+w]
-                blurred_plate = cv2.GaussianBlur(plate_roi, (99, 99), 30)
-                frame[y:y+h, x:x+w] = blurred_plate
-                
+            frame = self.redactor.redact_boxes(frame, [plate_info['bbox'] for plate_info in detected_plates])
         except Exception as e:
             logger.error(f"Errore nell'applicazione blur targhe: {e}")
             
         return frame
     
-    def save_plate_image(self, frame, bbox, license_plate):
-        """Salva l'immagine della targa rilevata"""
+    def apply_privacy_redaction(self, frame, detected_plates):
+        """Oscura volti e targhe entro il budget di tempo per frame"""
         try:
-            x, y, w, h = bbox
-            plate_region = frame[y:y+h, x:x+w]
+            frame = self.redactor.redact(frame, [plate_info['bbox'] for plate_info in detected_plates])
+        except Exception as e:
+            logger.error(f"Errore nell'oscuramento privacy: {e}")
+            
+        return frame
+    
+    def save_plate_image(self, frame, bbox, license_plate, crop=None):
+        """Salva l'immagine della targa rilevata (il ritaglio ad alta risoluzione se disponibile)"""
+        try:
+            if crop is not None:
+                plate_region = crop
+            else:
+                x, y, w, h = bbox
+                plate_region = frame[y:y+h, x:x+w]
             
             # Genera nome file unico
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -158,86 +273,38 @@ class LicensePlateService:
             logger.error(f"Errore nel salvataggio immagine targa: {e}")
             return None
     
-    def detect_license_plate(self, frame) -> List[Dict]:
-        """Riconosce le targhe in un frame usando YOLO + EasyOCR"""
-        detected_plates = []
-        
+    def detect_license_plate(self, frame, captured_at: float = None, high_res_request=None) -> List[Dict]:
+        """Riconosce le targhe in un frame tramite il motore targhe condiviso (priorità livestream)"""
         try:
-            if self.yolo_model is None:
-                logger.warning("Modello YOLO non disponibile")
-                return detected_plates
-            
-            # Usa YOLO per rilevare oggetti (targhe)
-            results = self.yolo_model(frame, conf=0.5, verbose=False)
-            
-            for result in results:
-                boxes = result.boxes
-                if boxes is not None:
-                    for box in boxes:
-                        # Ottieni coordinate del bounding box
-                        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-                        
-                        # Estrai la regione della targa
-                        plate_region = frame[y1:y2, x1:x2]
-                        
-                        if plate_region.size == 0:
-                            continue
-                        
-                        # Usa EasyOCR per riconoscere il testo
-                        license_plate = self._extract_text_from_image(plate_region)
-                        
-                        if license_plate and self._is_valid_italian_plate(license_plate):
-                            detected_plates.append({
-                                'license_plate': license_plate,
-                                'bbox': (x1, y1, x2-x1, y2-y1),
-                                'confidence': float(box.conf[0])
-                            })
-                            logger.info(f"Targa rilevata: {license_plate} (confidenza: {float(box.conf[0]):.2f})")
-            
+            if self.main_stream:
+                # Il frame ad alta risoluzione si attende prima di occupare uno slot di inferenza
+                high_res = self._wait_high_res(high_res_request or self.main_stream.request(captured_at or time.monotonic()))
+            with inference_gate.slot(PRIORITY_LIVE):
+                started = time.monotonic()
+                if self.main_stream:
+                    detected_plates = self.engine.detect_dual(frame, lambda: high_res, settings.DUAL_STREAM_CROP_PADDING)
+                else:
+                    detected_plates = self.engine.detect(frame)
+                seconds = time.monotonic() - started
+            shadow = get_shadow_evaluator()
+            if shadow:
+                shadow.offer(self.camera_id, frame, detected_plates, seconds)
+            for plate_info in detected_plates:
+                logger.info(f"Targa rilevata: {plate_info['license_plate']} (confidenza: {plate_info['confidence']:.2f})")
             return detected_plates
             
         except Exception as e:
             logger.error(f"Errore nel riconoscimento targa: {e}")
             return []
     
-    def _extract_text_from_image(self, image) -> Optional[str]:
-        """Estrae testo dall'immagine usando EasyOCR"""
-        try:
-            if self.ocr_reader is None:
-                logger.warning("EasyOCR non disponibile")
-                return None
-            
-            # Usa EasyOCR per riconoscere il testo
-            results = self.ocr_reader.readtext(image)
-            
-            if results:
-                # Prendi il testo con la confidenza più alta
-                best_result = max(results, key=lambda x: x[2])
-                text = best_result[1].strip()
-                confidence = best_result[2]
-                
-                # Filtra solo caratteri alfanumerici e spazi
-                text = re.sub(r'[^A-Z0-9\s]', '', text.upper())
-                text = re.sub(r'\s+', '', text)  # Rimuovi spazi
-                
-                logger.info(f"Testo riconosciuto: '{text}' (confidenza: {confidence:.2f})")
-                
-                # Restituisci solo se la confidenza è alta e il testo ha senso
-                if confidence > 0.3 and len(text) >= 5:
-                    return text
-            
-            return None
-            
-        except Exception as e:
-            logger.error(f"Errore nell'estrazione testo: {e}")
-            return None
+    def _wait_high_res(self, request):
+        return self.main_stream.wait(request, timeout=settings.DUAL_STREAM_FETCH_TIMEOUT_SECONDS)
     
-    def _is_valid_italian_plate(self, plate: str) -> bool:
-        """Verifica se la targa segue il formato italiano"""
-        # Formato italiano: AA123AA o AA123AA
-        pattern = r'^[A-Z]{2}\d{3}[A-Z]{2}$'
-        return bool(re.match(pattern, plate))
+    def _dual_stream_detect(self, high_res_request):
+        """Rilevamento sul frame del substream, OCR sul frame del main stream prenotato alla sua cattura"""
+        return lambda frame: self.engine.detect_dual(
+            frame, lambda: self._wait_high_res(high_res_request), settings.DUAL_STREAM_CROP_PADDING
+        )
     
     def find_vehicle_by_plate(self, license_plate: str) -> Optional[Vehicle]:
         """Cerca un veicolo nel database tramite targa"""
@@ -285,44 +352,35 @@ class LicensePlateService:
             logger.error(f"Errore nel recupero info cliente: {e}")
             return None
     
+    def lookup_plate(self, license_plate: str) -> Dict:
+        """Risolve targa -> veicolo, cliente e appuntamenti di oggi tramite la cache"""
+        return plate_cache.get(self.db, license_plate)
+    
     async def process_detected_plate(self, license_plate: str) -> Dict:
         """Processa una targa rilevata"""
         try:
-            # Cerca il veicolo nel database
-            vehicle = self.find_vehicle_by_plate(license_plate)
+            # Risolve veicolo, cliente e appuntamenti di oggi (senza query se in cache)
+            entry = self.lookup_plate(license_plate)
+            vehicle = entry["vehicle"]
             
             if vehicle:
-                # Ottieni informazioni cliente
-                customer_info = self.get_customer_info(vehicle)
-                
-                # Verifica appuntamenti per oggi
-                appointments = self.check_appointments_for_vehicle(vehicle.id)
+                appointments = entry["appointments"]
                 
                 # Prepara il risultato
                 result = {
                     "license_plate": license_plate,
-                    "detected_at": datetime.now().isoformat(),
+                    "detected_at": datetime.now(timezone.utc).isoformat(),
                     "vehicle_found": True,
-                    "vehicle_info": {
-                        "id": vehicle.id,
-                        "brand": vehicle.brand,
-                        "model": vehicle.model,
-                        "year": vehicle.year,
-                        "color": vehicle.color,
-                        "fuel_type": vehicle.fuel_type
-                    },
-                    "customer_info": customer_info,
+                    "vehicle_info": vehicle,
+                    "customer_info": entry["customer"],
                     "appointments": [
                         {
-                            "id": apt.id,
-                            "appointment_date": apt.appointment_date.isoformat(),
-                            "service": {
-                                "id": apt.service.id,
-                                "name": apt.service.name
-                            } if apt.service else None
+                            "id": apt["id"],
+                            "appointment_date": apt["appointment_date"],
+                            "service": apt["service"]
                         } for apt in appointments
                     ],
-                    "message": f"Veicolo trovato: {vehicle.brand} {vehicle.model}"
+                    "message": f"Veicolo trovato: {vehicle['brand']} {vehicle['model']}"
                 }
                 
                 if appointments:
@@ -333,7 +391,7 @@ class LicensePlateService:
             else:
                 result = {
                     "license_plate": license_plate,
-                    "detected_at": datetime.now().isoformat(),
+                    "detected_at": datetime.now(timezone.utc).isoformat(),
                     "vehicle_found": False,
                     "vehicle_info": None,
                     "customer_info": None,
@@ -347,7 +405,7 @@ class LicensePlateService:
             logger.error(f"Errore nel processamento targa: {e}")
             return {
                 "license_plate": license_plate,
-                "detected_at": datetime.now().isoformat(),
+                "detected_at": datetime.now(timezone.utc).isoformat(),
                 "vehicle_found": False,
                 "vehicle_info": None,
                 "customer_info": None,
@@ -357,64 +415,102 @@ class LicensePlateService:
     
     async def monitor_livestream(self, stream_url: str = "rtsp://host.docker.internal:8554/webcam", output_url: str = None):
         """Monitora continuamente il livestream per il riconoscimento targhe"""
-        # Usa sempre lo stream fisso
-        fixed_stream_url = "rtsp://host.docker.internal:8554/webcam"
-        if not self.start_livestream_monitoring(fixed_stream_url, output_url):
+        camera = next((camera for camera in settings.CAMERAS if camera["id"] == self.camera_id), {})
+        substream_url = camera.get("substream_url") if camera.get("url") == stream_url else None
+        # Apertura degli stream (handshake RTSP) fuori dall'event loop
+        if not await asyncio.to_thread(self.start_livestream_monitoring, stream_url, output_url, substream_url):
             return
         
         logger.info("Avvio monitoraggio livestream per riconoscimento targhe")
         
+        if settings.CLIP_RECORDING_ENABLED:
+            self.clip_recorder = ClipRecorder(
+                self.camera_id,
+                clips_dir=settings.CLIP_DIR,
+                pre_seconds=settings.CLIP_PRE_ROLL_SECONDS,
+                post_seconds=settings.CLIP_POST_ROLL_SECONDS,
+                fps=settings.CLIP_FPS,
+                jpeg_quality=settings.CLIP_JPEG_QUALITY,
+                max_buffer_bytes=settings.CLIP_BUFFER_MAX_MB * 1024 * 1024,
+                max_clip_seconds=settings.CLIP_MAX_SECONDS,
+                debounce_seconds=settings.CLIP_PLATE_DEBOUNCE_SECONDS
+            )
+        
+        scheduled = None  # (slot, future) del frame affidato allo scheduler
         try:
             frame_count = 0
             while self.is_streaming:
-                ret, frame = self.current_stream.read()
+                # Cattura: il frame viene decodificato direttamente in uno slot condiviso.
+                # La lettura blocca fino al frame successivo, quindi avviene fuori
+                # dall'event loop (con il monitoraggio nel processo API lo condivide con le richieste)
+                slot = await _in_thread(self._capture_frame)
+                captured_at = time.monotonic()
+                
+                if self._ring_resized:
+                    # L'anello si chiude solo dopo il frame ancora in mano allo scheduler
+                    if scheduled is not None:
+                        previous, scheduled = scheduled, None
+                        await self._finish_scheduled_frame(*previous)
+                    self._close_ring()
                 
-                if not ret:
+                if slot is None:
                     logger.warning("Frame non letto correttamente")
+                    await asyncio.sleep(0)
                     continue
                 
+                self._keep_latest(slot, captured_at)
                 frame_count += 1
                 if frame_count % 30 == 0:  # Log ogni 30 frame (circa 1 secondo a 30fps)
                     logger.info(f"Processando frame {frame_count}")
                 
-                # Applica blur alle facce
-                frame = self.apply_blur_to_faces(frame)
+                motion, switched = True, False
+                if self.motion_gate:
+                    motion = self.motion_gate.update(self.frame_ring.frame(slot), captured_at)
                 
-                # Riconosci targhe nel frame
-                detected_plates = self.detect_license_plate(frame)
+                # Doppio stream: il frame del main stream si prenota all'istante di
+                # cattura, così il ritaglio corrisponde ai riquadri del substream
+                high_res_request = None
+                if motion and self.main_stream:
+                    high_res_request = self.main_stream.request(captured_at)
                 
-                # Applica blur alle targhe rilevate
-                frame = self.apply_blur_to_plates(frame, detected_plates)
+                if self.motion_gate and self._idle_decoding:
+                    # Avvio e chiusura dei processi ffmpeg fuori dall'event loop
+                    switched = await _in_thread(self._update_decode_mode, motion, captured_at)
                 
-                # Processa ogni targa rilevata
-                for plate_info in detected_plates:
-                    license_plate = plate_info['license_plate']
-                    bbox = plate_info['bbox']
-                    
-                    logger.info(f"Targa rilevata: {license_plate}")
-                    
-                    # Salva l'immagine della targa
-                    plate_image_path = self.save_plate_image(frame, bbox, license_plate)
-                    
-                    # Processa la targa rilevata
-                    result = await self.process_detected_plate(license_plate)
-                    result['plate_image_path'] = plate_image_path
-                    
-                    # Log del risultato
-                    if result.get("vehicle_found"):
-                        if result.get("appointments"):
-                            logger.info(f"✅ {result['message']}")
-                        else:
-                            logger.info(f"ℹ️ {result['message']}")
-                    else:
-                        logger.info(f"❌ {result['message']}")
-                    
-                    # Qui potresti inviare notifiche, salvare nel database, etc.
-                    await self._handle_plate_detection(result)
+                if self.clip_recorder:
+                    now = time.time()
+                    if self.clip_recorder.wants_frame(now):
+                        # Encoding JPEG fuori dall'event loop: lo slot resta nostro fino al ritorno
+                        await _in_thread(self.clip_recorder.add_frame, self.frame_ring.frame(slot), now)
                 
-                # Scrivi il frame processato nello stream di output
-                if self.output_stream:
-                    self.output_stream.write(frame)
+                if scheduled is not None and (not motion or switched):
+                    # Scena ferma, o cambio di decodifica (con la risoluzione cambia
+                    # l'anello): si chiude prima il frame in corso nello scheduler
+                    previous, scheduled = scheduled, None
+                    await self._finish_scheduled_frame(*previous)
+                
+                if not motion:
+                    # Scena ferma: niente inferenza, il frame va solo in output
+                    try:
+                        await self._handle_frame_plates(self.frame_ring.frame(slot), [])
+                    finally:
+                        self.frame_ring.release(slot)
+                elif self.scheduler is not None and not switched:
+                    # Pipeline a due frame: mentre lo scheduler elabora il precedente
+                    # questo è già in coda, così peso e fps minimo della telecamera
+                    # contano anche quando il motore è saturo
+                    future = self.scheduler.submit(
+                        self.camera_id, self.frame_ring.frame(slot), captured_at,
+                        detect=self._dual_stream_detect(high_res_request) if self.main_stream else None
+                    )
+                    previous, scheduled = scheduled, (slot, future)
+                    if previous is not None:
+                        await self._finish_scheduled_frame(*previous)
+                else:
+                    try:
+                        await self._process_frame_slot(slot, captured_at, high_res_request)
+                    finally:
+                        self.frame_ring.release(slot)
                 
                 # Pausa per non sovraccaricare la CPU
                 await asyncio.sleep(0.1)  # 10 FPS
@@ -422,23 +518,165 @@ class LicensePlateService:
         except Exception as e:
             logger.error(f"Errore nel monitoraggio livestream: {e}")
         finally:
-            self.stop_livestream_monitoring()
+            # Anche dopo una cancellazione: cattura, cambio di decodifica e clip
+            # in corso sono già terminati (_in_thread), resta il frame dello scheduler
+            try:
+                if scheduled is not None:
+                    # Il frame può essere ancora in uso dall'inferenza: si attende prima di chiudere l'anello
+                    await _settle(asyncio.wrap_future(scheduled[1]))
+                    self.frame_ring.release(scheduled[0])
+                self.stop_livestream_monitoring()
+                if self.clip_recorder:
+                    # La clip in corso viene chiusa con i frame già raccolti
+                    await _in_thread(self.clip_recorder.flush)
+            finally:
+                self._close_ring()
+    
+    def _close_ring(self):
+        """Chiude l'anello di frame: nessuno stadio deve averne slot in uso"""
+        self._ring_resized = False
+        if self.frame_ring:
+            self._drop_latest()
+            self.frame_ring.close()
+            self.frame_ring = None
+    
+    def _keep_latest(self, slot: int, captured_at: float):
+        """Trattiene lo slot come ultimo frame (un riferimento in più) e rilascia il precedente"""
+        self.frame_ring.retain(slot)
+        with self._latest_lock:
+            previous, self._latest_slot, self._latest_at = self._latest_slot, slot, captured_at
+        if previous is not None:
+            self.frame_ring.release(previous)
     
-    async def _handle_plate_detection(self, result: Dict):
+    def _drop_latest(self):
+        with self._latest_lock:
+            previous, self._latest_slot = self._latest_slot, None
+        if previous is not None and self.frame_ring:
+            self.frame_ring.release(previous)
+    
+    def latest_frame(self) -> Optional[tuple]:
+        """Copia dell'ultimo frame catturato e istante monotonic di cattura, o None"""
+        with self._latest_lock:
+            if self._latest_slot is None or self.frame_ring is None:
+                return None
+            # Copia sotto il lock: lo slot non può essere rilasciato e riscritto nel frattempo
+            return self.frame_ring.frame(self._latest_slot).copy(), self._latest_at
+    
+    def _capture_frame(self) -> Optional[int]:
+        """Legge il prossimo frame nello slot libero dell'anello e ne restituisce l'indice"""
+        if self.frame_ring is None:
+            ret, frame = self.current_stream.read()
+            if not ret:
+                return None
+            self.frame_ring = FrameRing(settings.FRAME_RING_SLOTS, frame.shape, frame.dtype)
+            slot = self.frame_ring.acquire()
+            self.frame_ring.frame(slot)[:] = frame
+            return slot
+        
+        slot = self.frame_ring.acquire()
+        if slot is None:
+            # Tutti gli slot sono in uso: si scarta il frame senza decodificarlo
+            self.current_stream.grab()
+            return None
+        
+        view = self.frame_ring.frame(slot)
+        ret, frame = self.current_stream.read(view)
+        if not ret:
+            self.frame_ring.release(slot)
+            return None
+        
+        if frame.shape != view.shape:
+            # Cambio di risoluzione dello stream: l'anello viene chiuso dal ciclo di
+            # monitoraggio, dopo il frame in inferenza, e ricreato al frame successivo
+            logger.warning(f"Risoluzione stream cambiata: {view.shape} -> {frame.shape}")
+            self.frame_ring.release(slot)
+            self._ring_resized = True
+            return None
+        
+        if frame.ctypes.data != view.ctypes.data:
+            view[:] = frame
+        return slot
+    
+    async def _process_frame_slot(self, slot: int, captured_at: float = None, high_res_request=None):
+        """Esegue rilevamento, gestione targhe e output sul frame dello slot (vista, senza copie)"""
+        frame = self.frame_ring.frame(slot)
+        
+        # Riconosci targhe nel frame (fuori dall'event loop: l'attesa di uno slot
+        # di inferenza non blocca le altre richieste)
+        detected_plates = await _in_thread(self.detect_license_plate, frame, captured_at, high_res_request)
+        await self._handle_frame_plates(frame, detected_plates)
+    
+    async def _finish_scheduled_frame(self, slot: int, future):
+        """Attende il risultato dello scheduler per il frame dello slot e lo gestisce"""
+        try:
+            # Lo slot si rilascia solo a inferenza conclusa, anche se il monitoraggio viene cancellato
+            detected_plates = await _settle(asyncio.wrap_future(future))
+            if detected_plates is None:
+                # Frame scartato dallo scheduler perché superato o troppo vecchio
+                return
+            await self._handle_frame_plates(self.frame_ring.frame(slot), detected_plates)
+        finally:
+            self.frame_ring.release(slot)
+    
+    async def _handle_frame_plates(self, frame, detected_plates: List[Dict]):
+        """Gestione delle targhe rilevate e pubblicazione del frame sullo stream di output"""
+        # Processa ogni targa rilevata
+        for plate_info in detected_plates:
+            license_plate = plate_info['license_plate']
+            bbox = plate_info['bbox']
+            
+            logger.info(f"Targa rilevata: {license_plate}")
+            
+            # Salva l'immagine della targa
+            plate_image_path = self.save_plate_image(frame, bbox, license_plate, plate_info.get('crop'))
+            
+            # Processa la targa rilevata
+            result = await self.process_detected_plate(license_plate)
+            result['plate_image_path'] = plate_image_path
+            result['bbox'] = list(bbox)
+            
+            # Log del risultato
+            if result.get("vehicle_found"):
+                if result.get("appointments"):
+                    logger.info(f"✅ {result['message']}")
+                else:
+                    logger.info(f"ℹ️ {result['message']}")
+            else:
+                logger.info(f"❌ {result['message']}")
+            
+            # Check-in/check-out automatico (il DB viene toccato solo ai cambi di stato)
+            if settings.AUTO_CHECKIN_ENABLED and result.get("vehicle_found"):
+                result['checkin_action'] = await self.checkin_engine.handle_plate_pass_async(
+                    self.camera_id, result["vehicle_info"]["id"], license_plate
+                )
+            
+            # Passaggio targa: pre-roll + post-roll in una clip. Un cambio di check-in
+            # la avvia sempre; altrimenti solo se la targa non era già in vista
+            if self.clip_recorder:
+                clip_path = self.clip_recorder.trigger(
+                    key=license_plate, force=bool(result.get('checkin_action'))
+                )
+                if clip_path:
+                    result['clip_path'] = clip_path
+            
+            # Qui potresti inviare notifiche, salvare nel database, etc.
+            await self._handle_plate_detection(result, plate_info['confidence'])
+        
+        # Oscura volti e targhe solo se il frame viene pubblicato,
+        # dopo aver salvato le immagini delle targhe in chiaro
+        if self.output_stream:
+            if settings.REDACTION_ENABLED:
+                frame = self.apply_privacy_redaction(frame, detected_plates)
+            if self.output_size and frame.shape[1::-1] != self.output_size:
+                # Decodifica a bassa risoluzione: l'output resta alla risoluzione iniziale
+                frame = cv2.resize(frame, self.output_size)
+            self.output_stream.write(frame)
+    
+    async def _handle_plate_detection(self, result: Dict, confidence: float = 0.0):
         """Gestisce il risultato del riconoscimento targa"""
         try:
-            # Salva la rilevazione nel database
-            from app.core.database import AIDetection
-            
-            detection = AIDetection(
-                license_plate=result["license_plate"],
-                confidence_score=0.85,  # Simulato
-                detection_data=result,
-                is_automatic=True
-            )
-            
-            self.db.add(detection)
-            self.db.commit()
+            # Accoda la rilevazione: il salvataggio avviene a lotti fuori dal ciclo dei frame
+            detection_sink.submit(detection_row_from_result(result, confidence, source=self.camera_id))
             
             # Se c'è un appuntamento, invia notifica
             if result.get("appointments"):
@@ -0,0 +1,88 @@
+"""
+Query delle liste dell'API (clienti, veicoli, servizi, appuntamenti, check-in,
+rilevazioni): filtri come condizioni SQL e paginazione a cursore (keyset).
+
+Ogni lista ha un ordinamento stabile su colonne indicizzate che termina con
+la chiave primaria. Il cursore codifica i valori di ordinamento dell'ultimo
+elemento restituito e la pagina successiva riparte con un confronto su tupla
+(`(data, id) > (:data, :id)`) invece di un OFFSET: una pagina profonda costa
+quanto la prima. `skip` resta per compatibilità, ma scorre le righe saltate.
+"""
+from datetime import datetime, date
+from typing import Any, List, NamedTuple, Optional, Sequence
+import base64
+import json
+from sqlalchemy import literal, tuple_
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+CURSOR_HEADER = "X-Next-Cursor"
+
+
+class InvalidCursor(ValueError):
+    status_code = 400
+
+
+class Page(NamedTuple):
+    items: List[Any]
+    next_cursor: Optional[str]
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    payload = json.dumps([value.isoformat() if isinstance(value, (datetime, date)) else value for value in values])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns: Sequence) -> tuple:
+    """Valori di ordinamento del cursore, convertiti nei tipi delle colonne"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("numero di valori errato")
+        decoded = []
+        for column, value in zip(columns, values):
+            python_type = column.type.python_type
+            if python_type in (datetime, date):
+                decoded.append(python_type.fromisoformat(value))
+            else:
+                decoded.append(python_type(value))
+        return tuple(decoded)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+
+
+def where(query: Select, *conditions) -> Select:
+    """Aggiunge le condizioni dei filtri impostati (None = filtro assente)"""
+    present = [condition for condition in conditions if condition is not None]
+    return query.where(*present) if present else query
+
+
+def paginate(db: Session, query: Select, order_by: Sequence, limit: int,
+             cursor: str = None, skip: int = 0, descending: bool = False) -> Page:
+    """
+    Una pagina di `query` ordinata per `order_by` (colonne indicizzate, l'ultima
+    univoca), dopo il cursore se indicato; next_cursor è None sull'ultima pagina
+    """
+    if cursor:
+        # Parametri con il tipo della colonna: su SQLite le date sono confrontate come testo
+        after = tuple_(*(literal(value, column.type) for column, value in zip(order_by, decode_cursor(cursor, order_by))))
+        keys = tuple_(*order_by)
+        query = query.where(keys < after if descending else keys > after)
+    elif skip:
+        query = query.offset(skip)
+
+    # Un elemento in più dice se esiste una pagina successiva senza un COUNT
+    query = query.order_by(*(column.desc() if descending else column.asc() for column in order_by))
+    items = db.execute(query.limit(limit + 1)).scalars().all()
+    if len(items) <= limit:
+        return Page(items, None)
+    items = items[:limit]
+    last = items[-1]
+    return Page(items, encode_cursor([getattr(last, column.key) for column in order_by]))
+
+
+def page_items(page: Page, response) -> List[Any]:
+    """Elementi della pagina, con il cursore della successiva nell'header X-Next-Cursor"""
+    if page.next_cursor:
+        response.headers[CURSOR_HEADER] = page.next_cursor
+    return page.items
@@ -0,0 +1,78 @@
+from typing import Dict, Optional
+import time
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """
+    Rilevamento di movimento economico per decidere se un frame merita
+    l'inferenza: differenza tra il frame ridotto a `width` pixel e uno sfondo
+    a media mobile. Il movimento vale per `hold_seconds` dopo l'ultimo
+    cambiamento, così un'auto ferma davanti alla sbarra continua a essere letta.
+    Lo sfondo si aggiorna in base al tempo trascorso (costante di tempo
+    `background_seconds`), non al numero di frame: con la decodifica dei soli
+    keyframe si adatta alla stessa velocità.
+    """
+
+    def __init__(
+        self,
+        width: int = 160,
+        threshold: int = 25,
+        min_area: float = 0.002,
+        hold_seconds: float = 2.0,
+        background_seconds: float = 2.0
+    ):
+        self.width = width
+        self.threshold = threshold
+        self.min_area = min_area
+        self.hold_seconds = hold_seconds
+        self.background_seconds = background_seconds
+        self._background: Optional[np.ndarray] = None
+        self._last_motion = 0.0
+        self._last_update = 0.0
+        self.changed_fraction = 0.0
+        self.frames = 0
+        self.frames_with_motion = 0
+
+    def _prepare(self, frame: np.ndarray) -> np.ndarray:
+        height = max(1, int(frame.shape[0] * self.width / frame.shape[1]))
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def update(self, frame: np.ndarray, timestamp: float = None) -> bool:
+        """Aggiorna lo sfondo con il frame; True se c'è (o c'è stato da poco) movimento"""
+        if timestamp is None:
+            timestamp = time.monotonic()
+        small = self._prepare(frame)
+        self.frames += 1
+
+        if self._background is None or self._background.shape != small.shape:
+            self._background = small.astype(np.float32)
+            self._last_motion = timestamp
+        else:
+            diff = cv2.absdiff(small, cv2.convertScaleAbs(self._background))
+            self.changed_fraction = float(np.count_nonzero(diff > self.threshold)) / diff.size
+            alpha = min(1.0, max(0.0, timestamp - self._last_update) / self.background_seconds)
+            cv2.accumulateWeighted(small, self._background, alpha)
+            if self.changed_fraction >= self.min_area:
+                self._last_motion = timestamp
+
+        self._last_update = timestamp
+        active = timestamp - self._last_motion <= self.hold_seconds
+        if active:
+            self.frames_with_motion += 1
+        return active
+
+    @property
+    def last_motion(self) -> float:
+        return self._last_motion
+
+    def stats(self) -> Dict:
+        return {
+            "frames": self.frames,
+            "frames_with_motion": self.frames_with_motion,
+            "changed_fraction": round(self.changed_fraction, 4)
+        }
@@ -0,0 +1,214 @@
+from collections import OrderedDict
+from typing import Optional, Any, Dict, Hashable, Tuple
+import hashlib
+import threading
+import time
+
+try:
+    from app.core.metrics import record_ocr_cache_lookup, set_ocr_cache_size
+except ImportError:  # edge agent: senza prometheus/FastAPI le metriche restano solo in stats()
+    record_ocr_cache_lookup = set_ocr_cache_size = None
+
+_MISSING = object()
+
+
+def perceptual_hash(small) -> int:
+    """
+    Difference hash (dHash) di un'immagine già ridotta a (N+1)xN e normalizzata:
+    N² bit. La quantizzazione rende stabili le zone uniformi (rumore, JPEG)
+    """
+    import numpy as np
+
+    small = small // 16
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def plate_signature(gray, hash_size: int = 16, thumb_size: Tuple[int, int] = (64, 16)) -> Tuple[int, Any]:
+    """
+    Hash percettivo e miniatura normalizzata di un ritaglio targa in scala di
+    grigi. L'hash individua i ritagli simili; la miniatura serve a verificarli,
+    perché caratteri come D e B danno quasi lo stesso hash
+    """
+    # Import locali: la cache dei risultati di /ai/detect non deve caricare OpenCV nell'API
+    import cv2
+    import numpy as np
+
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    small = cv2.normalize(small, None, 0, 255, cv2.NORM_MINMAX)
+    thumb = cv2.resize(gray, thumb_size, interpolation=cv2.INTER_AREA)
+    thumb = cv2.normalize(thumb, None, 0, 255, cv2.NORM_MINMAX).astype(np.int16)
+    return perceptual_hash(small), thumb
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class TTLCache:
+    """
+    Cache LRU thread-safe con scadenza delle voci. Anche i risultati negativi
+    (None) vengono memorizzati: un ritaglio senza testo leggibile non viene
+    riletto finché la voce non scade.
+    """
+
+    def __init__(self, name: str, max_size: int = 1024, ttl_seconds: float = 300):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = _MISSING, record: bool = True) -> Any:
+        """Valore in cache oppure `default` (per distinguere un None memorizzato)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+            if record:
+                self._record(hit=entry is not None)
+            return entry[1] if entry is not None else default
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            if set_ocr_cache_size:
+                set_ocr_cache_size(self.name, len(self._entries))
+
+    def _record(self, hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        if record_ocr_cache_lookup:
+            record_ocr_cache_lookup(self.name, "hit" if hit else "miss")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if set_ocr_cache_size:
+                set_ocr_cache_size(self.name, 0)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions
+        }
+
+
+class OCRCache(TTLCache):
+    """
+    Letture OCR dei ritagli targa già normalizzati, per hash percettivo: un'auto
+    parcheggiata davanti alla telecamera produce ritagli quasi identici che
+    saltano il riconoscimento. Un ritaglio vale come già letto solo se anche la
+    sua miniatura differisce da quella memorizzata al massimo di
+    `max_pixel_diff` livelli di grigio in ogni punto; con `max_distance` > 0 si
+    cercano anche gli hash entro quella distanza di Hamming (solo sui miss).
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 300, max_distance: int = 0,
+                 max_pixel_diff: int = 48, per_key: int = 4):
+        super().__init__("ocr", max_size, ttl_seconds)
+        self.max_distance = max_distance
+        self.max_pixel_diff = max_pixel_diff
+        self.per_key = per_key
+
+    def signature(self, gray) -> Tuple[int, Any]:
+        return plate_signature(gray)
+
+    def _match(self, candidates, thumb) -> Any:
+        for cached_thumb, reading in candidates:
+            if abs(cached_thumb - thumb).max() <= self.max_pixel_diff:
+                return reading
+        return _MISSING
+
+    def lookup(self, signature: Tuple[int, Any]) -> Any:
+        key, thumb = signature
+        candidates = self.get(key, default=(), record=False)
+        value = self._match(candidates, thumb)
+        if value is _MISSING and self.max_distance > 0:
+            value = self._nearest(key, thumb)
+        with self._lock:
+            self._record(hit=value is not _MISSING)
+        return value
+
+    def _nearest(self, key: int, thumb) -> Any:
+        with self._lock:
+            now = time.monotonic()
+            for other, (expires_at, candidates) in reversed(self._entries.items()):
+                if expires_at > now and bin(key ^ other).count("1") <= self.max_distance:
+                    value = self._match(candidates, thumb)
+                    if value is not _MISSING:
+                        self._entries.move_to_end(other)
+                        return value
+        return _MISSING
+
+    def store(self, signature: Tuple[int, Any], reading: Any):
+        key, thumb = signature
+        candidates = [c for c in self.get(key, default=(), record=False)
+                      if abs(c[0] - thumb).max() > self.max_pixel_diff]
+        self.put(key, ([(thumb, reading)] + candidates)[:self.per_key])
+
+
+def is_missing(value: Any) -> bool:
+    return value is _MISSING
+
+
+# Letture OCR del motore targhe del processo. Vive qui e non nel motore: le
+# statistiche si leggono senza importare plate_engine (e quindi OpenCV)
+_ocr_cache: Optional[OCRCache] = None
+
+
+def get_ocr_cache() -> Optional[OCRCache]:
+    """Cache OCR del processo, o None se disabilitata"""
+    global _ocr_cache
+    from app.core.config import settings
+
+    if not settings.OCR_CACHE_ENABLED:
+        return None
+    if _ocr_cache is None:
+        _ocr_cache = OCRCache(
+            max_size=settings.OCR_CACHE_MAX_SIZE,
+            ttl_seconds=settings.OCR_CACHE_TTL_SECONDS,
+            max_distance=settings.OCR_CACHE_MAX_DISTANCE,
+            max_pixel_diff=settings.OCR_CACHE_MAX_PIXEL_DIFF
+        )
+    return _ocr_cache
+
+
+def ocr_cache_stats() -> Optional[Dict]:
+    """Statistiche della cache OCR, o None se il motore targhe non l'ha ancora creata"""
+    return _ocr_cache.stats() if _ocr_cache is not None else None
+
+
+# Risultati di /ai/detect per contenuto dell'immagine caricata (hash SHA-256)
+_detection_cache: Optional[TTLCache] = None
+
+
+def get_detection_cache() -> TTLCache:
+    global _detection_cache
+    if _detection_cache is None:
+        from app.core.config import settings
+
+        _detection_cache = TTLCache(
+            "image",
+            max_size=settings.DETECTION_CACHE_MAX_SIZE,
+            ttl_seconds=settings.DETECTION_CACHE_TTL_SECONDS
+        )
+    return _detection_cache
@@ -0,0 +1,359 @@
+from collections import OrderedDict
+from datetime import datetime, date, time, timedelta
+from typing import Optional, List, Dict, Set
+import asyncio
+import logging
+import threading
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session, joinedload
+from app.core.config import settings
+from app.core.database import SessionLocal, Vehicle, Appointment, PlateCacheInvalidation
+from app.core.metrics import record_plate_cache_lookup, record_plate_cache_eviction, set_plate_cache_size
+
+logger = logging.getLogger(__name__)
+
+
+def _vehicle_info(vehicle: Vehicle) -> Dict:
+    return {
+        "id": vehicle.id,
+        "brand": vehicle.brand,
+        "model": vehicle.model,
+        "year": vehicle.year,
+        "color": vehicle.color,
+        "fuel_type": vehicle.fuel_type
+    }
+
+
+def _customer_info(vehicle: Vehicle) -> Optional[Dict]:
+    customer = vehicle.customer
+    if not customer:
+        return None
+    return {
+        "id": customer.id,
+        "full_name": customer.full_name,
+        "email": customer.email,
+        "phone": customer.phone
+    }
+
+
+def _appointment_info(appointment: Appointment) -> Dict:
+    status = appointment.status
+    return {
+        "id": appointment.id,
+        "appointment_date": appointment.appointment_date.isoformat(),
+        "status": status.value if hasattr(status, "value") else status,
+        "service": {
+            "id": appointment.service.id,
+            "name": appointment.service.name
+        } if appointment.service else None
+    }
+
+
+def _day_bounds(day: date):
+    start = datetime.combine(day, time.min)
+    return start, start + timedelta(days=1)
+
+
+class PlateCache:
+    """
+    Cache read-through targa -> veicolo, proprietario e appuntamenti del giorno.
+
+    Le voci sono snapshot in forma di dizionario (nessun oggetto ORM), quindi
+    possono essere condivise tra sessioni e thread. Le targhe sconosciute vengono
+    memorizzate come voci negative con un TTL più breve.
+
+    Ogni processo (worker API, worker di visione, anche su altri nodi) ha la
+    propria copia: con `shared` le invalidazioni vengono anche registrate in
+    plate_cache_invalidations e ogni processo applica quelle degli altri con
+    sync(), chiamato periodicamente da run_invalidation_sync.
+    """
+
+    # Righe rilette a ogni sync oltre l'ultima vista: gli id di transazioni
+    # concorrenti possono diventare visibili fuori ordine
+    SYNC_OVERLAP = 100
+    # Righe conservate nella tabella delle invalidazioni
+    SYNC_RETAIN = 10000
+
+    def __init__(self, max_size: int = 5000, ttl_seconds: int = 900, negative_ttl_seconds: int = 60,
+                 shared: bool = False):
+        self.max_size = max_size
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.negative_ttl = timedelta(seconds=negative_ttl_seconds)
+        self.shared = shared
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._plates_by_vehicle: Dict[int, str] = {}
+        self._plates_by_customer: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+        self._synced_id: Optional[int] = None
+        self._applied: Set[int] = set()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(license_plate: str) -> str:
+        return license_plate.strip().upper()
+
+    def get(self, db: Session, license_plate: str) -> Dict:
+        """
+        Restituisce la voce della targa, caricandola dal database se assente,
+        scaduta o costruita per un giorno diverso da oggi
+        """
+        plate = self.normalize(license_plate)
+        today = date.today()
+        now = datetime.now()
+
+        with self._lock:
+            entry = self._entries.get(plate)
+            if entry and entry["day"] == today and entry["expires_at"] > now:
+                self._entries.move_to_end(plate)
+                self.hits += 1
+                record_plate_cache_lookup("hit" if entry["vehicle"] else "negative_hit")
+                return entry
+            self.misses += 1
+
+        record_plate_cache_lookup("miss")
+        entry = self._load(db, plate, today)
+        with self._lock:
+            self._store(plate, entry)
+        return entry
+
+    def _load(self, db: Session, plate: str, day: date) -> Dict:
+        vehicle = db.query(Vehicle)\
+            .options(joinedload(Vehicle.customer))\
+            .filter(Vehicle.license_plate == plate)\
+            .first()
+
+        if not vehicle:
+            return self._build_entry(plate, None, [], day)
+
+        start, end = _day_bounds(day)
+        appointments = db.query(Appointment)\
+            .options(joinedload(Appointment.service))\
+            .filter(
+                Appointment.vehicle_id == vehicle.id,
+                Appointment.appointment_date >= start,
+                Appointment.appointment_date < end
+            )\
+            .order_by(Appointment.appointment_date)\
+            .all()
+
+        return self._build_entry(plate, vehicle, appointments, day)
+
+    def _build_entry(self, plate: str, vehicle: Optional[Vehicle], appointments: List[Appointment], day: date) -> Dict:
+        ttl = self.ttl if vehicle else self.negative_ttl
+        return {
+            "license_plate": plate,
+            "vehicle": _vehicle_info(vehicle) if vehicle else None,
+            "customer": _customer_info(vehicle) if vehicle else None,
+            "appointments": [_appointment_info(apt) for apt in appointments],
+            "day": day,
+            "expires_at": datetime.now() + ttl
+        }
+
+    def _store(self, plate: str, entry: Dict):
+        # Chiamato con il lock acquisito
+        self._drop(plate)
+        self._entries[plate] = entry
+
+        if entry["vehicle"]:
+            self._plates_by_vehicle[entry["vehicle"]["id"]] = plate
+        if entry["customer"]:
+            self._plates_by_customer.setdefault(entry["customer"]["id"], set()).add(plate)
+
+        while len(self._entries) > self.max_size:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            record_plate_cache_eviction()
+
+        set_plate_cache_size(len(self._entries))
+
+    def _drop(self, plate: str):
+        # Chiamato con il lock acquisito
+        entry = self._entries.pop(plate, None)
+        if not entry:
+            return
+        if entry["vehicle"] and self._plates_by_vehicle.get(entry["vehicle"]["id"]) == plate:
+            del self._plates_by_vehicle[entry["vehicle"]["id"]]
+        if entry["customer"]:
+            plates = self._plates_by_customer.get(entry["customer"]["id"])
+            if plates:
+                plates.discard(plate)
+                if not plates:
+                    del self._plates_by_customer[entry["customer"]["id"]]
+
+    def warm(self, db: Session, day: date = None) -> int:
+        """Precarica le voci per tutti i veicoli con appuntamenti nel giorno indicato"""
+        day = day or date.today()
+        start, end = _day_bounds(day)
+
+        appointments = db.query(Appointment)\
+            .options(
+                joinedload(Appointment.vehicle).joinedload(Vehicle.customer),
+                joinedload(Appointment.service)
+            )\
+            .filter(
+                Appointment.appointment_date >= start,
+                Appointment.appointment_date < end
+            )\
+            .order_by(Appointment.appointment_date)\
+            .all()
+
+        by_vehicle: Dict[int, List[Appointment]] = {}
+        vehicles: Dict[int, Vehicle] = {}
+        for appointment in appointments:
+            if appointment.vehicle is None:
+                continue
+            vehicles[appointment.vehicle_id] = appointment.vehicle
+            by_vehicle.setdefault(appointment.vehicle_id, []).append(appointment)
+
+        with self._lock:
+            for vehicle_id, vehicle in vehicles.items():
+                plate = self.normalize(vehicle.license_plate)
+                self._store(plate, self._build_entry(plate, vehicle, by_vehicle[vehicle_id], day))
+
+        logger.info(f"Cache targhe precaricata: {len(vehicles)} veicoli per il {day.isoformat()}")
+        return len(vehicles)
+
+    def invalidate_plate(self, license_plate: str):
+        self._invalidate("plate", self.normalize(license_plate))
+        self._publish("plate", self.normalize(license_plate))
+
+    def invalidate_vehicle(self, vehicle_id: int):
+        self._invalidate("vehicle", vehicle_id)
+        self._publish("vehicle", vehicle_id)
+
+    def invalidate_customer(self, customer_id: int):
+        self._invalidate("customer", customer_id)
+        self._publish("customer", customer_id)
+
+    def _invalidate(self, kind: str, key):
+        with self._lock:
+            if kind == "plate":
+                self._drop(key)
+            elif kind == "vehicle":
+                plate = self._plates_by_vehicle.get(int(key))
+                if plate:
+                    self._drop(plate)
+            elif kind == "customer":
+                for plate in list(self._plates_by_customer.get(int(key), ())):
+                    self._drop(plate)
+            set_plate_cache_size(len(self._entries))
+
+    def _publish(self, kind: str, key):
+        """Registra l'invalidazione per gli altri processi"""
+        if not self.shared:
+            return
+        db = SessionLocal()
+        try:
+            db.execute(insert(PlateCacheInvalidation).values(kind=kind, key=str(key)))
+            db.commit()
+        except Exception as e:
+            # Gli altri processi vedranno la modifica alla scadenza della voce
+            db.rollback()
+            logger.error(f"Errore nella registrazione dell'invalidazione cache targhe ({kind} {key}): {e}")
+        finally:
+            db.close()
+
+    def sync(self, db: Session) -> int:
+        """Applica le invalidazioni registrate dagli altri processi; restituisce quante"""
+        if self._synced_id is None:
+            # All'avvio la cache è vuota: si parte dall'ultima invalidazione registrata
+            self._synced_id = db.execute(select(func.max(PlateCacheInvalidation.id))).scalar() or 0
+            return 0
+
+        rows = db.execute(
+            select(PlateCacheInvalidation.id, PlateCacheInvalidation.kind, PlateCacheInvalidation.key)
+            .where(PlateCacheInvalidation.id > self._synced_id - self.SYNC_OVERLAP)
+            .order_by(PlateCacheInvalidation.id)
+        ).all()
+        applied = 0
+        for row_id, kind, key in rows:
+            if row_id in self._applied:
+                continue
+            self._invalidate(kind, key)
+            self._applied.add(row_id)
+            applied += 1
+
+        if rows:
+            previous = self._synced_id
+            self._synced_id = max(self._synced_id, rows[-1][0])
+            self._applied = {row_id for row_id in self._applied if row_id > self._synced_id - self.SYNC_OVERLAP}
+            if self._synced_id // self.SYNC_RETAIN != previous // self.SYNC_RETAIN:
+                db.execute(delete(PlateCacheInvalidation).where(
+                    PlateCacheInvalidation.id <= self._synced_id - self.SYNC_RETAIN
+                ))
+                db.commit()
+        return applied
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._plates_by_vehicle.clear()
+            self._plates_by_customer.clear()
+            set_plate_cache_size(0)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups * 100, 2) if lookups > 0 else 0
+            }
+
+
+plate_cache = PlateCache(
+    max_size=settings.PLATE_CACHE_MAX_SIZE,
+    ttl_seconds=settings.PLATE_CACHE_TTL_SECONDS,
+    negative_ttl_seconds=settings.PLATE_CACHE_NEGATIVE_TTL_SECONDS,
+    shared=settings.PLATE_CACHE_SYNC_SECONDS > 0
+)
+
+
+def _warm_with_new_session(day: date = None) -> int:
+    db = SessionLocal()
+    try:
+        return plate_cache.warm(db, day)
+    finally:
+        db.close()
+
+
+async def run_daily_warmup(hour: int = None):
+    """Precarica la cache all'avvio e poi ogni mattina all'ora configurata"""
+    hour = settings.PLATE_CACHE_WARMUP_HOUR if hour is None else hour
+
+    while True:
+        try:
+            await asyncio.to_thread(_warm_with_new_session)
+        except Exception as e:
+            logger.error(f"Errore nel precaricamento cache targhe: {e}")
+
+        now = datetime.now()
+        next_run = datetime.combine(now.date(), time(hour=hour))
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        await asyncio.sleep((next_run - now).total_seconds())
+
+
+def _sync_with_new_session() -> int:
+    db = SessionLocal()
+    try:
+        return plate_cache.sync(db)
+    finally:
+        db.close()
+
+
+async def run_invalidation_sync(interval: float = None):
+    """Applica periodicamente le invalidazioni della cache targhe fatte dagli altri processi"""
+    interval = settings.PLATE_CACHE_SYNC_SECONDS if interval is None else interval
+    if interval <= 0:
+        return
+
+    while True:
+        try:
+            await asyncio.to_thread(_sync_with_new_session)
+        except Exception as e:
+            logger.error(f"Errore nella sincronizzazione cache targhe: {e}")
+        await asyncio.sleep(interval)
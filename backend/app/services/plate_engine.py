@@ -0,0 +1,372 @@
+from abc import ABC, abstractmethod
+import cv2
+import numpy as np
+from typing import Optional, List, Dict, Tuple, Callable
+import logging
+import os
+import threading
+from app.core.config import settings
+from app.services.ocr_cache import OCRCache, get_ocr_cache, is_missing
+from app.services.plate_text import PLATE_ALPHABET, normalize_plate
+
+logger = logging.getLogger(__name__)
+
+
+def decode_image(data: bytes) -> np.ndarray:
+    """Decodifica un'immagine codificata (JPEG, PNG...) in un array BGR"""
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Immagine non decodificabile")
+    return image
+
+
+def to_gray(image: np.ndarray) -> np.ndarray:
+    """Scala di grigi senza copia se l'immagine è già a un canale"""
+    if image.ndim == 2:
+        return image
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def prepare_plate_crop(crop: np.ndarray, min_height: int = 48) -> np.ndarray:
+    """Pre-elaborazione comune del ritaglio targa prima dell'OCR"""
+    gray = to_gray(crop)
+    height = gray.shape[0]
+    if 0 < height < min_height:
+        scale = min_height / float(height)
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+    return gray
+
+
+def filter_candidates(
+    boxes: np.ndarray,
+    scores: np.ndarray,
+    image_shape: Tuple[int, ...],
+    min_area: float = 600,
+    min_aspect: float = 1.5,
+    max_aspect: float = 6.5,
+    max_candidates: int = 5,
+    nms_threshold: float = 0.4
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Filtra i box candidati (N x 4, x1 y1 x2 y2) in modo vettoriale: ritaglio ai
+    bordi, area e rapporto d'aspetto minimi, non-maximum suppression e limite
+    ai `max_candidates` più probabili.
+    """
+    if len(boxes) == 0:
+        return np.empty((0, 4), dtype=np.int32), np.empty((0,), dtype=np.float32)
+
+    height, width = image_shape[:2]
+    boxes = np.asarray(boxes, dtype=np.float32).copy()
+    scores = np.asarray(scores, dtype=np.float32)
+    boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, width)
+    boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, height)
+
+    widths = boxes[:, 2] - boxes[:, 0]
+    heights = boxes[:, 3] - boxes[:, 1]
+    aspect = np.divide(widths, heights, out=np.zeros_like(widths), where=heights > 0)
+    keep = (widths * heights >= min_area) & (aspect >= min_aspect) & (aspect <= max_aspect)
+
+    boxes, scores = boxes[keep], scores[keep]
+    if len(boxes) == 0:
+        return boxes.astype(np.int32), scores
+
+    xywh = np.column_stack([boxes[:, 0], boxes[:, 1], boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]])
+    indices = cv2.dnn.NMSBoxes(xywh.tolist(), scores.tolist(), 0.0, nms_threshold)
+    indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+
+    # NMSBoxes restituisce gli indici ordinati per punteggio decrescente
+    indices = indices[:max_candidates]
+    return boxes[indices].astype(np.int32), scores[indices]
+
+
+class PlateDetector(ABC):
+    """Backend di rilevamento: restituisce box (N x 4, x1 y1 x2 y2) e punteggi"""
+
+    name = "base"
+
+    @abstractmethod
+    def detect(self, image: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        ...
+
+
+class YoloPlateDetector(PlateDetector):
+    """Rilevamento targhe con un modello YOLO addestrato sulle targhe"""
+
+    name = "yolo"
+
+    def __init__(self, model_path: str, confidence: float = 0.5):
+        from ultralytics import YOLO
+
+        self.model = YOLO(model_path)
+        self.confidence = confidence
+        logger.info(f"Modello YOLO caricato per il rilevamento targhe: {model_path}")
+
+    def detect(self, image: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        results = self.model(image, conf=self.confidence, verbose=False)
+        all_boxes, all_scores = [], []
+        for result in results:
+            if result.boxes is not None and len(result.boxes) > 0:
+                all_boxes.append(result.boxes.xyxy.cpu().numpy())
+                all_scores.append(result.boxes.conf.cpu().numpy())
+        if not all_boxes:
+            return np.empty((0, 4), dtype=np.float32), np.empty((0,), dtype=np.float32)
+        return np.concatenate(all_boxes), np.concatenate(all_scores)
+
+
+class ContourPlateDetector(PlateDetector):
+    """Rilevamento targhe classico: Canny + contorni rettangolari"""
+
+    name = "contour"
+
+    def __init__(self, min_contour_area: float = 1000, min_aspect: float = 2.0, max_aspect: float = 5.0):
+        self.min_contour_area = min_contour_area
+        self.min_aspect = min_aspect
+        self.max_aspect = max_aspect
+
+    def detect(self, image: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        gray = to_gray(image)
+        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+        edges = cv2.Canny(blurred, 50, 150)
+        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours:
+            return np.empty((0, 4), dtype=np.float32), np.empty((0,), dtype=np.float32)
+
+        rects = np.array([cv2.boundingRect(contour) for contour in contours], dtype=np.float32)
+        areas = np.array([cv2.contourArea(contour) for contour in contours], dtype=np.float32)
+        aspect = rects[:, 2] / np.maximum(rects[:, 3], 1)
+        keep = (areas > self.min_contour_area) & (aspect >= self.min_aspect) & (aspect <= self.max_aspect)
+        rects, areas = rects[keep], areas[keep]
+
+        boxes = np.column_stack([rects[:, 0], rects[:, 1], rects[:, 0] + rects[:, 2], rects[:, 1] + rects[:, 3]])
+        # Punteggio: quanto il contorno riempie il proprio rettangolo
+        scores = areas / np.maximum(rects[:, 2] * rects[:, 3], 1)
+        return boxes, scores
+
+
+class PlateRecognizer(ABC):
+    """Backend di riconoscimento: restituisce (testo, confidenza) o None"""
+
+    name = "base"
+
+    @abstractmethod
+    def recognize(self, crop: np.ndarray) -> Optional[Tuple[str, float]]:
+        ...
+
+
+class EasyOCRRecognizer(PlateRecognizer):
+    """Riconoscimento testo targa con EasyOCR limitato all'alfabeto delle targhe"""
+
+    name = "easyocr"
+
+    def __init__(self, languages: List[str] = None, min_confidence: float = 0.3):
+        import easyocr
+
+        self.reader = easyocr.Reader(languages or ['it', 'en'], gpu=False)
+        self.min_confidence = min_confidence
+        logger.info("EasyOCR caricato per il riconoscimento testo")
+
+    def recognize(self, crop: np.ndarray) -> Optional[Tuple[str, float]]:
+        results = self.reader.readtext(crop, allowlist=PLATE_ALPHABET)
+        if not results:
+            return None
+
+        # Le targhe vengono spesso lette in più frammenti: si uniscono da sinistra a destra
+        results.sort(key=lambda r: min(point[0] for point in r[0]))
+        text = "".join(r[1] for r in results)
+        confidence = float(sum(r[2] for r in results) / len(results))
+
+        if confidence < self.min_confidence:
+            return None
+        return text, confidence
+
+
+class PlateEngine:
+    """
+    Motore unico di riconoscimento targhe: rilevatore e riconoscitore
+    intercambiabili, pre-elaborazione e filtro dei candidati condivisi.
+    Usato da /ai/detect, /ai/stream e dal monitoraggio livestream.
+    """
+
+    def __init__(
+        self,
+        detector: PlateDetector,
+        recognizer: PlateRecognizer,
+        max_candidates: int = 5,
+        min_area: float = 600,
+        min_aspect: float = 1.5,
+        max_aspect: float = 6.5,
+        ocr_cache: Optional[OCRCache] = None
+    ):
+        self.detector = detector
+        self.recognizer = recognizer
+        self.ocr_cache = ocr_cache
+        self.max_candidates = max_candidates
+        self.min_area = min_area
+        self.min_aspect = min_aspect
+        self.max_aspect = max_aspect
+
+    def locate(self, image: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Rilevamento e filtro dei candidati, senza OCR"""
+        boxes, scores = self.detector.detect(image)
+        return filter_candidates(
+            boxes, scores, image.shape,
+            min_area=self.min_area,
+            min_aspect=self.min_aspect,
+            max_aspect=self.max_aspect,
+            max_candidates=self.max_candidates
+        )
+
+    def read(self, crop: np.ndarray, strict: bool = True) -> Optional[Tuple[str, float]]:
+        """
+        OCR di un ritaglio targa; restituisce (targa normalizzata, confidenza OCR).
+        Con strict=False accetta anche targhe estere o di formato precedente
+        """
+        if crop.size == 0:
+            return None
+        gray = prepare_plate_crop(crop)
+        if self.ocr_cache is None:
+            reading = self.recognizer.recognize(gray)
+        else:
+            # Ritagli quasi identici (auto ferma, stesso caricamento) saltano l'OCR.
+            # La cache tiene il testo letto: la normalizzazione dipende da `strict`
+            signature = self.ocr_cache.signature(gray)
+            reading = self.ocr_cache.lookup(signature)
+            if is_missing(reading):
+                reading = self.recognizer.recognize(gray)
+                self.ocr_cache.store(signature, reading)
+        if not reading:
+            return None
+        plate = normalize_plate(reading[0], strict)
+        if not plate:
+            return None
+        return plate, reading[1]
+
+    def detect(self, image, strict: bool = True) -> List[Dict]:
+        """
+        Rileva e legge le targhe nell'immagine (array BGR o bytes codificati),
+        ordinate per confidenza
+        """
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            image = decode_image(image)
+        boxes, scores = self.locate(image)
+
+        plates: Dict[str, Dict] = {}
+        for (x1, y1, x2, y2), score in zip(boxes.tolist(), scores.tolist()):
+            self._add_reading(plates, self.read(image[y1:y2, x1:x2], strict), (x1, y1, x2, y2), score)
+
+        return sorted(plates.values(), key=lambda p: p['confidence'], reverse=True)
+
+    def detect_dual(self, image: np.ndarray, fetch_high_res: Callable[[], Optional[np.ndarray]],
+                    padding: float = 0.15) -> List[Dict]:
+        """
+        Rilevamento sul frame a bassa risoluzione (substream) e OCR sui ritagli
+        del frame ad alta risoluzione, chiesto a `fetch_high_res` solo se ci
+        sono candidati. I bbox restano nelle coordinate del substream; il
+        ritaglio letto è in 'crop'. Senza frame ad alta risoluzione, o se il suo
+        ritaglio non dà una lettura (targa uscita dal margine), si legge il
+        ritaglio del substream.
+        """
+        boxes, scores = self.locate(image)
+        if len(boxes) == 0:
+            return []
+
+        high_res = fetch_high_res()
+
+        plates: Dict[str, Dict] = {}
+        for box, score in zip(boxes.tolist(), scores.tolist()):
+            crop, reading, used_high_res = None, None, False
+            if high_res is not None:
+                crop = self._padded_crop(high_res, image.shape, box, padding)
+                reading = self.read(crop)
+                used_high_res = bool(reading)
+            if not reading:
+                crop = self._padded_crop(image, image.shape, box, padding)
+                reading = self.read(crop)
+            plate = self._add_reading(plates, reading, tuple(box), score)
+            if plate:
+                plate['crop'] = crop
+                plate['high_res'] = used_high_res
+
+        return sorted(plates.values(), key=lambda p: p['confidence'], reverse=True)
+
+    @staticmethod
+    def _padded_crop(source: np.ndarray, detect_shape, box, padding: float) -> np.ndarray:
+        """Ritaglio del riquadro (coordinate del frame di rilevamento) con margine, scalato su `source`"""
+        # Margine attorno al riquadro: i due stream non sono allineati al frame
+        x1, y1, x2, y2 = box
+        scale_x = source.shape[1] / detect_shape[1]
+        scale_y = source.shape[0] / detect_shape[0]
+        height, width = source.shape[:2]
+        pad_x, pad_y = (x2 - x1) * padding, (y2 - y1) * padding
+        return source[
+            max(0, int((y1 - pad_y) * scale_y)):min(height, int((y2 + pad_y) * scale_y)),
+            max(0, int((x1 - pad_x) * scale_x)):min(width, int((x2 + pad_x) * scale_x))
+        ]
+
+    @staticmethod
+    def _add_reading(plates: Dict[str, Dict], reading, box, score) -> Optional[Dict]:
+        """Aggiunge la lettura se nuova o più sicura di quella della stessa targa"""
+        if not reading:
+            return None
+        plate, ocr_confidence = reading
+        confidence = float(score) * ocr_confidence
+        if plate in plates and plates[plate]['confidence'] >= confidence:
+            return None
+        x1, y1, x2, y2 = box
+        plates[plate] = {
+            'license_plate': plate,
+            'bbox': (x1, y1, x2 - x1, y2 - y1),
+            'confidence': confidence,
+            'detection_confidence': float(score),
+            'ocr_confidence': ocr_confidence
+        }
+        return plates[plate]
+
+    def detect_best(self, image, strict: bool = True) -> Optional[Dict]:
+        """La targa più probabile nell'immagine, o None"""
+        plates = self.detect(image, strict)
+        return plates[0] if plates else None
+
+
+def create_detector(backend: str = None, model_path: str = None) -> PlateDetector:
+    """Crea il rilevatore configurato; senza modello YOLO si usa il rilevatore a contorni"""
+    backend = backend or settings.PLATE_DETECTOR_BACKEND
+    model_path = model_path or settings.PLATE_DETECTOR_MODEL_PATH
+    if backend not in ("yolo", "contour"):
+        raise ValueError(f"Backend di rilevamento non supportato: {backend}")
+    if backend == "yolo":
+        if os.path.exists(model_path):
+            try:
+                return YoloPlateDetector(model_path, settings.PLATE_DETECTOR_CONFIDENCE)
+            except Exception as e:
+                logger.error(f"Errore nel caricamento modello YOLO: {e}")
+        else:
+            logger.warning(f"Modello targhe non trovato: {model_path}")
+        logger.info("Uso del rilevatore targhe a contorni")
+    return ContourPlateDetector()
+
+
+def create_recognizer(backend: str = None) -> PlateRecognizer:
+    backend = backend or settings.PLATE_RECOGNIZER_BACKEND
+    if backend != "easyocr":
+        raise ValueError(f"Backend OCR non supportato: {backend}")
+    return EasyOCRRecognizer(settings.PLATE_OCR_LANGUAGES)
+
+
+_engine: Optional[PlateEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_plate_engine() -> PlateEngine:
+    """Motore condiviso dal processo: i modelli vengono caricati una sola volta"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = PlateEngine(
+                    create_detector(),
+                    create_recognizer(),
+                    max_candidates=settings.PLATE_MAX_CANDIDATES,
+                    ocr_cache=get_ocr_cache()
+                )
+    return _engine
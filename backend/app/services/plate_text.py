@@ -0,0 +1,47 @@
+import re
+from typing import Optional
+
+PLATE_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+
+# Formato italiano attuale: AA123AA
+ITALIAN_PLATE_PATTERN = re.compile(r'^[A-Z]{2}\d{3}[A-Z]{2}$')
+
+# Correzioni OCR per posizione: lettere attese in 0,1,5,6 e cifre in 2,3,4
+_DIGIT_TO_LETTER = str.maketrans({"0": "O", "1": "I", "2": "Z", "5": "S", "8": "B", "6": "G"})
+_LETTER_TO_DIGIT = str.maketrans({"O": "0", "Q": "0", "D": "0", "I": "1", "L": "1", "Z": "2", "S": "5", "B": "8", "G": "6"})
+
+
+def clean_plate_text(text: str) -> str:
+    """Porta il testo in maiuscolo e tiene solo i caratteri alfanumerici"""
+    return re.sub(r'[^A-Z0-9]', '', text.upper())
+
+
+def is_valid_plate(plate: str) -> bool:
+    """Verifica se la targa segue il formato italiano"""
+    return bool(ITALIAN_PLATE_PATTERN.match(plate))
+
+
+def is_plausible_plate(plate: str) -> bool:
+    """Targa generica (estera o di formato precedente): 5-10 caratteri con lettere e cifre"""
+    return 5 <= len(plate) <= 10 and any(c.isalpha() for c in plate) and any(c.isdigit() for c in plate)
+
+
+def normalize_plate(text: str, strict: bool = True) -> Optional[str]:
+    """
+    Pulisce il testo OCR e lo riporta al formato targa, correggendo le confusioni
+    tipiche (0/O, 1/I, 5/S, 8/B...) in base alla posizione. None se non è una targa.
+    Con strict=False accetta anche le targhe non nel formato italiano attuale
+    (is_plausible_plate), senza correzioni.
+    """
+    plate = clean_plate_text(text)
+    if is_valid_plate(plate):
+        return plate
+    if len(plate) == 7:
+        corrected = (
+            plate[:2].translate(_DIGIT_TO_LETTER)
+            + plate[2:5].translate(_LETTER_TO_DIGIT)
+            + plate[5:].translate(_DIGIT_TO_LETTER)
+        )
+        if is_valid_plate(corrected):
+            return corrected
+    return plate if not strict and is_plausible_plate(plate) else None
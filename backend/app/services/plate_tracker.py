@@ -0,0 +1,143 @@
+from datetime import datetime, timezone
+from typing import Optional, List, Dict
+import itertools
+import uuid
+import numpy as np
+
+
+def iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """IoU tra ogni coppia di box (x1, y1, x2, y2)"""
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)), dtype=np.float32)
+
+    a = boxes_a.astype(np.float32)[:, None, :]
+    b = boxes_b.astype(np.float32)[None, :, :]
+    inter_w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = inter_w * inter_h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-6)
+
+
+class PlateTrack:
+    """Una targa seguita tra frame consecutivi, con le letture OCR accumulate"""
+
+    def __init__(self, track_id: int, bbox, score: float, timestamp: float):
+        self.track_id = track_id
+        self.bbox = tuple(int(v) for v in bbox)
+        self.detection_confidence = float(score)
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.hits = 1
+        self.reads = 0
+        self.votes: Dict[str, float] = {}
+        self.best_confidence: Dict[str, float] = {}
+        self.best_crop: Optional[np.ndarray] = None
+        self.best_crop_confidence = 0.0
+
+    def update(self, bbox, score: float, timestamp: float):
+        self.bbox = tuple(int(v) for v in bbox)
+        self.detection_confidence = float(score)
+        self.last_seen = timestamp
+        self.hits += 1
+
+    def add_reading(self, plate: str, confidence: float, crop: np.ndarray = None):
+        self.reads += 1
+        self.votes[plate] = self.votes.get(plate, 0.0) + confidence
+        self.best_confidence[plate] = max(self.best_confidence.get(plate, 0.0), confidence)
+        if crop is not None and confidence > self.best_crop_confidence:
+            self.best_crop = crop.copy()
+            self.best_crop_confidence = confidence
+
+    @property
+    def license_plate(self) -> Optional[str]:
+        """Lettura con il punteggio cumulato più alto"""
+        if not self.votes:
+            return None
+        return max(self.votes.items(), key=lambda item: item[1])[0]
+
+
+class PlateTracker:
+    """
+    Tracking IoU delle targhe rilevate: ogni veicolo che passa davanti alla
+    telecamera diventa una traccia, letta con l'OCR solo per i primi `max_reads`
+    frame e poi solo seguita. Quando la traccia non viene più vista per
+    `max_age` secondi produce un unico evento di passaggio con la lettura
+    più votata.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_age: float = 2.0, min_hits: int = 3, max_reads: int = 5):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.max_reads = max_reads
+        self.tracks: List[PlateTrack] = []
+        self._ids = itertools.count(1)
+
+    def update(self, boxes: np.ndarray, scores: np.ndarray, timestamp: float) -> List[PlateTrack]:
+        """Associa i box (x1, y1, x2, y2) del frame alle tracce; restituisce le tracce viste nel frame"""
+        boxes = np.asarray(boxes).reshape(-1, 4)
+        scores = np.asarray(scores).reshape(-1)
+        current = np.array([track.bbox for track in self.tracks], dtype=np.int32).reshape(-1, 4)
+        overlaps = iou_matrix(current, boxes)
+
+        seen: List[PlateTrack] = []
+        matched_tracks = set()
+        matched_boxes = set()
+        # Associazione greedy per IoU decrescente
+        for flat in np.argsort(overlaps, axis=None)[::-1]:
+            track_index, box_index = np.unravel_index(flat, overlaps.shape)
+            if overlaps[track_index, box_index] < self.iou_threshold:
+                break
+            if track_index in matched_tracks or box_index in matched_boxes:
+                continue
+            matched_tracks.add(track_index)
+            matched_boxes.add(box_index)
+            track = self.tracks[track_index]
+            track.update(boxes[box_index], scores[box_index], timestamp)
+            seen.append(track)
+
+        for box_index in range(len(boxes)):
+            if box_index not in matched_boxes:
+                track = PlateTrack(next(self._ids), boxes[box_index], scores[box_index], timestamp)
+                self.tracks.append(track)
+                seen.append(track)
+
+        return seen
+
+    def needs_read(self, track: PlateTrack) -> bool:
+        return track.reads < self.max_reads
+
+    def expire(self, timestamp: float) -> List[PlateTrack]:
+        """Chiude le tracce non più viste; restituisce quelle valide (abbastanza frame e una lettura)"""
+        finished = [track for track in self.tracks if timestamp - track.last_seen > self.max_age]
+        return self._close(finished)
+
+    def flush(self) -> List[PlateTrack]:
+        """Chiude tutte le tracce aperte (es. alla chiusura dello stream)"""
+        return self._close(list(self.tracks))
+
+    def _close(self, finished: List[PlateTrack]) -> List[PlateTrack]:
+        if not finished:
+            return []
+        closed = {id(track) for track in finished}
+        self.tracks = [track for track in self.tracks if id(track) not in closed]
+        return [track for track in finished if track.hits >= self.min_hits and track.license_plate]
+
+
+def plate_pass_event(track: PlateTrack, camera_id: str) -> Dict:
+    """Evento compatto di passaggio targa, con chiave di idempotenza"""
+    plate = track.license_plate
+    x1, y1, x2, y2 = track.bbox
+    return {
+        "event_id": uuid.uuid4().hex,
+        "camera_id": camera_id,
+        "license_plate": plate,
+        "confidence": round(track.best_confidence[plate], 4),
+        "first_seen": datetime.fromtimestamp(track.first_seen, timezone.utc).isoformat(),
+        "last_seen": datetime.fromtimestamp(track.last_seen, timezone.utc).isoformat(),
+        "frames": track.hits,
+        "reads": track.reads,
+        "bbox": [x1, y1, x2 - x1, y2 - y1]
+    }
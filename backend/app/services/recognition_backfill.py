@@ -0,0 +1,211 @@
+"""
+Rielaborazione dell'archivio dei ritagli targa con il motore attuale.
+
+Dopo un aggiornamento del rilevatore o dell'OCR le rilevazioni già salvate
+restano con la lettura del vecchio motore. Il backfill scorre ai_detections
+a lotti per id (mai tutta la tabella in memoria), rilegge i ritagli in
+uploads/plates in un pool di processi, aggiorna in blocco le rilevazioni la
+cui lettura è cambiata insieme al veicolo associato, e salva un checkpoint
+nella stessa transazione di ogni lotto: un job interrotto riparte dall'ultimo
+lotto completato senza riapplicarlo né contarlo due volte.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple, Callable
+import logging
+from sqlalchemy import select, update, func
+from sqlalchemy.orm import Session
+from app.core.database import AIDetection, Vehicle
+from app.services.detection_rollups import mark_hours_dirty
+
+logger = logging.getLogger(__name__)
+
+MISSING = "missing"
+UNREADABLE = "unreadable"
+READ = "read"
+
+_COUNTERS = ("scanned", "changed", "unchanged", "unreadable", "missing_files", "vehicle_matches_changed")
+
+# Motore del processo del pool, caricato una volta da _init_worker
+_worker_engine = None
+
+
+def _init_worker():
+    global _worker_engine
+    from app.services.plate_engine import get_plate_engine
+
+    _worker_engine = get_plate_engine()
+
+
+def recognize_archived(image_path: str) -> Tuple[str, Optional[str], Optional[float]]:
+    """
+    Rilegge un'immagine dell'archivio: (esito, targa, confidenza). I ritagli
+    vanno direttamente all'OCR; se non danno una lettura valida (ritaglio
+    troppo stretto, immagine intera) si ripete con rilevamento e OCR.
+    """
+    import cv2
+
+    if _worker_engine is None:
+        _init_worker()
+    image = cv2.imread(image_path) if Path(image_path).is_file() else None
+    if image is None:
+        return MISSING, None, None
+    reading = _worker_engine.read(image)
+    if reading:
+        return READ, reading[0], round(float(reading[1]), 4)
+    best = _worker_engine.detect_best(image)
+    if best:
+        return READ, best["license_plate"], best["confidence"]
+    return UNREADABLE, None, None
+
+
+class RecognitionBackfill:
+    """
+    Un passaggio di backfill su [start_id, end_id]. Con `dry_run` le letture
+    cambiate vengono solo contate; `checkpoint` è lo stato salvato da un
+    tentativo precedente ({"last_id": ..., "counters": {...}}) e
+    `save_checkpoint(db, state)` lo scrive senza commit, nella transazione del lotto.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        workers: int = 2,
+        batch_size: int = 200,
+        start_id: int = 0,
+        end_id: Optional[int] = None,
+        dry_run: bool = False,
+        job_id: Optional[int] = None,
+        checkpoint: Optional[Dict[str, Any]] = None,
+        save_checkpoint: Optional[Callable[[Session, Dict[str, Any]], None]] = None
+    ):
+        self.db = db
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.end_id = end_id
+        self.dry_run = dry_run
+        self.job_id = job_id
+        self.save_checkpoint = save_checkpoint
+        checkpoint = checkpoint or {}
+        self.start_id = start_id
+        self.last_id = max(start_id, checkpoint.get("last_id", 0))
+        self.counters = {name: checkpoint.get("counters", {}).get(name, 0) for name in _COUNTERS}
+        self.samples: List[Dict] = checkpoint.get("samples", [])
+
+    def _query(self, after_id: int):
+        query = select(
+            AIDetection.id, AIDetection.image_path, AIDetection.license_plate,
+            AIDetection.confidence, AIDetection.vehicle_id, AIDetection.detection_data,
+            AIDetection.detected_at
+        ).where(AIDetection.image_path.isnot(None), AIDetection.id > after_id)
+        if self.end_id is not None:
+            query = query.where(AIDetection.id <= self.end_id)
+        return query
+
+    def total(self) -> int:
+        """Rilevazioni con immagine nell'intervallo, per il calcolo dell'avanzamento"""
+        query = select(func.count(AIDetection.id)).where(
+            AIDetection.image_path.isnot(None), AIDetection.id > self.start_id
+        )
+        if self.end_id is not None:
+            query = query.where(AIDetection.id <= self.end_id)
+        return self.db.execute(query).scalar_one()
+
+    def batches(self):
+        """Lotti per id crescente (keyset): ogni lotto è una query indicizzata"""
+        while True:
+            rows = self.db.execute(
+                self._query(self.last_id).order_by(AIDetection.id).limit(self.batch_size)
+            ).all()
+            if not rows:
+                return
+            yield rows
+
+    def run(self, on_batch=None) -> Dict:
+        """Esegue il backfill; `on_batch(state, done, total)` viene chiamato dopo ogni lotto"""
+        total = self.total()
+        done = self.counters["scanned"]
+        executor = None
+        if self.workers > 1:
+            executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        try:
+            for rows in self.batches():
+                paths = [row.image_path for row in rows]
+                if executor:
+                    chunksize = max(1, len(paths) // (self.workers * 4))
+                    readings = list(executor.map(recognize_archived, paths, chunksize=chunksize))
+                else:
+                    readings = [recognize_archived(path) for path in paths]
+                self._apply(rows, readings)
+                self.last_id = rows[-1].id
+                if self.save_checkpoint:
+                    self.save_checkpoint(self.db, self.state())
+                # Aggiornamenti del lotto e checkpoint in un solo commit
+                self.db.commit()
+                done += len(rows)
+                if on_batch:
+                    on_batch(self.state(), done, total)
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
+        return self.result()
+
+    def _apply(self, rows, readings):
+        changed = []
+        for row, (status, plate, confidence) in zip(rows, readings):
+            self.counters["scanned"] += 1
+            if status == MISSING:
+                self.counters["missing_files"] += 1
+            elif status == UNREADABLE:
+                # Senza una nuova lettura si tiene quella esistente
+                self.counters["unreadable"] += 1
+            elif plate == row.license_plate:
+                self.counters["unchanged"] += 1
+            else:
+                self.counters["changed"] += 1
+                changed.append((row, plate, confidence))
+        if not changed:
+            return
+
+        # Una sola query per i veicoli di tutte le letture cambiate del lotto
+        plates = {plate for _, plate, _ in changed}
+        vehicles = dict(self.db.execute(
+            select(Vehicle.license_plate, Vehicle.id).where(Vehicle.license_plate.in_(plates))
+        ).all())
+
+        updates = []
+        for row, plate, confidence in changed:
+            vehicle_id = vehicles.get(plate)
+            if vehicle_id != row.vehicle_id:
+                self.counters["vehicle_matches_changed"] += 1
+            if len(self.samples) < 50:
+                self.samples.append({"id": row.id, "from": row.license_plate, "to": plate})
+            detection_data = dict(row.detection_data or {})
+            detection_data["vehicle_found"] = vehicle_id is not None
+            detection_data["backfill"] = {
+                "previous_plate": row.license_plate,
+                "previous_confidence": row.confidence,
+                "previous_vehicle_id": row.vehicle_id,
+                "job_id": self.job_id
+            }
+            updates.append({
+                "id": row.id,
+                "license_plate": plate,
+                "confidence": confidence,
+                "vehicle_id": vehicle_id,
+                "processed": vehicle_id is not None,
+                "detection_data": detection_data
+            })
+
+        if self.dry_run:
+            return
+        # UPDATE in blocco per chiave primaria (executemany), commit in run() con il checkpoint.
+        # Le ore già aggregate vengono ricalcolate dal prossimo rollup
+        self.db.execute(update(AIDetection), updates)
+        mark_hours_dirty(self.db, [row.detected_at for row, _, _ in changed])
+
+    def state(self) -> Dict:
+        return {"last_id": self.last_id, "counters": dict(self.counters), "samples": self.samples}
+
+    def result(self) -> Dict:
+        return {**self.counters, "last_id": self.last_id, "dry_run": self.dry_run, "samples": self.samples}
@@ -0,0 +1,162 @@
+import cv2
+import numpy as np
+from typing import List, Tuple, Iterable
+import logging
+import time
+from app.core.config import settings
+from app.core.metrics import record_redaction_duration, record_redaction_budget_overrun
+
+logger = logging.getLogger(__name__)
+
+Box = Tuple[int, int, int, int]
+
+
+def pixelate_region(frame, box: Box, block: int):
+    """Pixela in-place la regione (x, y, w, h) del frame"""
+    x, y, w, h = box
+    frame_h, frame_w = frame.shape[:2]
+    x0, y0 = max(0, x), max(0, y)
+    x1, y1 = min(frame_w, x + w), min(frame_h, y + h)
+    if x1 <= x0 or y1 <= y0:
+        return
+
+    roi = frame[y0:y1, x0:x1]
+    small_w = max(1, (x1 - x0) // block)
+    small_h = max(1, (y1 - y0) // block)
+    small = cv2.resize(roi, (small_w, small_h), interpolation=cv2.INTER_AREA)
+    cv2.resize(small, (x1 - x0, y1 - y0), dst=roi, interpolation=cv2.INTER_NEAREST)
+
+
+class PrivacyRedactor:
+    """
+    Stadio di oscuramento privacy (volti e targhe) con budget di tempo per frame.
+
+    I volti vengono rilevati con un classificatore Haar su una copia ridotta del
+    frame, solo ogni `detect_interval` frame e solo se il tempo stimato rientra nel
+    budget; negli altri frame vengono riutilizzati i box dell'ultimo rilevamento.
+    L'oscuramento avviene per pixelazione, molto più economica di un blur gaussiano.
+    """
+
+    def __init__(
+        self,
+        budget_ms: float = 12.0,
+        detect_width: int = 320,
+        detect_interval: int = 5,
+        pixel_block: int = 12,
+        track_max_age: int = 15,
+        box_margin: float = 0.15
+    ):
+        self.budget_ms = budget_ms
+        self.detect_width = detect_width
+        self.detect_interval = detect_interval
+        self.pixel_block = pixel_block
+        self.track_max_age = track_max_age
+        self.box_margin = box_margin
+
+        self.face_detector = None
+        self._load_face_detector()
+
+        self._tracked_faces: List[Box] = []
+        self._frames_since_detection = detect_interval
+        self._frames_since_refresh = 0
+        self._detect_cost_ms = 0.0
+
+    def _load_face_detector(self):
+        """Carica il classificatore Haar per i volti incluso in OpenCV"""
+        try:
+            cascade_path = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+            detector = cv2.CascadeClassifier(cascade_path)
+            if detector.empty():
+                logger.error(f"Classificatore volti non trovato: {cascade_path}")
+                return
+            self.face_detector = detector
+        except Exception as e:
+            logger.error(f"Errore nel caricamento rilevatore volti: {e}")
+
+    def detect_faces(self, frame) -> List[Box]:
+        """Rileva i volti su una versione ridotta del frame e riporta i box in scala piena"""
+        if self.face_detector is None:
+            return []
+
+        frame_h, frame_w = frame.shape[:2]
+        scale = min(1.0, self.detect_width / float(frame_w))
+        small = frame if scale == 1.0 else cv2.resize(
+            frame, (int(frame_w * scale), int(frame_h * scale)), interpolation=cv2.INTER_AREA
+        )
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+
+        faces = self.face_detector.detectMultiScale(gray, scaleFactor=1.2, minNeighbors=4, minSize=(16, 16))
+        if len(faces) == 0:
+            return []
+
+        # Riporta i box alla risoluzione originale e allarga il margine in un solo passaggio
+        boxes = np.asarray(faces, dtype=np.float32) / scale
+        margin = boxes[:, 2:4] * self.box_margin
+        boxes[:, 0:2] -= margin
+        boxes[:, 2:4] += 2 * margin
+        return [tuple(int(v) for v in box) for box in boxes]
+
+    def _update_faces(self, frame, started_at: float):
+        self._frames_since_detection += 1
+        self._frames_since_refresh += 1
+
+        if self._frames_since_detection < self.detect_interval:
+            return
+
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+        overdue = self._frames_since_detection >= self.detect_interval * 4
+        if not overdue and elapsed_ms + self._detect_cost_ms > self.budget_ms:
+            # Il rilevamento non sta nel budget: si riusano i box correnti
+            return
+
+        detect_start = time.perf_counter()
+        faces = self.detect_faces(frame)
+        cost_ms = (time.perf_counter() - detect_start) * 1000
+        self._detect_cost_ms = cost_ms if self._detect_cost_ms == 0 else 0.8 * self._detect_cost_ms + 0.2 * cost_ms
+
+        self._frames_since_detection = 0
+        if faces or self._frames_since_refresh >= self.track_max_age:
+            self._tracked_faces = faces
+            self._frames_since_refresh = 0
+
+    def redact_faces(self, frame):
+        """Oscura i volti nel frame (in-place)"""
+        started_at = time.perf_counter()
+        self._update_faces(frame, started_at)
+        for box in self._tracked_faces:
+            pixelate_region(frame, box, self.pixel_block)
+        return frame
+
+    def redact_boxes(self, frame, boxes: Iterable[Box]):
+        """Oscura le regioni indicate (in-place)"""
+        for box in boxes:
+            pixelate_region(frame, box, self.pixel_block)
+        return frame
+
+    def redact(self, frame, plate_boxes: Iterable[Box] = ()):
+        """Oscura volti e targhe rispettando il budget di tempo configurato"""
+        started_at = time.perf_counter()
+
+        # Le targhe sono già note per questo frame: si oscurano sempre
+        self.redact_boxes(frame, plate_boxes)
+
+        self._update_faces(frame, started_at)
+        for box in self._tracked_faces:
+            pixelate_region(frame, box, self.pixel_block)
+
+        duration_ms = (time.perf_counter() - started_at) * 1000
+        record_redaction_duration(duration_ms / 1000)
+        if duration_ms > self.budget_ms:
+            record_redaction_budget_overrun()
+
+        return frame
+
+
+def create_redactor() -> PrivacyRedactor:
+    """Crea un PrivacyRedactor con i parametri da configurazione"""
+    return PrivacyRedactor(
+        budget_ms=settings.REDACTION_BUDGET_MS,
+        detect_width=settings.REDACTION_FACE_DETECT_WIDTH,
+        detect_interval=settings.REDACTION_FACE_DETECT_INTERVAL,
+        pixel_block=settings.REDACTION_PIXEL_BLOCK
+    )
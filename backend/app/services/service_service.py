@@ -1,7 +1,10 @@
 from typing import List, Optional
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from app.core.database import Service
 from app.schemas.service import ServiceCreate, ServiceUpdate
+from app.services.list_query import Page, paginate, where
+from app.services import text_search
 from datetime import datetime
 
 class ServiceService:
@@ -14,6 +17,14 @@ class ServiceService:
     def get_services(self, skip: int = 0, limit: int = 100) -> List[Service]:
         return self.db.query(Service).offset(skip).limit(limit).all()
 
+    def list_services(self, limit: int = 100, cursor: str = None, skip: int = 0,
+                      search: str = None, category: str = None) -> Page:
+        conditions = [Service.category == category] if category else []
+        if search:
+            # Risultati per rilevanza: una sola pagina, senza cursore
+            return Page(self.search_services(search, limit=limit, conditions=conditions), None)
+        return paginate(self.db, where(select(Service), *conditions), (Service.id,), limit, cursor, skip)
+
     def get_services_by_category(self, category: str) -> List[Service]:
         return self.db.query(Service).filter(Service.category == category).all()
 
@@ -28,6 +39,7 @@ class ServiceService:
         self.db.add(db_service)
         self.db.commit()
         self.db.refresh(db_service)
+        text_search.invalidate("services")
         return db_service
 
     def update_service(self, service_id: int, service: ServiceUpdate) -> Optional[Service]:
@@ -42,6 +54,7 @@ class ServiceService:
         db_service.updated_at = datetime.utcnow()
         self.db.commit()
         self.db.refresh(db_service)
+        text_search.invalidate("services")
         return db_service
 
     def delete_service(self, service_id: int) -> bool:
@@ -51,11 +64,9 @@ class ServiceService:
         
         self.db.delete(db_service)
         self.db.commit()
+        text_search.invalidate("services")
         return True
 
-    def search_services(self, query: str) -> List[Service]:
-        return self.db.query(Service).filter(
-            Service.name.ilike(f"%{query}%") |
-            Service.description.ilike(f"%{query}%") |
-            Service.category.ilike(f"%{query}%")
-        ).all()
+    def search_services(self, query: str, limit: int = 50, conditions=()) -> List[Service]:
+        """Services by name, description or category, most relevant first"""
+        return text_search.search(self.db, text_search.SERVICE_SEARCH, query, limit, conditions)
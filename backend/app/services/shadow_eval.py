@@ -0,0 +1,324 @@
+"""
+Valutazione in ombra di un motore targhe candidato sul traffico reale.
+
+Una frazione dei frame già elaborati dal motore di produzione viene passata
+anche al candidato (altro modello di rilevamento e/o riconoscitore), che
+gira in un processo separato a priorità ridotta e con un budget di CPU
+fisso: dopo ogni inferenza il processo resta fermo quanto basta perché la
+CPU media non superi `cpu_share` di un core. Il passaggio del frame non
+attende mai: se il candidato è occupato o in pausa il frame non viene
+campionato. Le letture dei due motori vengono confrontate e i disaccordi
+salvati in JSONL (con il frame) insieme ai tempi di inferenza.
+"""
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, List, Dict, Any
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+AGREE = "agree"
+DISAGREE = "disagree"
+PRIMARY_ONLY = "primary_only"
+SHADOW_ONLY = "shadow_only"
+
+
+def _run_candidate(conn, detector_backend: str, model_path: str, recognizer_backend: str, cpu_share: float):
+    """Processo del candidato: riceve frame, risponde (targhe, secondi, secondi CPU, errore)"""
+    import cv2
+    from app.services.plate_engine import PlateEngine, create_detector, create_recognizer
+
+    os.nice(10)
+    # Un solo thread per OpenCV e torch: il budget è su un core
+    cv2.setNumThreads(1)
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+
+    if detector_backend == "yolo" and not os.path.exists(model_path):
+        # Senza il modello create_detector ripiegherebbe sul rilevatore a contorni
+        conn.send(("error", f"Modello candidato non trovato: {model_path}"))
+        return
+    engine = PlateEngine(create_detector(detector_backend, model_path), create_recognizer(recognizer_backend))
+    conn.send(("ready", None))
+
+    while True:
+        try:
+            frame = conn.recv()
+        except EOFError:
+            return
+        if frame is None:
+            return
+        started, cpu_started = time.monotonic(), time.process_time()
+        try:
+            plates, error = engine.detect(frame), None
+        except Exception as e:
+            plates, error = [], str(e)
+        seconds = time.monotonic() - started
+        cpu_seconds = time.process_time() - cpu_started
+        conn.send(("result", (plates, seconds, cpu_seconds, error)))
+        # Ciclo di lavoro: in media al massimo cpu_share della CPU di un core
+        time.sleep(max(0.0, cpu_seconds / cpu_share - seconds))
+
+
+def compare(primary: List[Dict], shadow: List[Dict]) -> str:
+    primary_plates = {plate["license_plate"] for plate in primary}
+    shadow_plates = {plate["license_plate"] for plate in shadow}
+    if primary_plates == shadow_plates:
+        return AGREE
+    if not shadow_plates:
+        return PRIMARY_ONLY
+    if not primary_plates:
+        return SHADOW_ONLY
+    return DISAGREE
+
+
+class ShadowEvaluator:
+    """
+    Confronto tra motore di produzione e candidato. `offer()` va chiamato dopo
+    ogni inferenza di produzione: costa una copia del frame solo se il frame
+    viene campionato, e non blocca mai.
+    """
+
+    def __init__(
+        self,
+        detector_backend: str,
+        model_path: str,
+        recognizer_backend: str = "easyocr",
+        sample_rate: float = 0.05,
+        cpu_share: float = 0.25,
+        output_dir: str = "uploads/shadow",
+        save_frames: bool = True
+    ):
+        self.detector_backend = detector_backend
+        self.model_path = model_path
+        self.recognizer_backend = recognizer_backend
+        self.sample_rate = sample_rate
+        self.cpu_share = min(max(cpu_share, 0.01), 1.0)
+        self.output_dir = Path(output_dir)
+        self.save_frames = save_frames
+        self._handoff: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=1)
+        self._thread: Optional[threading.Thread] = None
+        self._process = None
+        self._conn = None
+        self._lock = threading.Lock()
+        self._running = False
+        self.disabled_reason: Optional[str] = None
+        self.counters = {"offered": 0, "compared": 0, "skipped_busy": 0, "errors": 0,
+                         AGREE: 0, DISAGREE: 0, PRIMARY_ONLY: 0, SHADOW_ONLY: 0}
+        self.per_camera: Dict[str, Dict[str, int]] = {}
+        self._primary_seconds = 0.0
+        self._shadow_seconds = 0.0
+        self._shadow_cpu_seconds = 0.0
+        self.recent_disagreements: "deque[Dict]" = deque(maxlen=50)
+
+    def start(self):
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="shadow-eval", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._running = False
+        try:
+            self._handoff.put_nowait(None)
+        except queue.Full:
+            pass
+        if self._thread:
+            self._thread.join(timeout=10)
+        self._stop_process()
+
+    def offer(self, camera_id: str, frame, plates: List[Dict], seconds: float):
+        """Campiona il frame per il candidato se estratto e se il candidato è libero"""
+        if not self._running:
+            return
+        self.counters["offered"] += 1
+        if random.random() >= self.sample_rate:
+            return
+        if self._handoff.full():
+            self.counters["skipped_busy"] += 1
+            return
+        try:
+            # Copia: il frame di produzione torna nell'anello appena gestito
+            self._handoff.put_nowait((camera_id, frame.copy(), list(plates), seconds, time.time()))
+        except queue.Full:
+            self.counters["skipped_busy"] += 1
+
+    def _start_process(self) -> bool:
+        parent_conn, child_conn = multiprocessing.Pipe()
+        # spawn: il processo figlio non eredita i thread e i modelli del processo di produzione
+        context = multiprocessing.get_context("spawn")
+        self._process = context.Process(
+            target=_run_candidate,
+            args=(child_conn, self.detector_backend, self.model_path, self.recognizer_backend, self.cpu_share),
+            name="shadow-candidate",
+            daemon=True
+        )
+        self._conn = parent_conn
+        try:
+            self._process.start()
+            child_conn.close()
+            kind, message = self._conn.recv()
+        except EOFError:
+            kind, message = "error", "processo candidato terminato durante il caricamento"
+        except (OSError, RuntimeError) as e:
+            kind, message = "error", f"avvio del processo candidato fallito: {e}"
+        if kind != "ready":
+            self.disabled_reason = message
+            logger.error(f"Valutazione in ombra disattivata: {message}")
+            self._stop_process()
+            return False
+        logger.info(f"Candidato in ombra pronto: {self.detector_backend} {self.model_path}")
+        return True
+
+    def _stop_process(self):
+        if self._conn is not None:
+            try:
+                self._conn.send(None)
+            except (OSError, BrokenPipeError):
+                pass
+            self._conn.close()
+            self._conn = None
+        if self._process is not None and self._process.pid is not None:
+            self._process.join(timeout=5)
+            if self._process.is_alive():
+                self._process.terminate()
+        self._process = None
+
+    def _run(self):
+        if not self._start_process():
+            self._running = False
+            return
+        while self._running:
+            item = self._handoff.get()
+            if item is None:
+                return
+            camera_id, frame, primary, primary_seconds, captured_at = item
+            try:
+                self._conn.send(frame)
+                _, (shadow, seconds, cpu_seconds, error) = self._conn.recv()
+            except (EOFError, OSError) as e:
+                self.counters["errors"] += 1
+                logger.error(f"Processo candidato interrotto: {e}; riavvio")
+                self._stop_process()
+                if not self._start_process():
+                    self._running = False
+                    return
+                continue
+            if error:
+                self.counters["errors"] += 1
+                logger.warning(f"Errore del candidato in ombra: {error}")
+                continue
+            self._record(camera_id, frame, primary, primary_seconds, shadow, seconds, cpu_seconds, captured_at)
+
+    def _record(self, camera_id: str, frame, primary: List[Dict], primary_seconds: float,
+                shadow: List[Dict], seconds: float, cpu_seconds: float, captured_at: float):
+        from app.core.metrics import record_shadow_comparison
+
+        outcome = compare(primary, shadow)
+        with self._lock:
+            self.counters["compared"] += 1
+            self.counters[outcome] += 1
+            camera = self.per_camera.setdefault(camera_id, {AGREE: 0, DISAGREE: 0, PRIMARY_ONLY: 0, SHADOW_ONLY: 0})
+            camera[outcome] += 1
+            self._primary_seconds += primary_seconds
+            self._shadow_seconds += seconds
+            self._shadow_cpu_seconds += cpu_seconds
+        record_shadow_comparison(camera_id, outcome, primary_seconds, seconds)
+        if outcome == AGREE:
+            return
+
+        timestamp = datetime.fromtimestamp(captured_at)
+        entry = {
+            "camera_id": camera_id,
+            "captured_at": timestamp.isoformat(),
+            "outcome": outcome,
+            "primary": [self._plate(plate) for plate in primary],
+            "shadow": [self._plate(plate) for plate in shadow],
+            "primary_ms": round(primary_seconds * 1000, 1),
+            "shadow_ms": round(seconds * 1000, 1),
+            "frame_path": None
+        }
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            if self.save_frames:
+                import cv2
+
+                frame_path = self.output_dir / f"shadow_{camera_id}_{timestamp.strftime('%Y%m%d_%H%M%S_%f')}.jpg"
+                cv2.imwrite(str(frame_path), frame)
+                entry["frame_path"] = str(frame_path)
+            with open(self.output_dir / "disagreements.jsonl", "a") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            logger.error(f"Errore nel salvataggio del disaccordo in ombra: {e}")
+        self.recent_disagreements.append(entry)
+
+    @staticmethod
+    def _plate(plate: Dict) -> Dict:
+        return {
+            "license_plate": plate["license_plate"],
+            "confidence": round(float(plate["confidence"]), 3),
+            "bbox": [int(v) for v in plate["bbox"]]
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            compared = self.counters["compared"]
+            return {
+                "running": self._running,
+                "disabled_reason": self.disabled_reason,
+                "candidate": {
+                    "detector": self.detector_backend,
+                    "model_path": self.model_path,
+                    "recognizer": self.recognizer_backend
+                },
+                "sample_rate": self.sample_rate,
+                "cpu_share": self.cpu_share,
+                **self.counters,
+                "agreement_rate": round(self.counters[AGREE] / compared, 3) if compared else None,
+                "avg_primary_ms": round(self._primary_seconds / compared * 1000, 1) if compared else None,
+                "avg_shadow_ms": round(self._shadow_seconds / compared * 1000, 1) if compared else None,
+                "avg_shadow_cpu_ms": round(self._shadow_cpu_seconds / compared * 1000, 1) if compared else None,
+                "per_camera": {camera_id: dict(counts) for camera_id, counts in self.per_camera.items()},
+                "recent_disagreements": list(self.recent_disagreements)[-10:]
+            }
+
+
+_evaluator: Optional[ShadowEvaluator] = None
+_evaluator_lock = threading.Lock()
+
+
+def get_shadow_evaluator() -> Optional[ShadowEvaluator]:
+    """Valutatore del processo (avviato al primo uso), None se la valutazione in ombra è disattivata"""
+    global _evaluator
+    from app.core.config import settings
+
+    if not settings.SHADOW_EVAL_ENABLED:
+        return None
+    if _evaluator is None:
+        with _evaluator_lock:
+            if _evaluator is None:
+                _evaluator = ShadowEvaluator(
+                    settings.SHADOW_DETECTOR_BACKEND,
+                    settings.SHADOW_DETECTOR_MODEL_PATH,
+                    recognizer_backend=settings.SHADOW_RECOGNIZER_BACKEND,
+                    sample_rate=settings.SHADOW_SAMPLE_RATE,
+                    cpu_share=settings.SHADOW_CPU_SHARE,
+                    output_dir=settings.SHADOW_DIR,
+                    save_frames=settings.SHADOW_SAVE_FRAMES
+                )
+                _evaluator.start()
+    return _evaluator
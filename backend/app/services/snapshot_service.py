@@ -0,0 +1,171 @@
+"""
+Snapshot singoli dalle telecamere (POST /ai/stream) senza aprire ogni volta
+una nuova cattura: handshake RTSP e attesa del keyframe costano secondi.
+
+Se la telecamera è già monitorata nel processo, lo snapshot è una copia
+dell'ultimo frame decodificato dal monitoraggio. Altrimenti resta aperta una
+cattura persistente per URL (thread che fa solo grab(), frame convertito solo
+su richiesta), chiusa dopo `idle_seconds` senza richieste.
+"""
+from typing import Optional, Dict, Callable, Tuple
+import logging
+import threading
+import time
+import numpy as np
+from app.services.dual_stream import MainStreamReader
+
+logger = logging.getLogger(__name__)
+
+# Sorgente di un monitoraggio attivo: (copia del frame, istante monotonic di cattura) o None
+LiveSource = Callable[[], Optional[Tuple[np.ndarray, float]]]
+
+
+class SnapshotPool:
+    """Snapshot per URL: frame del monitoraggio attivo o cattura persistente in pool"""
+
+    def __init__(self, idle_seconds: float = 60.0, max_captures: int = 4,
+                 timeout: float = 2.0, max_frame_age: float = 5.0):
+        self.idle_seconds = idle_seconds
+        self.max_captures = max_captures
+        self.timeout = timeout
+        self.max_frame_age = max_frame_age
+        self._live: Dict[str, LiveSource] = {}
+        self._readers: Dict[str, MainStreamReader] = {}
+        self._last_used: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+        self.counters = {"live": 0, "pooled": 0, "opened": 0, "closed_idle": 0, "failed": 0}
+
+    def register_live(self, url: str, source: LiveSource):
+        """Il monitoraggio di `url` fornisce gli snapshot finché non viene rimosso"""
+        with self._lock:
+            self._live[url] = source
+        # La cattura in pool diventa un secondo client inutile sulla stessa telecamera
+        self._close(url)
+
+    def unregister_live(self, url: str, source: LiveSource = None):
+        with self._lock:
+            if source is None or self._live.get(url) == source:
+                self._live.pop(url, None)
+
+    def snapshot(self, url: str) -> Optional[np.ndarray]:
+        """Frame corrente della telecamera, o None se lo stream non è raggiungibile"""
+        source = self._live.get(url)
+        if source is not None:
+            latest = source()
+            if latest is not None and time.monotonic() - latest[1] <= self.max_frame_age:
+                self.counters["live"] += 1
+                return latest[0]
+
+        requested_at = time.monotonic()
+        reader = self._reader(url)
+        if reader is None:
+            self.counters["failed"] += 1
+            return None
+        frame = reader.fetch(requested_at, self.timeout)
+        if frame is None:
+            self.counters["failed"] += 1
+            return None
+        self.counters["pooled"] += 1
+        return frame
+
+    def _reader(self, url: str) -> Optional[MainStreamReader]:
+        with self._lock:
+            self._last_used[url] = time.monotonic()
+            reader = self._readers.get(url)
+        if reader is not None:
+            return reader
+
+        # Apertura fuori dal lock: l'handshake non blocca gli snapshot delle altre telecamere.
+        # Lo skew massimo non conta: si vuole il primo frame dopo la richiesta
+        reader = MainStreamReader(url, max_skew=self.timeout)
+        if not reader.start():
+            with self._lock:
+                self._last_used.pop(url, None)
+            return None
+
+        evicted = []
+        with self._lock:
+            existing = self._readers.get(url)
+            if existing is None:
+                while len(self._readers) >= self.max_captures:
+                    # Pool pieno: si chiude la cattura usata meno di recente
+                    oldest = min(self._readers, key=lambda current: self._last_used.get(current, 0.0))
+                    evicted.append((oldest, self._readers.pop(oldest)))
+                self._readers[url] = reader
+                self._last_used[url] = time.monotonic()
+                self.counters["opened"] += 1
+                self._start_reaper()
+        if existing is not None:
+            # Aperta in contemporanea da un'altra richiesta
+            reader.stop()
+            return existing
+        for oldest, evicted_reader in evicted:
+            evicted_reader.stop()
+            logger.info(f"Cattura snapshot chiusa (pool pieno): {oldest}")
+        logger.info(f"Cattura snapshot aperta: {url}")
+        return reader
+
+    def _start_reaper(self):
+        if self._reaper is None or not self._reaper.is_alive():
+            self._reaper = threading.Thread(target=self._reap, name="snapshot-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap(self):
+        while True:
+            time.sleep(min(self.idle_seconds / 4, 5.0))
+            now = time.monotonic()
+            with self._lock:
+                idle = [url for url in self._readers if now - self._last_used.get(url, 0.0) >= self.idle_seconds]
+            for url in idle:
+                if self._close(url):
+                    self.counters["closed_idle"] += 1
+                    logger.info(f"Cattura snapshot chiusa per inattività: {url}")
+            with self._lock:
+                if not self._readers:
+                    self._reaper = None
+                    return
+
+    def _close(self, url: str) -> bool:
+        with self._lock:
+            reader = self._readers.pop(url, None)
+            self._last_used.pop(url, None)
+        if reader is None:
+            return False
+        reader.stop()
+        return True
+
+    def close(self):
+        with self._lock:
+            urls = list(self._readers)
+        for url in urls:
+            self._close(url)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                **self.counters,
+                "live_sources": sorted(self._live),
+                "pooled_captures": sorted(self._readers)
+            }
+
+
+_pool: Optional[SnapshotPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_snapshot_pool() -> SnapshotPool:
+    """Pool di snapshot condiviso dal processo"""
+    global _pool
+    from app.core.config import settings
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = SnapshotPool(
+                    idle_seconds=settings.SNAPSHOT_IDLE_SECONDS,
+                    max_captures=settings.SNAPSHOT_MAX_CAPTURES,
+                    timeout=settings.SNAPSHOT_TIMEOUT_SECONDS,
+                    max_frame_age=settings.SNAPSHOT_MAX_FRAME_AGE_SECONDS
+                )
+    return _pool
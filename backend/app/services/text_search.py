@@ -0,0 +1,249 @@
+"""
+Ricerca testuale di clienti, veicoli e servizi (casella di ricerca dell'accettazione).
+
+Su Postgres la ricerca per sottostringa (ILIKE '%q%' sulle colonne della
+tabella) usa gli indici GIN a trigrammi di pg_trgm sulle colonne, ordina per
+word_similarity e restituisce al più `limit` risultati. Targhe e telefoni
+hanno una via rapida per prefisso su un indice btree della chiave
+normalizzata (targa in maiuscolo senza separatori, telefono senza prefisso
++39 e separatori): i risultati per prefisso vengono prima degli altri.
+L'indice a trigrammi filtra da 3 caratteri in su.
+
+Su SQLite, o su Postgres senza pg_trgm, la stessa ricerca usa un indice
+n-gram in memoria per tabella, ricostruito dopo le modifiche dei servizi e
+comunque al più ogni INDEX_MAX_AGE secondi.
+"""
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+import logging
+import re
+import threading
+import time
+from sqlalchemy import func, literal_column, or_, select, text
+from sqlalchemy.orm import Session
+from app.core.database import Customer, Vehicle, Service
+from app.services.plate_text import clean_plate_text
+
+logger = logging.getLogger(__name__)
+
+TRIGRAM_MIN_LENGTH = 3
+INDEX_MAX_AGE = 60.0
+_FETCH_CHUNK = 200
+
+
+def plate_key(value: str) -> str:
+    return clean_plate_text(value)
+
+
+def phone_key(value: str) -> str:
+    # Stessa espressione dell'indice idx_customers_phone_prefix
+    return re.sub(r"^(\+|00)39|\D", "", value)
+
+
+def _sql_regexp_replace(expression, pattern: str):
+    # Costanti letterali: l'espressione deve coincidere con quella dell'indice
+    return func.regexp_replace(expression, literal_column(f"'{pattern}'"), literal_column("''"), literal_column("'g'"))
+
+
+class PrefixKey(NamedTuple):
+    """Chiave normalizzata cercata per prefisso (targa, telefono)"""
+    column: Any
+    normalize: Callable[[str], str]
+    sql: Callable[[Any], Any]
+    accepts: Callable[[str], bool]
+
+
+class SearchSpec(NamedTuple):
+    table: str
+    model: Any
+    columns: Tuple
+    prefix: Optional[PrefixKey] = None
+
+
+CUSTOMER_SEARCH = SearchSpec(
+    "customers", Customer, (Customer.full_name, Customer.email, Customer.phone),
+    PrefixKey(
+        Customer.phone, phone_key,
+        lambda column: _sql_regexp_replace(column, r"^(\+|00)39|\D"),
+        lambda query: bool(re.fullmatch(r"[\d\s+\-/().]+", query)) and len(phone_key(query)) >= 3
+    )
+)
+VEHICLE_SEARCH = SearchSpec(
+    "vehicles", Vehicle, (Vehicle.license_plate, Vehicle.brand, Vehicle.model, Vehicle.vin),
+    PrefixKey(
+        Vehicle.license_plate, plate_key,
+        lambda column: _sql_regexp_replace(func.upper(column), "[^A-Z0-9]"),
+        lambda query: bool(re.fullmatch(r"[A-Za-z0-9 \-]{2,10}", query))
+    )
+)
+SERVICE_SEARCH = SearchSpec("services", Service, (Service.name, Service.description, Service.category))
+
+
+def _grams(value: str) -> Set[str]:
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+def _word_trigrams(value: str) -> Set[str]:
+    # Trigrammi come pg_trgm: per parola, con due spazi prima e uno dopo
+    grams = set()
+    for word in re.findall(r"[^\W_]+", value.lower()):
+        grams |= _grams(f"  {word} ")
+    return grams
+
+
+class NgramIndex:
+    """Indice n-gram in memoria di una tabella: trigrammi -> id, più le chiavi per prefisso ordinate"""
+
+    def __init__(self, spec: SearchSpec):
+        self.spec = spec
+        self.docs: Dict[int, Tuple[str, ...]] = {}
+        self.postings: Dict[str, Set[int]] = defaultdict(set)
+        self.keys: List[Tuple[str, int]] = []
+        self.built_at: Optional[float] = None
+
+    def build(self, db: Session):
+        model = self.spec.model
+        docs, postings, keys = {}, defaultdict(set), []
+        key_position = None
+        if self.spec.prefix is not None:
+            key_position = next(i for i, column in enumerate(self.spec.columns) if column is self.spec.prefix.column)
+        for row in db.execute(select(model.id, *self.spec.columns)):
+            values = tuple((value or "").lower() for value in row[1:])
+            docs[row[0]] = values
+            for value in values:
+                for gram in _grams(value):
+                    postings[gram].add(row[0])
+            if key_position is not None:
+                value = row[1 + key_position]
+                if value:
+                    keys.append((self.spec.prefix.normalize(value), row[0]))
+        self.docs, self.postings, self.keys = docs, postings, sorted(keys)
+        self.built_at = time.monotonic()
+
+    def search(self, query: str) -> List[int]:
+        """Id con `query` contenuta in una delle colonne, per rilevanza"""
+        needle = query.lower()
+        if len(needle) >= TRIGRAM_MIN_LENGTH:
+            postings = sorted((self.postings.get(gram, set()) for gram in _grams(needle)), key=len)
+            candidates = set.intersection(*postings) if postings else set()
+        else:
+            candidates = self.docs.keys()
+
+        query_grams = _word_trigrams(needle)
+        ranked = []
+        for doc_id in candidates:
+            values = self.docs[doc_id]
+            if not any(needle in value for value in values):
+                continue
+            # Quota dei trigrammi della ricerca presenti nel campo, come word_similarity
+            rank = max((len(query_grams & _word_trigrams(value)) / len(query_grams) if query_grams else 0.0)
+                       for value in values)
+            ranked.append((-rank, doc_id))
+        return [doc_id for _, doc_id in sorted(ranked)]
+
+    def prefix(self, key: str) -> List[int]:
+        ids = []
+        for position in range(bisect_left(self.keys, (key,)), len(self.keys)):
+            value, doc_id = self.keys[position]
+            if not value.startswith(key):
+                break
+            ids.append(doc_id)
+        return ids
+
+
+_indexes: Dict[Tuple[str, str], NgramIndex] = {}
+_trigram_support: Dict[str, bool] = {}
+_lock = threading.Lock()
+
+
+def invalidate(table: str):
+    """Da chiamare dopo le modifiche a una tabella: l'indice in memoria viene ricostruito alla prossima ricerca"""
+    with _lock:
+        for key, index in _indexes.items():
+            if key[1] == table:
+                index.built_at = None
+
+
+def _index_for(db: Session, spec: SearchSpec) -> NgramIndex:
+    key = (str(db.get_bind().url), spec.table)
+    with _lock:
+        index = _indexes.setdefault(key, NgramIndex(spec))
+        if index.built_at is None or time.monotonic() - index.built_at > INDEX_MAX_AGE:
+            index.build(db)
+        return index
+
+
+def uses_trigrams(db: Session) -> bool:
+    """True su Postgres con pg_trgm installata (verificato una volta per database)"""
+    bind = db.get_bind()
+    if bind.dialect.name != "postgresql":
+        return False
+    url = str(bind.url)
+    if url not in _trigram_support:
+        _trigram_support[url] = bool(db.execute(text(
+            "SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')"
+        )).scalar())
+        if not _trigram_support[url]:
+            logger.warning("pg_trgm non installata: ricerca testuale con l'indice in memoria")
+    return _trigram_support[url]
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _fetch(db: Session, spec: SearchSpec, ids: List[int], limit: int, conditions: Sequence) -> List:
+    """Oggetti degli id nell'ordine dato che soddisfano le condizioni, al più `limit`"""
+    found = []
+    for start in range(0, len(ids), _FETCH_CHUNK):
+        chunk = ids[start:start + _FETCH_CHUNK]
+        rows = db.execute(select(spec.model).where(spec.model.id.in_(chunk), *conditions)).scalars().all()
+        by_id = {row.id: row for row in rows}
+        found.extend(by_id[doc_id] for doc_id in chunk if doc_id in by_id)
+        if len(found) >= limit:
+            break
+    return found[:limit]
+
+
+def search(db: Session, spec: SearchSpec, query: str, limit: int = 50, conditions: Sequence = ()) -> List:
+    """
+    Righe di `spec` che contengono `query` in una delle colonne, prima le
+    corrispondenze per prefisso della chiave (targa/telefono) e poi per
+    rilevanza; `conditions` sono filtri SQL aggiuntivi (es. cliente)
+    """
+    query = (query or "").strip()
+    if not query or limit <= 0:
+        return []
+    model = spec.model
+    trigrams = uses_trigrams(db)
+
+    found = []
+    if spec.prefix is not None and spec.prefix.accepts(query):
+        key = spec.prefix.normalize(query)
+        if trigrams:
+            expression = spec.prefix.sql(spec.prefix.column)
+            found = db.execute(
+                select(model).where(expression.like(f"{key}%"), *conditions)
+                .order_by(expression, model.id).limit(limit)
+            ).scalars().all()
+        else:
+            found = _fetch(db, spec, _index_for(db, spec).prefix(key), limit, conditions)
+        if len(found) >= limit:
+            return found
+
+    exclude = {row.id for row in found}
+    remaining = limit - len(found)
+    if trigrams:
+        pattern = f"%{_escape_like(query)}%"
+        rank = func.greatest(*(func.word_similarity(query, column) for column in spec.columns))
+        statement = select(model).where(
+            or_(*(column.ilike(pattern, escape="\\") for column in spec.columns)), *conditions
+        )
+        if exclude:
+            statement = statement.where(model.id.notin_(sorted(exclude)))
+        rows = db.execute(statement.order_by(rank.desc(), model.id).limit(remaining)).scalars().all()
+    else:
+        ids = [doc_id for doc_id in _index_for(db, spec).search(query) if doc_id not in exclude]
+        rows = _fetch(db, spec, ids, remaining, conditions)
+    return list(found) + list(rows)
@@ -1,7 +1,11 @@
 from typing import List, Optional
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from app.core.database import Vehicle
 from app.schemas.vehicle import VehicleCreate, VehicleUpdate
+from app.services.list_query import Page, paginate, where
+from app.services.plate_cache import plate_cache
+from app.services import text_search
 from datetime import datetime
 
 class VehicleService:
@@ -14,6 +18,14 @@ class VehicleService:
     def get_vehicles(self, skip: int = 0, limit: int = 100) -> List[Vehicle]:
         return self.db.query(Vehicle).offset(skip).limit(limit).all()
 
+    def list_vehicles(self, limit: int = 100, cursor: str = None, skip: int = 0,
+                      search: str = None, customer_id: int = None) -> Page:
+        conditions = [Vehicle.customer_id == customer_id] if customer_id is not None else []
+        if search:
+            # Risultati per rilevanza: una sola pagina, senza cursore
+            return Page(self.search_vehicles(search, limit=limit, conditions=conditions), None)
+        return paginate(self.db, where(select(Vehicle), *conditions), (Vehicle.id,), limit, cursor, skip)
+
     def get_vehicle_by_license_plate(self, license_plate: str) -> Optional[Vehicle]:
         return self.db.query(Vehicle).filter(Vehicle.license_plate == license_plate).first()
 
@@ -35,6 +47,8 @@ class VehicleService:
         self.db.add(db_vehicle)
         self.db.commit()
         self.db.refresh(db_vehicle)
+        plate_cache.invalidate_plate(db_vehicle.license_plate)
+        text_search.invalidate("vehicles")
         return db_vehicle
 
     def update_vehicle(self, vehicle_id: int, vehicle: VehicleUpdate) -> Optional[Vehicle]:
@@ -49,6 +63,9 @@ class VehicleService:
         db_vehicle.updated_at = datetime.utcnow()
         self.db.commit()
         self.db.refresh(db_vehicle)
+        plate_cache.invalidate_vehicle(vehicle_id)
+        plate_cache.invalidate_plate(db_vehicle.license_plate)
+        text_search.invalidate("vehicles")
         return db_vehicle
 
     def delete_vehicle(self, vehicle_id: int) -> bool:
@@ -58,12 +75,10 @@ class VehicleService:
         
         self.db.delete(db_vehicle)
         self.db.commit()
+        plate_cache.invalidate_vehicle(vehicle_id)
+        text_search.invalidate("vehicles")
         return True
 
-    def search_vehicles(self, query: str) -> List[Vehicle]:
-        return self.db.query(Vehicle).filter(
-            Vehicle.license_plate.ilike(f"%{query}%") |
-            Vehicle.brand.ilike(f"%{query}%") |
-            Vehicle.model.ilike(f"%{query}%") |
-            Vehicle.vin.ilike(f"%{query}%")
-        ).all()
+    def search_vehicles(self, query: str, limit: int = 50, conditions=()) -> List[Vehicle]:
+        """Vehicles by plate, brand, model or VIN (plate prefix first), most relevant first"""
+        return text_search.search(self.db, text_search.VEHICLE_SEARCH, query, limit, conditions)
@@ -0,0 +1,140 @@
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection
+from typing import Optional, List, Dict, Any
+import asyncio
+import logging
+import queue
+import threading
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class VisionWorkerUnavailable(Exception):
+    """Il worker di visione non è raggiungibile o non ha risposto in tempo"""
+
+
+class VisionWorkerError(Exception):
+    """Errore sollevato dal worker di visione durante l'elaborazione della richiesta"""
+
+
+def vision_authkey() -> bytes:
+    return (settings.VISION_WORKER_AUTHKEY or settings.SECRET_KEY).encode()
+
+
+class VisionClient:
+    """
+    Client RPC verso il worker di visione dedicato (socket Unix).
+
+    Espone `detect` e `detect_best` come PlateEngine, così i servizi possono usarlo
+    al posto del motore in-process. Le connessioni vengono riutilizzate tramite un
+    piccolo pool; una connessione che fallisce viene chiusa e non torna nel pool.
+    """
+
+    def __init__(self, address: str, authkey: bytes, timeout: float = 30.0, pool_size: int = 4):
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self._pool: "queue.LifoQueue[Connection]" = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self) -> Connection:
+        try:
+            return Client(self.address, family="AF_UNIX", authkey=self.authkey)
+        except (OSError, EOFError, AuthenticationError) as e:
+            raise VisionWorkerUnavailable(f"Worker di visione non raggiungibile su {self.address}: {e}")
+
+    def _checkout(self) -> Connection:
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def _checkin(self, conn: Connection):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def call(self, method: str, **params) -> Any:
+        """Esegue una chiamata sul worker e ne restituisce il risultato"""
+        # Una connessione presa dal pool può essere stata chiusa dal worker
+        # (es. riavvio): in quel caso si riprova una volta con una connessione nuova
+        for attempt in range(2):
+            conn = self._checkout() if attempt == 0 else self._connect()
+            try:
+                conn.send((method, params))
+                if not conn.poll(self.timeout):
+                    conn.close()
+                    raise VisionWorkerUnavailable(f"Timeout del worker di visione su {method}")
+                status, payload = conn.recv()
+            except (OSError, EOFError) as e:
+                conn.close()
+                if attempt == 0:
+                    continue
+                raise VisionWorkerUnavailable(f"Connessione al worker di visione persa: {e}")
+
+            self._checkin(conn)
+            if status == "overloaded":
+                from app.core.admission import Overloaded
+                raise Overloaded(*payload)
+            if status == "error":
+                raise VisionWorkerError(payload)
+            return payload
+
+    async def call_async(self, method: str, **params) -> Any:
+        return await asyncio.to_thread(self.call, method, **params)
+
+    def ping(self) -> Dict:
+        return self.call("ping")
+
+    def detect(self, image, strict: bool = True) -> List[Dict]:
+        """Rileva le targhe nell'immagine (array BGR o bytes codificati)"""
+        return self.call("detect", image=image, strict=strict)
+
+    def detect_best(self, image, strict: bool = True) -> Optional[Dict]:
+        return self.call("detect_best", image=image, strict=strict)
+
+    def snapshot(self, camera_url: str):
+        """Frame corrente della telecamera (array BGR) o None"""
+        return self.call("snapshot", camera_url=camera_url)
+
+    def snapshot_detect_best(self, camera_url: str, strict: bool = True) -> Optional[Dict]:
+        """La targa più probabile nel frame corrente della telecamera, rilevata nel worker"""
+        return self.call("snapshot_detect_best", camera_url=camera_url, strict=strict)
+
+    def start_livestream(self, camera_id: str, stream_url: str, output_url: str = None) -> Dict:
+        return self.call("livestream_start", camera_id=camera_id, stream_url=stream_url, output_url=output_url)
+
+    def stop_livestream(self, camera_id: str = None) -> Dict:
+        return self.call("livestream_stop", camera_id=camera_id)
+
+    def livestream_status(self, camera_id: str = None) -> Dict:
+        return self.call("livestream_status", camera_id=camera_id)
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_client: Optional[VisionClient] = None
+_client_lock = threading.Lock()
+
+
+def get_vision_client() -> Optional[VisionClient]:
+    """Client condiviso dal processo, o None se il worker di visione non è configurato"""
+    global _client
+    if not settings.VISION_WORKER_SOCKET:
+        return None
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = VisionClient(
+                    settings.VISION_WORKER_SOCKET,
+                    vision_authkey(),
+                    timeout=settings.VISION_WORKER_TIMEOUT_SECONDS,
+                    pool_size=settings.VISION_WORKER_POOL_SIZE
+                )
+    return _client
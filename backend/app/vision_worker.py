@@ -0,0 +1,337 @@
+"""
+Worker di visione dedicato.
+
+Un solo processo tiene la copia dei modelli (YOLO + EasyOCR) e i cicli di
+monitoraggio dei livestream; i worker uvicorn gli inviano le richieste di
+inferenza tramite RPC su socket Unix (vedi app.services.vision_client).
+Così il livello HTTP può scalare su più processi senza moltiplicare la
+memoria dei modelli né avviare più volte lo stesso livestream.
+
+Uso: VISION_WORKER_SOCKET=/tmp/vision.sock python -m app.vision_worker
+"""
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Connection
+from typing import Optional, Dict, Any, Callable
+import asyncio
+import logging
+import os
+import signal
+import threading
+import time
+from app.core.admission import InferenceGate, Overloaded, PRIORITY_LIVE, PRIORITY_UPLOAD
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.services.plate_engine import PlateEngine, get_plate_engine
+from app.services.vision_client import vision_authkey
+from app.services.camera_lease_service import CameraLeaseManager
+from app.services.camera_scheduler import CameraScheduler
+from app.services.detection_sink import detection_sink
+from app.services.plate_cache import run_invalidation_sync
+from app.services.shadow_eval import get_shadow_evaluator
+from app.services.snapshot_service import get_snapshot_pool
+
+logger = logging.getLogger(__name__)
+
+
+class _SerializedEngine:
+    """
+    Motore targhe condiviso tra le connessioni RPC e i livestream: un'inferenza
+    alla volta, con i livestream serviti prima delle richieste RPC in attesa
+    """
+
+    def __init__(self, engine: PlateEngine):
+        self._engine = engine
+        self._gate = InferenceGate(1, reserved_live=0, max_upload_waiting=settings.INFERENCE_MAX_UPLOAD_WAITING)
+
+    def detect(self, image, strict: bool = True, priority: int = PRIORITY_LIVE):
+        with self._gate.slot(priority):
+            return self._engine.detect(image, strict)
+
+    def detect_best(self, image, strict: bool = True, priority: int = PRIORITY_LIVE):
+        with self._gate.slot(priority):
+            return self._engine.detect_best(image, strict)
+
+    def detect_dual(self, image, fetch_high_res, padding: float = 0.15, priority: int = PRIORITY_LIVE):
+        # L'attesa del frame del main stream non occupa l'unico slot di inferenza
+        high_res = fetch_high_res()
+        with self._gate.slot(priority):
+            return self._engine.detect_dual(image, lambda: high_res, padding)
+
+    def ocr_cache_stats(self) -> Optional[Dict]:
+        return self._engine.ocr_cache.stats() if self._engine.ocr_cache else None
+
+
+class VisionWorker:
+    """
+    Server RPC: un thread per connessione. Ogni livestream ha un thread con il
+    proprio event loop, così una lettura bloccante di una telecamera (OpenCV,
+    ffmpeg) non ferma le altre; il loop `_loop` resta per i compiti di fondo
+    """
+
+    def __init__(self, address: str, authkey: bytes, engine: Optional[PlateEngine] = None):
+        self.address = address
+        self.authkey = authkey
+        self.engine = _SerializedEngine(engine or get_plate_engine())
+        self.monitors: Dict[str, Dict[str, Any]] = {}
+        self._monitors_lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._listener: Optional[Listener] = None
+        self._running = False
+        self._handlers: Dict[str, Callable[..., Any]] = {
+            "ping": self.ping,
+            "detect": lambda image, strict=True: self.engine.detect(image, strict, priority=PRIORITY_UPLOAD),
+            "detect_best": lambda image, strict=True: self.engine.detect_best(image, strict, priority=PRIORITY_UPLOAD),
+            "livestream_start": self.request_livestream_start,
+            "livestream_stop": self.request_livestream_stop,
+            "livestream_status": self.livestream_status,
+            "snapshot": lambda camera_url: get_snapshot_pool().snapshot(camera_url),
+            "snapshot_detect_best": self.snapshot_detect_best,
+        }
+        
+        # Inferenza dei livestream ripartita tra le telecamere per peso e fps minimo
+        self.scheduler: Optional[CameraScheduler] = None
+        # Candidato in ombra sui frame dei livestream (processo separato, CPU limitata)
+        self.shadow = get_shadow_evaluator()
+        if settings.CAMERA_SCHEDULER_ENABLED:
+            self.scheduler = CameraScheduler(
+                self.engine.detect,
+                max_frame_age=settings.CAMERA_SCHEDULER_MAX_FRAME_AGE_SECONDS,
+                fps_window=settings.CAMERA_SCHEDULER_FPS_WINDOW_SECONDS,
+                on_result=self.shadow.offer if self.shadow else None
+            )
+        self.camera_config = {camera["id"]: camera for camera in settings.CAMERAS}
+
+        # Con più nodi le telecamere vengono suddivise tra i worker tramite lease
+        self.camera_urls = {camera["id"]: camera["url"] for camera in settings.CAMERAS}
+        self.leases: Optional[CameraLeaseManager] = None
+        if settings.CAMERA_LEASES_ENABLED:
+            self.leases = CameraLeaseManager(
+                list(self.camera_urls),
+                on_acquire=lambda camera_id: self.start_livestream(camera_id, self.camera_urls[camera_id]),
+                on_release=self.stop_livestream,
+                lease_seconds=settings.CAMERA_LEASE_TTL_SECONDS,
+                heartbeat_seconds=settings.CAMERA_LEASE_HEARTBEAT_SECONDS
+            )
+
+    def serve_forever(self):
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+
+        threading.Thread(target=self._loop.run_forever, name="vision-background", daemon=True).start()
+        # Invalidazioni della cache targhe fatte dall'API (anche su altri nodi)
+        asyncio.run_coroutine_threadsafe(run_invalidation_sync(), self._loop)
+        if self.scheduler:
+            self.scheduler.start()
+        self._listener = Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+        self._running = True
+        logger.info(f"Worker di visione in ascolto su {self.address} (pid {os.getpid()})")
+        if self.leases:
+            self.leases.start()
+
+        try:
+            while self._running:
+                try:
+                    conn = self._listener.accept()
+                except (OSError, EOFError, AuthenticationError) as e:
+                    # Listener chiuso da shutdown() o handshake di autenticazione fallito
+                    if not self._running:
+                        break
+                    logger.warning(f"Connessione al worker di visione rifiutata: {e}")
+                    continue
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        if not self._running and self._listener is None:
+            return
+        self._running = False
+        if self.leases:
+            self.leases.stop()
+        threads = [monitor["thread"] for monitor in self.monitors.values()]
+        self.stop_livestream()
+        # Attende la chiusura dei monitoraggi (clip in corso, ultime rilevazioni accodate)
+        deadline = time.monotonic() + 10.0
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        # Scrive le rilevazioni ancora in coda
+        detection_sink.stop()
+        if self.scheduler:
+            self.scheduler.stop()
+        if self.shadow:
+            self.shadow.stop()
+        get_snapshot_pool().close()
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        logger.info("Worker di visione fermato")
+
+    def _serve_connection(self, conn: Connection):
+        with conn:
+            while True:
+                try:
+                    method, params = conn.recv()
+                except (EOFError, OSError):
+                    return
+
+                handler = self._handlers.get(method)
+                try:
+                    if handler is None:
+                        raise ValueError(f"Metodo sconosciuto: {method}")
+                    reply = ("ok", handler(**params))
+                except Overloaded as e:
+                    # Coda di inferenza piena: il client risponde 503 con Retry-After
+                    reply = ("overloaded", (str(e), e.retry_after))
+                except Exception as e:
+                    logger.error(f"Errore nel worker di visione ({method}): {e}")
+                    reply = ("error", f"{type(e).__name__}: {e}")
+
+                try:
+                    conn.send(reply)
+                except (EOFError, OSError):
+                    return
+
+    def ping(self) -> Dict:
+        return {
+            "pid": os.getpid(),
+            "livestreams": sorted(self.monitors),
+            "worker_id": self.leases.worker_id if self.leases else None,
+            "leased_cameras": sorted(self.leases.owned) if self.leases else None,
+            "ocr_cache": self.engine.ocr_cache_stats(),
+            "shadow": self.shadow.stats() if self.shadow else None,
+            "snapshots": get_snapshot_pool().stats()
+        }
+
+    def snapshot_detect_best(self, camera_url: str, strict: bool = True) -> Optional[Dict]:
+        """
+        /ai/stream: snapshot e rilevamento restano nel worker, all'API torna
+        solo il risultato e il frame non attraversa l'RPC
+        """
+        frame = get_snapshot_pool().snapshot(camera_url)
+        if frame is None:
+            return None
+        return self.engine.detect_best(frame, strict, priority=PRIORITY_UPLOAD)
+
+    def request_livestream_start(self, camera_id: str, stream_url: str, output_url: str = None) -> Dict:
+        """
+        /ai/livestream/start. Con i lease una telecamera configurata non viene
+        avviata qui: torna assegnabile e la monitora il worker che ne prende il lease
+        """
+        if self.leases and camera_id in self.camera_urls:
+            self.leases.set_stopped([camera_id], False)
+            return {
+                "camera_id": camera_id,
+                "started": camera_id in self.leases.owned,
+                "leased": True,
+                "stream_url": self.camera_urls[camera_id]
+            }
+        return self.start_livestream(camera_id, stream_url, output_url)
+
+    def request_livestream_stop(self, camera_id: str = None) -> Dict:
+        """/ai/livestream/stop: con i lease la telecamera resta ferma su tutti i worker"""
+        if self.leases:
+            self.leases.set_stopped([camera_id] if camera_id else list(self.camera_urls), True)
+        return self.stop_livestream(camera_id)
+
+    def start_livestream(self, camera_id: str, stream_url: str, output_url: str = None) -> Dict:
+        """Avvia il monitoraggio della telecamera, se non è già attivo in questo worker"""
+        from app.services.license_plate_service import LicensePlateService
+
+        with self._monitors_lock:
+            monitor = self.monitors.get(camera_id)
+            if monitor and not monitor["future"].done():
+                return {"camera_id": camera_id, "started": False, "stream_url": monitor["stream_url"]}
+            if monitor:
+                logger.warning(f"Monitoraggio {camera_id} terminato: riavvio")
+
+            if self.scheduler:
+                camera = self.camera_config.get(camera_id, {})
+                self.scheduler.register(camera_id, camera.get("weight", 1.0), camera.get("min_fps", 0.0))
+
+            db = SessionLocal()
+            service = LicensePlateService(db, engine=self.engine, camera_id=camera_id, scheduler=self.scheduler)
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_run_loop, args=(loop,), name=f"vision-camera-{camera_id}", daemon=True)
+            thread.start()
+            future = asyncio.run_coroutine_threadsafe(
+                _run_monitor(service.monitor_livestream(stream_url, output_url), db), loop
+            )
+            self.monitors[camera_id] = {
+                "service": service,
+                "future": future,
+                "thread": thread,
+                "stream_url": stream_url,
+                "output_url": output_url
+            }
+
+        logger.info(f"Livestream {camera_id} avviato nel worker di visione")
+        return {"camera_id": camera_id, "started": True, "stream_url": stream_url}
+
+    def stop_livestream(self, camera_id: str = None) -> Dict:
+        """Ferma il monitoraggio di una telecamera (o di tutte se camera_id è None)"""
+        with self._monitors_lock:
+            camera_ids = [camera_id] if camera_id else list(self.monitors)
+            stopped = []
+            for current_id in camera_ids:
+                monitor = self.monitors.pop(current_id, None)
+                if not monitor:
+                    continue
+                monitor["service"].stop_livestream_monitoring()
+                monitor["future"].cancel()
+                if self.scheduler:
+                    self.scheduler.unregister(current_id)
+                stopped.append(current_id)
+        return {"stopped": stopped}
+
+    def livestream_status(self, camera_id: str = None) -> Dict:
+        with self._monitors_lock:
+            monitors = {
+                current_id: monitor for current_id, monitor in self.monitors.items()
+                if camera_id is None or current_id == camera_id
+            }
+            scheduling = self.scheduler.stats() if self.scheduler else {}
+            return {
+                current_id: {
+                    "is_streaming": monitor["service"].is_streaming,
+                    "is_task_running": not monitor["future"].done(),
+                    "stream_url": monitor["stream_url"],
+                    "scheduling": scheduling.get(current_id),
+                    "decode": monitor["service"].decode_status(),
+                    "dual_stream": monitor["service"].main_stream.stats() if monitor["service"].main_stream else None,
+                    "motion": monitor["service"].motion_gate.stats() if monitor["service"].motion_gate else None
+                }
+                for current_id, monitor in monitors.items()
+            }
+
+
+def _run_loop(loop: asyncio.AbstractEventLoop):
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_forever()
+        loop.run_until_complete(loop.shutdown_default_executor())
+    finally:
+        loop.close()
+
+
+async def _run_monitor(monitor, db):
+    """Esegue il monitoraggio e ferma il loop della telecamera quando termina (anche se annullato)"""
+    try:
+        await monitor
+    finally:
+        db.close()
+        asyncio.get_running_loop().call_soon(asyncio.get_running_loop().stop)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if not settings.VISION_WORKER_SOCKET:
+        raise SystemExit("VISION_WORKER_SOCKET non configurato")
+
+    worker = VisionWorker(settings.VISION_WORKER_SOCKET, vision_authkey())
+    signal.signal(signal.SIGTERM, lambda *_: worker.shutdown())
+    worker.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
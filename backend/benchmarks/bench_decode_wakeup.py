@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Benchmark del risveglio della decodifica ffmpeg: da modo ridotto a "full".
+
+Apre lo stream in modo ridotto (keyframes o lowres), poi ripete il passaggio
+a "full" e ritorno misurando quanto tempo passa da set_mode al primo frame
+del nuovo processo (handshake RTSP + attesa del keyframe). Durante l'attesa
+continuano ad arrivare i frame del modo precedente: viene contato anche
+quanti ne sono stati letti.
+
+Uso: python benchmarks/bench_decode_wakeup.py rtsp://... [--idle-mode keyframes] [--runs 5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.ffmpeg_capture import FFmpegCapture, MODE_FULL, MODE_KEYFRAMES, MODE_LOWRES, ffmpeg_version
+
+
+def _switch(capture: FFmpegCapture, mode: str, timeout: float) -> tuple:
+    """(secondi fino al primo frame del nuovo modo, frame letti nel frattempo), o None se scade"""
+    started = time.monotonic()
+    capture.set_mode(mode)
+    frames = 0
+    while not capture.poll_switch():
+        if time.monotonic() - started > timeout:
+            return None
+        ok, _ = capture.read()
+        if ok:
+            frames += 1
+    return time.monotonic() - started, frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("url")
+    parser.add_argument("--idle-mode", choices=[MODE_KEYFRAMES, MODE_LOWRES], default=MODE_KEYFRAMES)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--ffmpeg", default="ffmpeg")
+    parser.add_argument("--timeout", type=float, default=15.0)
+    args = parser.parse_args()
+
+    print(f"ffmpeg {'.'.join(map(str, ffmpeg_version(args.ffmpeg)))}")
+    capture = FFmpegCapture(args.url, mode=args.idle_mode, ffmpeg_path=args.ffmpeg)
+    if not capture.open():
+        sys.exit(f"Impossibile aprire {args.url}")
+    try:
+        wakeups = []
+        for run in range(args.runs):
+            result = _switch(capture, MODE_FULL, args.timeout)
+            if result is None:
+                print(f"run {run + 1}: nessun frame in {args.timeout:.0f}s")
+                continue
+            seconds, frames = result
+            wakeups.append(seconds)
+            print(f"run {run + 1}: {args.idle_mode} -> full in {seconds * 1000:.0f} ms ({frames} frame {args.idle_mode} nel frattempo)")
+            _switch(capture, args.idle_mode, args.timeout)
+        if wakeups:
+            print(f"risveglio: mediana {statistics.median(wakeups) * 1000:.0f} ms, massimo {max(wakeups) * 1000:.0f} ms")
+    finally:
+        capture.release()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Benchmark del trasporto frame tra processi: cattura -> inferenza -> encoder.
+
+Confronta il passaggio dei frame numpy tramite multiprocessing.Queue (pickle)
+con l'anello di slot in memoria condivisa (FrameRing), dove tra i processi
+viaggia solo l'indice dello slot.
+
+Le copie per frame sono misurate con tracemalloc: ogni stadio azzera il picco
+di memoria prima di ricevere il frame e conta quanti buffer grandi quanto un
+frame sono stati allocati per gestirlo.
+
+Uso: python benchmarks/bench_frame_transport.py [--frames 300] [--width 1920] [--height 1080]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.frame_ring import FrameRing
+
+PLATE_BBOX = (800, 600, 240, 60)
+
+
+def _frame_copies(frame_bytes: int) -> int:
+    """Numero di buffer di dimensione frame allocati dall'ultimo reset del picco"""
+    current, peak = tracemalloc.get_traced_memory()
+    return int(round(max(0, peak - current) / frame_bytes))
+
+
+def _capture_frame(frame: np.ndarray, index: int):
+    # Simula la decodifica scrivendo nel buffer di destinazione
+    frame[::64, ::64] = index % 255
+
+
+# --- Trasporto con pickle (multiprocessing.Queue) ---
+
+def _queue_inference(in_queue, out_queue, frame_bytes, results):
+    tracemalloc.start()
+    copies = 0
+    while True:
+        tracemalloc.reset_peak()
+        frame = in_queue.get()
+        if frame is None:
+            break
+        x, y, w, h = PLATE_BBOX
+        crop = frame[y:y + h, x:x + w]
+        crop.mean()
+        out_queue.put(frame)
+        copies += _frame_copies(frame_bytes)
+        del frame, crop
+    out_queue.put(None)
+    results.put(("inference", copies))
+
+
+def _queue_encoder(in_queue, frame_bytes, results):
+    tracemalloc.start()
+    copies = 0
+    frames = 0
+    while True:
+        tracemalloc.reset_peak()
+        frame = in_queue.get()
+        if frame is None:
+            break
+        frame[::32, ::32].sum()
+        copies += _frame_copies(frame_bytes)
+        frames += 1
+        del frame
+    results.put(("encoder", copies))
+    results.put(("frames", frames))
+
+
+def run_queue(frames: int, shape) -> dict:
+    frame_bytes = int(np.prod(shape))
+    capture_to_inference = multiprocessing.Queue(maxsize=4)
+    inference_to_encoder = multiprocessing.Queue(maxsize=4)
+    results = multiprocessing.Queue()
+
+    workers = [
+        multiprocessing.Process(target=_queue_inference, args=(capture_to_inference, inference_to_encoder, frame_bytes, results)),
+        multiprocessing.Process(target=_queue_encoder, args=(inference_to_encoder, frame_bytes, results)),
+    ]
+    for worker in workers:
+        worker.start()
+
+    tracemalloc.start()
+    capture_copies = 0
+    started = time.perf_counter()
+    for index in range(frames):
+        tracemalloc.reset_peak()
+        # Con la coda ogni frame catturato richiede un nuovo buffer
+        frame = np.empty(shape, dtype=np.uint8)
+        _capture_frame(frame, index)
+        capture_to_inference.put(frame)
+        del frame
+        capture_copies += _frame_copies(frame_bytes)
+    capture_to_inference.put(None)
+
+    stats = dict(results.get() for _ in range(3))
+    elapsed = time.perf_counter() - started
+    for worker in workers:
+        worker.join()
+    tracemalloc.stop()
+
+    stats["capture"] = capture_copies
+    return {"elapsed": elapsed, **stats}
+
+
+# --- Trasporto con anello in memoria condivisa ---
+
+def _ring_inference(ring, in_queue, out_queue, results):
+    tracemalloc.start()
+    copies = 0
+    while True:
+        tracemalloc.reset_peak()
+        slot = in_queue.get()
+        if slot is None:
+            break
+        crop = ring.crop(slot, PLATE_BBOX)
+        crop.mean()
+        out_queue.put(slot)
+        copies += _frame_copies(ring.frame_bytes)
+        del crop
+    out_queue.put(None)
+    results.put(("inference", copies))
+    ring.close()
+
+
+def _ring_encoder(ring, in_queue, results):
+    tracemalloc.start()
+    copies = 0
+    frames = 0
+    while True:
+        tracemalloc.reset_peak()
+        slot = in_queue.get()
+        if slot is None:
+            break
+        frame = ring.frame(slot)
+        frame[::32, ::32].sum()
+        ring.release(slot)
+        copies += _frame_copies(ring.frame_bytes)
+        frames += 1
+        del frame
+    results.put(("encoder", copies))
+    results.put(("frames", frames))
+    ring.close()
+
+
+def run_ring(frames: int, shape) -> dict:
+    ring = FrameRing(8, shape)
+    capture_to_inference = multiprocessing.Queue(maxsize=4)
+    inference_to_encoder = multiprocessing.Queue(maxsize=4)
+    results = multiprocessing.Queue()
+
+    workers = [
+        multiprocessing.Process(target=_ring_inference, args=(ring, capture_to_inference, inference_to_encoder, results)),
+        multiprocessing.Process(target=_ring_encoder, args=(ring, inference_to_encoder, results)),
+    ]
+    for worker in workers:
+        worker.start()
+
+    tracemalloc.start()
+    capture_copies = 0
+    started = time.perf_counter()
+    for index in range(frames):
+        tracemalloc.reset_peak()
+        slot = ring.acquire()
+        while slot is None:
+            time.sleep(0.0005)
+            slot = ring.acquire()
+        _capture_frame(ring.frame(slot), index)
+        capture_to_inference.put(slot)
+        capture_copies += _frame_copies(ring.frame_bytes)
+    capture_to_inference.put(None)
+
+    stats = dict(results.get() for _ in range(3))
+    elapsed = time.perf_counter() - started
+    for worker in workers:
+        worker.join()
+    tracemalloc.stop()
+    ring.close()
+
+    stats["capture"] = capture_copies
+    return {"elapsed": elapsed, **stats}
+
+
+def _report(name: str, stats: dict, frames: int):
+    copies = stats["capture"] + stats["inference"] + stats["encoder"]
+    print(
+        f"{name:<14} {frames / stats['elapsed']:>8.1f} fps   "
+        f"copie/frame: {copies / frames:.2f} "
+        f"(cattura {stats['capture'] / frames:.2f}, inferenza {stats['inference'] / frames:.2f}, "
+        f"encoder {stats['encoder'] / frames:.2f})"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    args = parser.parse_args()
+
+    shape = (args.height, args.width, 3)
+    print(f"{args.frames} frame {args.width}x{args.height}, pipeline cattura -> inferenza -> encoder")
+    _report("queue (pickle)", run_queue(args.frames, shape), args.frames)
+    _report("FrameRing", run_ring(args.frames, shape), args.frames)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,11 +9,13 @@
 
 -- Create extensions
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
 -- Create enum types
 CREATE TYPE user_role AS ENUM ('admin', 'manager', 'mechanic', 'receptionist');
 CREATE TYPE appointment_status AS ENUM ('scheduled', 'confirmed', 'in_progress', 'completed', 'cancelled');
 CREATE TYPE invoice_status AS ENUM ('draft', 'sent', 'paid', 'overdue', 'cancelled');
+CREATE TYPE job_status AS ENUM ('queued', 'running', 'succeeded', 'failed', 'cancelled');
 
 -- Create tables
 CREATE TABLE IF NOT EXISTS users (
@@ -102,16 +104,70 @@ CREATE TABLE IF NOT EXISTS invoices (
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Partizionata per mese (UTC) su detected_at: partizioni future e retention
+-- gestite dal job ai.maintain_detection_storage
 CREATE TABLE IF NOT EXISTS ai_detections (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     license_plate VARCHAR(20) NOT NULL,
     confidence DECIMAL(5,4) NOT NULL,
     image_path VARCHAR(500),
     processed BOOLEAN DEFAULT FALSE,
     vehicle_id INTEGER REFERENCES vehicles(id) ON DELETE SET NULL,
-    detected_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    detection_data JSONB,
+    is_automatic BOOLEAN DEFAULT FALSE,
+    source VARCHAR(100),
+    event_id VARCHAR(64),
+    clip_path VARCHAR(500),
+    detected_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, detected_at)
+) PARTITION BY RANGE (detected_at);
+
+CREATE TABLE IF NOT EXISTS ai_detections_default PARTITION OF ai_detections DEFAULT;
+
+DO $$
+DECLARE
+    month TIMESTAMP WITH TIME ZONE;
+BEGIN
+    FOR month IN
+        SELECT generate_series(
+            date_trunc('month', now() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+            date_trunc('month', now() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' + interval '2 months',
+            interval '1 month'
+        )
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF ai_detections FOR VALUES FROM (%L) TO (%L)',
+            'ai_detections_p' || to_char(month AT TIME ZONE 'UTC', 'YYYYMM'),
+            month,
+            month + interval '1 month'
+        );
+    END LOOP;
+END $$;
+
+-- Chiavi di idempotenza degli eventi acquisiti (unicità di event_id tra le partizioni)
+CREATE TABLE IF NOT EXISTS ai_detection_event_keys (
+    event_id VARCHAR(64) PRIMARY KEY,
+    detected_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+-- Rollup orari letti dalle statistiche al posto delle righe grezze
+CREATE TABLE IF NOT EXISTS ai_detection_rollups_hourly (
+    bucket TIMESTAMP WITH TIME ZONE NOT NULL,
+    camera_id VARCHAR(100) NOT NULL,
+    vehicle_found BOOLEAN NOT NULL,
+    detections INTEGER NOT NULL DEFAULT 0,
+    processed INTEGER NOT NULL DEFAULT 0,
+    with_appointments INTEGER NOT NULL DEFAULT 0,
+    confidence_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, camera_id, vehicle_found)
+);
+
+-- Ore aggregate da ricalcolare al prossimo rollup (rilevazioni modificate dopo l'aggregazione)
+CREATE TABLE IF NOT EXISTS ai_detection_rollup_dirty_hours (
+    bucket TIMESTAMP WITH TIME ZONE PRIMARY KEY,
+    marked_at TIMESTAMP WITH TIME ZONE NOT NULL
 );
 
 CREATE TABLE IF NOT EXISTS audit_logs (
@@ -125,6 +181,53 @@ CREATE TABLE IF NOT EXISTS audit_logs (
     timestamp TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+CREATE TABLE IF NOT EXISTS vision_workers (
+    worker_id VARCHAR(255) PRIMARY KEY,
+    hostname VARCHAR(255),
+    started_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    heartbeat_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS camera_leases (
+    camera_id VARCHAR(100) PRIMARY KEY,
+    worker_id VARCHAR(255),
+    lease_expires_at TIMESTAMP WITH TIME ZONE,
+    acquired_at TIMESTAMP WITH TIME ZONE,
+    stopped BOOLEAN NOT NULL DEFAULT FALSE,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS plate_cache_invalidations (
+    id SERIAL PRIMARY KEY,
+    kind VARCHAR(20) NOT NULL,
+    key VARCHAR(100) NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id SERIAL PRIMARY KEY,
+    queue VARCHAR(100) NOT NULL DEFAULT 'default',
+    job_type VARCHAR(100) NOT NULL,
+    payload JSONB,
+    status job_status NOT NULL DEFAULT 'queued',
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    run_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_by VARCHAR(255),
+    heartbeat_at TIMESTAMP WITH TIME ZONE,
+    cancel_requested BOOLEAN NOT NULL DEFAULT FALSE,
+    progress DOUBLE PRECISION NOT NULL DEFAULT 0,
+    progress_message VARCHAR(500),
+    result JSONB,
+    checkpoint JSONB,
+    error TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP WITH TIME ZONE,
+    finished_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Create indexes for better performance
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
 CREATE INDEX IF NOT EXISTS idx_customers_email ON customers(email);
@@ -132,15 +235,38 @@ CREATE INDEX IF NOT EXISTS idx_vehicles_license_plate ON vehicles(license_plate)
 CREATE INDEX IF NOT EXISTS idx_vehicles_customer_id ON vehicles(customer_id);
 CREATE INDEX IF NOT EXISTS idx_appointments_customer_id ON appointments(customer_id);
 CREATE INDEX IF NOT EXISTS idx_appointments_vehicle_id ON appointments(vehicle_id);
-CREATE INDEX IF NOT EXISTS idx_appointments_date ON appointments(appointment_date);
+CREATE INDEX IF NOT EXISTS idx_appointments_date_id ON appointments(appointment_date, id);
 CREATE INDEX IF NOT EXISTS idx_appointments_status ON appointments(status);
 CREATE INDEX IF NOT EXISTS idx_checkins_vehicle_id ON checkins(vehicle_id);
-CREATE INDEX IF NOT EXISTS idx_checkins_checkin_time ON checkins(checkin_time);
+CREATE INDEX IF NOT EXISTS idx_checkins_checkin_time_id ON checkins(checkin_time, id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_checkins_open_vehicle ON checkins(vehicle_id) WHERE checkout_time IS NULL;
 CREATE INDEX IF NOT EXISTS idx_invoices_customer_id ON invoices(customer_id);
 CREATE INDEX IF NOT EXISTS idx_invoices_status ON invoices(status);
 CREATE INDEX IF NOT EXISTS idx_ai_detections_license_plate ON ai_detections(license_plate);
 CREATE INDEX IF NOT EXISTS idx_ai_detections_processed ON ai_detections(processed);
+CREATE INDEX IF NOT EXISTS idx_ai_detections_created_at ON ai_detections(created_at);
+CREATE INDEX IF NOT EXISTS idx_ai_detections_detected_at_id ON ai_detections(detected_at, id);
+CREATE INDEX IF NOT EXISTS idx_ai_detections_event_id ON ai_detections(event_id);
+CREATE INDEX IF NOT EXISTS idx_ai_detection_event_keys_detected_at ON ai_detection_event_keys(detected_at);
 CREATE INDEX IF NOT EXISTS idx_audit_logs_timestamp ON audit_logs(timestamp);
+CREATE INDEX IF NOT EXISTS idx_camera_leases_worker_id ON camera_leases(worker_id);
+CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs(queue, priority DESC, run_at, id) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS idx_jobs_running_heartbeat ON jobs(heartbeat_at) WHERE status = 'running';
+CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs(created_at);
+
+-- Ricerca testuale: trigrammi per sottostringa, prefisso su targa e telefono normalizzati
+CREATE INDEX IF NOT EXISTS idx_customers_full_name_trgm ON customers USING gin (full_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_customers_email_trgm ON customers USING gin (email gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_customers_phone_trgm ON customers USING gin (phone gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_vehicles_license_plate_trgm ON vehicles USING gin (license_plate gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_vehicles_brand_trgm ON vehicles USING gin (brand gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_vehicles_model_trgm ON vehicles USING gin (model gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_vehicles_vin_trgm ON vehicles USING gin (vin gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_services_name_trgm ON services USING gin (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_services_description_trgm ON services USING gin (description gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_services_category_trgm ON services USING gin (category gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_vehicles_plate_prefix ON vehicles ((regexp_replace(upper(license_plate), '[^A-Z0-9]', '', 'g')) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_customers_phone_prefix ON customers ((regexp_replace(phone, '^(\+|00)39|\D', '', 'g')) text_pattern_ops);
 
 -- Insert sample data
 
@@ -0,0 +1,21 @@
+-- Migrazione per l'assegnazione delle telecamere ai worker di visione
+-- Data: 2026-10-19
+
+-- Worker di visione attivi (heartbeat periodico)
+CREATE TABLE IF NOT EXISTS vision_workers (
+    worker_id VARCHAR(255) PRIMARY KEY,
+    hostname VARCHAR(255),
+    started_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    heartbeat_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+-- Una riga per telecamera: il worker che la monitora e la scadenza del lease
+CREATE TABLE IF NOT EXISTS camera_leases (
+    camera_id VARCHAR(100) PRIMARY KEY,
+    worker_id VARCHAR(255),
+    lease_expires_at TIMESTAMP WITH TIME ZONE,
+    acquired_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_camera_leases_worker_id ON camera_leases(worker_id);
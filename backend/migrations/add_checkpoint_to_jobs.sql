@@ -0,0 +1,6 @@
+-- Migrazione per i job ripresi da un checkpoint (es. rielaborazione dell'archivio targhe)
+-- Data: 2026-10-19
+
+-- Stato salvato dall'handler: un nuovo tentativo riparte da qui invece che dall'inizio
+ALTER TABLE jobs
+ADD COLUMN IF NOT EXISTS checkpoint JSONB;
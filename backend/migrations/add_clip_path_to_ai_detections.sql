@@ -0,0 +1,6 @@
+-- Migrazione per le clip degli eventi dal buffer di pre-roll
+-- Data: 2026-10-19
+
+-- Percorso della clip (pre-roll + post-roll) collegata alla rilevazione
+ALTER TABLE ai_detections
+ADD COLUMN IF NOT EXISTS clip_path VARCHAR(500);
@@ -0,0 +1,12 @@
+-- Migrazione per salvare i dati strutturati delle rilevazioni AI
+-- Data: 2026-10-19
+
+-- Risultato completo della rilevazione (veicolo, cliente, appuntamenti, bbox)
+ALTER TABLE ai_detections
+ADD COLUMN IF NOT EXISTS detection_data JSONB,
+ADD COLUMN IF NOT EXISTS is_automatic BOOLEAN DEFAULT FALSE,
+ADD COLUMN IF NOT EXISTS source VARCHAR(100);
+
+-- Le rilevazioni recenti vengono lette in ordine di creazione
+CREATE INDEX IF NOT EXISTS idx_ai_detections_created_at ON ai_detections(created_at);
+CREATE INDEX IF NOT EXISTS idx_ai_detections_detected_at ON ai_detections(detected_at);
@@ -0,0 +1,8 @@
+-- Migrazione per l'acquisizione a lotti degli eventi targa (edge agent, telecamere ANPR)
+-- Data: 2026-10-19
+
+-- Chiave di idempotenza: un evento reinviato non crea una seconda rilevazione
+ALTER TABLE ai_detections
+ADD COLUMN IF NOT EXISTS event_id VARCHAR(64);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_ai_detections_event_id ON ai_detections(event_id);
@@ -0,0 +1,36 @@
+-- Migrazione per la coda di job persistente (video, rilevamenti in blocco, export, promemoria)
+-- Data: 2026-10-19
+
+DO $$ BEGIN
+    CREATE TYPE job_status AS ENUM ('queued', 'running', 'succeeded', 'failed', 'cancelled');
+EXCEPTION
+    WHEN duplicate_object THEN NULL;
+END $$;
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id SERIAL PRIMARY KEY,
+    queue VARCHAR(100) NOT NULL DEFAULT 'default',
+    job_type VARCHAR(100) NOT NULL,
+    payload JSONB,
+    status job_status NOT NULL DEFAULT 'queued',
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    run_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_by VARCHAR(255),
+    heartbeat_at TIMESTAMP WITH TIME ZONE,
+    cancel_requested BOOLEAN NOT NULL DEFAULT FALSE,
+    progress DOUBLE PRECISION NOT NULL DEFAULT 0,
+    progress_message VARCHAR(500),
+    result JSONB,
+    error TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP WITH TIME ZONE,
+    finished_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- I worker prelevano il prossimo job in coda con FOR UPDATE SKIP LOCKED
+CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs(queue, priority DESC, run_at, id) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS idx_jobs_running_heartbeat ON jobs(heartbeat_at) WHERE status = 'running';
+CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs(created_at);
@@ -0,0 +1,19 @@
+-- Migrazione per la paginazione a cursore delle liste (appuntamenti, check-in, rilevazioni)
+-- Data: 2026-10-19
+--
+-- Le liste sono ordinate per (data, id) e la pagina successiva parte da un
+-- confronto su tupla: l'indice composto la legge come un'unica scansione.
+-- Sostituisce gli indici sulla sola data, di cui copre anche gli usi.
+
+BEGIN;
+
+CREATE INDEX IF NOT EXISTS idx_appointments_date_id ON appointments(appointment_date, id);
+DROP INDEX IF EXISTS idx_appointments_date;
+
+CREATE INDEX IF NOT EXISTS idx_checkins_checkin_time_id ON checkins(checkin_time, id);
+DROP INDEX IF EXISTS idx_checkins_checkin_time;
+
+CREATE INDEX IF NOT EXISTS idx_ai_detections_detected_at_id ON ai_detections(detected_at, id);
+DROP INDEX IF EXISTS idx_ai_detections_detected_at;
+
+COMMIT;
@@ -0,0 +1,27 @@
+-- Migrazione per l'indice unico sui check-in aperti
+-- Data: 2026-10-19
+--
+-- Il check-in automatico (worker di visione su più nodi, ingest degli edge
+-- agent) e i check-in manuali scrivono da processi diversi: l'indice impedisce
+-- due check-in aperti per lo stesso veicolo. I duplicati già presenti vengono
+-- chiusi all'orario di apertura del check-in più recente, che resta aperto.
+
+BEGIN;
+
+WITH ranked AS (
+    SELECT
+        id,
+        first_value(checkin_time) OVER w AS latest_checkin,
+        row_number() OVER w AS position
+    FROM checkins
+    WHERE checkout_time IS NULL
+    WINDOW w AS (PARTITION BY vehicle_id ORDER BY checkin_time DESC, id DESC)
+)
+UPDATE checkins
+SET checkout_time = ranked.latest_checkin
+FROM ranked
+WHERE checkins.id = ranked.id AND ranked.position > 1;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_checkins_open_vehicle ON checkins(vehicle_id) WHERE checkout_time IS NULL;
+
+COMMIT;
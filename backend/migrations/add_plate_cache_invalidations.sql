@@ -0,0 +1,13 @@
+-- Migrazione per le invalidazioni condivise della cache targhe
+-- Data: 2026-10-19
+--
+-- Ogni processo (worker API, worker di visione, anche su altri nodi) ha la
+-- propria cache targhe: le modifiche a veicoli, clienti e appuntamenti vengono
+-- registrate qui e applicate da tutti i processi ogni PLATE_CACHE_SYNC_SECONDS.
+
+CREATE TABLE IF NOT EXISTS plate_cache_invalidations (
+    id SERIAL PRIMARY KEY,
+    kind VARCHAR(20) NOT NULL,
+    key VARCHAR(100) NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,11 @@
+-- Migrazione per le ore dei rollup da ricalcolare
+-- Data: 2026-10-19
+--
+-- Il rollup orario ricalcola solo le ultime DETECTION_ROLLUP_LOOKBACK_HOURS ore:
+-- backfill del riconoscimento, modifiche via PUT /ai/{id} ed eventi acquisiti in
+-- ritardo segnano qui le ore già aggregate che vanno ricalcolate.
+
+CREATE TABLE IF NOT EXISTS ai_detection_rollup_dirty_hours (
+    bucket TIMESTAMP WITH TIME ZONE PRIMARY KEY,
+    marked_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
@@ -0,0 +1,7 @@
+-- Migrazione per fermare le telecamere su tutti i worker di visione
+-- Data: 2026-10-19
+--
+-- Una telecamera fermata da /ai/livestream/stop perde il lease e non viene
+-- riassegnata finché /ai/livestream/start non la riavvia.
+
+ALTER TABLE camera_leases ADD COLUMN IF NOT EXISTS stopped BOOLEAN NOT NULL DEFAULT FALSE;
@@ -0,0 +1,31 @@
+-- Migrazione per la ricerca testuale indicizzata di clienti, veicoli e servizi
+-- Data: 2026-10-19
+--
+-- Indici GIN a trigrammi (pg_trgm) per la ricerca per sottostringa (ILIKE '%q%')
+-- e indici btree per prefisso su targa e telefono normalizzati. Le espressioni
+-- degli indici per prefisso devono restare identiche a quelle di text_search.
+
+BEGIN;
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Un indice per colonna: le condizioni in OR diventano un BitmapOr di scansioni
+-- selettive (un indice GIN multicolonna viene stimato come scansione completa)
+CREATE INDEX IF NOT EXISTS idx_customers_full_name_trgm ON customers USING gin (full_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_customers_email_trgm ON customers USING gin (email gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_customers_phone_trgm ON customers USING gin (phone gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_vehicles_license_plate_trgm ON vehicles USING gin (license_plate gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_vehicles_brand_trgm ON vehicles USING gin (brand gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_vehicles_model_trgm ON vehicles USING gin (model gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_vehicles_vin_trgm ON vehicles USING gin (vin gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_services_name_trgm ON services USING gin (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_services_description_trgm ON services USING gin (description gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_services_category_trgm ON services USING gin (category gin_trgm_ops);
+
+-- Targa in maiuscolo senza separatori, telefono senza prefisso +39/0039 e separatori
+CREATE INDEX IF NOT EXISTS idx_vehicles_plate_prefix ON vehicles
+    ((regexp_replace(upper(license_plate), '[^A-Z0-9]', '', 'g')) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_customers_phone_prefix ON customers
+    ((regexp_replace(phone, '^(\+|00)39|\D', '', 'g')) text_pattern_ops);
+
+COMMIT;
@@ -0,0 +1,107 @@
+-- Migrazione per il partizionamento mensile di ai_detections, la retention e i rollup orari
+-- Data: 2026-10-19
+--
+-- ai_detections diventa una tabella partizionata per intervallo su detected_at
+-- (una partizione per mese UTC, ai_detections_pAAAAMM, più una partizione di
+-- default). Le partizioni dei mesi futuri e la retention sono gestite dal job
+-- ai.maintain_detection_storage. Da eseguire a servizi fermi: le righe esistenti
+-- vengono copiate nella nuova tabella.
+
+BEGIN;
+
+-- Chiavi di idempotenza degli eventi acquisiti: una tabella partizionata non
+-- ammette un indice unico sul solo event_id
+CREATE TABLE IF NOT EXISTS ai_detection_event_keys (
+    event_id VARCHAR(64) PRIMARY KEY,
+    detected_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS ai_detection_rollups_hourly (
+    bucket TIMESTAMP WITH TIME ZONE NOT NULL,
+    camera_id VARCHAR(100) NOT NULL,
+    vehicle_found BOOLEAN NOT NULL,
+    detections INTEGER NOT NULL DEFAULT 0,
+    processed INTEGER NOT NULL DEFAULT 0,
+    with_appointments INTEGER NOT NULL DEFAULT 0,
+    confidence_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, camera_id, vehicle_found)
+);
+
+ALTER TABLE ai_detections RENAME TO ai_detections_unpartitioned;
+ALTER TABLE ai_detections_unpartitioned RENAME CONSTRAINT ai_detections_pkey TO ai_detections_unpartitioned_pkey;
+ALTER TABLE ai_detections_unpartitioned RENAME CONSTRAINT ai_detections_vehicle_id_fkey TO ai_detections_unpartitioned_vehicle_id_fkey;
+ALTER SEQUENCE ai_detections_id_seq OWNED BY NONE;
+
+CREATE TABLE ai_detections (
+    id INTEGER NOT NULL DEFAULT nextval('ai_detections_id_seq'),
+    license_plate VARCHAR(20) NOT NULL,
+    confidence DECIMAL(5,4) NOT NULL,
+    image_path VARCHAR(500),
+    processed BOOLEAN DEFAULT FALSE,
+    vehicle_id INTEGER REFERENCES vehicles(id) ON DELETE SET NULL,
+    detection_data JSONB,
+    is_automatic BOOLEAN DEFAULT FALSE,
+    source VARCHAR(100),
+    event_id VARCHAR(64),
+    clip_path VARCHAR(500),
+    detected_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, detected_at)
+) PARTITION BY RANGE (detected_at);
+
+ALTER SEQUENCE ai_detections_id_seq OWNED BY ai_detections.id;
+
+CREATE TABLE ai_detections_default PARTITION OF ai_detections DEFAULT;
+
+-- Una partizione per ogni mese dei dati esistenti, fino a due mesi in avanti
+DO $$
+DECLARE
+    month TIMESTAMP WITH TIME ZONE;
+BEGIN
+    FOR month IN
+        SELECT generate_series(
+            date_trunc('month', COALESCE(min(COALESCE(detected_at, created_at)), now()) AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+            date_trunc('month', now() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' + interval '2 months',
+            interval '1 month'
+        )
+        FROM ai_detections_unpartitioned
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF ai_detections FOR VALUES FROM (%L) TO (%L)',
+            'ai_detections_p' || to_char(month AT TIME ZONE 'UTC', 'YYYYMM'),
+            month,
+            month + interval '1 month'
+        );
+    END LOOP;
+END $$;
+
+INSERT INTO ai_detections (
+    id, license_plate, confidence, image_path, processed, vehicle_id, detection_data,
+    is_automatic, source, event_id, clip_path, detected_at, created_at, updated_at
+)
+SELECT
+    id, license_plate, confidence, image_path, processed, vehicle_id, detection_data,
+    is_automatic, source, event_id, clip_path, COALESCE(detected_at, created_at, now()), created_at, updated_at
+FROM ai_detections_unpartitioned;
+
+INSERT INTO ai_detection_event_keys (event_id, detected_at)
+SELECT event_id, COALESCE(detected_at, created_at, now())
+FROM ai_detections_unpartitioned
+WHERE event_id IS NOT NULL
+ON CONFLICT (event_id) DO NOTHING;
+
+DROP TABLE ai_detections_unpartitioned;
+
+-- Indici sulla tabella padre: creati su ogni partizione, anche su quelle future
+CREATE INDEX IF NOT EXISTS idx_ai_detections_license_plate ON ai_detections(license_plate);
+CREATE INDEX IF NOT EXISTS idx_ai_detections_processed ON ai_detections(processed);
+CREATE INDEX IF NOT EXISTS idx_ai_detections_created_at ON ai_detections(created_at);
+CREATE INDEX IF NOT EXISTS idx_ai_detections_detected_at ON ai_detections(detected_at);
+CREATE INDEX IF NOT EXISTS idx_ai_detections_event_id ON ai_detections(event_id);
+CREATE INDEX IF NOT EXISTS idx_ai_detection_event_keys_detected_at ON ai_detection_event_keys(detected_at);
+
+-- Il trigger di updated_at è stato eliminato con la vecchia tabella
+CREATE TRIGGER update_ai_detections_updated_at BEFORE UPDATE ON ai_detections FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+COMMIT;
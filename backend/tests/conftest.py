@@ -0,0 +1,72 @@
+"""
+Fixture comuni: database SQLite su file per ogni test (più sessioni vedono le
+stesse righe, come su Postgres) e, se TEST_DATABASE_URL punta a un Postgres
+di prova, lo stesso schema su Postgres per i test che ne dipendono
+(SKIP LOCKED, pg_trgm, partizioni). Il Postgres indicato viene svuotato.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base, Customer, Vehicle
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    yield session
+    session.close()
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def any_session_factory(request):
+    """Lo stesso test su SQLite e, se configurato, su Postgres"""
+    return request.getfixturevalue("session_factory" if request.param == "sqlite" else "pg_session_factory")
+
+
+@pytest.fixture
+def pg_session_factory():
+    url = os.environ.get("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL non impostato: test solo Postgres")
+    engine = create_engine(url)
+    with engine.begin() as connection:
+        # Come migrations/add_trigram_search.sql: la ricerca testuale usa pg_trgm se installata
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    yield sessionmaker(bind=engine, autocommit=False, autoflush=False)
+    Base.metadata.drop_all(engine)
+    engine.dispose()
+
+
+def add_vehicle(db, license_plate: str = "AB123CD") -> Vehicle:
+    customer = Customer(full_name="Mario Rossi", email=f"{license_plate.lower()}@example.com", phone="3331234567")
+    db.add(customer)
+    db.flush()
+    vehicle = Vehicle(
+        license_plate=license_plate, brand="Fiat", model="Panda", year=2020, color="bianco", customer_id=customer.id
+    )
+    db.add(vehicle)
+    db.commit()
+    return vehicle
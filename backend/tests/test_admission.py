@@ -0,0 +1,78 @@
+import threading
+import time
+
+import pytest
+
+from app.core.admission import PRIORITY_LIVE, PRIORITY_UPLOAD, InferenceGate, Overloaded
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condizione non raggiunta")
+        time.sleep(0.001)
+
+
+def waiting(gate, priority, order):
+    """Thread in coda sul gate: registra l'ordine in cui ottiene lo slot e lo rilascia subito"""
+    def run():
+        with gate.slot(priority):
+            order.append(priority)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_live_served_before_earlier_uploads():
+    gate = InferenceGate(slots=1, reserved_live=0)
+    order = []
+    gate.acquire(PRIORITY_UPLOAD)
+    threads = [waiting(gate, PRIORITY_UPLOAD, order)]
+    wait_until(lambda: gate.stats()["waiting_uploads"] == 1)
+    threads.append(waiting(gate, PRIORITY_LIVE, order))
+    wait_until(lambda: gate.stats()["waiting_live"] == 1)
+
+    gate.release(PRIORITY_UPLOAD)
+    for thread in threads:
+        thread.join(5)
+
+    assert order == [PRIORITY_LIVE, PRIORITY_UPLOAD]
+    assert gate.stats()["busy"] == 0
+
+
+def test_reserved_slot_not_blocked_by_waiting_uploads():
+    gate = InferenceGate(slots=2, reserved_live=1)
+    order = []
+    gate.acquire(PRIORITY_UPLOAD)
+    upload = waiting(gate, PRIORITY_UPLOAD, order)
+    wait_until(lambda: gate.stats()["waiting_uploads"] == 1)
+
+    # Lo slot riservato è libero: il livestream non aspetta il caricamento in coda
+    gate.acquire(PRIORITY_LIVE, timeout=1)
+    assert gate.stats()["busy"] == 2
+    gate.release(PRIORITY_LIVE)
+    assert order == []
+
+    gate.release(PRIORITY_UPLOAD)
+    upload.join(5)
+    assert order == [PRIORITY_UPLOAD]
+
+
+def test_upload_queue_full_and_timeout():
+    gate = InferenceGate(slots=1, reserved_live=0, max_upload_waiting=1)
+    gate.acquire(PRIORITY_UPLOAD)
+    upload = waiting(gate, PRIORITY_UPLOAD, [])
+    wait_until(lambda: gate.stats()["waiting_uploads"] == 1)
+
+    with pytest.raises(Overloaded) as rejected:
+        gate.acquire(PRIORITY_UPLOAD)
+    assert rejected.value.reason == "queue_full"
+    with pytest.raises(Overloaded):
+        gate.acquire(PRIORITY_LIVE, timeout=0.05)
+    assert gate.stats()["waiting_live"] == 0
+
+    gate.release(PRIORITY_UPLOAD)
+    upload.join(5)
+    assert gate.stats()["busy"] == 0
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import event, select
+
+from app.core.database import CheckIn
+from app.services import checkin_service
+from app.services.auto_checkin_service import AutoCheckInEngine
+from app.services.checkin_service import CheckInService
+from conftest import add_vehicle
+
+T0 = datetime(2026, 10, 1, 8, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def db(any_session_factory):
+    session = any_session_factory()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def checkin_engine(any_session_factory, monkeypatch):
+    engine = AutoCheckInEngine(any_session_factory, camera_roles={"cancello": "both"}, dedup_seconds=0, debounce_seconds=300)
+    # I check-in manuali invalidano lo stato di questo motore
+    monkeypatch.setattr(checkin_service, "auto_checkin_engine", engine)
+    return engine
+
+
+@pytest.fixture
+def checkin_reads(any_session_factory):
+    reads = []
+    bind = any_session_factory.kw["bind"]
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "checkins" in statement:
+            reads.append(statement)
+
+    event.listen(bind, "before_cursor_execute", record)
+    yield reads
+    event.remove(bind, "before_cursor_execute", record)
+
+
+def test_passes_of_a_known_vehicle_skip_the_database(db, checkin_engine, checkin_reads):
+    vehicle = add_vehicle(db)
+
+    assert checkin_engine.handle_plate_pass("cancello", vehicle.id, "AB123CD", T0) == "checkin"
+    for minutes in range(1, 5):
+        assert checkin_engine.handle_plate_pass("cancello", vehicle.id, "AB123CD", T0 + timedelta(minutes=minutes)) is None
+    assert checkin_engine.handle_plate_pass("cancello", vehicle.id, "AB123CD", T0 + timedelta(minutes=10)) == "checkout"
+    assert checkin_engine.handle_plate_pass("cancello", vehicle.id, "AB123CD", T0 + timedelta(minutes=11)) is None
+
+    assert len(checkin_reads) == 1
+    times = db.execute(select(CheckIn.checkin_time, CheckIn.checkout_time)).one()
+    assert [value.replace(tzinfo=None) for value in times] == [T0.replace(tzinfo=None), (T0 + timedelta(minutes=10)).replace(tzinfo=None)]
+
+
+def test_manual_checkout_invalidates_the_state(db, checkin_engine):
+    vehicle = add_vehicle(db)
+    assert checkin_engine.handle_plate_pass("cancello", vehicle.id, "AB123CD", T0) == "checkin"
+
+    CheckInService(db).checkout_vehicle(vehicle.id, datetime(2026, 10, 1, 8, 5))
+
+    # Senza invalidazione il motore chiuderebbe di nuovo il check-in già chiuso
+    assert checkin_engine.handle_plate_pass("cancello", vehicle.id, "AB123CD", T0 + timedelta(minutes=20)) == "checkin"
+    assert db.execute(select(CheckIn).where(CheckIn.checkout_time.is_(None))).scalar_one().is_automatic
+
+
+def test_state_outdated_by_another_process_is_reread(db, checkin_engine):
+    vehicle = add_vehicle(db)
+    assert checkin_engine.handle_plate_pass("cancello", vehicle.id, "AB123CD", T0) == "checkin"
+    assert checkin_engine.handle_plate_pass("cancello", vehicle.id, "AB123CD", T0 + timedelta(minutes=10)) == "checkout"
+    # Check-in aperto da un altro nodo: questo processo non riceve l'invalidazione
+    db.add(CheckIn(vehicle_id=vehicle.id, checkin_time=T0 + timedelta(minutes=20), notes="altro nodo"))
+    db.commit()
+
+    assert checkin_engine.handle_plate_pass("cancello", vehicle.id, "AB123CD", T0 + timedelta(minutes=30)) is None
+    assert checkin_engine.handle_plate_pass("cancello", vehicle.id, "AB123CD", T0 + timedelta(minutes=31)) == "checkout"
+    assert db.execute(select(CheckIn).where(CheckIn.checkout_time.is_(None))).first() is None
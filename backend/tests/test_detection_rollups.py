@@ -0,0 +1,161 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import func, insert, select, text, update
+from sqlalchemy.orm import Session
+
+from app.core.database import AIDetection, AIDetectionRollup, AIDetectionRollupDirtyHour
+from app.services.detection_rollups import mark_hours_dirty, rolled_until, rollup_hours, summarize
+from conftest import add_vehicle
+
+T0 = datetime(2026, 10, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def db(any_session_factory):
+    session = any_session_factory()
+    yield session
+    session.close()
+
+
+def add_detections(db, start, hours, per_hour=1, vehicle_id=None):
+    db.execute(insert(AIDetection), [
+        {
+            "license_plate": f"AB{hour:03d}CD",
+            "confidence": 0.5,
+            "source": "cam1" if index % 2 else "cam2",
+            "vehicle_id": vehicle_id,
+            "processed": vehicle_id is not None,
+            "detected_at": start + timedelta(hours=hour, minutes=7 * index % 60)
+        }
+        for hour in range(hours) for index in range(per_hour)
+    ])
+    db.commit()
+
+
+def raw_totals(db, start=None, end=None):
+    query = select(func.count(AIDetection.id), func.count(AIDetection.vehicle_id))
+    if start is not None:
+        query = query.where(AIDetection.detected_at >= start)
+    if end is not None:
+        query = query.where(AIDetection.detected_at < end)
+    detections, vehicle_found = db.execute(query).one()
+    return {"detections": detections, "vehicle_found": vehicle_found}
+
+
+def summary(db, start=None, end=None):
+    totals = summarize(db, start, end)
+    return {"detections": totals["detections"], "vehicle_found": totals["vehicle_found"]}
+
+
+def test_rerun_rewrites_the_same_hours(db):
+    add_detections(db, T0, 30)
+    now = T0 + timedelta(hours=30)
+
+    first = rollup_hours(db, lookback_hours=24, now=now)
+    second = rollup_hours(db, lookback_hours=24, now=now)
+
+    assert first > 0 and second > 0
+    assert summary(db) == raw_totals(db) == {"detections": 30, "vehicle_found": 0}
+
+
+def test_server_default_timestamp_on_the_hour(db):
+    if db.get_bind().dialect.name != "sqlite":
+        pytest.skip("formato di CURRENT_TIMESTAMP specifico di SQLite")
+    add_detections(db, T0, 3)
+    # CURRENT_TIMESTAMP su SQLite: senza microsecondi, esattamente allo scoccare dell'ora
+    db.execute(text(
+        "INSERT INTO ai_detections (license_plate, confidence, source, detected_at) "
+        "VALUES ('XY123ZW', 0.9, 'cam1', '2026-10-01 02:00:00')"
+    ))
+    db.commit()
+    now = T0 + timedelta(hours=4)
+
+    rollup_hours(db, lookback_hours=24, now=now)
+    rollup_hours(db, lookback_hours=24, now=now)
+
+    assert summary(db) == raw_totals(db) == {"detections": 4, "vehicle_found": 0}
+
+
+def test_outage_longer_than_lookback(db):
+    add_detections(db, T0, 72, per_hour=1)
+    rollup_hours(db, lookback_hours=24, now=T0 + timedelta(hours=72))
+    # 48 ore senza manutenzione, con rilevazioni in tutto il periodo
+    add_detections(db, T0 + timedelta(hours=72), 48, per_hour=1)
+
+    rollup_hours(db, lookback_hours=24, now=T0 + timedelta(hours=120))
+
+    assert rolled_until(db) == T0 + timedelta(hours=120)
+    assert summary(db) == raw_totals(db) == {"detections": 120, "vehicle_found": 0}
+    assert summary(db, T0 + timedelta(hours=60, minutes=30), T0 + timedelta(hours=110)) == \
+        raw_totals(db, T0 + timedelta(hours=60, minutes=30), T0 + timedelta(hours=110))
+
+
+def test_dirty_hours_outside_lookback(db):
+    add_detections(db, T0, 100)
+    now = T0 + timedelta(hours=100)
+    rollup_hours(db, lookback_hours=24, now=now)
+
+    # Backfill o PUT /ai/{id} su rilevazioni di ore già aggregate e fuori dalla finestra
+    vehicle = add_vehicle(db)
+    old = db.execute(
+        select(AIDetection.id, AIDetection.detected_at).where(AIDetection.detected_at < T0 + timedelta(hours=10))
+    ).all()
+    db.execute(update(AIDetection).where(AIDetection.id.in_([row.id for row in old])).values(vehicle_id=vehicle.id, processed=True))
+    assert mark_hours_dirty(db, [row.detected_at for row in old]) == 10
+    db.commit()
+    assert summary(db) != raw_totals(db)
+
+    rollup_hours(db, lookback_hours=24, now=now)
+
+    assert summary(db) == raw_totals(db) == {"detections": 100, "vehicle_found": 10}
+    assert db.execute(select(func.count()).select_from(AIDetectionRollupDirtyHour)).scalar() == 0
+
+
+def test_dirty_mark_renewed_during_rollup_is_kept(db, monkeypatch):
+    from app.services import detection_rollups
+
+    add_detections(db, T0, 40)
+    now = T0 + timedelta(hours=40)
+    rollup_hours(db, lookback_hours=24, now=now)
+    hour = T0 + timedelta(hours=2)
+    mark_hours_dirty(db, [hour])
+    db.commit()
+
+    rollup_range = detection_rollups._rollup_range
+    renewed = []
+
+    def renew_then_rollup(*args):
+        if not renewed:
+            # Un'altra modifica della stessa ora, segnata dopo che il rollup ha letto le segnalazioni
+            other = Session(bind=db.get_bind())
+            mark_hours_dirty(other, [hour + timedelta(minutes=30)])
+            other.commit()
+            other.close()
+            renewed.append(True)
+        return rollup_range(*args)
+
+    monkeypatch.setattr(detection_rollups, "_rollup_range", renew_then_rollup)
+    rollup_hours(db, lookback_hours=24, now=now)
+
+    buckets = db.execute(select(AIDetectionRollupDirtyHour.bucket)).scalars().all()
+    assert [bucket.replace(tzinfo=None) for bucket in buckets] == [hour.replace(tzinfo=None)]
+
+
+def test_mark_hours_dirty_before(db):
+    assert mark_hours_dirty(db, [T0 + timedelta(minutes=5), T0 + timedelta(hours=1, minutes=5)], before=T0 + timedelta(hours=1)) == 1
+    assert mark_hours_dirty(db, [T0 + timedelta(hours=3)], before=T0) == 0
+    db.commit()
+    assert db.execute(select(func.count()).select_from(AIDetectionRollupDirtyHour)).scalar() == 1
+
+
+@pytest.mark.parametrize("start_hour, end_hour", [(0, 48), (3.5, 20.25), (47, 60), (None, 30)])
+def test_summary_matches_raw_counts(db, start_hour, end_hour):
+    add_detections(db, T0, 48, per_hour=3)
+    add_detections(db, T0, 48, per_hour=1, vehicle_id=add_vehicle(db).id)
+    rollup_hours(db, lookback_hours=24, now=T0 + timedelta(hours=40))
+    start = T0 + timedelta(hours=start_hour) if start_hour is not None else None
+    end = T0 + timedelta(hours=end_hour)
+
+    assert summary(db, start, end) == raw_totals(db, start, end)
+    assert db.execute(select(func.count()).select_from(AIDetectionRollup)).scalar() > 0
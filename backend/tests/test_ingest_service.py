@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import func, select
+
+from app.core.config import settings
+from app.core.database import AIDetection, AIDetectionEventKey
+from app.services.ingest_service import IngestService, InvalidLine
+from conftest import add_vehicle
+
+T0 = datetime(2026, 10, 1, 8, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def db(any_session_factory, monkeypatch):
+    monkeypatch.setattr(settings, "AUTO_CHECKIN_ENABLED", False)
+    session = any_session_factory()
+    yield session
+    session.close()
+
+
+def event(event_id, plate="AB123CD", minutes=0):
+    return {
+        "event_id": event_id, "camera_id": "cam1", "license_plate": plate, "confidence": 0.9,
+        "last_seen": (T0 + timedelta(minutes=minutes)).isoformat()
+    }
+
+
+def count(db, model):
+    return db.execute(select(func.count()).select_from(model)).scalar()
+
+
+def test_duplicates_within_a_batch(db):
+    result = IngestService(db, save_crops=False).ingest([event("e1"), event("e2", "XY987ZW"), event("e1")])
+
+    assert (result["received"], result["accepted"], result["duplicates"]) == (3, 2, 1)
+    assert count(db, AIDetection) == count(db, AIDetectionEventKey) == 2
+
+
+def test_resent_batch_creates_no_detections(db):
+    batch = [event(f"e{index}", minutes=index) for index in range(5)]
+    IngestService(db, save_crops=False).ingest(batch)
+
+    # Reinvio parziale dopo un timeout dell'edge agent, con due eventi nuovi
+    result = IngestService(db, save_crops=False).ingest(batch[2:] + [event("e5"), event("e6")])
+
+    assert (result["accepted"], result["duplicates"]) == (2, 3)
+    assert count(db, AIDetection) == 7
+
+
+def test_invalid_events_do_not_discard_the_batch(db):
+    vehicle = add_vehicle(db, "AB123CD")
+    batch = [
+        event("e1", " ab-123 cd "),
+        InvalidLine("JSON non valido"),
+        {"event_id": "e2", "camera_id": "cam1"},
+        event("e3", "--"),
+        event("e4", "ZZ000ZZ")
+    ]
+
+    result = IngestService(db, save_crops=False).ingest(batch)
+
+    assert (result["accepted"], result["rejected"], result["matched_vehicles"]) == (2, 3, 1)
+    assert [error["index"] for error in result["errors"]] == [1, 2, 3]
+    matched = db.execute(select(AIDetection).where(AIDetection.vehicle_id.is_not(None))).scalar_one()
+    assert (matched.license_plate, matched.vehicle_id, matched.processed) == ("AB123CD", vehicle.id, True)
+
+
+def test_mixed_timestamps_reach_auto_checkin_in_utc(db, monkeypatch):
+    from app.services.auto_checkin_service import auto_checkin_engine
+
+    monkeypatch.setattr(settings, "AUTO_CHECKIN_ENABLED", True)
+    passes = []
+    monkeypatch.setattr(auto_checkin_engine, "handle_plate_pass",
+                        lambda camera_id, vehicle_id, plate, seen_at: passes.append((plate, seen_at)))
+    add_vehicle(db, "AB123CD")
+    add_vehicle(db, "CD456EF")
+    add_vehicle(db, "EF789GH")
+    batch = [
+        {"event_id": "e1", "camera_id": "cam1", "license_plate": "AB123CD", "confidence": 0.9},
+        {**event("e2", "CD456EF"), "last_seen": "2026-10-01T08:05:00"},
+        {**event("e3", "EF789GH"), "last_seen": "2026-10-01T09:01:00+02:00"},
+    ]
+
+    result = IngestService(db, save_crops=False).ingest(batch)
+
+    assert (result["accepted"], result["matched_vehicles"]) == (3, 3)
+    assert all(seen_at.utcoffset() == timedelta(0) for _, seen_at in passes)
+    assert [plate for plate, _ in passes] == ["EF789GH", "CD456EF", "AB123CD"]
+    stored = {
+        plate: detected_at if detected_at.tzinfo else detected_at.replace(tzinfo=timezone.utc)
+        for plate, detected_at in db.execute(select(AIDetection.license_plate, AIDetection.detected_at))
+    }
+    assert stored["CD456EF"] == datetime(2026, 10, 1, 8, 5, tzinfo=timezone.utc)
+    assert stored["EF789GH"] == datetime(2026, 10, 1, 7, 1, tzinfo=timezone.utc)
@@ -0,0 +1,156 @@
+import threading
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+from app.core.database import Job, JobStatus
+from app.services import job_queue
+from app.services.job_queue import JobLockLost, JobWorker, claim_next, complete_job, enqueue, fail_job, requeue_stale
+
+
+@pytest.fixture(autouse=True)
+def handlers(monkeypatch):
+    monkeypatch.setitem(job_queue.JOB_HANDLERS, "echo", lambda ctx, payload: payload)
+
+
+@pytest.fixture
+def db(any_session_factory):
+    session = any_session_factory()
+    yield session
+    session.close()
+
+
+def orphan(db, job_id):
+    """Il worker del job smette di aggiornare l'heartbeat e il job torna in coda"""
+    db.execute(update(Job).where(Job.id == job_id).values(heartbeat_at=job_queue._now() - timedelta(minutes=10)))
+    db.commit()
+    assert requeue_stale(db, stale_seconds=60) == 1
+
+
+def test_claim_order(db):
+    low = enqueue(db, "echo", {"n": 1})
+    high = enqueue(db, "echo", {"n": 2}, priority=5)
+    enqueue(db, "echo", {"n": 3}, priority=9, run_at=job_queue._now() + timedelta(hours=1))
+    enqueue(db, "echo", {"n": 4}, priority=9, queue="video")
+
+    assert claim_next(db, "w1", ["default"]).id == high.id
+    assert claim_next(db, "w1", ["default"]).id == low.id
+    assert claim_next(db, "w1", ["default"]) is None
+
+
+def test_completion_after_requeue_is_discarded(db, any_session_factory):
+    job_id = enqueue(db, "echo").id
+    first = claim_next(db, "w1", ["default"])
+    orphan(db, job_id)
+    other = any_session_factory()
+    second = claim_next(other, "w2", ["default"])
+    assert second.id == job_id and second.attempts == 2
+
+    with pytest.raises(JobLockLost):
+        complete_job(db, first, {"from": "w1"}, "w1")
+    with pytest.raises(JobLockLost):
+        fail_job(db, first, "timeout", "w1")
+    complete_job(other, second, {"from": "w2"}, "w2")
+    other.close()
+
+    job = db.get(Job, job_id)
+    db.refresh(job)
+    assert (job.status, job.result, job.locked_by) == (JobStatus.SUCCEEDED, {"from": "w2"}, None)
+
+
+def test_worker_drops_result_of_lost_job(db, any_session_factory, monkeypatch):
+    job_id = enqueue(db, "echo", {"from": "w1"}).id
+    taken_over = []
+
+    def slow_echo(ctx, payload):
+        # Mentre l'handler gira, il job viene rimesso in coda e preso da un altro worker
+        other = any_session_factory()
+        orphan(other, ctx.job_id)
+        job = claim_next(other, "w2", ["default"])
+        taken_over.append(job.id)
+        complete_job(other, job, {"from": "w2"}, "w2")
+        other.close()
+        return payload
+
+    monkeypatch.setitem(job_queue.JOB_HANDLERS, "echo", slow_echo)
+    finished = []
+    monkeypatch.setattr("app.core.metrics.record_job_finished", lambda job_type, status, seconds: finished.append(status))
+
+    assert JobWorker("w1", session_factory=any_session_factory).run_once()
+
+    assert taken_over == [job_id] and finished == ["lost"]
+    job = db.get(Job, job_id)
+    assert (job.status, job.result) == (JobStatus.SUCCEEDED, {"from": "w2"})
+
+
+def test_stale_jobs_follow_the_retry_rules(db):
+    retried = enqueue(db, "echo").id
+    exhausted = enqueue(db, "echo", max_attempts=1).id
+    cancelled = enqueue(db, "echo").id
+    for _ in range(3):
+        claim_next(db, "w1", ["default"])
+    db.execute(update(Job).where(Job.id == cancelled).values(cancel_requested=True))
+    db.execute(update(Job).values(heartbeat_at=job_queue._now() - timedelta(minutes=10)))
+    db.commit()
+
+    # Un job appena rilevato da un worker vivo non è orfano
+    assert requeue_stale(db, stale_seconds=3600) == 0
+    assert requeue_stale(db, stale_seconds=60) == 1
+
+    statuses = dict(db.execute(select(Job.id, Job.status)).all())
+    assert statuses == {retried: JobStatus.QUEUED, exhausted: JobStatus.FAILED, cancelled: JobStatus.CANCELLED}
+    assert db.execute(select(Job.locked_by).where(Job.locked_by.is_not(None))).first() is None
+
+
+def test_claim_session_idle_while_handler_runs(db, any_session_factory, monkeypatch):
+    job_id = enqueue(db, "echo", {"n": 1}).id
+    sessions = []
+
+    def tracked_session():
+        sessions.append(any_session_factory())
+        return sessions[-1]
+
+    def check(ctx, payload):
+        # La sessione del prelievo non tiene aperta una transazione durante l'handler
+        claim = sessions[0]
+        assert not claim.in_transaction()
+        return {"attempt": ctx.attempt, **payload}
+
+    monkeypatch.setitem(job_queue.JOB_HANDLERS, "echo", check)
+
+    assert JobWorker("w1", session_factory=tracked_session).run_once()
+
+    job = db.get(Job, job_id)
+    assert (job.status, job.result) == (JobStatus.SUCCEEDED, {"attempt": 1, "n": 1})
+
+
+def test_concurrent_claims_never_share_a_job(pg_session_factory):
+    setup = pg_session_factory()
+    ids = {enqueue(setup, "echo", {"n": n}).id for n in range(40)}
+    setup.close()
+    claimed = []
+    start = threading.Barrier(8)
+
+    def worker(name):
+        db = pg_session_factory()
+        start.wait()
+        while True:
+            job = claim_next(db, name, ["default"])
+            if job is None:
+                break
+            claimed.append((job.id, name))
+        db.close()
+
+    threads = [threading.Thread(target=worker, args=(f"w{n}",)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+
+    assert sorted(job_id for job_id, _ in claimed) == sorted(ids)
+    db = pg_session_factory()
+    rows = db.execute(select(Job.id, Job.locked_by, Job.attempts)).all()
+    db.close()
+    assert {row.id: row.locked_by for row in rows} == dict(claimed)
+    assert {row.attempts for row in rows} == {1}
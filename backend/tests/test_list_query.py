@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import insert, select
+
+from app.core.database import AIDetection
+from app.services.list_query import InvalidCursor, encode_cursor, paginate, where
+
+T0 = datetime(2026, 10, 1, tzinfo=timezone.utc)
+ORDER = (AIDetection.detected_at, AIDetection.id)
+
+
+@pytest.fixture
+def db(any_session_factory):
+    session = any_session_factory()
+    yield session
+    session.close()
+
+
+def add_detections(db, count):
+    # Tre rilevazioni per istante: i pareggi sulla data si risolvono con l'id
+    db.execute(insert(AIDetection), [
+        {"license_plate": f"AB{index:03d}CD", "confidence": 0.5, "source": "cam1",
+         "detected_at": T0 + timedelta(minutes=index // 3)}
+        for index in range(count)
+    ])
+    db.commit()
+
+
+def walk(db, limit, descending=False, query=None):
+    query = query if query is not None else select(AIDetection)
+    pages, cursor = [], None
+    while True:
+        page = paginate(db, query, ORDER, limit, cursor, descending=descending)
+        pages.append([item.id for item in page.items])
+        if page.next_cursor is None:
+            return pages
+        cursor = page.next_cursor
+
+
+def expected_ids(db, descending=False):
+    order = [column.desc() if descending else column.asc() for column in ORDER]
+    return db.execute(select(AIDetection.id).order_by(*order)).scalars().all()
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_cursor_walk_visits_every_row_once(db, descending):
+    add_detections(db, 25)
+
+    pages = walk(db, 10, descending)
+
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert [item for page in pages for item in page] == expected_ids(db, descending)
+
+
+def test_last_full_page_has_no_cursor(db):
+    add_detections(db, 20)
+
+    pages = walk(db, 10)
+
+    assert [len(page) for page in pages] == [10, 10]
+
+
+def test_filters_are_kept_across_pages(db):
+    add_detections(db, 30)
+    query = where(select(AIDetection), AIDetection.detected_at >= T0 + timedelta(minutes=4), None)
+
+    pages = walk(db, 7, descending=True, query=query)
+
+    assert [item for page in pages for item in page] == db.execute(
+        select(AIDetection.id).where(AIDetection.detected_at >= T0 + timedelta(minutes=4))
+        .order_by(AIDetection.detected_at.desc(), AIDetection.id.desc())
+    ).scalars().all()
+    assert sum(len(page) for page in pages) == 18
+
+
+def test_skip_without_cursor(db):
+    add_detections(db, 12)
+
+    page = paginate(db, select(AIDetection), ORDER, 5, skip=5)
+
+    assert [item.id for item in page.items] == expected_ids(db)[5:10]
+    assert page.next_cursor is not None
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", encode_cursor([1]), encode_cursor(["ieri", 3]), "W10"])
+def test_invalid_cursor(db, cursor):
+    with pytest.raises(InvalidCursor):
+        paginate(db, select(AIDetection), ORDER, 10, cursor)
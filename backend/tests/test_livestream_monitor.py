@@ -0,0 +1,114 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services.frame_ring import FrameRing
+from app.services.license_plate_service import LicensePlateService
+
+
+class SlowCapture:
+    """Cattura finta: ogni lettura dura `delay` e scrive nello slot ricevuto; l'ultima risoluzione resta"""
+
+    def __init__(self, delay=0.2, shapes=None):
+        self.delay = delay
+        self.shapes = list(shapes or [(48, 64, 3)])
+        self.reads = 0
+        self.reading = threading.Event()
+        self.lock = threading.Lock()
+
+    def isOpened(self):
+        return True
+
+    def read(self, view=None):
+        with self.lock:
+            self.reading.set()
+            self.reads += 1
+            shape = self.shapes.pop(0) if len(self.shapes) > 1 else self.shapes[0]
+            time.sleep(self.delay)
+            frame = view if view is not None and view.shape == shape else np.empty(shape, np.uint8)
+            frame[:] = self.reads % 255
+            self.reading.clear()
+            return True, frame
+
+    def grab(self):
+        return True
+
+    def release(self):
+        pass
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(settings, "CLIP_RECORDING_ENABLED", False)
+    service = LicensePlateService(db=None, camera_id="cam1")
+    service.detect_license_plate = lambda frame, captured_at=None, high_res_request=None: []
+    return service
+
+
+async def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condizione non raggiunta"
+        await asyncio.sleep(0.005)
+
+
+def test_cancel_during_slow_capture_waits_for_the_read(service, monkeypatch):
+    capture = SlowCapture()
+    monkeypatch.setattr(LicensePlateService, "_open_capture", lambda self, url: capture)
+    closes = []
+    close = FrameRing.close
+    monkeypatch.setattr(FrameRing, "close", lambda ring: closes.append(capture.reading.is_set()) or close(ring))
+
+    async def run():
+        task = asyncio.ensure_future(service.monitor_livestream("rtsp://cam1"))
+        # Seconda lettura in corso: decodifica direttamente in uno slot dell'anello
+        await wait_for(lambda: capture.reads >= 2 and capture.reading.is_set())
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+
+    assert closes == [False]
+    assert service.frame_ring is None and not service.is_streaming
+
+
+def test_resolution_change_waits_for_scheduled_inference(service, monkeypatch):
+    capture = SlowCapture(delay=0.01, shapes=[(48, 64, 3)] * 3 + [(60, 80, 3)])
+    monkeypatch.setattr(LicensePlateService, "_open_capture", lambda self, url: capture)
+    inferences = []
+
+    class SlowScheduler:
+        def submit(self, camera_id, frame, captured_at=None, detect=None):
+            future = Future()
+
+            def infer():
+                time.sleep(0.3)
+                frame.sum()
+                future.set_result([])
+
+            threading.Thread(target=infer, daemon=True).start()
+            inferences.append(future)
+            return future
+
+    service.scheduler = SlowScheduler()
+    closes = []
+    close = FrameRing.close
+    monkeypatch.setattr(FrameRing, "close", lambda ring: closes.append(all(f.done() for f in inferences)) or close(ring))
+
+    async def run():
+        task = asyncio.ensure_future(service.monitor_livestream("rtsp://cam1"))
+        # Anello ricreato alla nuova risoluzione
+        await wait_for(lambda: service.frame_ring is not None and service.frame_ring.shape == (60, 80, 3))
+        service.is_streaming = False
+        await task
+
+    asyncio.run(run())
+
+    assert closes == [True, True]
@@ -0,0 +1,54 @@
+import numpy as np
+
+from app.services import vision_client
+from app.services.ai_service import AIService
+
+FRAME = np.zeros((48, 64, 3), np.uint8)
+PLATE = {"license_plate": "AB123CD", "confidence": 0.9, "bbox": (1, 2, 30, 10)}
+
+
+class RecordingClient:
+    """Client del worker di visione finto: registra i metodi RPC chiamati"""
+
+    def __init__(self):
+        self.calls = []
+
+    def call(self, method, **params):
+        self.calls.append(method)
+        return {"snapshot": FRAME, "detect_best": PLATE, "snapshot_detect_best": PLATE}[method]
+
+    snapshot = vision_client.VisionClient.snapshot
+    detect_best = vision_client.VisionClient.detect_best
+    snapshot_detect_best = vision_client.VisionClient.snapshot_detect_best
+
+
+def test_frame_stays_in_the_vision_worker(monkeypatch):
+    client = RecordingClient()
+    monkeypatch.setattr(vision_client, "get_vision_client", lambda: client)
+
+    assert AIService(db=None).process_camera_stream("rtsp://cam1") == PLATE
+    assert client.calls == ["snapshot_detect_best"]
+
+
+def test_worker_detects_on_its_own_snapshot(monkeypatch):
+    from app import vision_worker
+
+    class Engine:
+        def detect_best(self, image, strict=True):
+            assert image is FRAME and not strict
+            return PLATE
+
+    class Pool:
+        def __init__(self, frame):
+            self.frame = frame
+
+        def snapshot(self, camera_url):
+            return self.frame
+
+    worker = vision_worker.VisionWorker("/tmp/unused.sock", b"key", engine=Engine())
+    handler = worker._handlers["snapshot_detect_best"]
+
+    monkeypatch.setattr(vision_worker, "get_snapshot_pool", lambda: Pool(FRAME))
+    assert handler(camera_url="rtsp://cam1", strict=False) == PLATE
+    monkeypatch.setattr(vision_worker, "get_snapshot_pool", lambda: Pool(None))
+    assert handler(camera_url="rtsp://cam1", strict=False) is None
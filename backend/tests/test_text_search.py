@@ -0,0 +1,95 @@
+import pytest
+
+from app.core.database import Customer, Vehicle
+from app.services import text_search
+from app.services.text_search import CUSTOMER_SEARCH, VEHICLE_SEARCH, search
+from conftest import add_vehicle
+
+
+@pytest.fixture
+def db(any_session_factory):
+    session = any_session_factory()
+    yield session
+    session.close()
+
+
+def add_vehicles(db, *plates, model="Panda", customer_id=None):
+    if customer_id is None:
+        customer = Customer(full_name=f"Cliente {plates[0]}", email=f"{plates[0].lower()}@example.com", phone="0612345678")
+        db.add(customer)
+        db.flush()
+        customer_id = customer.id
+    db.add_all([
+        Vehicle(license_plate=plate, brand="Fiat", model=model, year=2020, color="bianco", customer_id=customer_id)
+        for plate in plates
+    ])
+    db.commit()
+    # Come VehicleService dopo le modifiche: l'indice in memoria (SQLite) si ricostruisce
+    text_search.invalidate("vehicles")
+
+
+def plates(rows):
+    return [row.license_plate for row in rows]
+
+
+def test_plate_prefix_first_then_substring(db):
+    add_vehicles(db, "XAB12YZ", "AB129ZZ", "ZZ999ZZ", "AB123CD")
+
+    assert plates(search(db, VEHICLE_SEARCH, "ab12")) == ["AB123CD", "AB129ZZ", "XAB12YZ"]
+    # Separatori e minuscole come li scrive l'accettazione
+    assert plates(search(db, VEHICLE_SEARCH, "ab-129")) == ["AB129ZZ"]
+
+
+def test_limit_and_conditions(db):
+    owner = add_vehicle(db, "AB100AA").customer_id
+    add_vehicles(db, "AB101AA", "AB102AA", "AB103AA")
+    add_vehicles(db, "AB104AA", customer_id=owner)
+
+    assert plates(search(db, VEHICLE_SEARCH, "AB10", limit=2)) == ["AB100AA", "AB101AA"]
+    assert plates(search(db, VEHICLE_SEARCH, "AB10", conditions=[Vehicle.customer_id == owner])) == ["AB100AA", "AB104AA"]
+
+
+def test_other_columns_and_short_queries(db):
+    add_vehicles(db, "AB123CD", "CD456EF")
+    add_vehicles(db, "EF789GH", model="Tipo")
+
+    assert sorted(plates(search(db, VEHICLE_SEARCH, "pand"))) == ["AB123CD", "CD456EF"]
+    assert plates(search(db, VEHICLE_SEARCH, "ti")) == ["EF789GH"]
+    assert search(db, VEHICLE_SEARCH, "  ") == []
+
+
+def test_like_wildcards_are_literal(db):
+    add_vehicles(db, "AB123CD")
+
+    assert search(db, VEHICLE_SEARCH, "%") == []
+    assert search(db, VEHICLE_SEARCH, "a_1") == []
+
+
+def test_phone_prefix_ignores_country_code_and_separators(db):
+    db.add_all([
+        Customer(full_name="Anna Bianchi", email="anna@example.com", phone="+39 333 1299999"),
+        Customer(full_name="Luca Verdi", email="luca@example.com", phone="333-1234567"),
+        Customer(full_name="Sara Neri", email="sara@example.com", phone="06 12333123"),
+    ])
+    db.commit()
+    text_search.invalidate("customers")
+
+    found = search(db, CUSTOMER_SEARCH, "0039 333 12")
+
+    assert [customer.full_name for customer in found] == ["Luca Verdi", "Anna Bianchi"]
+    assert [customer.full_name for customer in search(db, CUSTOMER_SEARCH, "bianc")] == ["Anna Bianchi"]
+
+
+def test_index_rebuilt_after_invalidate(session_factory):
+    db = session_factory()
+    add_vehicles(db, "AB123CD")
+    assert plates(search(db, VEHICLE_SEARCH, "AB1")) == ["AB123CD"]
+
+    db.add(Vehicle(license_plate="AB199ZZ", brand="Fiat", model="Panda", year=2020, color="nero",
+                   customer_id=db.query(Vehicle).one().customer_id))
+    db.commit()
+    # Senza invalidate l'indice in memoria resta quello costruito, fino a INDEX_MAX_AGE
+    assert plates(search(db, VEHICLE_SEARCH, "AB1")) == ["AB123CD"]
+    text_search.invalidate("vehicles")
+    assert plates(search(db, VEHICLE_SEARCH, "AB1")) == ["AB123CD", "AB199ZZ"]
+    db.close()